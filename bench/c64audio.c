@@ -0,0 +1,187 @@
+/*
+    c64audio.c
+
+    Measures how much of the per-frame work of the C64 emulation moves off
+    the emulation thread with deferred SID synthesis (c64_desc_t.audio_deferred).
+
+    A small replacement KERNAL ROM switches on the display, initializes
+    the SID with a filtered 3-voice sound, and then updates the voice and
+    filter frequencies and retriggers voice 1 once per frame, so that the
+    CPU, VIC-II (with badlines), CIAs and SID are all running. The program
+    runs once without SID register reads, and once with an OSC3 read per
+    frame (which needs the SID generator state on the emulation thread).
+    Each program runs the same frames twice:
+
+    - inline: the SID is synthesized inside c64_exec()
+    - deferred: c64_exec() + c64_audio_swap() on the emulation thread, and
+      c64_audio_synth() (which would run on another thread) is timed
+      separately
+
+    Both runs of a program must print the same audio checksum. Build and run from the
+    repository root:
+
+        cc -O2 -o c64audio bench/c64audio.c && ./c64audio
+*/
+#define CHIPS_IMPL
+#include "../chips/m6502.h"
+#include "../chips/m6526.h"
+#include "../chips/m6569.h"
+#include "../chips/m6581.h"
+#include "../chips/kbd.h"
+#include "../chips/mem.h"
+#include "../chips/clk.h"
+#include "../systems/c1530.h"
+#include "../chips/m6522.h"
+#include "../systems/c1541.h"
+#include "../systems/c64.h"
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define FRAME_US (19950)
+#define NUM_FRAMES (500)
+#define NUM_RUNS (5)
+
+static uint8_t rom_char[0x1000];
+static uint8_t rom_basic[0x2000];
+static uint8_t rom_kernal[0x2000];
+static uint32_t pixels[512*320];
+static c64_t sys;
+static uint32_t audio_sum;
+static uint32_t audio_samples;
+
+static const uint8_t prg[] = {
+    0x78,               /* E000: SEI */
+    0xA2, 0x00,         /* E001: LDX #00 */
+    0xBD, 0x00, 0xF0,   /* E003: LDA F000,X */
+    0x9D, 0x00, 0xD4,   /* E006: STA D400,X */
+    0xE8,               /* E009: INX */
+    0xE0, 0x19,         /* E00A: CPX #19 */
+    0xD0, 0xF5,         /* E00C: BNE E003 */
+    0xA9, 0x1B,         /* E00E: LDA #1B */
+    0x8D, 0x11, 0xD0,   /* E010: STA D011 */
+    0xAD, 0x12, 0xD0,   /* E013: LDA D012 */
+    0xC9, 0x80,         /* E016: CMP #80 */
+    0xD0, 0xF9,         /* E018: BNE E013 */
+    0xE6, 0x02,         /* E01A: INC 02 */
+    0xA5, 0x02,         /* E01C: LDA 02 */
+    0x8D, 0x01, 0xD4,   /* E01E: STA D401 */
+    0x0A,               /* E021: ASL A */
+    0x8D, 0x08, 0xD4,   /* E022: STA D408 */
+    0x4A,               /* E025: LSR A */
+    0x8D, 0x16, 0xD4,   /* E026: STA D416 */
+    0xAD, 0x1B, 0xD4,   /* E029: LDA D41B (patched to LDA 0002 if OSC3 isn't read) */
+    0x8D, 0x0F, 0xD4,   /* E02C: STA D40F */
+    0xA5, 0x02,         /* E02F: LDA 02 */
+    0x29, 0x0F,         /* E031: AND #0F */
+    0xD0, 0x0A,         /* E033: BNE E03F */
+    0xA9, 0x40,         /* E035: LDA #40 */
+    0x8D, 0x04, 0xD4,   /* E037: STA D404 */
+    0xA9, 0x41,         /* E03A: LDA #41 */
+    0x8D, 0x04, 0xD4,   /* E03C: STA D404 */
+    0x4C, 0x13, 0xE0,   /* E03F: JMP E013 */
+    0x40,               /* E042: RTI */
+};
+
+/* initial SID register values at F000 */
+static const uint8_t sid_regs[25] = {
+    0x00, 0x10, 0x00, 0x08, 0x41, 0x09, 0xF0,   /* voice 1: pulse */
+    0x00, 0x20, 0x00, 0x04, 0x21, 0x0A, 0xA0,   /* voice 2: sawtooth */
+    0x00, 0x05, 0x00, 0x08, 0x11, 0x08, 0x80,   /* voice 3: triangle */
+    0x00, 0x40, 0xF3, 0x1F,                     /* filter voice 1+2, lowpass, volume 15 */
+};
+
+static void audio_cb(const float* samples, int num_samples, void* user_data) {
+    (void)user_data;
+    for (int i = 0; i < num_samples; i++) {
+        uint32_t bits;
+        memcpy(&bits, &samples[i], sizeof(bits));
+        audio_sum = (audio_sum << 1 | audio_sum >> 31) ^ bits;
+    }
+    audio_samples += num_samples;
+}
+
+static void init(bool deferred, bool read_osc3) {
+    memset(rom_kernal, 0xEA, sizeof(rom_kernal));
+    memcpy(rom_kernal, prg, sizeof(prg));
+    if (!read_osc3) {
+        rom_kernal[0x2A] = 0x02;
+        rom_kernal[0x2B] = 0x00;
+    }
+    memcpy(&rom_kernal[0x1000], sid_regs, sizeof(sid_regs));
+    /* NMI, RESET and IRQ vectors */
+    rom_kernal[0x1FFA] = 0x42; rom_kernal[0x1FFB] = 0xE0;
+    rom_kernal[0x1FFC] = 0x00; rom_kernal[0x1FFD] = 0xE0;
+    rom_kernal[0x1FFE] = 0x42; rom_kernal[0x1FFF] = 0xE0;
+    c64_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.pixel_buffer = pixels;
+    desc.pixel_buffer_size = sizeof(pixels);
+    desc.audio_cb = audio_cb;
+    desc.audio_deferred = deferred;
+    desc.rom_char = rom_char;
+    desc.rom_char_size = sizeof(rom_char);
+    desc.rom_basic = rom_basic;
+    desc.rom_basic_size = sizeof(rom_basic);
+    desc.rom_kernal = rom_kernal;
+    desc.rom_kernal_size = sizeof(rom_kernal);
+    c64_init(&sys, &desc);
+    audio_sum = 0;
+    audio_samples = 0;
+}
+
+static double ms_since(clock_t start) {
+    return 1000.0 * (double)(clock() - start) / CLOCKS_PER_SEC;
+}
+
+static void run(const char* name, bool read_osc3) {
+    double best_inline = 0.0, best_emu = 0.0, best_synth = 0.0;
+    uint32_t sum_inline = 0, sum_deferred = 0;
+    uint32_t num_inline = 0, num_deferred = 0;
+    for (int i = 0; i < NUM_RUNS; i++) {
+        init(false, read_osc3);
+        clock_t start = clock();
+        for (int frame = 0; frame < NUM_FRAMES; frame++) {
+            c64_exec(&sys, FRAME_US);
+        }
+        double ms = ms_since(start);
+        if ((0 == i) || (ms < best_inline)) {
+            best_inline = ms;
+        }
+        sum_inline = audio_sum;
+        num_inline = audio_samples;
+        c64_discard(&sys);
+
+        init(true, read_osc3);
+        double emu_ms = 0.0, synth_ms = 0.0;
+        for (int frame = 0; frame < NUM_FRAMES; frame++) {
+            start = clock();
+            c64_exec(&sys, FRAME_US);
+            c64_audio_swap(&sys);
+            emu_ms += ms_since(start);
+            start = clock();
+            c64_audio_synth(&sys);
+            synth_ms += ms_since(start);
+        }
+        if ((0 == i) || (emu_ms < best_emu)) {
+            best_emu = emu_ms;
+            best_synth = synth_ms;
+        }
+        sum_deferred = audio_sum;
+        num_deferred = audio_samples;
+        c64_discard(&sys);
+    }
+    printf("%s:\n", name);
+    printf("  inline:   emulation thread %8.2f ms\n", best_inline);
+    printf("  deferred: emulation thread %8.2f ms, synthesis %8.2f ms\n", best_emu, best_synth);
+    printf("  emulation thread time saved: %.1f%%\n", 100.0 * (best_inline - best_emu) / best_inline);
+    printf("  audio checksum inline: %08X (%u samples), deferred: %08X (%u samples)\n\n",
+        sum_inline, num_inline, sum_deferred, num_deferred);
+}
+
+int main() {
+    printf("%d frames, best of %d runs\n\n", NUM_FRAMES, NUM_RUNS);
+    run("no SID reads", false);
+    run("OSC3 read per frame", true);
+    return 0;
+}
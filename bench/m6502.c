@@ -0,0 +1,107 @@
+/*
+    m6502.c
+
+    Measures the m6502_tick() throughput on a small loop of loads, ALU
+    instructions, read-modify-write instructions and branches (including
+    the undocumented DCP and SLO instructions, which are common in C64
+    demos and games). The CPU is connected to 64 KBytes of RAM, like in
+    the typical system emulator tick function.
+
+    Build and run from the repository root, once with the N and Z flags
+    in the status register, and once with the NZ flag cache:
+
+        cc -O2 -o m6502 bench/m6502.c && ./m6502
+        cc -O2 -DM6502_NZ_CACHE -o m6502nz bench/m6502.c && ./m6502nz
+
+    Both builds must print the same checksum.
+*/
+#define CHIPS_IMPL
+#include "../chips/m6502.h"
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define NUM_TICKS (200000000)
+#define NUM_RUNS (5)
+
+static uint8_t mem[1<<16];
+
+static const uint8_t prg[] = {
+    0xA2, 0x00,         /* 0200: LDX #00 */
+    0xBD, 0x00, 0x10,   /* 0202: LDA 1000,X */
+    0x18,               /* 0205: CLC */
+    0x65, 0x30,         /* 0206: ADC 30 */
+    0x85, 0x30,         /* 0208: STA 30 */
+    0x5D, 0x00, 0x11,   /* 020A: EOR 1100,X */
+    0x0A,               /* 020D: ASL A */
+    0x26, 0x31,         /* 020E: ROL 31 */
+    0xDF, 0x00, 0x12,   /* 0210: DCP 1200,X (undoc) */
+    0x07, 0x32,         /* 0213: SLO 32 (undoc) */
+    0xE8,               /* 0215: INX */
+    0xD0, 0xEA,         /* 0216: BNE 0202 */
+    0xE6, 0x33,         /* 0218: INC 33 */
+    0x4C, 0x00, 0x02,   /* 021A: JMP 0200 */
+};
+
+static void init(m6502_t* cpu, uint64_t* pins) {
+    memset(mem, 0, sizeof(mem));
+    uint32_t r = 0x12345678;
+    for (int i = 0x1000; i < 0x1300; i++) {
+        r = r * 1103515245 + 12345;
+        mem[i] = (uint8_t)(r >> 16);
+    }
+    memcpy(&mem[0x0200], prg, sizeof(prg));
+    mem[0xFFFC] = 0x00;
+    mem[0xFFFD] = 0x02;
+    m6502_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    *pins = m6502_init(cpu, &desc);
+}
+
+static uint64_t run(m6502_t* cpu, uint64_t pins, uint32_t num_ticks) {
+    for (uint32_t i = 0; i < num_ticks; i++) {
+        pins = m6502_tick(cpu, pins);
+        const uint16_t addr = M6502_GET_ADDR(pins);
+        if (pins & M6502_RW) {
+            M6502_SET_DATA(pins, mem[addr]);
+        }
+        else {
+            mem[addr] = M6502_GET_DATA(pins);
+        }
+    }
+    return pins;
+}
+
+static uint32_t checksum(m6502_t* cpu) {
+    uint32_t sum = (m6502_a(cpu)<<24) | (m6502_x(cpu)<<16) | (m6502_y(cpu)<<8) | m6502_p(cpu);
+    for (int i = 0; i < (1<<16); i++) {
+        sum = (sum << 1 | sum >> 31) ^ mem[i];
+    }
+    return sum;
+}
+
+int main() {
+    #if defined(M6502_NZ_CACHE)
+    printf("m6502_tick() with M6502_NZ_CACHE:\n\n");
+    #else
+    printf("m6502_tick():\n\n");
+    #endif
+    double best_ms = 0.0;
+    uint32_t sum = 0;
+    for (int i = 0; i < NUM_RUNS; i++) {
+        m6502_t cpu;
+        uint64_t pins;
+        init(&cpu, &pins);
+        clock_t start = clock();
+        run(&cpu, pins, NUM_TICKS);
+        double ms = 1000.0 * (double)(clock() - start) / CLOCKS_PER_SEC;
+        if ((0 == i) || (ms < best_ms)) {
+            best_ms = ms;
+        }
+        sum = checksum(&cpu);
+        printf("run %d: %8.2f ms\n", i, ms);
+    }
+    printf("\nbest: %.2f ms for %d ticks (%.1f MHz)\n", best_ms, NUM_TICKS, NUM_TICKS / (best_ms * 1000.0));
+    printf("checksum: %08X\n", sum);
+    return 0;
+}
@@ -0,0 +1,212 @@
+/*
+    multicpu.c
+
+    Compares fixed time-slice interleaving of two Z80 boards (as previously
+    used in bombjack.h) with the timestamped command queue in chips/syncq.h.
+
+    The 'main board' (4 MHz) writes an incrementing command byte to a
+    shared latch every few hundred ticks, the 'sound board' (3 MHz) polls
+    the latch, stores each received command in RAM and clears the latch
+    by reading it (like the Bomb Jack sound board). The benchmark reports
+    the run time, the number of z80_exec() calls (CPU switches), and how
+    many commands arrived at the sound board compared to a reference run
+    which switches CPUs after every instruction.
+
+    Build and run from the repository root:
+
+        cc -O2 -o multicpu bench/multicpu.c && ./multicpu
+*/
+#define CHIPS_IMPL
+/* the main board writes about 80 commands per frame */
+#define SYNCQ_MAX_EVENTS (256)
+#include "../chips/z80.h"
+#include "../chips/clk.h"
+#include "../chips/syncq.h"
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define MAIN_FREQ (4000000)
+#define SOUND_FREQ (3000000)
+#define FRAME_US (16667)
+#define NUM_FRAMES (600)
+
+typedef struct {
+    z80_t main_cpu;
+    z80_t sound_cpu;
+    clk_t main_clk;
+    clk_t sound_clk;
+    uint64_t main_ticks;
+    uint64_t sound_ticks;
+    bool use_syncq;
+    syncq_t syncq;
+    uint8_t latch;
+    uint8_t main_mem[1<<16];
+    uint8_t sound_mem[1<<16];
+    uint32_t num_received;
+    uint32_t num_exec_calls;
+} boards_t;
+
+static uint64_t main_tick(int num_ticks, uint64_t pins, void* user_data) {
+    boards_t* b = (boards_t*) user_data;
+    b->main_ticks += num_ticks;
+    const uint16_t addr = Z80_GET_ADDR(pins);
+    if (pins & Z80_MREQ) {
+        if (pins & Z80_RD) {
+            Z80_SET_DATA(pins, b->main_mem[addr]);
+        }
+        else if (pins & Z80_WR) {
+            if (addr == 0xB800) {
+                if (b->use_syncq) {
+                    syncq_push(&b->syncq, b->main_ticks, Z80_GET_DATA(pins));
+                }
+                else {
+                    b->latch = Z80_GET_DATA(pins);
+                }
+            }
+            else {
+                b->main_mem[addr] = Z80_GET_DATA(pins);
+            }
+        }
+    }
+    return pins & Z80_PIN_MASK;
+}
+
+static uint64_t sound_tick(int num_ticks, uint64_t pins, void* user_data) {
+    boards_t* b = (boards_t*) user_data;
+    b->sound_ticks += num_ticks;
+    const uint16_t addr = Z80_GET_ADDR(pins);
+    if (pins & Z80_MREQ) {
+        if (pins & Z80_RD) {
+            if (addr == 0x6000) {
+                if (b->use_syncq) {
+                    uint32_t cmd;
+                    while (syncq_pop(&b->syncq, b->sound_ticks, &cmd)) {
+                        b->latch = (uint8_t) cmd;
+                    }
+                }
+                Z80_SET_DATA(pins, b->latch);
+                b->latch = 0;
+            }
+            else {
+                Z80_SET_DATA(pins, b->sound_mem[addr]);
+            }
+        }
+        else if (pins & Z80_WR) {
+            b->sound_mem[addr] = Z80_GET_DATA(pins);
+            b->num_received++;
+        }
+    }
+    return pins & Z80_PIN_MASK;
+}
+
+static void init(boards_t* b, bool use_syncq) {
+    memset(b, 0, sizeof(boards_t));
+    b->use_syncq = use_syncq;
+    /* main board: write incrementing (non-zero) command bytes to latch at B800 */
+    static const uint8_t main_prg[] = {
+        0x3E, 0x00,         /* 0000: LD A,0 */
+        0x3C,               /* 0002: INC A */
+        0x28, 0xFD,         /* 0003: JR Z,0002 */
+        0x32, 0x00, 0xB8,   /* 0005: LD (B800),A */
+        0x06, 0x40,         /* 0008: LD B,40h */
+        0x10, 0xFE,         /* 000A: DJNZ 000A */
+        0x18, 0xF4,         /* 000C: JR 0002 */
+    };
+    /* sound board: poll latch at 6000, store received commands at 4000.. */
+    static const uint8_t sound_prg[] = {
+        0x21, 0x00, 0x40,   /* 0000: LD HL,4000 */
+        0x3A, 0x00, 0x60,   /* 0003: LD A,(6000) */
+        0xB7,               /* 0006: OR A */
+        0x28, 0xFA,         /* 0007: JR Z,0003 */
+        0x77,               /* 0009: LD (HL),A */
+        0x2C,               /* 000A: INC L */
+        0x18, 0xF6,         /* 000B: JR 0003 */
+    };
+    memcpy(b->main_mem, main_prg, sizeof(main_prg));
+    memcpy(b->sound_mem, sound_prg, sizeof(sound_prg));
+    z80_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.user_data = b;
+    desc.tick_cb = main_tick;
+    z80_init(&b->main_cpu, &desc);
+    desc.tick_cb = sound_tick;
+    z80_init(&b->sound_cpu, &desc);
+    clk_init(&b->main_clk, MAIN_FREQ);
+    clk_init(&b->sound_clk, SOUND_FREQ);
+    syncq_init(&b->syncq, &(syncq_desc_t){ .src_freq_hz = MAIN_FREQ, .dst_freq_hz = SOUND_FREQ });
+}
+
+static void exec_slice(boards_t* b, z80_t* cpu, clk_t* clk, uint32_t us) {
+    uint32_t ticks_to_run = clk_ticks_to_run(clk, us);
+    clk_ticks_executed(clk, z80_exec(cpu, ticks_to_run));
+    b->num_exec_calls++;
+}
+
+/* run both boards interleaved in fixed slices per frame */
+static void run_fixed(boards_t* b, int num_slices) {
+    for (int frame = 0; frame < NUM_FRAMES; frame++) {
+        for (int i = 0; i < num_slices; i++) {
+            exec_slice(b, &b->main_cpu, &b->main_clk, FRAME_US / num_slices);
+            exec_slice(b, &b->sound_cpu, &b->sound_clk, FRAME_US / num_slices);
+        }
+    }
+}
+
+/* run each board for a whole frame, commands are passed through the syncq */
+static void run_syncq(boards_t* b) {
+    for (int frame = 0; frame < NUM_FRAMES; frame++) {
+        exec_slice(b, &b->main_cpu, &b->main_clk, FRAME_US);
+        exec_slice(b, &b->sound_cpu, &b->sound_clk, FRAME_US);
+    }
+}
+
+/* reference: switch boards after each instruction, keeping both clocks in step */
+static void run_reference(boards_t* b) {
+    const uint64_t end_ticks = ((uint64_t)MAIN_FREQ * FRAME_US * NUM_FRAMES) / 1000000;
+    while (b->main_ticks < end_ticks) {
+        if ((b->main_ticks * SOUND_FREQ) <= (b->sound_ticks * MAIN_FREQ)) {
+            z80_exec(&b->main_cpu, 1);
+        }
+        else {
+            z80_exec(&b->sound_cpu, 1);
+        }
+        b->num_exec_calls++;
+    }
+}
+
+static boards_t boards;
+
+static void report(const char* name, clock_t start, uint32_t ref_received) {
+    double ms = 1000.0 * (double)(clock() - start) / CLOCKS_PER_SEC;
+    printf("%-24s %8.2f ms  %8u exec calls  %6u/%u commands received\n",
+        name, ms, boards.num_exec_calls, boards.num_received, ref_received);
+}
+
+int main() {
+    clock_t start;
+    printf("%d frames of emulated time:\n\n", NUM_FRAMES);
+
+    init(&boards, false);
+    start = clock();
+    run_reference(&boards);
+    const uint32_t ref_received = boards.num_received;
+    report("reference (per instr)", start, ref_received);
+
+    const int slices[] = { 2, 16, 64 };
+    for (int i = 0; i < 3; i++) {
+        char name[32];
+        snprintf(name, sizeof(name), "fixed %d slices/frame", slices[i]);
+        init(&boards, false);
+        start = clock();
+        run_fixed(&boards, slices[i]);
+        report(name, start, ref_received);
+    }
+
+    init(&boards, true);
+    start = clock();
+    run_syncq(&boards);
+    report("syncq 1 slice/frame", start, ref_received);
+    printf("\nsyncq conflicts: %u, overflows: %u\n", boards.syncq.num_conflicts, boards.syncq.num_overflows);
+    return 0;
+}
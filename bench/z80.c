@@ -0,0 +1,126 @@
+/*
+    z80.c
+
+    Measures the z80_exec() throughput on a loop of 8-bit loads and ALU
+    instructions, (HL) and (IX+d) accesses, CB-prefixed shifts, 16-bit
+    arithmetic, PUSH/POP, EX DE,HL and EXX. The CPU is connected to 64
+    KBytes of RAM, like in the typical system emulator tick callback.
+
+    This is mainly used to compare the register representations of the
+    code generator (see codegen/README.txt): the default core keeps the
+    registers in 64-bit register banks, the alternative core generated
+    with '--regs locals' keeps them in separate 8- and 16-bit local
+    variables. Build and run from the repository root:
+
+        cc -O2 -o z80 bench/z80.c && ./z80
+        cd codegen && python z80_gen.py --regs locals -o ../bench/z80_locals.h && cd ..
+        cc -O2 -DZ80_HEADER='"z80_locals.h"' -o z80l bench/z80.c && ./z80l
+
+    Both builds must print the same checksum.
+*/
+#define CHIPS_IMPL
+#if !defined(Z80_HEADER)
+#define Z80_HEADER "../chips/z80.h"
+#endif
+#include Z80_HEADER
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define NUM_TICKS (200000000)
+#define NUM_TICKS_PER_EXEC (70000)
+#define NUM_RUNS (5)
+
+static uint8_t mem[1<<16];
+
+static const uint8_t prg[] = {
+    0xDD, 0x21, 0x00, 0x40, /* 0100: LD IX,4000 */
+    0x21, 0x00, 0x50,       /* 0104: LD HL,5000 */
+    0x06, 0x40,             /* 0107: LD B,40 */
+    0x7E,                   /* 0109: LD A,(HL) */
+    0xDD, 0x86, 0x01,       /* 010A: ADD A,(IX+1) */
+    0xDD, 0x77, 0x02,       /* 010D: LD (IX+2),A */
+    0xA9,                   /* 0110: XOR C */
+    0x4F,                   /* 0111: LD C,A */
+    0xCB, 0x06,             /* 0112: RLC (HL) */
+    0xCB, 0x3A,             /* 0114: SRL D */
+    0x8B,                   /* 0116: ADC A,E */
+    0x5F,                   /* 0117: LD E,A */
+    0xC5,                   /* 0118: PUSH BC */
+    0xEB,                   /* 0119: EX DE,HL */
+    0x19,                   /* 011A: ADD HL,DE */
+    0xEB,                   /* 011B: EX DE,HL */
+    0xC1,                   /* 011C: POP BC */
+    0x23,                   /* 011D: INC HL */
+    0xDD, 0x23,             /* 011E: INC IX */
+    0x10, 0xE7,             /* 0120: DJNZ 0109 */
+    0x27,                   /* 0122: DAA */
+    0xD9,                   /* 0123: EXX */
+    0x04,                   /* 0124: INC B */
+    0xD9,                   /* 0125: EXX */
+    0x18, 0xD8,             /* 0126: JR 0100 */
+};
+
+static uint64_t tick(int num_ticks, uint64_t pins, void* user_data) {
+    (void)num_ticks; (void)user_data;
+    if (pins & Z80_MREQ) {
+        const uint16_t addr = Z80_GET_ADDR(pins);
+        if (pins & Z80_RD) {
+            Z80_SET_DATA(pins, mem[addr]);
+        }
+        else if (pins & Z80_WR) {
+            mem[addr] = Z80_GET_DATA(pins);
+        }
+    }
+    return pins;
+}
+
+static void init(z80_t* cpu) {
+    memset(mem, 0, sizeof(mem));
+    uint32_t r = 0x12345678;
+    for (int i = 0x4000; i < 0x5100; i++) {
+        r = r * 1103515245 + 12345;
+        mem[i] = (uint8_t)(r >> 16);
+    }
+    memcpy(&mem[0x0100], prg, sizeof(prg));
+    z80_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.tick_cb = tick;
+    z80_init(cpu, &desc);
+    z80_set_pc(cpu, 0x0100);
+    z80_set_sp(cpu, 0xF000);
+}
+
+static uint32_t checksum(z80_t* cpu) {
+    uint32_t sum = (z80_af(cpu)<<16) | z80_bc(cpu);
+    sum ^= (z80_de(cpu)<<16) | z80_hl(cpu);
+    sum ^= (z80_ix(cpu)<<16) | z80_bc_(cpu);
+    for (int i = 0; i < (1<<16); i++) {
+        sum = (sum << 1 | sum >> 31) ^ mem[i];
+    }
+    return sum;
+}
+
+int main() {
+    printf("z80_exec() with %s:\n\n", Z80_HEADER);
+    double best_ms = 0.0;
+    uint32_t sum = 0;
+    for (int i = 0; i < NUM_RUNS; i++) {
+        z80_t cpu;
+        init(&cpu);
+        clock_t start = clock();
+        uint32_t ticks = 0;
+        while (ticks < NUM_TICKS) {
+            ticks += z80_exec(&cpu, NUM_TICKS_PER_EXEC);
+        }
+        double ms = 1000.0 * (double)(clock() - start) / CLOCKS_PER_SEC;
+        if ((0 == i) || (ms < best_ms)) {
+            best_ms = ms;
+        }
+        sum = checksum(&cpu);
+        printf("run %d: %8.2f ms\n", i, ms);
+    }
+    printf("\nbest: %.2f ms for %d ticks (%.1f MHz)\n", best_ms, NUM_TICKS, NUM_TICKS / (best_ms * 1000.0));
+    printf("checksum: %08X\n", sum);
+    return 0;
+}
@@ -0,0 +1,139 @@
+/*
+    z80alu.c
+
+    Compares the two flag computations of the 8-bit ADD, ADC, SUB, SBC,
+    CP, NEG and DAA instructions in the Z80 code generator: bit arithmetic
+    (the default), and lookup tables (z80_gen.py --alu-flags table), which
+    need 2 * 128 KBytes for the add and subtract flags and 4 KBytes for DAA.
+
+    Two workloads are measured:
+
+    - bcd: a BCD score counter (ADD/ADC followed by DAA), which only
+      touches a few cache lines of the tables
+    - random: ADD, ADC, SUB, SBC and CP on random operands, which spread
+      the lookups over the whole tables and compete with the emulated
+      memory for the CPU caches
+
+    Build and run from the repository root:
+
+        cc -O2 -o z80alu bench/z80alu.c && ./z80alu
+        cd codegen && python z80_gen.py --alu-flags table -o ../bench/z80_table.h && cd ..
+        cc -O2 -DZ80_HEADER='"z80_table.h"' -o z80alut bench/z80alu.c && ./z80alut
+
+    Both builds must print the same checksums.
+*/
+#define CHIPS_IMPL
+#if !defined(Z80_HEADER)
+#define Z80_HEADER "../chips/z80.h"
+#endif
+#include Z80_HEADER
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define NUM_TICKS (100000000)
+#define NUM_TICKS_PER_EXEC (70000)
+#define NUM_RUNS (5)
+
+static uint8_t mem[1<<16];
+
+static const uint8_t bcd_prg[] = {
+    0x21, 0x02, 0x40,   /* 0100: LD HL,4002 */
+    0x7E,               /* 0103: LD A,(HL) */
+    0xC6, 0x25,         /* 0104: ADD A,25 */
+    0x27,               /* 0106: DAA */
+    0x77,               /* 0107: LD (HL),A */
+    0x2B,               /* 0108: DEC HL */
+    0x7E,               /* 0109: LD A,(HL) */
+    0xCE, 0x01,         /* 010A: ADC A,01 */
+    0x27,               /* 010C: DAA */
+    0x77,               /* 010D: LD (HL),A */
+    0x2B,               /* 010E: DEC HL */
+    0x7E,               /* 010F: LD A,(HL) */
+    0xCE, 0x00,         /* 0110: ADC A,00 */
+    0x27,               /* 0112: DAA */
+    0x77,               /* 0113: LD (HL),A */
+    0x18, 0xEA,         /* 0114: JR 0100 */
+};
+
+static const uint8_t random_prg[] = {
+    0x21, 0x00, 0x50,   /* 0100: LD HL,5000 */
+    0x06, 0x00,         /* 0103: LD B,00 */
+    0x86,               /* 0105: ADD A,(HL) */
+    0x23,               /* 0106: INC HL */
+    0x9E,               /* 0107: SBC A,(HL) */
+    0x23,               /* 0108: INC HL */
+    0xBE,               /* 0109: CP (HL) */
+    0x8E,               /* 010A: ADC A,(HL) */
+    0x23,               /* 010B: INC HL */
+    0x96,               /* 010C: SUB (HL) */
+    0x23,               /* 010D: INC HL */
+    0x10, 0xF5,         /* 010E: DJNZ 0105 */
+    0x18, 0xEE,         /* 0110: JR 0100 */
+};
+
+static uint64_t tick(int num_ticks, uint64_t pins, void* user_data) {
+    (void)num_ticks; (void)user_data;
+    if (pins & Z80_MREQ) {
+        const uint16_t addr = Z80_GET_ADDR(pins);
+        if (pins & Z80_RD) {
+            Z80_SET_DATA(pins, mem[addr]);
+        }
+        else if (pins & Z80_WR) {
+            mem[addr] = Z80_GET_DATA(pins);
+        }
+    }
+    return pins;
+}
+
+static void init(z80_t* cpu, const uint8_t* prg, size_t prg_size) {
+    memset(mem, 0, sizeof(mem));
+    uint32_t r = 0x12345678;
+    for (int i = 0x5000; i < 0x5400; i++) {
+        r = r * 1103515245 + 12345;
+        mem[i] = (uint8_t)(r >> 16);
+    }
+    memcpy(&mem[0x0100], prg, prg_size);
+    z80_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.tick_cb = tick;
+    z80_init(cpu, &desc);
+    z80_set_pc(cpu, 0x0100);
+    z80_set_sp(cpu, 0xF000);
+}
+
+static uint32_t checksum(z80_t* cpu) {
+    uint32_t sum = (z80_af(cpu)<<16) | z80_hl(cpu);
+    for (int i = 0; i < (1<<16); i++) {
+        sum = (sum << 1 | sum >> 31) ^ mem[i];
+    }
+    return sum;
+}
+
+static void run(const char* name, const uint8_t* prg, size_t prg_size) {
+    double best_ms = 0.0;
+    uint32_t sum = 0;
+    for (int i = 0; i < NUM_RUNS; i++) {
+        z80_t cpu;
+        init(&cpu, prg, prg_size);
+        clock_t start = clock();
+        uint32_t ticks = 0;
+        while (ticks < NUM_TICKS) {
+            ticks += z80_exec(&cpu, NUM_TICKS_PER_EXEC);
+        }
+        double ms = 1000.0 * (double)(clock() - start) / CLOCKS_PER_SEC;
+        if ((0 == i) || (ms < best_ms)) {
+            best_ms = ms;
+        }
+        sum = checksum(&cpu);
+    }
+    printf("%-8s best: %8.2f ms for %d ticks (%.1f MHz), checksum: %08X\n",
+        name, best_ms, NUM_TICKS, NUM_TICKS / (best_ms * 1000.0), sum);
+}
+
+int main() {
+    printf("z80_exec() with %s:\n\n", Z80_HEADER);
+    run("bcd", bcd_prg, sizeof(bcd_prg));
+    run("random", random_prg, sizeof(random_prg));
+    return 0;
+}
@@ -43,6 +43,24 @@
     ## Notes
     (TODO)
 
+    ## Pixel Decoding
+
+    Video memory bytes are converted to RGBA8 pixels through lookup tables
+    keyed by video mode and byte value, each entry holds the 8 framebuffer
+    pixels (2, 4 or 8 distinct pixels) of one byte with the current ink
+    colors already resolved. Table entries are refreshed lazily when a byte
+    value is first used after an ink color change, so that a palette write
+    only costs a counter increment (this keeps raster-bar effects which
+    change colors on every scanline cheap).
+
+    ## Headless Mode
+
+    If am40010_t.headless is set to true, the video signal generator
+    doesn't write pixels into the framebuffer, but the CRT beam position,
+    HSYNC/VSYNC processing, interrupt generation and CPU wait states work
+    exactly as with video output enabled. The flag can be toggled at
+    any time.
+
     ## Links
     
     TODO
@@ -182,6 +200,13 @@ typedef struct am40010_colors_t {
     uint32_t hw_rgba8[32];          /* the hardware color RGBA8 values */
 } am40010_colors_t;
 
+/* pixel lookup tables, 8 RGBA8 pixels per (video mode, byte value) */
+typedef struct am40010_pixel_lut_t {
+    uint32_t gen;                       /* bumped when the ink colors change */
+    uint32_t entry_gen[3][256];         /* an entry is valid if entry_gen == gen */
+    uint32_t rgba8[3][256][8];
+} am40010_pixel_lut_t;
+
 /* vsync/video/irq generation */
 typedef struct am40010_video_t {
     int hscount;        /* 5-bit counter updated at HSYNC falling edge */
@@ -209,6 +234,7 @@ typedef struct am40010_crt_t {
 /* AM40010 state */
 typedef struct am40010_t {
     bool dbg_vis;               /* debug visualization currently enabled? */
+    bool headless;              /* if true, don't write pixels into the framebuffer */
     am40010_cpc_type_t cpc_type;
     uint32_t seq_tick_count;    /* gate array sequencer ticks */
     uint64_t crtc_pins;         /* previous crtc pins */
@@ -218,6 +244,7 @@ typedef struct am40010_t {
     am40010_video_t video;
     am40010_crt_t crt;
     am40010_colors_t colors;
+    am40010_pixel_lut_t lut;
     am40010_bankswitch_t bankswitch_cb;
     am40010_cclk_t cclk_cb;
     const uint8_t* ram;
@@ -248,6 +275,11 @@ void am40010_iorq(am40010_t* ga, uint64_t cpu_pins);
 */
 uint64_t am40010_tick(am40010_t* ga, int num_ticks, uint64_t cpu_pins);
 
+/* clear host pointers in a snapshot before saving */
+void am40010_snapshot_onsave(am40010_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void am40010_snapshot_onload(am40010_t* snapshot, am40010_t* sys);
+
 #ifdef __cplusplus
 } /* extern "C" */
 #endif
@@ -374,6 +406,7 @@ void am40010_init(am40010_t* ga, const am40010_desc_t* desc) {
     _am40010_init_video(ga);
     _am40010_init_crt(ga);
     _am40010_init_colors(ga);
+    ga->lut.gen = 1;
     ga->bankswitch_cb(ga->ram_config, ga->regs.config, ga->rom_select, ga->user_data);
 }
 
@@ -640,24 +673,11 @@ static inline uint64_t _am40010_do_tick(am40010_t* ga, bool int_ack, uint64_t pi
     return pins;
 }
 
-static void _am40010_decode_pixels(am40010_t* ga, uint32_t* dst, uint64_t crtc_pins) {
-    /*
-         compute the source address from current CRTC ma (memory address)
-         and ra (raster address) like this:
-    
-         |ma13|ma12|ra2|ra1|ra0|ma9|ma8|ma7|ma6|ma5|ma4|ma3|ma2|ma1|ma0|0|
-    
-        Bits ma13 and m12 point to the 16 KByte page, and all
-        other bits are the index into that page.
-    */
-    const uint16_t addr = ((crtc_pins & 0x3000) << 2) |     /* MA13,MA12 */
-                          ((crtc_pins & 0x3FF) << 1) |      /* MA9..MA0 */
-                          (((crtc_pins>>48) & 7) << 11);    /* RA0..RA2 */
-    const uint8_t* src = &(ga->ram[addr]);
-    uint8_t c;
-    uint32_t p;
+/* resolve the 8 framebuffer pixels of a video memory byte into a lookup table entry */
+static void _am40010_fill_lut_entry(am40010_t* ga, uint32_t* dst, uint8_t mode, uint8_t c) {
     const uint32_t* ink = ga->colors.ink_rgba8;
-    switch (ga->video.mode) {
+    uint32_t p;
+    switch (mode) {
         case 0:
             /*
                 160x200 @ 16 colors (2 pixels per byte)
@@ -665,13 +685,10 @@ static void _am40010_decode_pixels(am40010_t* ga, uint32_t* dst, uint64_t crtc_p
                 0:       |1|5|3|7|
                 1:       |0|4|2|6|
             */
-            for (int i = 0; i < 2; i++) {
-                c = *src++;
-                p = ink[((c>>7)&0x1)|((c>>2)&0x2)|((c>>3)&0x4)|((c<<2)&0x8)];
-                *dst++ = p; *dst++ = p; *dst++ = p; *dst++ = p;
-                p = ink[((c>>6)&0x1)|((c>>1)&0x2)|((c>>2)&0x4)|((c<<3)&0x8)];
-                *dst++ = p; *dst++ = p; *dst++ = p; *dst++ = p;
-            }
+            p = ink[((c>>7)&0x1)|((c>>2)&0x2)|((c>>3)&0x4)|((c<<2)&0x8)];
+            *dst++ = p; *dst++ = p; *dst++ = p; *dst++ = p;
+            p = ink[((c>>6)&0x1)|((c>>1)&0x2)|((c>>2)&0x4)|((c<<3)&0x8)];
+            *dst++ = p; *dst++ = p; *dst++ = p; *dst++ = p;
             break;
         case 1:
             /*
@@ -682,31 +699,71 @@ static void _am40010_decode_pixels(am40010_t* ga, uint32_t* dst, uint64_t crtc_p
                 2:       |1|5|
                 3:       |0|4|
             */
-            for (int i = 0; i < 2; i++) {
-                c = *src++;
-                p = ink[((c>>2)&2)|((c>>7)&1)];
-                *dst++ = p; *dst++ = p;
-                p = ink[((c>>1)&2)|((c>>6)&1)];
-                *dst++ = p; *dst++ = p;
-                p = ink[((c>>0)&2)|((c>>5)&1)];
-                *dst++ = p; *dst++ = p;
-                p = ink[((c<<1)&2)|((c>>4)&1)];
-                *dst++ = p; *dst++ = p;
-            }
+            p = ink[((c>>2)&2)|((c>>7)&1)];
+            *dst++ = p; *dst++ = p;
+            p = ink[((c>>1)&2)|((c>>6)&1)];
+            *dst++ = p; *dst++ = p;
+            p = ink[((c>>0)&2)|((c>>5)&1)];
+            *dst++ = p; *dst++ = p;
+            p = ink[((c<<1)&2)|((c>>4)&1)];
+            *dst++ = p; *dst++ = p;
             break;
-        case 2:
+        default:
             /* 640x200 @ 2 colors (8 pixels per byte) */
-            for (int i = 0; i < 2; i++) {
-                c = *src++;
-                for (int j = 7; j >= 0; j--) {
-                    *dst++ = ink[(c>>j)&1];
-                }
+            for (int j = 7; j >= 0; j--) {
+                *dst++ = ink[(c>>j)&1];
             }
             break;
-        /* FIXME: undocumented mode 3 (not on KC Compact) */
     }
 }
 
+/* lookup the 8 framebuffer pixels of a video memory byte, refresh the entry if stale */
+static inline const uint32_t* _am40010_lut(am40010_t* ga, uint8_t mode, uint8_t c) {
+    uint32_t* entry = ga->lut.rgba8[mode][c];
+    if (ga->lut.entry_gen[mode][c] != ga->lut.gen) {
+        ga->lut.entry_gen[mode][c] = ga->lut.gen;
+        _am40010_fill_lut_entry(ga, entry, mode, c);
+    }
+    return entry;
+}
+
+/* invalidate all lookup table entries (called when the ink colors change) */
+static inline void _am40010_lut_invalidate(am40010_t* ga) {
+    if (++ga->lut.gen == 0) {
+        /* wrap-around, start over */
+        memset(ga->lut.entry_gen, 0, sizeof(ga->lut.entry_gen));
+        ga->lut.gen = 1;
+    }
+}
+
+/* decode a run of video memory bytes into the framebuffer */
+static void _am40010_decode_bytes(am40010_t* ga, uint32_t* dst, uint8_t mode, const uint8_t* src, int num) {
+    /* FIXME: undocumented mode 3 (not on KC Compact) */
+    if (mode < 3) {
+        for (int i = 0; i < num; i++, dst += 8) {
+            const uint32_t* p = _am40010_lut(ga, mode, src[i]);
+            dst[0] = p[0]; dst[1] = p[1]; dst[2] = p[2]; dst[3] = p[3];
+            dst[4] = p[4]; dst[5] = p[5]; dst[6] = p[6]; dst[7] = p[7];
+        }
+    }
+}
+
+/* compute the video memory address from the CRTC pins */
+static inline uint16_t _am40010_video_addr(uint64_t crtc_pins) {
+    /*
+         compute the source address from current CRTC ma (memory address)
+         and ra (raster address) like this:
+    
+         |ma13|ma12|ra2|ra1|ra0|ma9|ma8|ma7|ma6|ma5|ma4|ma3|ma2|ma1|ma0|0|
+    
+        Bits ma13 and m12 point to the 16 KByte page, and all
+        other bits are the index into that page.
+    */
+    return ((crtc_pins & 0x3000) << 2) |     /* MA13,MA12 */
+           ((crtc_pins & 0x3FF) << 1) |      /* MA9..MA0 */
+           (((crtc_pins>>48) & 7) << 11);    /* RA0..RA2 */
+}
+
 /* video signal generator, call this at 1 MHz frequency */
 static void _am40010_decode_video(am40010_t* ga, uint64_t crtc_pins) {
     if (ga->dbg_vis) {
@@ -729,7 +786,7 @@ static void _am40010_decode_video(am40010_t* ga, uint64_t crtc_pins) {
             }
             uint32_t c = (0xFF<<24) | (b<<16) | (g<<8) | r;
             if (crtc_pins & AM40010_DE) {
-                _am40010_decode_pixels(ga, dst, crtc_pins);
+                _am40010_decode_bytes(ga, dst, ga->video.mode, &(ga->ram[_am40010_video_addr(crtc_pins)]), 2);
                 for (int i = 0; i < 16; i++) {
                     dst[i] = (i & 1) ? dst[i] : c;
                 }
@@ -747,7 +804,7 @@ static void _am40010_decode_video(am40010_t* ga, uint64_t crtc_pins) {
         bool black = ga->video.sync;
         uint32_t* dst = &ga->rgba8_buffer[dst_x + dst_y * AM40010_DISPLAY_WIDTH];
         if (crtc_pins & AM40010_DE) {
-            _am40010_decode_pixels(ga, dst, crtc_pins);
+            _am40010_decode_bytes(ga, dst, ga->video.mode, &(ga->ram[_am40010_video_addr(crtc_pins)]), 2);
         }
         else if (black) {
             for (int i = 0; i < 16; i++) {
@@ -766,6 +823,7 @@ static void _am40010_decode_video(am40010_t* ga, uint64_t crtc_pins) {
 /* make the selected colors visible by updating the color cache */
 static inline void _am40010_update_colors(am40010_t* ga) {
     if (ga->colors.dirty) {
+        _am40010_lut_invalidate(ga);
         ga->colors.dirty = false;
         ga->colors.border_rgba8 = ga->colors.hw_rgba8[ga->regs.border];
         for (int i = 0; i < 16; i++) {
@@ -776,10 +834,12 @@ static inline void _am40010_update_colors(am40010_t* ga) {
 
 /* the actions which need to happen on CCLK (1 MHz frequency) */
 static inline void _am40010_do_cclk(am40010_t* ga, uint64_t crtc_pins) {
-    _am40010_update_colors(ga);
     bool sync = _am40010_sync_irq(ga, crtc_pins);
     _am40010_crt_tick(ga, sync);
-    _am40010_decode_video(ga, crtc_pins);
+    if (!ga->headless) {
+        _am40010_update_colors(ga);
+        _am40010_decode_video(ga, crtc_pins);
+    }
 }
 
 /* determine at which cycle of the current machine cycle the
@@ -863,4 +923,23 @@ uint64_t am40010_tick(am40010_t* ga, int num_ticks, uint64_t pins) {
     ga->pins = pins | ((AM40010_DE|AM40010_HS|AM40010_VS) & ga->crtc_pins);
     return pins;
 }
+
+void am40010_snapshot_onsave(am40010_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->bankswitch_cb = 0;
+    snapshot->cclk_cb = 0;
+    snapshot->ram = 0;
+    snapshot->rgba8_buffer = 0;
+    snapshot->user_data = 0;
+}
+
+void am40010_snapshot_onload(am40010_t* snapshot, am40010_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->bankswitch_cb = sys->bankswitch_cb;
+    snapshot->cclk_cb = sys->cclk_cb;
+    snapshot->ram = sys->ram;
+    snapshot->rgba8_buffer = sys->rgba8_buffer;
+    snapshot->user_data = sys->user_data;
+}
+
 #endif /* CHIPS_IMPL */
@@ -33,6 +33,77 @@
       a CP1610 CPU
     - the RESET pin state is ignored, instead call ay38910_reset()
 
+    BLOCK RENDERING:
+
+    Instead of calling ay38910_tick() once per tick, you can also advance
+    the chip by a whole span of ticks between register accesses with:
+
+        int ay38910_render(ay38910_t* ay, uint32_t num_ticks, float* out_samples)
+
+    This advances the tone, noise and envelope generators with closed-form
+    period arithmetic up to the next sample point, writes all samples
+    generated in the span to out_samples (which must have room for
+    num_ticks samples, or be a null pointer if only the last generated
+    sample in ay38910_t.sample is needed), and returns the number of
+    generated samples. The output is bit-identical with calling
+    ay38910_tick() num_ticks times. In deferred synthesis mode (see
+    below), the ticks are only recorded and no samples are generated.
+
+    DEFERRED SYNTHESIS:
+
+    If ay38910_desc_t.deferred is true, the sound synthesis can be moved
+    to another thread. In this mode, ay38910_tick() and ay38910_render()
+    only count the elapsed ticks, and writes to the sound generator
+    registers (0..13) are recorded in a timestamped log. The ay38910_t
+    instance contains two logs, one is filled by the emulation, the other
+    is owned by the synthesis. On the emulation thread, call:
+
+        ay38910_log_t* ay38910_log_swap(ay38910_t* ay)
+
+    ...to finish the log which has been filled since the last call, start
+    filling the other log, and get the finished log. The finished log is
+    synthesized on a separate ay38910_t instance which has been initialized
+    with the same ay38910_desc_t (but with deferred set to false and
+    without port callbacks):
+
+        int ay38910_synth(ay38910_t* synth, ay38910_log_t* log, float* out_samples, int max_samples)
+
+    This writes at most max_samples samples to out_samples and returns the
+    number of samples written, call it repeatedly until
+    ay38910_synth_pending(log) returns false. The generated samples are
+    bit-identical with the inline synthesis. ay38910_synth() doesn't access
+    the deferred ay38910_t instance, so it can run on another thread, as
+    long as the synthesis of a log has finished before the next call to
+    ay38910_log_swap() (the synchronization is up to the host application,
+    the headers don't contain any threading code).
+
+    Register reads and the IO ports only depend on the register bank, which
+    is still updated immediately by ay38910_iorq() in deferred mode, so
+    register accesses never need to wait for the synthesis.
+
+    The logs are allocated on the heap when the first register write is
+    logged. A log starts with room for AY38910_LOG_WRITES register writes,
+    and doubles its size when it is full, so no register write is ever
+    dropped. Only the log which is filled by the emulation is resized,
+    never the log owned by the synthesis. Call ay38910_discard() to free
+    the logs.
+
+    The logs are not part of a snapshot. ay38910_snapshot_onsave() takes
+    the saved copy of the synthesis instance (or a null pointer if the
+    instance isn't deferred), synthesizes the pending parts of both logs
+    on it (without output), and clears the logs in the saved copy.
+    ay38910_snapshot_onload() keeps the log memory of the running instance.
+    ay38910_synth() must not run while a snapshot is saved or loaded.
+
+    HEADLESS MODE:
+
+    If ay38910_t.headless is set to true, the tone, noise and envelope
+    generators keep running (so that the chip state is identical), but
+    no output samples are computed. ay38910_render() and ay38910_synth()
+    advance whole spans in one step and return 0 generated samples,
+    ay38910_tick() still signals when a sample would be ready, but
+    ay38910_t.sample isn't updated. The flag can be toggled at any time.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -134,6 +205,8 @@ extern "C" {
 #define AY38910_NUM_CHANNELS (3)
 /* DC adjustment buffer length */
 #define AY38910_DCADJ_BUFLEN (512)
+/* initial number of register writes in a deferred synthesis log (grows when needed) */
+#define AY38910_LOG_WRITES (1024)
 
 /* IO port names */
 #define AY38910_PORT_A (0)
@@ -165,6 +238,7 @@ typedef struct {
     ay38910_in_t in_cb;     /* I/O port input callback */
     ay38910_out_t out_cb;   /* I/O port output callback */
     void* user_data;        /* optional user-data for callbacks */
+    bool deferred;          /* if true, only log register writes for ay38910_synth() */
 } ay38910_desc_t;
 
 /* a tone channel */
@@ -194,6 +268,23 @@ typedef struct {
     uint8_t shape_state;
 } ay38910_env_t;
 
+/* a logged register write for deferred synthesis */
+typedef struct {
+    uint32_t tick;      /* number of ticks before the write happened */
+    uint8_t reg;
+    uint8_t data;
+} ay38910_write_t;
+
+/* a deferred synthesis log, see ay38910_log_swap() */
+typedef struct {
+    uint32_t num_ticks;     /* number of ticks in the log */
+    uint32_t num_writes;    /* number of register writes in the log */
+    uint32_t max_writes;    /* number of register writes the log has room for */
+    uint32_t synth_pos;     /* number of ticks already synthesized */
+    uint32_t write_pos;     /* index of next register write to synthesize */
+    ay38910_write_t* writes;    /* heap-allocated, grows when full */
+} ay38910_log_t;
+
 /* AY-3-8910 state */
 typedef struct {
     ay38910_type_t type;        /* the chip flavour */
@@ -233,9 +324,15 @@ typedef struct {
     int sample_counter;
     float mag;
     float sample;
+    bool headless;              /* if true, skip sample generation */
     float dcadj_sum;
     uint32_t dcadj_pos;
     float dcadj_buf[AY38910_DCADJ_BUFLEN];
+
+    /* deferred synthesis state */
+    bool deferred;
+    uint32_t log_index;     /* index of the log filled by the emulation */
+    ay38910_log_t log[2];
 } ay38910_t;
 
 /* extract 8-bit data bus from 64-bit pins */
@@ -249,12 +346,29 @@ typedef struct {
 
 /* initialize a AY-3-8910 instance */
 void ay38910_init(ay38910_t* ay, const ay38910_desc_t* desc);
+/* discard a AY-3-8910 instance, frees the deferred synthesis logs */
+void ay38910_discard(ay38910_t* ay);
 /* reset an existing AY-3-8910 instance */
 void ay38910_reset(ay38910_t* ay);
 /* perform an IO request machine cycle */
 uint64_t ay38910_iorq(ay38910_t* ay, uint64_t pins);
 /* tick the AY-3-8910, return true if a new sample is ready */
 bool ay38910_tick(ay38910_t* ay);
+/* tick the AY-3-8910 num_ticks times, return number of samples written to out_samples (may be null) */
+int ay38910_render(ay38910_t* ay, uint32_t num_ticks, float* out_samples);
+/* hand the deferred synthesis log over to the synthesis, and start a new log */
+ay38910_log_t* ay38910_log_swap(ay38910_t* ay);
+/* synthesize a deferred synthesis log, return number of samples written */
+int ay38910_synth(ay38910_t* synth, ay38910_log_t* log, float* out_samples, int max_samples);
+/* return true if a deferred synthesis log hasn't been completely synthesized */
+static inline bool ay38910_synth_pending(const ay38910_log_t* log) {
+    return (log->synth_pos < log->num_ticks) || (log->write_pos < log->num_writes);
+}
+
+/* clear host pointers in a snapshot before saving, and bring the synthesis state up to date (synth may be null if not deferred) */
+void ay38910_snapshot_onsave(ay38910_t* snapshot, ay38910_t* synth);
+/* restore host pointers and log memory in a snapshot from the running instance before loading */
+void ay38910_snapshot_onload(ay38910_t* snapshot, ay38910_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -263,6 +377,8 @@ bool ay38910_tick(ay38910_t* ay);
 /*-- IMPLEMENTATION ----------------------------------------------------------*/
 #ifdef CHIPS_IMPL
 #include <string.h>
+#include <stdlib.h>     /* realloc, free */
+#include <limits.h>     /* INT_MAX */
 #ifndef CHIPS_ASSERT
     #include <assert.h>
     #define CHIPS_ASSERT(c) assert(c)
@@ -411,12 +527,24 @@ void ay38910_init(ay38910_t* ay, const ay38910_desc_t* desc) {
     ay->sample_period = (desc->tick_hz * AY38910_FIXEDPOINT_SCALE) / desc->sound_hz;
     ay->sample_counter = ay->sample_period;
     ay->mag = desc->magnitude;
+    ay->deferred = desc->deferred;
     _ay38910_update_values(ay);
     _ay38910_restart_env_shape(ay);
 }
 
-void ay38910_reset(ay38910_t* ay) {
+void ay38910_discard(ay38910_t* ay) {
     CHIPS_ASSERT(ay);
+    for (int i = 0; i < 2; i++) {
+        free(ay->log[i].writes);
+        memset(&ay->log[i], 0, sizeof(ay38910_log_t));
+    }
+}
+
+/* a logged ay38910_reset() (register numbers are 4 bits) */
+#define _AY38910_LOG_RESET (0xFF)
+
+/* reset the register bank (shared by ay38910_reset() and ay38910_synth()) */
+static void _ay38910_reset_state(ay38910_t* ay) {
     ay->addr = 0;
     ay->tick = 0;
     for (int i = 0; i < AY38910_NUM_REGISTERS; i++) {
@@ -426,7 +554,40 @@ void ay38910_reset(ay38910_t* ay) {
     _ay38910_restart_env_shape(ay);
 }
 
-bool ay38910_tick(ay38910_t* ay) {
+static void _ay38910_log_write(ay38910_t* ay, uint8_t reg, uint8_t data);
+
+void ay38910_reset(ay38910_t* ay) {
+    CHIPS_ASSERT(ay);
+    if (ay->deferred) {
+        /* the synthesis state is reset when the reset is reached in the log */
+        _ay38910_log_write(ay, _AY38910_LOG_RESET, 0);
+    }
+    _ay38910_reset_state(ay);
+}
+
+/* compute a new output sample from the current generator state */
+static void _ay38910_sample(ay38910_t* ay) {
+    float sm = 0.0f;
+    for (int i = 0; i < AY38910_NUM_CHANNELS; i++) {
+        const ay38910_tone_t* chn = &ay->tone[i];
+        float vol;
+        if (0 == (ay->reg[AY38910_REG_AMP_A+i] & (1<<4))) {
+            /* fixed amplitude */
+            vol = _ay38910_volumes[ay->reg[AY38910_REG_AMP_A+i] & 0x0F];
+        }
+        else {
+            /* envelope control */
+            vol = _ay38910_volumes[ay->env.shape_state];
+        }
+        int vol_enable = (chn->bit|chn->tone_disable) & ((ay->noise.rng&1)|(chn->noise_disable));
+        if (vol_enable) {
+            sm += vol;
+        }
+    }
+    ay->sample = _ay38910_dcadjust(ay, sm) * ay->mag;
+}
+
+static bool _ay38910_tick(ay38910_t* ay) {
     ay->tick++;
     if ((ay->tick & 7) == 0) {
         /* tick the tone channels */
@@ -472,31 +633,209 @@ bool ay38910_tick(ay38910_t* ay) {
     ay->sample_counter -= AY38910_FIXEDPOINT_SCALE;
     if (ay->sample_counter <= 0) {
         ay->sample_counter += ay->sample_period;
-        float sm = 0.0f;
-        for (int i = 0; i < AY38910_NUM_CHANNELS; i++) {
-            const ay38910_tone_t* chn = &ay->tone[i];
-            float vol;
-            if (0 == (ay->reg[AY38910_REG_AMP_A+i] & (1<<4))) {
-                /* fixed amplitude */
-                vol = _ay38910_volumes[ay->reg[AY38910_REG_AMP_A+i] & 0x0F];
-            }
-            else {
-                /* envelope control */
-                vol = _ay38910_volumes[ay->env.shape_state];
-            }
-            int vol_enable = (chn->bit|chn->tone_disable) & ((ay->noise.rng&1)|(chn->noise_disable));
-            if (vol_enable) {
-                sm += vol;
-            }
+        if (!ay->headless) {
+            _ay38910_sample(ay);
         }
-        ay->sample = _ay38910_dcadjust(ay, sm) * ay->mag;
         return true;    /* new sample is ready */
     }
     /* fallthrough: no new sample ready yet */
     return false;
 }
 
+/* advance a counter by num_steps, return number of times the period was reached */
+static inline uint32_t _ay38910_count(uint16_t* counter, uint16_t period, uint32_t num_steps) {
+    uint32_t wraps = 0;
+    if (*counter >= period) {
+        /* period was lowered below the current counter, this wraps on the next step */
+        *counter = 0;
+        wraps = 1;
+        num_steps--;
+    }
+    const uint32_t total = *counter + num_steps;
+    *counter = (uint16_t)(total % period);
+    return wraps + (total / period);
+}
+
+/* advance the sound generators by num_ticks without generating samples */
+static void _ay38910_advance(ay38910_t* ay, uint32_t num_ticks) {
+    /* number of 8- and 16-tick clock edges in the span */
+    const uint32_t num_steps = ((ay->tick & 7) + num_ticks) >> 3;
+    const uint32_t num_env_steps = ((ay->tick & 15) + num_ticks) >> 4;
+    ay->tick += num_ticks;
+    if (num_steps > 0) {
+        /* tone channels */
+        for (int i = 0; i < AY38910_NUM_CHANNELS; i++) {
+            ay38910_tone_t* chn = &ay->tone[i];
+            chn->bit ^= _ay38910_count(&chn->counter, chn->period, num_steps) & 1;
+        }
+        /* noise channel, the RNG is clocked each time the noise bit flips to 1 */
+        uint32_t flips = _ay38910_count(&ay->noise.counter, ay->noise.period, num_steps);
+        uint32_t num_rng = ay->noise.bit ? (flips >> 1) : ((flips + 1) >> 1);
+        ay->noise.bit ^= flips & 1;
+        while (num_rng-- > 0) {
+            ay->noise.rng ^= (((ay->noise.rng & 1) ^ ((ay->noise.rng >> 3) & 1)) << 17);
+            ay->noise.rng >>= 1;
+        }
+    }
+    if (num_env_steps > 0) {
+        /* envelope generator */
+        uint32_t env_steps = _ay38910_count(&ay->env.counter, ay->env.period, num_env_steps);
+        if (env_steps > 0) {
+            if (!ay->env.shape_holding) {
+                uint32_t dist = (0x1F - ay->env.shape_counter) & 0x1F;
+                if (0 == dist) {
+                    dist = 32;
+                }
+                if (ay->env.shape_hold && (env_steps >= dist)) {
+                    ay->env.shape_counter = 0x1F;
+                    ay->env.shape_holding = true;
+                }
+                else {
+                    ay->env.shape_counter = (ay->env.shape_counter + env_steps) & 0x1F;
+                }
+            }
+            ay->env.shape_state = _ay38910_shapes[ay->env_shape_cycle][ay->env.shape_counter];
+        }
+    }
+}
+
+/* render up to num_ticks or until max_samples have been generated, return number of ticks */
+static uint32_t _ay38910_render(ay38910_t* ay, uint32_t num_ticks, float* out_samples, int max_samples, int* out_num_samples) {
+    if (ay->headless) {
+        /* no samples, advance the whole span and wrap the sample counter */
+        _ay38910_advance(ay, num_ticks);
+        ay->sample_counter -= (int)num_ticks * AY38910_FIXEDPOINT_SCALE;
+        if (ay->sample_counter <= 0) {
+            ay->sample_counter = ay->sample_period - ((-ay->sample_counter) % ay->sample_period);
+        }
+        *out_num_samples = 0;
+        return num_ticks;
+    }
+    uint32_t ticks = 0;
+    int num_samples = 0;
+    while ((ticks < num_ticks) && (num_samples < max_samples)) {
+        /* number of ticks up to and including the next sample point */
+        uint32_t span = 1;
+        if (ay->sample_counter > AY38910_FIXEDPOINT_SCALE) {
+            span = (ay->sample_counter + AY38910_FIXEDPOINT_SCALE - 1) / AY38910_FIXEDPOINT_SCALE;
+        }
+        if (span > (num_ticks - ticks)) {
+            span = num_ticks - ticks;
+        }
+        _ay38910_advance(ay, span);
+        ticks += span;
+        ay->sample_counter -= (int)span * AY38910_FIXEDPOINT_SCALE;
+        if (ay->sample_counter <= 0) {
+            ay->sample_counter += ay->sample_period;
+            _ay38910_sample(ay);
+            if (out_samples) {
+                out_samples[num_samples] = ay->sample;
+            }
+            num_samples++;
+        }
+    }
+    *out_num_samples = num_samples;
+    return ticks;
+}
+
+int ay38910_render(ay38910_t* ay, uint32_t num_ticks, float* out_samples) {
+    CHIPS_ASSERT(ay);
+    if (ay->deferred) {
+        ay->log[ay->log_index].num_ticks += num_ticks;
+        return 0;
+    }
+    int num_samples = 0;
+    _ay38910_render(ay, num_ticks, out_samples, INT_MAX, &num_samples);
+    return num_samples;
+}
+
+bool ay38910_tick(ay38910_t* ay) {
+    if (ay->deferred) {
+        ay->log[ay->log_index].num_ticks++;
+        return false;
+    }
+    return _ay38910_tick(ay);
+}
+
+/* write a sound generator register and update dependent values */
+static void _ay38910_write(ay38910_t* ay, uint8_t reg, uint8_t data) {
+    ay->reg[reg] = data & _ay38910_reg_mask[reg];
+    _ay38910_update_values(ay);
+    if (reg == AY38910_REG_ENV_SHAPE_CYCLE) {
+        _ay38910_restart_env_shape(ay);
+    }
+}
+
+/* true if pins and address latch describe a write to a sound generator register */
+static inline bool _ay38910_is_synth_write(ay38910_t* ay, uint64_t pins) {
+    return ((pins & (AY38910_BDIR|AY38910_BC1)) == AY38910_BDIR) && (ay->addr < AY38910_REG_IO_PORT_A);
+}
+
+/* record a register write (or a reset) in the current log */
+static void _ay38910_log_write(ay38910_t* ay, uint8_t reg, uint8_t data) {
+    ay38910_log_t* log = &ay->log[ay->log_index];
+    if (log->num_writes == log->max_writes) {
+        /* the log is full, grow it */
+        const uint32_t max_writes = (log->max_writes > 0) ? (2 * log->max_writes) : AY38910_LOG_WRITES;
+        ay38910_write_t* writes = (ay38910_write_t*) realloc(log->writes, max_writes * sizeof(ay38910_write_t));
+        CHIPS_ASSERT(writes);
+        log->writes = writes;
+        log->max_writes = max_writes;
+    }
+    ay38910_write_t* wr = &log->writes[log->num_writes++];
+    wr->tick = log->num_ticks;
+    wr->reg = reg;
+    wr->data = data;
+}
+
+/* apply all logged register writes which happened after 'synth_pos' ticks */
+static void _ay38910_apply_writes(ay38910_t* ay, ay38910_log_t* log) {
+    while ((log->write_pos < log->num_writes) && (log->writes[log->write_pos].tick == log->synth_pos)) {
+        const ay38910_write_t* wr = &log->writes[log->write_pos++];
+        if (wr->reg == _AY38910_LOG_RESET) {
+            _ay38910_reset_state(ay);
+        }
+        else {
+            _ay38910_write(ay, wr->reg, wr->data);
+        }
+    }
+}
+
+ay38910_log_t* ay38910_log_swap(ay38910_t* ay) {
+    CHIPS_ASSERT(ay && ay->deferred);
+    ay38910_log_t* log = &ay->log[ay->log_index];
+    ay->log_index ^= 1;
+    ay38910_log_t* next = &ay->log[ay->log_index];
+    next->num_ticks = next->num_writes = 0;
+    next->synth_pos = next->write_pos = 0;
+    return log;
+}
+
+int ay38910_synth(ay38910_t* synth, ay38910_log_t* log, float* out_samples, int max_samples) {
+    CHIPS_ASSERT(synth && !synth->deferred && log && out_samples && (max_samples > 0));
+    int num_samples = 0;
+    _ay38910_apply_writes(synth, log);
+    while ((log->synth_pos < log->num_ticks) && (num_samples < max_samples)) {
+        /* render the span up to the next logged register write */
+        uint32_t end_tick = log->num_ticks;
+        if (log->write_pos < log->num_writes) {
+            end_tick = log->writes[log->write_pos].tick;
+        }
+        int n = 0;
+        log->synth_pos += _ay38910_render(synth, end_tick - log->synth_pos, &out_samples[num_samples], max_samples - num_samples, &n);
+        num_samples += n;
+        _ay38910_apply_writes(synth, log);
+    }
+    return num_samples;
+}
+
 uint64_t ay38910_iorq(ay38910_t* ay, uint64_t pins) {
+    if (ay->deferred && _ay38910_is_synth_write(ay, pins)) {
+        /* in deferred mode, log writes to the sound generator registers
+           for the synthesis, the register bank is updated as usual below
+        */
+        _ay38910_log_write(ay, ay->addr, AY38910_DATA(pins));
+    }
     if (pins & (AY38910_BDIR|AY38910_BC1)) {
         if (pins & AY38910_BDIR) {
             const uint8_t data = AY38910_DATA(pins);
@@ -514,11 +853,7 @@ uint64_t ay38910_iorq(ay38910_t* ay, uint64_t pins) {
                 */
                 if (ay->addr < AY38910_NUM_REGISTERS) {
                     /* write register content, and update dependent values */
-                    ay->reg[ay->addr] = data & _ay38910_reg_mask[ay->addr];
-                    _ay38910_update_values(ay);
-                    if (ay->addr == AY38910_REG_ENV_SHAPE_CYCLE) {
-                        _ay38910_restart_env_shape(ay);
-                    }
+                    _ay38910_write(ay, ay->addr, data);
                     /* Handle port output:
 
                         If port A or B is in output mode, call the
@@ -530,7 +865,7 @@ uint64_t ay38910_iorq(ay38910_t* ay, uint64_t pins) {
                             bit6 = 1: port A in output mode
                             bit7 = 1: port B in output mode
                     */
-                    else if (ay->addr == AY38910_REG_IO_PORT_A) {
+                    if (ay->addr == AY38910_REG_IO_PORT_A) {
                         if (ay->enable & (1<<6)) {
                             if (ay->out_cb) {
                                 ay->out_cb(AY38910_PORT_A, ay->port_a, ay->user_data);
@@ -595,4 +930,40 @@ uint64_t ay38910_iorq(ay38910_t* ay, uint64_t pins) {
     return pins;
 }
 
+void ay38910_snapshot_onsave(ay38910_t* snapshot, ay38910_t* synth) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->in_cb = 0;
+    snapshot->out_cb = 0;
+    snapshot->user_data = 0;
+    if (!snapshot->deferred) {
+        return;
+    }
+    CHIPS_ASSERT(synth && !synth->deferred);
+    /* the logs are not part of the snapshot, synthesize the rest of the
+       handed-over log and the current log on the saved synthesis state
+       instead, the log memory is only read
+    */
+    float samples[64];
+    for (int i = 0; i < 2; i++) {
+        ay38910_log_t* log = &snapshot->log[snapshot->log_index ^ 1 ^ i];
+        while (ay38910_synth_pending(log)) {
+            ay38910_synth(synth, log, samples, 64);
+        }
+        memset(log, 0, sizeof(ay38910_log_t));
+    }
+}
+
+void ay38910_snapshot_onload(ay38910_t* snapshot, ay38910_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->in_cb = sys->in_cb;
+    snapshot->out_cb = sys->out_cb;
+    snapshot->user_data = sys->user_data;
+    for (int i = 0; i < 2; i++) {
+        snapshot->log[i].writes = sys->log[i].writes;
+        snapshot->log[i].max_writes = sys->log[i].max_writes;
+        snapshot->log[i].num_ticks = snapshot->log[i].num_writes = 0;
+        snapshot->log[i].synth_pos = snapshot->log[i].write_pos = 0;
+    }
+}
+
 #endif /* CHIPS_IMPL */
@@ -2,7 +2,29 @@
 /*
     beeper.h    -- simple square-wave beeper
 
-    TODO: docs
+    Call beeper_set() or beeper_toggle() to change the beeper output
+    level, and either call beeper_tick() once per tick (returns true when
+    a new sample is ready in beeper_t.sample), or advance the beeper by
+    a whole span of ticks with:
+
+        int beeper_render(beeper_t* beeper, uint32_t num_ticks, float* out_samples)
+
+    This writes all samples generated in the span to out_samples (which
+    must have room for num_ticks samples, or be a null pointer if only the
+    last generated sample in beeper_t.sample is needed), and returns the
+    number of generated samples. beeper_sample_ticks() returns the number
+    of ticks up to and including the next sample point, which is useful
+    to mix the beeper output with other sound sources.
+
+    With span rendering, the level changes must happen at the right time
+    within the sample stream, so render all ticks up to the current tick
+    before calling beeper_set() or beeper_toggle().
+
+    Level changes are inserted into the output as band-limited steps (a
+    precomputed windowed-sinc step table with BEEPER_BLEP_PHASES sub-sample
+    positions, spread over BEEPER_BLEP_TAPS samples), this removes most
+    of the aliasing of a naively sampled square wave. The output is
+    delayed by BEEPER_BLEP_TAPS/2 samples.
 
     ## zlib/libpng license
 
@@ -33,6 +55,12 @@ extern "C" {
 #define BEEPER_FIXEDPOINT_SCALE (16)
 /* DC adjust buffer size */
 #define BEEPER_DCADJ_BUFLEN (512)
+/* number of samples a band-limited step is spread over */
+#define BEEPER_BLEP_TAPS (9)
+/* number of sub-sample step positions */
+#define BEEPER_BLEP_PHASES (16)
+/* ring buffer for pending band-limited steps (must be 2^N) */
+#define BEEPER_BLEP_RING (16)
 
 /* beeper state */
 typedef struct {
@@ -41,6 +69,9 @@ typedef struct {
     int counter;
     float mag;
     float sample;
+    float level;            /* band-limited output level */
+    uint32_t blep_pos;      /* ring buffer position of the next sample */
+    float blep_ring[BEEPER_BLEP_RING];
     float dcadj_sum;
     uint32_t dcadj_pos;
     float dcadj_buf[BEEPER_DCADJ_BUFLEN];
@@ -51,15 +82,18 @@ void beeper_init(beeper_t* beeper, int tick_hz, int sound_hz, float magnitude);
 /* reset the beeper instance */
 void beeper_reset(beeper_t* beeper);
 /* set current on/off state */
-static inline void beeper_set(beeper_t* beeper, bool state) {
-    beeper->state = state ? 1 : 0;
-}
+void beeper_set(beeper_t* beeper, bool state);
 /* toggle current state (on->off or off->on) */
-static inline void beeper_toggle(beeper_t* beeper) {
-    beeper->state = !beeper->state;
-}
+void beeper_toggle(beeper_t* beeper);
 /* tick the beeper, return true if a new sample is ready */
 bool beeper_tick(beeper_t* beeper);
+/* render a span of ticks, return number of samples written to out_samples (may be null) */
+int beeper_render(beeper_t* beeper, uint32_t num_ticks, float* out_samples);
+/* return number of ticks up to and including the next sample point */
+static inline uint32_t beeper_sample_ticks(beeper_t* beeper) {
+    const int scale = BEEPER_FIXEDPOINT_SCALE;
+    return (beeper->counter > scale) ? (uint32_t)((beeper->counter + scale - 1) / scale) : 1;
+}
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -72,6 +106,31 @@ bool beeper_tick(beeper_t* beeper);
     #define CHIPS_ASSERT(c) assert(c)
 #endif
 
+/* band-limited step table, one row per sub-sample position (0: step
+   right at the next sample point, BEEPER_BLEP_PHASES: step right after
+   the previous sample point), each row sums up to 1.0 (windowed sinc
+   with Blackman window and a cutoff at 0.9 * Nyquist)
+*/
+static const float _beeper_blep[BEEPER_BLEP_PHASES+1][BEEPER_BLEP_TAPS] = {
+    { 0.000000f, 0.000552f, 0.005585f, -0.061540f, 0.555403f, 0.555403f, -0.061540f, 0.005585f, 0.000552f },
+    { -0.000000f, 0.000963f, 0.002835f, -0.052861f, 0.605192f, 0.502577f, -0.066496f, 0.007545f, 0.000246f },
+    { -0.000003f, 0.001488f, -0.000760f, -0.040040f, 0.650878f, 0.447815f, -0.068200f, 0.008789f, 0.000031f },
+    { -0.000010f, 0.002134f, -0.005218f, -0.022727f, 0.691456f, 0.392211f, -0.067151f, 0.009412f, -0.000106f },
+    { -0.000024f, 0.002899f, -0.010521f, -0.000666f, 0.726013f, 0.336831f, -0.063865f, 0.009514f, -0.000182f },
+    { -0.000045f, 0.003773f, -0.016604f, 0.026295f, 0.753761f, 0.282676f, -0.058847f, 0.009202f, -0.000211f },
+    { -0.000074f, 0.004734f, -0.023350f, 0.058181f, 0.774058f, 0.230662f, -0.052583f, 0.008578f, -0.000207f },
+    { -0.000109f, 0.005749f, -0.030584f, 0.094885f, 0.786431f, 0.181596f, -0.045524f, 0.007739f, -0.000182f },
+    { -0.000147f, 0.006771f, -0.038073f, 0.136156f, 0.790587f, 0.136156f, -0.038073f, 0.006771f, -0.000147f },
+    { -0.000182f, 0.007739f, -0.045524f, 0.181596f, 0.786431f, 0.094885f, -0.030584f, 0.005749f, -0.000109f },
+    { -0.000207f, 0.008578f, -0.052583f, 0.230662f, 0.774058f, 0.058181f, -0.023350f, 0.004734f, -0.000074f },
+    { -0.000211f, 0.009202f, -0.058847f, 0.282676f, 0.753761f, 0.026295f, -0.016604f, 0.003773f, -0.000045f },
+    { -0.000182f, 0.009514f, -0.063865f, 0.336831f, 0.726013f, -0.000666f, -0.010521f, 0.002899f, -0.000024f },
+    { -0.000106f, 0.009412f, -0.067151f, 0.392211f, 0.691456f, -0.022727f, -0.005218f, 0.002134f, -0.000010f },
+    { 0.000031f, 0.008789f, -0.068200f, 0.447815f, 0.650878f, -0.040040f, -0.000760f, 0.001488f, -0.000003f },
+    { 0.000246f, 0.007545f, -0.066496f, 0.502577f, 0.605192f, -0.052861f, 0.002835f, 0.000963f, -0.000000f },
+    { 0.000552f, 0.005585f, -0.061540f, 0.555403f, 0.555403f, -0.061540f, 0.005585f, 0.000552f, 0.000000f },
+};
+
 void beeper_init(beeper_t* b, int tick_hz, int sound_hz, float magnitude) {
     CHIPS_ASSERT(b);
     CHIPS_ASSERT((tick_hz > 0) && (sound_hz > 0));
@@ -86,6 +145,9 @@ void beeper_reset(beeper_t* b) {
     b->state = 0;
     b->counter = b->period;
     b->sample = 0;
+    b->level = 0.0f;
+    b->blep_pos = 0;
+    memset(b->blep_ring, 0, sizeof(b->blep_ring));
 }
 
 /* DC adjustment filter from StSound, this moves an "offcenter"
@@ -101,16 +163,76 @@ static float _beeper_dcadjust(beeper_t* bp, float s) {
     return s - (bp->dcadj_sum / BEEPER_DCADJ_BUFLEN);
 }
 
+/* insert a band-limited step at the current position between two sample points */
+static void _beeper_step(beeper_t* bp, float delta) {
+    /* distance to the next sample point in BEEPER_BLEP_PHASES units */
+    int phase = (bp->counter * BEEPER_BLEP_PHASES + (bp->period / 2)) / bp->period;
+    if (phase < 0) {
+        phase = 0;
+    }
+    else if (phase > BEEPER_BLEP_PHASES) {
+        phase = BEEPER_BLEP_PHASES;
+    }
+    const float* blep = _beeper_blep[phase];
+    for (int i = 0; i < BEEPER_BLEP_TAPS; i++) {
+        bp->blep_ring[(bp->blep_pos + i) & (BEEPER_BLEP_RING-1)] += delta * blep[i];
+    }
+}
+
+void beeper_set(beeper_t* bp, bool state) {
+    const int new_state = state ? 1 : 0;
+    if (new_state != bp->state) {
+        _beeper_step(bp, (float)(new_state - bp->state));
+        bp->state = new_state;
+    }
+}
+
+void beeper_toggle(beeper_t* bp) {
+    beeper_set(bp, 0 == bp->state);
+}
+
+/* generate the next output sample */
+static inline void _beeper_sample(beeper_t* bp) {
+    float* slot = &bp->blep_ring[bp->blep_pos];
+    bp->level += *slot;
+    *slot = 0.0f;
+    bp->blep_pos = (bp->blep_pos + 1) & (BEEPER_BLEP_RING-1);
+    bp->sample = _beeper_dcadjust(bp, bp->level) * bp->mag;
+}
+
 bool beeper_tick(beeper_t* bp) {
     /* generate a new sample? */
     bp->counter -= BEEPER_FIXEDPOINT_SCALE;
     if (bp->counter <= 0) {
         bp->counter += bp->period;
-        bp->sample = _beeper_dcadjust(bp, (float)bp->state) * bp->mag;
+        _beeper_sample(bp);
         return true;
     }
     return false;
 }
 
+int beeper_render(beeper_t* bp, uint32_t num_ticks, float* out_samples) {
+    CHIPS_ASSERT(bp);
+    int num_samples = 0;
+    while (num_ticks > 0) {
+        /* number of ticks up to and including the next sample point */
+        const uint32_t span = beeper_sample_ticks(bp);
+        if (span > num_ticks) {
+            /* no sample point in the remaining span */
+            bp->counter -= (int)num_ticks * BEEPER_FIXEDPOINT_SCALE;
+            break;
+        }
+        num_ticks -= span;
+        bp->counter -= (int)span * BEEPER_FIXEDPOINT_SCALE;
+        bp->counter += bp->period;
+        _beeper_sample(bp);
+        if (out_samples) {
+            out_samples[num_samples] = bp->sample;
+        }
+        num_samples++;
+    }
+    return num_samples;
+}
+
 
 #endif /* CHIPS_IMPL */
@@ -20,6 +20,29 @@
 
     FIXME: DOCS
 
+    ## Disc Data
+
+    The disc image data either lives in the fdd_t's own data buffer (when
+    the disc was inserted with fdd_insert_disc() or one of the copying
+    format loaders in fdd_cpc.h), or in caller-owned memory (when the disc
+    was inserted with one of the _nocopy() format loaders), in that case
+    the memory must remain valid until the disc is ejected. All disc data
+    access goes through fdd_t.data_ptr.
+
+    A format loader may also defer building the sector descriptions of a
+    track until the track is accessed for the first time, this is done
+    by setting fdd_track_t.indexed to false and providing an index
+    callback in fdd_t.index_track. Tracks are indexed when the drive
+    seeks to them, and track 0 right when the disc is inserted.
+
+    ## Snapshots
+
+    fdd_snapshot_onsave() and fdd_snapshot_onload() must be called on
+    a copy of an fdd_t when saving and loading system snapshots. A disc
+    in the fdd_t's own data buffer is fully contained in the snapshot,
+    but a disc in caller-owned memory is only referenced, such a snapshot
+    can only be loaded while the memory is still valid.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -83,6 +106,7 @@ typedef struct {
     int data_offset;    /* offset of track data in disc data blob */
     int data_size;      /* track data size in bytes */
     int num_sectors;    /* number of sectors in track */
+    bool indexed;       /* false if the sector descriptions haven't been built yet */
     fdd_sector_t sectors[FDD_MAX_SECTORS];  /* the sector descriptions */
 } fdd_track_t;
 
@@ -95,6 +119,9 @@ typedef struct {
     fdd_track_t tracks[FDD_MAX_SIDES][FDD_MAX_TRACKS];
 } fdd_disc_t;
 
+/* callback to build the sector descriptions of a track on first access */
+typedef bool (*fdd_index_track_t)(fdd_disc_t* disc, const uint8_t* data, int data_size, int side, int track);
+
 /* a floppy disc drive description */
 typedef struct {
     int cur_side;
@@ -104,6 +131,8 @@ typedef struct {
     bool has_disc;
     bool motor_on;
     fdd_disc_t disc;
+    fdd_index_track_t index_track;  /* optional, for lazily indexed tracks */
+    const uint8_t* data_ptr;        /* points to data[] or caller-owned memory */
     int data_size;
     uint8_t data[FDD_MAX_DISC_SIZE];
 } fdd_t;
@@ -122,6 +151,10 @@ int fdd_seek_track(fdd_t* fdd, int track);
 int fdd_seek_sector(fdd_t* fdd, uint8_t c, uint8_t h, uint8_t r, uint8_t n);
 /* read the next byte from the seeked-to sector, return FDD_RESULT_* */
 int fdd_read(fdd_t* fdd, uint8_t h, uint8_t* out_data);
+/* clear host pointers in a snapshot before saving */
+void fdd_snapshot_onsave(fdd_t* snapshot, fdd_t* sys);
+/* restore host pointers in a snapshot before loading */
+void fdd_snapshot_onload(fdd_t* snapshot, fdd_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -130,6 +163,7 @@ int fdd_read(fdd_t* fdd, uint8_t h, uint8_t* out_data);
 /*--- IMPLEMENTATION ---------------------------------------------------------*/
 #ifdef CHIPS_IMPL
 #include <string.h>
+#include <stddef.h> /* offsetof */
 #ifndef CHIPS_ASSERT
     #include <assert.h>
     #define CHIPS_ASSERT(c) assert(c)
@@ -137,7 +171,8 @@ int fdd_read(fdd_t* fdd, uint8_t h, uint8_t* out_data);
 
 void fdd_init(fdd_t* fdd) {
     CHIPS_ASSERT(fdd);
-    memset(fdd, 0, sizeof(fdd_t));
+    /* don't touch the data buffer, it's only needed for copied discs */
+    memset(fdd, 0, offsetof(fdd_t, data));
 }
 
 void fdd_motor(fdd_t* fdd, bool on) {
@@ -154,7 +189,24 @@ void fdd_eject_disc(fdd_t* fdd) {
     fdd->has_disc = false;
     fdd->motor_on = false;
     memset(&fdd->disc, 0, sizeof(fdd->disc));
-    memset(&fdd->data, 0, sizeof(fdd->data));
+    fdd->index_track = 0;
+    fdd->data_ptr = 0;
+    fdd->data_size = 0;
+}
+
+/* build the sector descriptions of a lazily indexed track */
+static void _fdd_index_track(fdd_t* fdd, int track_index) {
+    for (int side_index = 0; side_index < fdd->disc.num_sides; side_index++) {
+        fdd_track_t* track = &fdd->disc.tracks[side_index][track_index];
+        if (!track->indexed) {
+            CHIPS_ASSERT(fdd->index_track);
+            if (!fdd->index_track(&fdd->disc, fdd->data_ptr, fdd->data_size, side_index, track_index)) {
+                /* broken track data, treat as unformatted track */
+                track->num_sectors = 0;
+            }
+            track->indexed = true;
+        }
+    }
 }
 
 bool _fdd_validate_disc(const fdd_disc_t* disc) {
@@ -204,6 +256,11 @@ bool fdd_insert_disc(fdd_t* fdd, const fdd_disc_t* disc, const uint8_t* data, in
     }
     if (_fdd_validate_disc(disc)) {
         fdd->disc = *disc;
+        for (int side_index = 0; side_index < FDD_MAX_SIDES; side_index++) {
+            for (int track_index = 0; track_index < FDD_MAX_TRACKS; track_index++) {
+                fdd->disc.tracks[side_index][track_index].indexed = true;
+            }
+        }
     }
     else {
         /* invalid disc structure */
@@ -213,6 +270,7 @@ bool fdd_insert_disc(fdd_t* fdd, const fdd_disc_t* disc, const uint8_t* data, in
         if ((data_size > 0) && (data_size <= FDD_MAX_DISC_SIZE)) {
             fdd->data_size = data_size;
             memcpy(&fdd->data, data, data_size);
+            fdd->data_ptr = fdd->data;
             fdd->disc.formatted = true;
         }
         else {
@@ -221,6 +279,7 @@ bool fdd_insert_disc(fdd_t* fdd, const fdd_disc_t* disc, const uint8_t* data, in
         }
     }
     else {
+        fdd->data_ptr = fdd->data;
         fdd->disc.formatted = false;
     }
     fdd->has_disc = true;
@@ -230,6 +289,7 @@ bool fdd_insert_disc(fdd_t* fdd, const fdd_disc_t* disc, const uint8_t* data, in
 int fdd_seek_track(fdd_t* fdd, int track) {
     CHIPS_ASSERT(fdd);
     if (fdd->has_disc && fdd->motor_on && (track < fdd->disc.num_tracks)) {
+        _fdd_index_track(fdd, track);
         fdd->cur_track_index = track;
         return FDD_RESULT_SUCCESS;
     }
@@ -268,7 +328,7 @@ int fdd_read(fdd_t* fdd, uint8_t h, uint8_t* out_data) {
         const fdd_sector_t* sector = &fdd->disc.tracks[h][fdd->cur_track_index].sectors[fdd->cur_sector_index];
         if (fdd->cur_sector_pos < sector->data_size) {
             const int data_offset = sector->data_offset + fdd->cur_sector_pos;
-            *out_data = fdd->data[data_offset];
+            *out_data = fdd->data_ptr[data_offset];
             fdd->cur_sector_pos++;
             if (fdd->cur_sector_pos < sector->data_size) {
                 return FDD_RESULT_SUCCESS;
@@ -283,4 +343,20 @@ int fdd_read(fdd_t* fdd, uint8_t h, uint8_t* out_data) {
     return FDD_RESULT_NOT_READY;
 }
 
+void fdd_snapshot_onsave(fdd_t* snapshot, fdd_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    if (sys->data_ptr == sys->data) {
+        /* disc data is part of the snapshot, all tracks have been indexed */
+        snapshot->data_ptr = 0;
+        snapshot->index_track = 0;
+    }
+}
+
+void fdd_snapshot_onload(fdd_t* snapshot, fdd_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    if (snapshot->has_disc && (0 == snapshot->data_ptr)) {
+        snapshot->data_ptr = sys->data;
+    }
+}
+
 #endif /* CHIPS_IMPL */
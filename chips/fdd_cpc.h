@@ -19,6 +19,21 @@
         data        - pointer to the .dsk image data in memory
         data_size   - size in bytes of the image data
 
+        The image data will be copied into the fdd_t, and all tracks
+        will be indexed right away.
+
+    ~~~C
+    bool fdd_cpc_insert_dsk_nocopy(fdd_t* fdd, const uint8_t* data, int data_size)
+    ~~~
+        Same as fdd_cpc_insert_dsk(), but the image data will not be copied,
+        instead the fdd_t keeps a pointer to it. The data must remain valid
+        until the disc is ejected (or another disc is inserted). The data
+        may be a memory-mapped file. Only the track offsets are computed
+        from the .dsk header, the sector descriptions of a track are built
+        when the drive first seeks to the track, so that a large memory-mapped
+        image isn't touched as a whole when inserted. The data size isn't
+        limited by FDD_MAX_DISC_SIZE.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -43,6 +58,8 @@ extern "C" {
 
 /* load Amstrad CPC .dsk file format */
 bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size);
+/* same, but reference the caller-owned data instead of copying it */
+bool fdd_cpc_insert_dsk_nocopy(fdd_t* fdd, const uint8_t* data, int data_size);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -88,10 +105,53 @@ typedef struct {
     uint8_t ext[2];         /* in extended disk format, actual sector data size in bytes */
 } _fdd_cpc_dsk_sector_info;
 
-/* parse a standard .dsk image */
-static bool _fdd_cpc_parse_dsk(fdd_t* fdd, bool ext, const uint8_t* data, int data_size) {
-    CHIPS_ASSERT(fdd);
-    const _fdd_cpc_dsk_header* hdr = (_fdd_cpc_dsk_header*) data;
+/* build the sector descriptions of a track, track offset and size must be set */
+static bool _fdd_cpc_index_track(fdd_disc_t* disc, const uint8_t* data, int data_size, int side_index, int track_index) {
+    CHIPS_ASSERT(disc && data);
+    (void)data_size;
+    const _fdd_cpc_dsk_header* hdr = (const _fdd_cpc_dsk_header*) data;
+    const bool ext = (0 == memcmp(hdr->magic, "EXTENDED", 8));
+    fdd_track_t* track = &disc->tracks[side_index][track_index];
+    CHIPS_ASSERT(track->data_size > 0);
+    const _fdd_cpc_dsk_track_info* track_info = (const _fdd_cpc_dsk_track_info*) &data[track->data_offset];
+    if (0 != memcmp("Track-Info", track_info->magic, 10)) {
+        return false;
+    }
+    if (track_info->num_sectors > FDD_MAX_SECTORS) {
+        return false;
+    }
+    track->num_sectors = track_info->num_sectors;
+    int sector_data_offset = track->data_offset + 0x100;
+    const _fdd_cpc_dsk_sector_info* sector_infos = (const _fdd_cpc_dsk_sector_info*) (track_info+1);
+    for (int sector_index = 0; sector_index < track->num_sectors; sector_index++) {
+        fdd_sector_t* sector = &track->sectors[sector_index];
+        const _fdd_cpc_dsk_sector_info* sector_info = &sector_infos[sector_index];
+        int sector_size;
+        if (ext) {
+            sector_size = (sector_info->ext[1]<<8) | sector_info->ext[0];
+        }
+        else {
+            sector_size = 0x80 << track_info->sector_size;
+        }
+        sector->info.upd765.c = sector_info->track;
+        sector->info.upd765.h = sector_info->side;
+        sector->info.upd765.r = sector_info->sector_id;
+        sector->info.upd765.n = sector_info->sector_size;
+        sector->info.upd765.st1 = sector_info->st1;
+        sector->info.upd765.st2 = sector_info->st2;
+        sector->data_offset = sector_data_offset;
+        sector->data_size = sector_size;
+        sector_data_offset += sector_size;
+    }
+    CHIPS_ASSERT((track->data_offset + track->data_size) == sector_data_offset);
+    track->indexed = true;
+    return true;
+}
+
+/* parse a standard .dsk image, with lazy indexing only the track offsets are computed upfront */
+static bool _fdd_cpc_parse_dsk(fdd_t* fdd, bool ext, bool lazy) {
+    CHIPS_ASSERT(fdd && fdd->data_ptr);
+    const _fdd_cpc_dsk_header* hdr = (const _fdd_cpc_dsk_header*) fdd->data_ptr;
     if (hdr->num_sides > 2) {
         return false;
     }
@@ -99,15 +159,12 @@ static bool _fdd_cpc_parse_dsk(fdd_t* fdd, bool ext, const uint8_t* data, int da
         return false;
     }
 
-    /* copy the data blob to the local buffer */
-    fdd->data_size = data_size;
-    memcpy(fdd->data, data, fdd->data_size);
-
     /* setup the disc structure */
     fdd_disc_t* disc = &fdd->disc;
     disc->formatted = true;
     disc->num_sides = hdr->num_sides;
     disc->num_tracks = hdr->num_tracks;
+    fdd->index_track = _fdd_cpc_index_track;
     int data_offset = sizeof(_fdd_cpc_dsk_header);
     for (int track_index = 0; track_index < disc->num_tracks; track_index++) {
         for (int side_index = 0; side_index < disc->num_sides; side_index++) {
@@ -121,54 +178,39 @@ static bool _fdd_cpc_parse_dsk(fdd_t* fdd, bool ext, const uint8_t* data, int da
                 track_size = (hdr->track_size_h<<8) | hdr->track_size_l;
             }
             if (track_size > 0) {
-                const _fdd_cpc_dsk_track_info* track_info = (const _fdd_cpc_dsk_track_info*) &fdd->data[data_offset];
-                if (0 != memcmp("Track-Info", track_info->magic, 10)) {
-                    return false;
-                }
-                if ((data_offset + track_size) > data_size) {
+                if ((data_offset + track_size) > fdd->data_size) {
                     return false;
                 }
                 track->data_offset = data_offset;
                 track->data_size = track_size;
-                track->num_sectors = track_info->num_sectors;
-                int sector_data_offset = data_offset + 0x100;
-                const _fdd_cpc_dsk_sector_info* sector_infos = (const _fdd_cpc_dsk_sector_info*) (track_info+1);
-                for (int sector_index = 0; sector_index < track->num_sectors; sector_index++) {
-                    fdd_sector_t* sector = &track->sectors[sector_index];
-                    const _fdd_cpc_dsk_sector_info* sector_info = &sector_infos[sector_index];
-                    int sector_size;
-                    if (ext) {
-                        sector_size = (sector_info->ext[1]<<8) | sector_info->ext[0];
-                    }
-                    else {
-                        sector_size = 0x80 << track_info->sector_size;
+                track->num_sectors = 0;
+                track->indexed = false;
+                if (!lazy) {
+                    if (!_fdd_cpc_index_track(disc, fdd->data_ptr, fdd->data_size, side_index, track_index)) {
+                        return false;
                     }
-                    sector->info.upd765.c = sector_info->track;
-                    sector->info.upd765.h = sector_info->side;
-                    sector->info.upd765.r = sector_info->sector_id;
-                    sector->info.upd765.n = sector_info->sector_size;
-                    sector->info.upd765.st1 = sector_info->st1;
-                    sector->info.upd765.st2 = sector_info->st2;
-                    sector->data_offset = sector_data_offset;
-                    sector->data_size = sector_size;
-                    sector_data_offset += sector_size;
                 }
                 data_offset += track_size;
-                CHIPS_ASSERT(data_offset == sector_data_offset);
             }
             else {
                 /* unformatted / non-existing track */
                 track->data_offset = 0;
                 track->data_size = 0;
                 track->num_sectors = 0;
+                track->indexed = true;
             }
         }
     }
     fdd->has_disc = true;
+    if (lazy && (disc->num_tracks > 0)) {
+        /* the drive head starts at track 0 */
+        _fdd_index_track(fdd, 0);
+    }
     return true;
 }
 
-bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size) {
+/* check the .dsk header, and either copy the image data or reference it */
+static bool _fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size, bool copy) {
     CHIPS_ASSERT(fdd);
     CHIPS_ASSERT(sizeof(_fdd_cpc_dsk_header) == 256);
     CHIPS_ASSERT(sizeof(_fdd_cpc_dsk_track_info) == 24);
@@ -179,7 +221,7 @@ bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size) {
     }
 
     /* check if the header is valid */
-    if (data_size > FDD_MAX_DISC_SIZE) {
+    if (copy && (data_size > FDD_MAX_DISC_SIZE)) {
         return false;
     }
     if (data_size <= (int)sizeof(_fdd_cpc_dsk_header)) {
@@ -196,7 +238,16 @@ bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size) {
         ext = true;
     }
     if (valid) {
-        if (!_fdd_cpc_parse_dsk(fdd, ext, data, data_size)) {
+        if (copy) {
+            /* copy the data blob to the local buffer */
+            memcpy(fdd->data, data, data_size);
+            fdd->data_ptr = fdd->data;
+        }
+        else {
+            fdd->data_ptr = data;
+        }
+        fdd->data_size = data_size;
+        if (!_fdd_cpc_parse_dsk(fdd, ext, !copy)) {
             fdd_eject_disc(fdd);
             return false;
         }
@@ -206,4 +257,12 @@ bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size) {
         return false;
     }
 }
+
+bool fdd_cpc_insert_dsk(fdd_t* fdd, const uint8_t* data, int data_size) {
+    return _fdd_cpc_insert_dsk(fdd, data, data_size, true);
+}
+
+bool fdd_cpc_insert_dsk_nocopy(fdd_t* fdd, const uint8_t* data, int data_size) {
+    return _fdd_cpc_insert_dsk(fdd, data, data_size, false);
+}
 #endif /* CHIPS_IMPL */
@@ -137,6 +137,20 @@
         m6502_set_pc(next_pc);
         ~~~~
 
+    ## NZ flag caching
+
+    Define M6502_NZ_CACHE before including the implementation to keep
+    the N and Z flags out of the status register: instead of updating
+    two bits in P after each load, transfer, logic and arithmetic
+    instruction, the emulator only stores the result byte, and N and
+    Z are derived from it when they are actually needed (by the branch
+    instructions, PHP, BRK and interrupts, and the m6502_p() function).
+    With the define, the N and Z bits in m6502_t.P are meaningless while
+    the CPU is running, always read and write the status register
+    through m6502_p() and m6502_set_p(). Snapshots contain the complete
+    status register in P, so that they can be exchanged between
+    emulators compiled with and without M6502_NZ_CACHE.
+
     ## Functions
     ~~~C
     uint64_t m6502_init(m6502_t* cpu, const m6502_desc_t* desc)
@@ -181,6 +195,16 @@
     ~~~
         Set and get 6502 registers and flags.
 
+    ~~~C
+    void m6502_snapshot_onsave(m6502_t* snapshot)
+    void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys)
+    ~~~
+        Helper functions for saving and loading system snapshots. A snapshot
+        of a m6502_t is a plain copy of the struct, call m6502_snapshot_onsave()
+        on the copy to clear the m6510 port IO callbacks and their user data.
+        Before a snapshot is copied back into a running m6502_t instance,
+        call m6502_snapshot_onload() on the snapshot to take the callbacks
+        over from the running instance.
 
     ## zlib/libpng license
 
@@ -291,6 +315,7 @@ typedef struct {
     uint16_t PC;        /* internal program counter register */
     uint16_t AD;        /* ADL/ADH internal register */
     uint8_t A,X,Y,S,P;  /* regular registers */
+    uint16_t nz;        /* N and Z flag source with M6502_NZ_CACHE */
     uint64_t PINS;      /* last stored pin state (do NOT modify) */
     uint16_t irq_pip;
     uint16_t nmi_pip;
@@ -315,6 +340,10 @@ uint64_t m6502_init(m6502_t* cpu, const m6502_desc_t* desc);
 uint64_t m6502_tick(m6502_t* cpu, uint64_t pins);
 /* perform m6510 port IO (only call this if M6510_CHECK_IO(pins) is true) */
 uint64_t m6510_iorq(m6502_t* cpu, uint64_t pins);
+/* clear host pointers in a snapshot before saving */
+void m6502_snapshot_onsave(m6502_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys);
 
 /* register access functions */
 void m6502_set_a(m6502_t* cpu, uint8_t v);
@@ -359,23 +388,50 @@ uint16_t m6502_pc(m6502_t* cpu);
     #define CHIPS_ASSERT(c) assert(c)
 #endif
 
+#if defined(M6502_NZ_CACHE)
+/*
+    The N and Z flags are kept in cpu->nz: Z is set if the lower 8 bits
+    are zero, and N is set if bit 7 or bit 8 is set (bit 8 is only needed
+    for the combination of N and Z set, which isn't the result of an
+    instruction, but can be loaded into the status register).
+*/
+static inline uint8_t _m6502_get_p(const m6502_t* cpu) {
+    return (cpu->P & ~(M6502_NF|M6502_ZF)) |
+           ((cpu->nz & 0xFF) ? 0 : M6502_ZF) |
+           ((cpu->nz | (cpu->nz >> 1)) & M6502_NF);
+}
+static inline void _m6502_set_p(m6502_t* cpu, uint8_t v) {
+    cpu->P = v;
+    cpu->nz = ((v & M6502_ZF) ? 0 : 1) | ((v & M6502_NF) << ((v & M6502_ZF) ? 1 : 0));
+}
+#define _M6502_NZ(p,v) (cpu->nz=(uint8_t)(v),(p))
+#define _M6502_SYNC_NZ() _m6502_set_p(cpu, cpu->P)
+#else
+static inline uint8_t _m6502_get_p(const m6502_t* cpu) {
+    return cpu->P;
+}
+static inline void _m6502_set_p(m6502_t* cpu, uint8_t v) {
+    cpu->P = v;
+}
+#define _M6502_NZ(p,v) ((p&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
+#define _M6502_SYNC_NZ()
+#endif
+
 /* register access functions */
 void m6502_set_a(m6502_t* cpu, uint8_t v) { cpu->A = v; }
 void m6502_set_x(m6502_t* cpu, uint8_t v) { cpu->X = v; }
 void m6502_set_y(m6502_t* cpu, uint8_t v) { cpu->Y = v; }
 void m6502_set_s(m6502_t* cpu, uint8_t v) { cpu->S = v; }
-void m6502_set_p(m6502_t* cpu, uint8_t v) { cpu->P = v; }
+void m6502_set_p(m6502_t* cpu, uint8_t v) { _m6502_set_p(cpu, v); }
 void m6502_set_pc(m6502_t* cpu, uint16_t v) { cpu->PC = v; }
 uint8_t m6502_a(m6502_t* cpu) { return cpu->A; }
 uint8_t m6502_x(m6502_t* cpu) { return cpu->X; }
 uint8_t m6502_y(m6502_t* cpu) { return cpu->Y; }
 uint8_t m6502_s(m6502_t* cpu) { return cpu->S; }
-uint8_t m6502_p(m6502_t* cpu) { return cpu->P; }
+uint8_t m6502_p(m6502_t* cpu) { return _m6502_get_p(cpu); }
 uint16_t m6502_pc(m6502_t* cpu) { return cpu->PC; }
 
-/* helper macros and functions for code-generated instruction decoder */
-#define _M6502_NZ(p,v) ((p&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
-
+/* helper functions for code-generated instruction decoder */
 static inline void _m6502_adc(m6502_t* cpu, uint8_t val) {
     if (cpu->bcd_enabled && (cpu->P & M6502_DF)) {
         /* decimal mode (credit goes to MAME) */
@@ -402,6 +458,7 @@ static inline void _m6502_adc(m6502_t* cpu, uint8_t val) {
             cpu->P |= M6502_CF;
         }
         cpu->A = (ah<<4) | (al & 0x0F);
+        _M6502_SYNC_NZ();
     }
     else {
         /* default mode */
@@ -445,6 +502,7 @@ static inline void _m6502_sbc(m6502_t* cpu, uint8_t val) {
             ah -= 6;
         }
         cpu->A = (ah<<4) | (al & 0x0F);
+        _M6502_SYNC_NZ();
     }
     else {
         /* default mode */
@@ -511,6 +569,7 @@ static inline void _m6502_bit(m6502_t* cpu, uint8_t v) {
         cpu->P |= M6502_ZF;
     }
     cpu->P |= v & (M6502_NF|M6502_VF);
+    _M6502_SYNC_NZ();
 }
 
 static inline void _m6502_arr(m6502_t* cpu) {
@@ -569,11 +628,12 @@ static inline void _m6502_sbx(m6502_t* cpu, uint8_t v) {
     cpu->X = (uint8_t)t;
 }
 #undef _M6502_NZ
+#undef _M6502_SYNC_NZ
 
 uint64_t m6502_init(m6502_t* c, const m6502_desc_t* desc) {
     CHIPS_ASSERT(c && desc);
     memset(c, 0, sizeof(*c));
-    c->P = M6502_ZF;
+    _m6502_set_p(c, M6502_ZF);
     c->bcd_enabled = !desc->bcd_disabled;
     c->PINS = M6502_RW | M6502_SYNC | M6502_RES;
     c->in_cb = desc->m6510_in_cb;
@@ -584,6 +644,22 @@ uint64_t m6502_init(m6502_t* c, const m6502_desc_t* desc) {
     return c->PINS;
 }
 
+void m6502_snapshot_onsave(m6502_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->user_data = 0;
+    snapshot->in_cb = 0;
+    snapshot->out_cb = 0;
+    snapshot->P = _m6502_get_p(snapshot);
+}
+
+void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->user_data = sys->user_data;
+    snapshot->in_cb = sys->in_cb;
+    snapshot->out_cb = sys->out_cb;
+    _m6502_set_p(snapshot, snapshot->P);
+}
+
 /* only call this when accessing address 0 or 1 (M6510_CHECK_IO(pins) evaluates to true) */
 uint64_t m6510_iorq(m6502_t* c, uint64_t pins) {
     CHIPS_ASSERT(c->in_cb && c->out_cb);
@@ -640,8 +716,17 @@ uint64_t m6510_iorq(m6502_t* c, uint64_t pins) {
 #define _RD() _ON(M6502_RW);
 /* a memory write tick */
 #define _WR() _OFF(M6502_RW);
+#if defined(M6502_NZ_CACHE)
+/* set N and Z flags depending on value */
+#define _NZ(v) c->nz=(uint8_t)(v)
+#else
 /* set N and Z flags depending on value */
 #define _NZ(v) c->P=((c->P&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
+#endif
+/* get the complete status register */
+#define _GP() _m6502_get_p(c)
+/* set the complete status register */
+#define _SP(v) _m6502_set_p(c,v)
 
 #if defined(_MSC_VER)
 #pragma warning(push)
@@ -715,7 +800,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x00<<3)|0: _SA(c->PC);break;
         case (0x00<<3)|1: if(0==(c->brk_flags&(M6502_BRK_IRQ|M6502_BRK_NMI))){c->PC++;}_SAD(0x0100|c->S--,c->PC>>8);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}break;
         case (0x00<<3)|2: _SAD(0x0100|c->S--,c->PC);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}break;
-        case (0x00<<3)|3: _SAD(0x0100|c->S--,c->P|M6502_XF);if(c->brk_flags&M6502_BRK_RESET){c->AD=0xFFFC;}else{_WR();if(c->brk_flags&M6502_BRK_NMI){c->AD=0xFFFA;}else{c->AD=0xFFFE;}}break;
+        case (0x00<<3)|3: _SAD(0x0100|c->S--,_GP()|M6502_XF);if(c->brk_flags&M6502_BRK_RESET){c->AD=0xFFFC;}else{_WR();if(c->brk_flags&M6502_BRK_NMI){c->AD=0xFFFA;}else{c->AD=0xFFFE;}}break;
         case (0x00<<3)|4: _SA(c->AD++);c->P|=(M6502_IF|M6502_BF);c->brk_flags=0; /* RES/NMI hijacking */break;
         case (0x00<<3)|5: _SA(c->AD);c->AD=_GD(); /* NMI "half-hijacking" not possible */break;
         case (0x00<<3)|6: c->PC=(_GD()<<8)|c->AD;_FETCH();break;
@@ -745,7 +830,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x03<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0x03<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0x03<<3)|5: c->AD=_GD();_WR();break;
-        case (0x03<<3)|6: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x03<<3)|6: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x03<<3)|7: _FETCH();break;
     /* NOP zp (undoc) */
         case (0x04<<3)|0: _SA(c->PC++);break;
@@ -778,14 +863,14 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x07<<3)|0: _SA(c->PC++);break;
         case (0x07<<3)|1: _SA(_GD());break;
         case (0x07<<3)|2: c->AD=_GD();_WR();break;
-        case (0x07<<3)|3: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x07<<3)|3: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x07<<3)|4: _FETCH();break;
         case (0x07<<3)|5: assert(false);break;
         case (0x07<<3)|6: assert(false);break;
         case (0x07<<3)|7: assert(false);break;
     /* PHP  */
         case (0x08<<3)|0: _SA(c->PC);break;
-        case (0x08<<3)|1: _SAD(0x0100|c->S--,c->P|M6502_XF);_WR();break;
+        case (0x08<<3)|1: _SAD(0x0100|c->S--,_GP()|M6502_XF);_WR();break;
         case (0x08<<3)|2: _FETCH();break;
         case (0x08<<3)|3: assert(false);break;
         case (0x08<<3)|4: assert(false);break;
@@ -851,13 +936,13 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x0F<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0x0F<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0x0F<<3)|3: c->AD=_GD();_WR();break;
-        case (0x0F<<3)|4: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x0F<<3)|4: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x0F<<3)|5: _FETCH();break;
         case (0x0F<<3)|6: assert(false);break;
         case (0x0F<<3)|7: assert(false);break;
     /* BPL # */
         case (0x10<<3)|0: _SA(c->PC++);break;
-        case (0x10<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((c->P&0x80)!=0x0){_FETCH();};break;
+        case (0x10<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((_GP()&0x80)!=0x0){_FETCH();};break;
         case (0x10<<3)|2: _SA((c->PC&0xFF00)|(c->AD&0x00FF));if((c->AD&0xFF00)==(c->PC&0xFF00)){c->PC=c->AD;c->irq_pip>>=1;c->nmi_pip>>=1;_FETCH();};break;
         case (0x10<<3)|3: c->PC=c->AD;_FETCH();break;
         case (0x10<<3)|4: assert(false);break;
@@ -889,7 +974,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x13<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x13<<3)|4: _SA(c->AD+c->Y);break;
         case (0x13<<3)|5: c->AD=_GD();_WR();break;
-        case (0x13<<3)|6: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x13<<3)|6: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x13<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0x14<<3)|0: _SA(c->PC++);break;
@@ -923,7 +1008,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x17<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0x17<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0x17<<3)|3: c->AD=_GD();_WR();break;
-        case (0x17<<3)|4: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x17<<3)|4: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x17<<3)|5: _FETCH();break;
         case (0x17<<3)|6: assert(false);break;
         case (0x17<<3)|7: assert(false);break;
@@ -960,7 +1045,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x1B<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x1B<<3)|3: _SA(c->AD+c->Y);break;
         case (0x1B<<3)|4: c->AD=_GD();_WR();break;
-        case (0x1B<<3)|5: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x1B<<3)|5: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x1B<<3)|6: _FETCH();break;
         case (0x1B<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -996,7 +1081,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x1F<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0x1F<<3)|3: _SA(c->AD+c->X);break;
         case (0x1F<<3)|4: c->AD=_GD();_WR();break;
-        case (0x1F<<3)|5: c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();break;
+        case (0x1F<<3)|5: c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;c->A|=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x1F<<3)|6: _FETCH();break;
         case (0x1F<<3)|7: assert(false);break;
     /* JSR  */
@@ -1033,7 +1118,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x23<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0x23<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0x23<<3)|5: c->AD=_GD();_WR();break;
-        case (0x23<<3)|6: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x23<<3)|6: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x23<<3)|7: _FETCH();break;
     /* BIT zp */
         case (0x24<<3)|0: _SA(c->PC++);break;
@@ -1066,7 +1151,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x27<<3)|0: _SA(c->PC++);break;
         case (0x27<<3)|1: _SA(_GD());break;
         case (0x27<<3)|2: c->AD=_GD();_WR();break;
-        case (0x27<<3)|3: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x27<<3)|3: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x27<<3)|4: _FETCH();break;
         case (0x27<<3)|5: assert(false);break;
         case (0x27<<3)|6: assert(false);break;
@@ -1075,7 +1160,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x28<<3)|0: _SA(c->PC);break;
         case (0x28<<3)|1: _SA(0x0100|c->S++);break;
         case (0x28<<3)|2: _SA(0x0100|c->S);break;
-        case (0x28<<3)|3: c->P=(_GD()|M6502_BF)&~M6502_XF;_FETCH();break;
+        case (0x28<<3)|3: _SP((_GD()|M6502_BF)&~M6502_XF);_FETCH();break;
         case (0x28<<3)|4: assert(false);break;
         case (0x28<<3)|5: assert(false);break;
         case (0x28<<3)|6: assert(false);break;
@@ -1139,13 +1224,13 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x2F<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0x2F<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0x2F<<3)|3: c->AD=_GD();_WR();break;
-        case (0x2F<<3)|4: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x2F<<3)|4: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x2F<<3)|5: _FETCH();break;
         case (0x2F<<3)|6: assert(false);break;
         case (0x2F<<3)|7: assert(false);break;
     /* BMI # */
         case (0x30<<3)|0: _SA(c->PC++);break;
-        case (0x30<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((c->P&0x80)!=0x80){_FETCH();};break;
+        case (0x30<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((_GP()&0x80)!=0x80){_FETCH();};break;
         case (0x30<<3)|2: _SA((c->PC&0xFF00)|(c->AD&0x00FF));if((c->AD&0xFF00)==(c->PC&0xFF00)){c->PC=c->AD;c->irq_pip>>=1;c->nmi_pip>>=1;_FETCH();};break;
         case (0x30<<3)|3: c->PC=c->AD;_FETCH();break;
         case (0x30<<3)|4: assert(false);break;
@@ -1177,7 +1262,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x33<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x33<<3)|4: _SA(c->AD+c->Y);break;
         case (0x33<<3)|5: c->AD=_GD();_WR();break;
-        case (0x33<<3)|6: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x33<<3)|6: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x33<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0x34<<3)|0: _SA(c->PC++);break;
@@ -1211,7 +1296,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x37<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0x37<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0x37<<3)|3: c->AD=_GD();_WR();break;
-        case (0x37<<3)|4: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x37<<3)|4: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x37<<3)|5: _FETCH();break;
         case (0x37<<3)|6: assert(false);break;
         case (0x37<<3)|7: assert(false);break;
@@ -1248,7 +1333,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x3B<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x3B<<3)|3: _SA(c->AD+c->Y);break;
         case (0x3B<<3)|4: c->AD=_GD();_WR();break;
-        case (0x3B<<3)|5: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x3B<<3)|5: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x3B<<3)|6: _FETCH();break;
         case (0x3B<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -1284,14 +1369,14 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x3F<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0x3F<<3)|3: _SA(c->AD+c->X);break;
         case (0x3F<<3)|4: c->AD=_GD();_WR();break;
-        case (0x3F<<3)|5: c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();break;
+        case (0x3F<<3)|5: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}c->A&=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x3F<<3)|6: _FETCH();break;
         case (0x3F<<3)|7: assert(false);break;
     /* RTI  */
         case (0x40<<3)|0: _SA(c->PC);break;
         case (0x40<<3)|1: _SA(0x0100|c->S++);break;
         case (0x40<<3)|2: _SA(0x0100|c->S++);break;
-        case (0x40<<3)|3: _SA(0x0100|c->S++);c->P=(_GD()|M6502_BF)&~M6502_XF;break;
+        case (0x40<<3)|3: _SA(0x0100|c->S++);_SP((_GD()|M6502_BF)&~M6502_XF);break;
         case (0x40<<3)|4: _SA(0x0100|c->S);c->AD=_GD();break;
         case (0x40<<3)|5: c->PC=(_GD()<<8)|c->AD;_FETCH();break;
         case (0x40<<3)|6: assert(false);break;
@@ -1321,7 +1406,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x43<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0x43<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0x43<<3)|5: c->AD=_GD();_WR();break;
-        case (0x43<<3)|6: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x43<<3)|6: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x43<<3)|7: _FETCH();break;
     /* NOP zp (undoc) */
         case (0x44<<3)|0: _SA(c->PC++);break;
@@ -1354,7 +1439,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x47<<3)|0: _SA(c->PC++);break;
         case (0x47<<3)|1: _SA(_GD());break;
         case (0x47<<3)|2: c->AD=_GD();_WR();break;
-        case (0x47<<3)|3: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x47<<3)|3: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x47<<3)|4: _FETCH();break;
         case (0x47<<3)|5: assert(false);break;
         case (0x47<<3)|6: assert(false);break;
@@ -1427,7 +1512,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x4F<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0x4F<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0x4F<<3)|3: c->AD=_GD();_WR();break;
-        case (0x4F<<3)|4: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x4F<<3)|4: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x4F<<3)|5: _FETCH();break;
         case (0x4F<<3)|6: assert(false);break;
         case (0x4F<<3)|7: assert(false);break;
@@ -1465,7 +1550,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x53<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x53<<3)|4: _SA(c->AD+c->Y);break;
         case (0x53<<3)|5: c->AD=_GD();_WR();break;
-        case (0x53<<3)|6: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x53<<3)|6: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x53<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0x54<<3)|0: _SA(c->PC++);break;
@@ -1499,7 +1584,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x57<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0x57<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0x57<<3)|3: c->AD=_GD();_WR();break;
-        case (0x57<<3)|4: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x57<<3)|4: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x57<<3)|5: _FETCH();break;
         case (0x57<<3)|6: assert(false);break;
         case (0x57<<3)|7: assert(false);break;
@@ -1536,7 +1621,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x5B<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x5B<<3)|3: _SA(c->AD+c->Y);break;
         case (0x5B<<3)|4: c->AD=_GD();_WR();break;
-        case (0x5B<<3)|5: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x5B<<3)|5: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x5B<<3)|6: _FETCH();break;
         case (0x5B<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -1572,7 +1657,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x5F<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0x5F<<3)|3: _SA(c->AD+c->X);break;
         case (0x5F<<3)|4: c->AD=_GD();_WR();break;
-        case (0x5F<<3)|5: c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();break;
+        case (0x5F<<3)|5: c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;c->A^=c->AD;_NZ(c->A);_SD(c->AD);_WR();break;
         case (0x5F<<3)|6: _FETCH();break;
         case (0x5F<<3)|7: assert(false);break;
     /* RTS  */
@@ -1609,7 +1694,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x63<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0x63<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0x63<<3)|5: c->AD=_GD();_WR();break;
-        case (0x63<<3)|6: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x63<<3)|6: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x63<<3)|7: _FETCH();break;
     /* NOP zp (undoc) */
         case (0x64<<3)|0: _SA(c->PC++);break;
@@ -1642,7 +1727,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x67<<3)|0: _SA(c->PC++);break;
         case (0x67<<3)|1: _SA(_GD());break;
         case (0x67<<3)|2: c->AD=_GD();_WR();break;
-        case (0x67<<3)|3: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x67<<3)|3: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x67<<3)|4: _FETCH();break;
         case (0x67<<3)|5: assert(false);break;
         case (0x67<<3)|6: assert(false);break;
@@ -1715,7 +1800,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x6F<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0x6F<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0x6F<<3)|3: c->AD=_GD();_WR();break;
-        case (0x6F<<3)|4: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x6F<<3)|4: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x6F<<3)|5: _FETCH();break;
         case (0x6F<<3)|6: assert(false);break;
         case (0x6F<<3)|7: assert(false);break;
@@ -1753,7 +1838,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x73<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x73<<3)|4: _SA(c->AD+c->Y);break;
         case (0x73<<3)|5: c->AD=_GD();_WR();break;
-        case (0x73<<3)|6: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x73<<3)|6: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x73<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0x74<<3)|0: _SA(c->PC++);break;
@@ -1787,7 +1872,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x77<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0x77<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0x77<<3)|3: c->AD=_GD();_WR();break;
-        case (0x77<<3)|4: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x77<<3)|4: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x77<<3)|5: _FETCH();break;
         case (0x77<<3)|6: assert(false);break;
         case (0x77<<3)|7: assert(false);break;
@@ -1824,7 +1909,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x7B<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0x7B<<3)|3: _SA(c->AD+c->Y);break;
         case (0x7B<<3)|4: c->AD=_GD();_WR();break;
-        case (0x7B<<3)|5: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x7B<<3)|5: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x7B<<3)|6: _FETCH();break;
         case (0x7B<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -1860,7 +1945,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0x7F<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0x7F<<3)|3: _SA(c->AD+c->X);break;
         case (0x7F<<3)|4: c->AD=_GD();_WR();break;
-        case (0x7F<<3)|5: c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();break;
+        case (0x7F<<3)|5: {const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}_m6502_adc(c,c->AD);_SD(c->AD);_WR();break;
         case (0x7F<<3)|6: _FETCH();break;
         case (0x7F<<3)|7: assert(false);break;
     /* NOP # (undoc) */
@@ -2473,7 +2558,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xC3<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0xC3<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0xC3<<3)|5: c->AD=_GD();_WR();break;
-        case (0xC3<<3)|6: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xC3<<3)|6: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xC3<<3)|7: _FETCH();break;
     /* CPY zp */
         case (0xC4<<3)|0: _SA(c->PC++);break;
@@ -2506,7 +2591,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xC7<<3)|0: _SA(c->PC++);break;
         case (0xC7<<3)|1: _SA(_GD());break;
         case (0xC7<<3)|2: c->AD=_GD();_WR();break;
-        case (0xC7<<3)|3: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xC7<<3)|3: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xC7<<3)|4: _FETCH();break;
         case (0xC7<<3)|5: assert(false);break;
         case (0xC7<<3)|6: assert(false);break;
@@ -2579,13 +2664,13 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xCF<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0xCF<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0xCF<<3)|3: c->AD=_GD();_WR();break;
-        case (0xCF<<3)|4: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xCF<<3)|4: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xCF<<3)|5: _FETCH();break;
         case (0xCF<<3)|6: assert(false);break;
         case (0xCF<<3)|7: assert(false);break;
     /* BNE # */
         case (0xD0<<3)|0: _SA(c->PC++);break;
-        case (0xD0<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((c->P&0x2)!=0x0){_FETCH();};break;
+        case (0xD0<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((_GP()&0x2)!=0x0){_FETCH();};break;
         case (0xD0<<3)|2: _SA((c->PC&0xFF00)|(c->AD&0x00FF));if((c->AD&0xFF00)==(c->PC&0xFF00)){c->PC=c->AD;c->irq_pip>>=1;c->nmi_pip>>=1;_FETCH();};break;
         case (0xD0<<3)|3: c->PC=c->AD;_FETCH();break;
         case (0xD0<<3)|4: assert(false);break;
@@ -2617,7 +2702,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xD3<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0xD3<<3)|4: _SA(c->AD+c->Y);break;
         case (0xD3<<3)|5: c->AD=_GD();_WR();break;
-        case (0xD3<<3)|6: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xD3<<3)|6: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xD3<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0xD4<<3)|0: _SA(c->PC++);break;
@@ -2651,7 +2736,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xD7<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0xD7<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0xD7<<3)|3: c->AD=_GD();_WR();break;
-        case (0xD7<<3)|4: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xD7<<3)|4: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xD7<<3)|5: _FETCH();break;
         case (0xD7<<3)|6: assert(false);break;
         case (0xD7<<3)|7: assert(false);break;
@@ -2688,7 +2773,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xDB<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0xDB<<3)|3: _SA(c->AD+c->Y);break;
         case (0xDB<<3)|4: c->AD=_GD();_WR();break;
-        case (0xDB<<3)|5: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xDB<<3)|5: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xDB<<3)|6: _FETCH();break;
         case (0xDB<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -2724,7 +2809,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xDF<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0xDF<<3)|3: _SA(c->AD+c->X);break;
         case (0xDF<<3)|4: c->AD=_GD();_WR();break;
-        case (0xDF<<3)|5: c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();break;
+        case (0xDF<<3)|5: c->AD--;_m6502_cmp(c, c->A, c->AD);_SD(c->AD);_WR();break;
         case (0xDF<<3)|6: _FETCH();break;
         case (0xDF<<3)|7: assert(false);break;
     /* CPX # */
@@ -2761,7 +2846,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xE3<<3)|3: _SA((c->AD+1)&0xFF);c->AD=_GD();break;
         case (0xE3<<3)|4: _SA((_GD()<<8)|c->AD);break;
         case (0xE3<<3)|5: c->AD=_GD();_WR();break;
-        case (0xE3<<3)|6: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xE3<<3)|6: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xE3<<3)|7: _FETCH();break;
     /* CPX zp */
         case (0xE4<<3)|0: _SA(c->PC++);break;
@@ -2794,7 +2879,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xE7<<3)|0: _SA(c->PC++);break;
         case (0xE7<<3)|1: _SA(_GD());break;
         case (0xE7<<3)|2: c->AD=_GD();_WR();break;
-        case (0xE7<<3)|3: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xE7<<3)|3: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xE7<<3)|4: _FETCH();break;
         case (0xE7<<3)|5: assert(false);break;
         case (0xE7<<3)|6: assert(false);break;
@@ -2867,13 +2952,13 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xEF<<3)|1: _SA(c->PC++);c->AD=_GD();break;
         case (0xEF<<3)|2: _SA((_GD()<<8)|c->AD);break;
         case (0xEF<<3)|3: c->AD=_GD();_WR();break;
-        case (0xEF<<3)|4: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xEF<<3)|4: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xEF<<3)|5: _FETCH();break;
         case (0xEF<<3)|6: assert(false);break;
         case (0xEF<<3)|7: assert(false);break;
     /* BEQ # */
         case (0xF0<<3)|0: _SA(c->PC++);break;
-        case (0xF0<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((c->P&0x2)!=0x2){_FETCH();};break;
+        case (0xF0<<3)|1: _SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((_GP()&0x2)!=0x2){_FETCH();};break;
         case (0xF0<<3)|2: _SA((c->PC&0xFF00)|(c->AD&0x00FF));if((c->AD&0xFF00)==(c->PC&0xFF00)){c->PC=c->AD;c->irq_pip>>=1;c->nmi_pip>>=1;_FETCH();};break;
         case (0xF0<<3)|3: c->PC=c->AD;_FETCH();break;
         case (0xF0<<3)|4: assert(false);break;
@@ -2905,7 +2990,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xF3<<3)|3: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0xF3<<3)|4: _SA(c->AD+c->Y);break;
         case (0xF3<<3)|5: c->AD=_GD();_WR();break;
-        case (0xF3<<3)|6: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xF3<<3)|6: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xF3<<3)|7: _FETCH();break;
     /* NOP zp,X (undoc) */
         case (0xF4<<3)|0: _SA(c->PC++);break;
@@ -2939,7 +3024,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xF7<<3)|1: c->AD=_GD();_SA(c->AD);break;
         case (0xF7<<3)|2: _SA((c->AD+c->X)&0x00FF);break;
         case (0xF7<<3)|3: c->AD=_GD();_WR();break;
-        case (0xF7<<3)|4: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xF7<<3)|4: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xF7<<3)|5: _FETCH();break;
         case (0xF7<<3)|6: assert(false);break;
         case (0xF7<<3)|7: assert(false);break;
@@ -2976,7 +3061,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xFB<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));break;
         case (0xFB<<3)|3: _SA(c->AD+c->Y);break;
         case (0xFB<<3)|4: c->AD=_GD();_WR();break;
-        case (0xFB<<3)|5: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xFB<<3)|5: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xFB<<3)|6: _FETCH();break;
         case (0xFB<<3)|7: assert(false);break;
     /* NOP abs,X (undoc) */
@@ -3012,7 +3097,7 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
         case (0xFF<<3)|2: c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));break;
         case (0xFF<<3)|3: _SA(c->AD+c->X);break;
         case (0xFF<<3)|4: c->AD=_GD();_WR();break;
-        case (0xFF<<3)|5: c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();break;
+        case (0xFF<<3)|5: c->AD++;_m6502_sbc(c,c->AD);_SD(c->AD);_WR();break;
         case (0xFF<<3)|6: _FETCH();break;
         case (0xFF<<3)|7: assert(false);break;
 
@@ -3037,4 +3122,6 @@ uint64_t m6502_tick(m6502_t* c, uint64_t pins) {
 #undef _RD
 #undef _WR
 #undef _NZ
+#undef _GP
+#undef _SP
 #endif /* CHIPS_IMPL */
@@ -86,6 +86,31 @@
     m6522_reset(&sys->via);
     ~~~
 
+    ## Lazy Timer Evaluation
+
+    Most of the time the VIA does nothing else than decrementing its
+    timers. When the chip is in such a 'quiet' state (no delay-pipeline
+    activity, no CA/CB edges, no register access and no timer underflow
+    in sight), m6522_tick() only updates the port and IRQ pins, and
+    defers the timer decrements. The deferred ticks are applied in one
+    step (computed from the number of elapsed ticks) before the next
+    register access, before the next timer underflow, or whenever a
+    CA1/CA2/CB1/CB2 edge or PB6 pulse is detected, so that all externally
+    visible behaviour stays cycle-exact.
+
+    If the timer state in m6522_t must be inspected directly (for instance
+    in a debugger UI), call m6522_sync() first to apply the deferred ticks:
+
+    ~~~C
+    m6522_sync(&sys->via);
+    ~~~
+
+    The function m6522_deadline() returns the number of ticks until the
+    next timer underflow, assuming that the input pins don't change
+    and the chip isn't accessed by the CPU (a return value of 0 means that
+    the chip will need to do 'real work' in the next tick). This can be
+    used by system emulators to decide how long a VIA can be left alone.
+
     ## LINKS
 
     On timer behaviour when hitting zero:
@@ -291,6 +316,8 @@ typedef struct {
     uint8_t acr;        /* auxilary control register */
     uint8_t pcr;        /* peripheral control register */
     uint64_t pins;
+    uint32_t lazy_ticks;    /* number of deferred timer ticks */
+    uint32_t lazy_deadline; /* max number of ticks which can be deferred */
 } m6522_t;
 
 /* extract 8-bit data bus from 64-bit pins */
@@ -314,6 +341,10 @@ void m6522_init(m6522_t* m6522);
 void m6522_reset(m6522_t* m6522);
 /* tick the m6522 */
 uint64_t m6522_tick(m6522_t* m6522, uint64_t pins);
+/* apply deferred timer ticks (call before inspecting timer state) */
+void m6522_sync(m6522_t* m6522);
+/* number of ticks until the next timer underflow (0: chip isn't idle) */
+uint32_t m6522_deadline(m6522_t* m6522);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -379,6 +410,7 @@ void m6522_init(m6522_t* c) {
 */
 void m6522_reset(m6522_t* c) {
     CHIPS_ASSERT(c);
+    m6522_sync(c);
     _m6522_init_port(&c->pa);
     _m6522_init_port(&c->pb);
     _m6522_init_timer(&c->t1, true);
@@ -629,9 +661,8 @@ static uint64_t _m6522_update_irq(m6522_t* c, uint64_t pins) {
     return pins;
 }
 
-/* perform a tick */
+/* perform a tick (port input pins must have been read already) */
 static uint64_t _m6522_tick(m6522_t* c, uint64_t pins) {
-    _m6522_read_port_pins(c, pins);
     _m6522_update_cab(c);
     _m6522_tick_t1(c);
     _m6522_tick_t2(c, pins);
@@ -839,8 +870,79 @@ static void _m6522_write(m6522_t* c, uint8_t addr, uint8_t data) {
     }
 }
 
+/*--- lazy timer evaluation ---*/
+
+/* number of ticks the timers can be left alone, 0 if the chip isn't quiet */
+static uint32_t _m6522_quiet_deadline(m6522_t* c) {
+    /* both counter pipelines must be in steady 'counting' state, no reload pending */
+    if ((c->t1.pip != 0x0003) || (c->t2.pip != 0x0003)) {
+        return 0;
+    }
+    /* the interrupt pipeline must be in steady state */
+    if (c->intr.pip != ((c->intr.ifr & c->intr.ier) ? 1 : 0)) {
+        return 0;
+    }
+    /* T1 underflows (and reloads) when decrementing from 0 */
+    uint32_t deadline = c->t1.counter;
+    /* T2 only matters until it has triggered its oneshot interrupt */
+    if (!c->t2.t_bit) {
+        if (M6522_ACR_T2_COUNT_PB6(c)) {
+            if (0xFFFF == c->t2.counter) {
+                deadline = 0;
+            }
+        }
+        else if (c->t2.counter < deadline) {
+            deadline = c->t2.counter;
+        }
+    }
+    return deadline;
+}
+
+/* check if the current tick can be deferred (port pins must have been read) */
+static inline bool _m6522_can_defer(m6522_t* c, uint64_t pins) {
+    if (c->pa.c1_triggered || c->pa.c2_triggered || c->pb.c1_triggered || c->pb.c2_triggered) {
+        return false;
+    }
+    if (M6522_ACR_T2_COUNT_PB6(c) && (M6522_PB6 & (~pins & (pins ^ c->pins)))) {
+        return false;
+    }
+    if (0 == c->lazy_ticks) {
+        c->lazy_deadline = _m6522_quiet_deadline(c);
+    }
+    return c->lazy_ticks < c->lazy_deadline;
+}
+
+void m6522_sync(m6522_t* c) {
+    CHIPS_ASSERT(c);
+    if (c->lazy_ticks > 0) {
+        /* the deadline guarantees that T1 doesn't underflow, and that
+           T2 only wraps around after it has fired its interrupt
+        */
+        const uint16_t ticks = (uint16_t) c->lazy_ticks;
+        c->t1.counter -= ticks;
+        c->t1.t_out = false;
+        if (!M6522_ACR_T2_COUNT_PB6(c)) {
+            c->t2.counter -= ticks;
+        }
+        c->t2.t_out = (0xFFFF == c->t2.counter);
+        c->lazy_ticks = 0;
+    }
+}
+
+uint32_t m6522_deadline(m6522_t* c) {
+    CHIPS_ASSERT(c);
+    if (c->lazy_ticks > 0) {
+        return c->lazy_deadline - c->lazy_ticks;
+    }
+    else {
+        return _m6522_quiet_deadline(c);
+    }
+}
+
 uint64_t m6522_tick(m6522_t* c, uint64_t pins) {
-    if ((pins & (M6522_CS1|M6522_CS2)) == M6522_CS1) {
+    const bool cs = (pins & (M6522_CS1|M6522_CS2)) == M6522_CS1;
+    if (cs) {
+        m6522_sync(c);
         uint8_t addr = pins & M6522_RS_PINS;
         if (pins & M6522_RW) {
             uint8_t data = _m6522_read(c, addr);
@@ -852,7 +954,20 @@ uint64_t m6522_tick(m6522_t* c, uint64_t pins) {
         }
     }
     /* FIXME: move tick above read/write? */
-    pins = _m6522_tick(c, pins);
+    _m6522_read_port_pins(c, pins);
+    if (!cs && _m6522_can_defer(c, pins)) {
+        /* quiet tick: timers are evaluated later in m6522_sync(),
+           the delay-pipelines are in a steady state, and CA/CB
+           didn't trigger, so only the IRQ and port pins need updating
+        */
+        c->lazy_ticks++;
+        pins = _m6522_update_irq(c, pins);
+        pins = _m6522_write_port_pins(c, pins);
+    }
+    else {
+        m6522_sync(c);
+        pins = _m6522_tick(c, pins);
+    }
     c->pins = pins;
     return pins;
 }
@@ -48,6 +48,19 @@
     - https://ist.uwaterloo.ca/~schepers/MJK/cia6526.html
     - https://ist.uwaterloo.ca/~schepers/MJK/cia6526.html
 
+    ## Lazy Timer Evaluation
+
+    When both timers are in a 'quiet' state (delay-pipelines settled, no
+    pending force-load, no timer underflow in sight, no FLAG edge and no
+    register access), m6526_tick() only updates the port and IRQ pins and
+    defers the timer decrements. The deferred ticks are applied in one step
+    before the next register access or timer underflow, so that all
+    externally visible behaviour stays cycle-exact.
+
+    Call m6526_sync() before inspecting the timer state in m6526_t directly,
+    and m6526_deadline() to get the number of ticks until the next timer
+    underflow (0 means the chip needs to do 'real work' in the next tick).
+
     TODO: Documentation
     
     ## zlib/libpng license
@@ -211,6 +224,8 @@ typedef struct {
     m6526_timer_t tb;
     m6526_int_t intr;
     uint64_t pins;
+    uint32_t lazy_ticks;    /* number of deferred timer ticks */
+    uint32_t lazy_deadline; /* max number of ticks which can be deferred */
 } m6526_t;
 
 /* extract 8-bit data bus from 64-bit pins */
@@ -234,6 +249,10 @@ void m6526_init(m6526_t* c);
 void m6526_reset(m6526_t* c);
 /* tick the m6526_t instance */
 uint64_t m6526_tick(m6526_t* c, uint64_t pins);
+/* apply deferred timer ticks (call before inspecting timer state) */
+void m6526_sync(m6526_t* c);
+/* number of ticks until the next timer underflow (0: chip isn't idle) */
+uint32_t m6526_deadline(m6526_t* c);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -291,6 +310,8 @@ void m6526_reset(m6526_t* c) {
     _m6526_init_timer(&c->tb);
     _m6526_init_interrupt(&c->intr);
     c->pins = 0;
+    c->lazy_ticks = 0;
+    c->lazy_deadline = 0;
 }
 
 /*--- delay-pipeline macros ---*/
@@ -628,7 +649,103 @@ static void _m6526_write(m6526_t* c, uint8_t addr, uint8_t data) {
     }
 }
 
+/*--- lazy timer evaluation ---*/
+static inline bool _m6526_timer_counting(const m6526_timer_t* t) {
+    return 0x0003 == (t->pip & 0xFF);
+}
+
+/* number of ticks a timer can be left alone, 0 if the timer isn't quiet */
+static uint32_t _m6526_timer_deadline(const m6526_timer_t* t, bool phi2) {
+    if (t->t_out || M6526_FORCE_LOAD(t->cr)) {
+        return 0;
+    }
+    /* the pipelines must be in the state they would be in after the next tick */
+    const uint32_t count_pip = (M6526_TIMER_STARTED(t->cr) && phi2) ? 0x0003 : 0;
+    const uint32_t oneshot_pip = M6526_RUNMODE_ONESHOT(t->cr) ? 0x0100 : 0;
+    if (t->pip != (count_pip | oneshot_pip)) {
+        return 0;
+    }
+    if (count_pip) {
+        /* timer underflows when the counter is decremented to 0 */
+        return (t->counter > 0) ? (t->counter - 1) : 0;
+    }
+    else {
+        return 0xFFFFFFFF;
+    }
+}
+
+/* number of ticks the timers can be left alone, 0 if the chip isn't quiet */
+static uint32_t _m6526_quiet_deadline(m6526_t* c) {
+    /* interrupt pipelines must be in steady state */
+    if (c->intr.imr != c->intr.imr1) {
+        return 0;
+    }
+    if (c->intr.pip != (uint32_t)((c->intr.icr & c->intr.imr) ? 1 : 0)) {
+        return 0;
+    }
+    /* NOTE: in the TA and TACNT input modes, timer B doesn't count while
+       timer A doesn't underflow, so it can be treated like a stopped timer
+    */
+    uint32_t deadline = _m6526_timer_deadline(&c->ta, M6526_TA_INMODE_PHI2(c->ta.cr));
+    if (deadline > 0) {
+        const uint32_t tb_deadline = _m6526_timer_deadline(&c->tb, M6526_TB_INMODE_PHI2(c->tb.cr));
+        if (tb_deadline < deadline) {
+            deadline = tb_deadline;
+        }
+    }
+    return deadline;
+}
+
+/* check if the current tick can be deferred */
+static inline bool _m6526_can_defer(m6526_t* c, uint64_t pins) {
+    if ((pins & M6526_FLAG) && !c->intr.flag) {
+        return false;
+    }
+    if (0 == c->lazy_ticks) {
+        c->lazy_deadline = _m6526_quiet_deadline(c);
+    }
+    return c->lazy_ticks < c->lazy_deadline;
+}
+
+void m6526_sync(m6526_t* c) {
+    CHIPS_ASSERT(c);
+    if (c->lazy_ticks > 0) {
+        /* the deadline guarantees that no timer reaches zero */
+        const uint16_t ticks = (uint16_t) c->lazy_ticks;
+        if (_m6526_timer_counting(&c->ta)) {
+            c->ta.counter -= ticks;
+        }
+        if (_m6526_timer_counting(&c->tb)) {
+            c->tb.counter -= ticks;
+        }
+        c->lazy_ticks = 0;
+    }
+}
+
+uint32_t m6526_deadline(m6526_t* c) {
+    CHIPS_ASSERT(c);
+    if (c->lazy_ticks > 0) {
+        return c->lazy_deadline - c->lazy_ticks;
+    }
+    else {
+        return _m6526_quiet_deadline(c);
+    }
+}
+
 uint64_t m6526_tick(m6526_t* c, uint64_t pins) {
+    if (!(pins & M6526_CS) && _m6526_can_defer(c, pins)) {
+        /* quiet tick: timers are evaluated later in m6526_sync(),
+           the delay-pipelines are in a steady state, so only
+           the IRQ and port pins need updating
+        */
+        c->lazy_ticks++;
+        _m6526_read_port_pins(c, pins);
+        pins = _m6526_update_irq(c, pins);
+        pins = _m6526_write_port_pins(c, pins);
+        c->pins = pins;
+        return pins;
+    }
+    m6526_sync(c);
     pins = _m6526_tick(c, pins);
     if (pins & M6526_CS) {
         uint8_t addr = pins & M6526_RS;
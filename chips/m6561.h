@@ -21,6 +21,15 @@
 
     TODO: Documentation
 
+    ## Headless Mode
+
+    If m6561_t.headless is set to true, no pixels are written to the
+    framebuffer and the sound generators are not ticked (their state
+    isn't visible to the CPU), so the M6561_SAMPLE pin is never set.
+    The raster counter, video memory fetches and register reads
+    work exactly as with video and audio output. The flag can be toggled
+    at any time.
+
     ## Links
 
     http://sleepingelephant.com/ipw-web/bulletin/bb/viewtopic.php?f=11&t=8733&sid=59d3d281086e98689f6d1f95c4a1c4a9
@@ -220,6 +229,7 @@ typedef struct {
     m6561_fetch_t fetch_cb; /* memory fetch callback */
     void* user_data;        /* memory fetch callback user data */
     bool debug_vis;
+    bool headless;          /* if true, skip pixel decoding and sound generation */
     uint8_t regs[M6561_NUM_REGS];
     m6561_raster_unit_t rs;
     m6561_memory_unit_t mem;
@@ -242,6 +252,11 @@ int m6561_display_height(m6561_t* vic);
 /* get 32-bit RGBA8 value from color index (0..15) */
 uint32_t m6561_color(int i);
 
+/* clear host pointers in a snapshot before saving */
+void m6561_snapshot_onsave(m6561_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void m6561_snapshot_onload(m6561_t* snapshot, m6561_t* sys);
+
 #ifdef __cplusplus
 } /* extern "C" */
 #endif
@@ -448,7 +463,7 @@ static inline void _m6561_decode_pixels(m6561_t* vic, uint32_t* dst) {
 static void _m6561_tick_video(m6561_t* vic) {
 
     /* decode pixels, each tick is 4 pixels */
-    if (vic->crt.rgba8_buffer) {
+    if (vic->crt.rgba8_buffer && !vic->headless) {
         int x, y, w;
         if (vic->debug_vis) {
             x = vic->rs.h_count;
@@ -652,10 +667,28 @@ uint64_t m6561_tick(m6561_t* vic, uint64_t pins) {
 
     /* perform per-tick actions */
     _m6561_tick_video(vic);
-    pins = _m6561_tick_audio(vic, pins);
+    if (vic->headless) {
+        pins &= ~M6561_SAMPLE;
+    }
+    else {
+        pins = _m6561_tick_audio(vic, pins);
+    }
     vic->pins = pins;
     return pins;
 }
 
+void m6561_snapshot_onsave(m6561_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->fetch_cb = 0;
+    snapshot->user_data = 0;
+    snapshot->crt.rgba8_buffer = 0;
+}
+
+void m6561_snapshot_onload(m6561_t* snapshot, m6561_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->fetch_cb = sys->fetch_cb;
+    snapshot->user_data = sys->user_data;
+    snapshot->crt.rgba8_buffer = sys->crt.rgba8_buffer;
+}
 
 #endif
@@ -39,6 +39,39 @@
 
     TODO: Documentation
 
+    ## Line-Batched Rendering
+
+    By default, m6569_tick() decodes 8 pixels per tick through the sprite
+    units, graphics sequencer and color multiplexer. If the
+    m6569_desc_t.line_batched flag is set, pixel groups where no sprite
+    is visible are not decoded immediately, instead the inputs for
+    the graphics sequencer (the fetched graphics byte, video matrix value
+    and border state) are recorded, and the recorded pixel groups are
+    decoded in one pass with specialized loops per display mode. This
+    happens once per raster line (before the graphics sequencer is
+    restarted in cycle 16), or earlier if a register is written (so
+    mid-line register changes take effect at the exact pixel group, like
+    in the per-tick renderer), or a pixel group with visible sprites must
+    be decoded (so sprite collisions are detected at the exact same tick).
+    The generated image is identical to the per-tick renderer.
+
+    Call m6569_flush() after running the emulation for a frame to decode
+    the pending pixel groups of the current raster line into the
+    framebuffer. m6569_snapshot_onsave() also decodes the pending pixel
+    groups (on the snapshot copy), so that a snapshot never contains
+    framebuffer pointers.
+
+    ## Headless Mode
+
+    If m6569_t.headless is set to true, no pixels are written to the
+    framebuffer, but all timing-relevant state (raster counter, raster
+    interrupt, badline BA/AEC stalls and sprite DMA) is updated as
+    usual. Pixel groups with visible sprites are still decoded into a
+    scratch buffer, so that sprite collisions and collision interrupts
+    happen at the same tick as with rendering enabled. The flag can be toggled at any time (for instance to only
+    render every Nth frame), the debug visualization is ignored in
+    headless mode.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -126,6 +159,8 @@ typedef struct {
     m6569_fetch_t fetch_cb;
     /* optional user-data for fetch callback */
     void* user_data;
+    /* if true, decode pixels with the line-batched renderer */
+    bool line_batched;
 } m6569_desc_t;
 
 /* register bank */
@@ -264,9 +299,26 @@ typedef struct {
                                 */
 } m6569_sprite_unit_t;
 
+/* a recorded 8-pixel group for the line-batched renderer */
+typedef struct {
+    uint32_t* dst;              /* framebuffer location */
+    uint32_t brd_color;         /* border color */
+    uint16_t vm_data;           /* video matrix value for the graphics sequencer */
+    uint8_t g_data;             /* graphics data byte */
+    bool brd;                   /* true if the border is active */
+} m6569_pixel_group_t;
+
+/* line-batched renderer state */
+typedef struct {
+    bool enabled;
+    int num;                    /* number of recorded pixel groups */
+    m6569_pixel_group_t groups[64];
+} m6569_line_batch_t;
+
 /* the m6569 state structure */
 typedef struct {
     bool debug_vis;             /* toggle this to switch debug visualization on/off */
+    bool headless;              /* toggle this to skip writing pixels to the framebuffer */
     m6569_registers_t reg;
     m6569_crt_t crt;
     m6569_border_unit_t brd;
@@ -275,6 +327,7 @@ typedef struct {
     m6569_graphics_unit_t gunit;
     m6569_sprite_unit_t sunit;
     m6569_video_matrix_t vm;
+    m6569_line_batch_t batch;
     uint64_t pins;
 } m6569_t;
 
@@ -284,12 +337,18 @@ void m6569_init(m6569_t* vic, const m6569_desc_t* desc);
 void m6569_reset(m6569_t* vic);
 /* tick the m6569 instance */
 uint64_t m6569_tick(m6569_t* vic, uint64_t pins);
+/* decode pending pixels into the framebuffer (only needed in line-batched mode) */
+void m6569_flush(m6569_t* vic);
 /* get the visible display width in pixels */
 int m6569_display_width(m6569_t* vic);
 /* get the visible display height in pixels */
 int m6569_display_height(m6569_t* vic);
 /* get 32-bit RGBA8 value from color index (0..15) */
 uint32_t m6569_color(int i);
+/* clear host pointers in a snapshot before saving */
+void m6569_snapshot_onsave(m6569_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void m6569_snapshot_onload(m6569_t* snapshot, m6569_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -404,6 +463,7 @@ void m6569_init(m6569_t* vic, const m6569_desc_t* desc) {
     _m6569_init_crt(&vic->crt, desc);
     vic->mem.fetch_cb = desc->fetch_cb;
     vic->mem.user_data = desc->user_data;
+    vic->batch.enabled = desc->line_batched;
 }
 
 /*--- reset ------------------------------------------------------------------*/
@@ -460,6 +520,7 @@ void m6569_reset(m6569_t* vic) {
     _m6569_reset_video_matrix_unit(&vic->vm);
     _m6569_reset_graphics_unit(&vic->gunit);
     _m6569_reset_sprite_unit(&vic->sunit);
+    vic->batch.num = 0;
 }
 
 /*--- register read/writes ---------------------------------------------------*/
@@ -730,13 +791,13 @@ static inline void _m6569_gunit_rewind(m6569_t* vic, uint8_t xscroll) {
 /* Tick the graphics sequencer, this will countdown a counter, when it
    hits 0 the pixel shifter will be reloaded from the last g_access data
    byte, and the video-matrix value with the current video-matrix-value
-   (or 0 if the graphics sequencer is idle).
+   (vm_data is 0 if the graphics sequencer is idle, see _m6569_gunit_vm_data()).
 */
-static inline void _m6569_gunit_tick(m6569_t* vic, uint8_t g_data) {
+static inline void _m6569_gunit_tick(m6569_t* vic, uint8_t g_data, uint16_t vm_data) {
     if (vic->gunit.count == 0) {
         vic->gunit.count = 7;
         vic->gunit.shift |= g_data;
-        vic->gunit.c_data = vic->gunit.enabled ? vic->vm.line[vic->vm.vmli] : 0;
+        vic->gunit.c_data = vm_data;
     }
     else {
         vic->gunit.count--;
@@ -748,6 +809,11 @@ static inline void _m6569_gunit_tick(m6569_t* vic, uint8_t g_data) {
     vic->gunit.shift <<= 1;
 }
 
+/* the video-matrix value loaded by the graphics sequencer in the current tick */
+static inline uint16_t _m6569_gunit_vm_data(m6569_t* vic) {
+    return vic->gunit.enabled ? vic->vm.line[vic->vm.vmli] : 0;
+}
+
 /* 
     graphics sequencer decoding functions for 1 pixel
 
@@ -1123,10 +1189,11 @@ static inline void _m6569_decode_pixels(m6569_t* vic, uint8_t g_data, uint32_t*
     uint32_t brd_color = vic->brd.main ? vic->brd.bc_rgba8 : vic->gunit.bg_rgba8[0];
     const uint8_t mdp = vic->reg.mdp;
     const uint8_t mode = vic->gunit.mode;
+    const uint16_t vm_data = _m6569_gunit_vm_data(vic);
     uint32_t bmc = 0;
     for (int i = 0; i < 8; i++) {
         uint32_t sc = _m6569_sunit_decode(vic, hpos);
-        _m6569_gunit_tick(vic, g_data);
+        _m6569_gunit_tick(vic, g_data, vm_data);
         switch (mode) {
             case 0: bmc = _m6569_gunit_decode_mode0(vic); break;
             case 1: bmc = _m6569_gunit_decode_mode1(vic); break;
@@ -1139,6 +1206,102 @@ static inline void _m6569_decode_pixels(m6569_t* vic, uint8_t g_data, uint32_t*
     }
 }
 
+/*--- line-batched renderer -------------------------------------------------*/
+
+/* check if any sprite unit is active in the current pixel group */
+static inline bool _m6569_sunit_visible(m6569_t* vic, uint8_t hpos) {
+    const m6569_sprite_unit_t* su = &vic->sunit;
+    for (int i = 0; i < 8; i++) {
+        if (su->disp_enabled[i] && (hpos >= su->h_first[i]) && (hpos <= su->h_last[i])) {
+            return true;
+        }
+    }
+    return false;
+}
+
+/* record a pixel group without visible sprites for later decoding */
+static inline void _m6569_batch_push(m6569_t* vic, uint8_t g_data, uint32_t* dst) {
+    m6569_line_batch_t* b = &vic->batch;
+    CHIPS_ASSERT(b->num < 64);
+    m6569_pixel_group_t* pg = &b->groups[b->num++];
+    pg->dst = dst;
+    pg->brd = vic->brd.vert | vic->brd.main;
+    pg->brd_color = vic->brd.main ? vic->brd.bc_rgba8 : vic->gunit.bg_rgba8[0];
+    pg->vm_data = _m6569_gunit_vm_data(vic);
+    pg->g_data = g_data;
+}
+
+/* decode all recorded pixel groups
+
+    Since none of the recorded pixel groups has visible sprites, the
+    sprite units, collision checks and the color multiplexer can
+    be skipped (the multiplexer would just set the alpha bits of the
+    graphics sequencer color), and the display mode is constant
+    because a register write flushes the recorded pixel groups.
+*/
+static void _m6569_batch_decode(m6569_t* vic) {
+    m6569_line_batch_t* b = &vic->batch;
+    const uint8_t mode = vic->gunit.mode;
+    for (int pi = 0; pi < b->num; pi++) {
+        const m6569_pixel_group_t* pg = &b->groups[pi];
+        uint32_t* dst = pg->dst;
+        const uint8_t g_data = pg->g_data;
+        const uint16_t vm_data = pg->vm_data;
+        if (0 == dst) {
+            /* recorded in headless mode, only tick the graphics sequencer */
+            for (int i = 0; i < 8; i++) {
+                _m6569_gunit_tick(vic, g_data, vm_data);
+            }
+        }
+        else if (pg->brd) {
+            for (int i = 0; i < 8; i++) {
+                _m6569_gunit_tick(vic, g_data, vm_data);
+                dst[i] = pg->brd_color;
+            }
+        }
+        else switch (mode) {
+            case 0:
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = _m6569_gunit_decode_mode0(vic) | 0xFF000000;
+                }
+                break;
+            case 1:
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = _m6569_gunit_decode_mode1(vic) | 0xFF000000;
+                }
+                break;
+            case 2:
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = _m6569_gunit_decode_mode2(vic) | 0xFF000000;
+                }
+                break;
+            case 3:
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = _m6569_gunit_decode_mode3(vic) | 0xFF000000;
+                }
+                break;
+            case 4:
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = _m6569_gunit_decode_mode4(vic) | 0xFF000000;
+                }
+                break;
+            default:
+                /* invalid modes output black */
+                for (int i = 0; i < 8; i++) {
+                    _m6569_gunit_tick(vic, g_data, vm_data);
+                    dst[i] = 0xFF000000;
+                }
+                break;
+        }
+    }
+    b->num = 0;
+}
+
 /* decode the next 8 pixels as debug visualization */
 static void _m6569_decode_pixels_debug(m6569_t* vic, uint8_t g_data, bool ba_pin, uint32_t* dst, uint8_t hpos) {
     _m6569_decode_pixels(vic, g_data, dst, hpos);
@@ -1510,6 +1673,16 @@ static uint64_t _m6569_tick(m6569_t* vic, uint64_t pins) {
             pins = _m6569_ba(vic, pins);
             pins = _m6569_aec(pins);
             vic->gunit.enabled = vic->rs.display_state;
+            /* recorded pixel groups need the graphics sequencer state before the rewind */
+            if (vic->batch.num > 0) {
+                if (vic->headless) {
+                    /* no pixels to write, and the rewind resets the graphics sequencer */
+                    vic->batch.num = 0;
+                }
+                else {
+                    _m6569_batch_decode(vic);
+                }
+            }
             _m6569_gunit_rewind(vic, vic->reg.ctrl_2 & M6569_CTRL2_XSCROLL);
             _m6569_sunit_update_mcbase(vic);
             _m6569_c_access(vic);
@@ -1619,13 +1792,37 @@ static uint64_t _m6569_tick(m6569_t* vic, uint64_t pins) {
     }
 
     /*--- decode pixels into framebuffer -------------------------------------*/
-    if (vic->crt.rgba8_buffer) {
+    if (vic->headless) {
+        /* only pixel groups with visible sprites must be decoded (for
+           the collision checks), the other pixel groups are recorded
+           without framebuffer location to keep the graphics sequencer
+           state for the next decoded pixel group
+        */
+        if ((vic->crt.x >= vic->crt.vis_x0) && (vic->crt.x < vic->crt.vis_x1) &&
+            (vic->crt.y >= vic->crt.vis_y0) && (vic->crt.y < vic->crt.vis_y1))
+        {
+            if (!_m6569_sunit_visible(vic, vic->rs.h_count)) {
+                _m6569_batch_push(vic, g_data, 0);
+            }
+            else {
+                if (vic->batch.num > 0) {
+                    _m6569_batch_decode(vic);
+                }
+                uint32_t scratch[8];
+                _m6569_decode_pixels(vic, g_data, scratch, vic->rs.h_count);
+            }
+        }
+    }
+    else if (vic->crt.rgba8_buffer) {
         int x, y, w;
         if (vic->debug_vis) {
             x = vic->rs.h_count;
             y = vic->rs.v_count;
             w = _M6569_HTOTAL;
             uint32_t* dst = vic->crt.rgba8_buffer + (y * w + x) * 8;
+            if (vic->batch.num > 0) {
+                _m6569_batch_decode(vic);
+            }
             _m6569_decode_pixels_debug(vic, g_data, 0 != (pins & M6569_BA), dst, vic->rs.h_count);
         }
         else if ((vic->crt.x >= vic->crt.vis_x0) && (vic->crt.x < vic->crt.vis_x1) &&
@@ -1635,7 +1832,15 @@ static uint64_t _m6569_tick(m6569_t* vic, uint64_t pins) {
             const int y = vic->crt.y - vic->crt.vis_y0;
             const int w = vic->crt.vis_w;
             uint32_t* dst = vic->crt.rgba8_buffer + (y * w + x) * 8;
-            _m6569_decode_pixels(vic, g_data, dst, vic->rs.h_count);
+            if (vic->batch.enabled && !_m6569_sunit_visible(vic, vic->rs.h_count)) {
+                _m6569_batch_push(vic, g_data, dst);
+            }
+            else {
+                if (vic->batch.num > 0) {
+                    _m6569_batch_decode(vic);
+                }
+                _m6569_decode_pixels(vic, g_data, dst, vic->rs.h_count);
+            }
         }
     }
     vic->vm.vmli = vic->vm.next_vmli;
@@ -1653,6 +1858,10 @@ uint64_t m6569_tick(m6569_t* vic, uint64_t pins) {
             pins = _m6569_read(vic, pins);
         }
         else {
+            /* recorded pixel groups must be decoded with the old register values */
+            if (vic->batch.num > 0) {
+                _m6569_batch_decode(vic);
+            }
             _m6569_write(vic, pins);
         }
     }
@@ -1660,6 +1869,13 @@ uint64_t m6569_tick(m6569_t* vic, uint64_t pins) {
     return pins;
 }
 
+void m6569_flush(m6569_t* vic) {
+    CHIPS_ASSERT(vic);
+    if (vic->batch.num > 0) {
+        _m6569_batch_decode(vic);
+    }
+}
+
 int m6569_display_width(m6569_t* vic) {
     CHIPS_ASSERT(vic);
     return 8 * (vic->debug_vis ? _M6569_HTOTAL : vic->crt.vis_w);
@@ -1674,4 +1890,23 @@ uint32_t m6569_color(int i) {
     CHIPS_ASSERT((i >= 0) && (i < 16));
     return _m6569_colors[i];
 }
+
+void m6569_snapshot_onsave(m6569_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    /* the recorded pixel groups point into the framebuffer, decode them
+       now, this yields the same pixels and graphics sequencer state as
+       decoding them later in the running instance
+    */
+    m6569_flush(snapshot);
+    snapshot->mem.fetch_cb = 0;
+    snapshot->mem.user_data = 0;
+    snapshot->crt.rgba8_buffer = 0;
+}
+
+void m6569_snapshot_onload(m6569_t* snapshot, m6569_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->mem.fetch_cb = sys->mem.fetch_cb;
+    snapshot->mem.user_data = sys->mem.user_data;
+    snapshot->crt.rgba8_buffer = sys->crt.rgba8_buffer;
+}
 #endif /* CHIPS_IMPL */
@@ -36,6 +36,95 @@
     The emulation has an additional "virtual pin" which is set to active
     whenever a new sample is ready (M6581_SAMPLE).
 
+    ## Deferred Synthesis
+
+    Sound synthesis is the most expensive part of the SID emulation, and
+    usually it's done inline with the CPU emulation, one m6581_tick() per
+    CPU tick. If m6581_desc_t.deferred is true, the synthesis can be moved
+    to another thread (for instance the host's audio thread). In this mode,
+    m6581_tick() only counts the elapsed ticks and records register writes
+    in a timestamped log. The m6581_t instance contains two logs: one is
+    filled by the emulation, the other is owned by the synthesis. The log
+    hand-off happens with (on the emulation thread):
+
+    ~~~C
+    m6581_log_t* m6581_log_swap(m6581_t* sid, const m6581_t* synth)
+    ~~~
+        Finish the log which has been filled since the last call, start
+        filling the other log, and return the finished log. Usually this
+        is called once per emulated frame. synth is the synthesis state
+        (see below), it is only read, and may be a null pointer.
+
+    The returned log is synthesized on a separate m6581_t instance which
+    has been initialized with the same m6581_desc_t, but with deferred
+    set to false (the synthesis state):
+
+    ~~~C
+    int m6581_synth(m6581_t* synth, m6581_log_t* log, float* out_samples, int max_samples)
+    ~~~
+        Replay the logged ticks and register writes on the synthesis
+        state, write at most max_samples samples to out_samples and
+        return the number of samples written. Call m6581_synth() repeatedly
+        until m6581_synth_pending(log) returns false.
+
+    m6581_synth() only modifies the synthesis state and the progress
+    counters of the log returned by m6581_log_swap(), m6581_tick() never
+    accesses those, so the two sides don't need to be locked against each
+    other. The only requirement is that m6581_synth() isn't running while
+    the emulation thread calls m6581_log_swap() (this is up to the host
+    application, for instance by waiting on a semaphore, the headers don't
+    contain any threading code). The generated samples are bit-identical
+    with the inline synthesis.
+
+    Register reads depend on the decaying bus value of write-only registers,
+    and on the state of the wave and envelope generators (OSC3 and ENV3).
+    The deferred m6581_t updates the bus value in m6581_tick(), and keeps
+    its own 'shadow' generator state, which skips the filter, mixer and
+    sample generation, and which is only caught up from the logged ticks
+    and writes in a tight loop when OSC3 or ENV3 is read. If no register
+    has been read since the last m6581_log_swap() and the previous log
+    has been completely synthesized, m6581_log_swap() copies the generator
+    state from the synthesis state instead, so that emulated programs which
+    don't read OSC3 or ENV3 don't need to run the generators on the
+    emulation thread at all.
+
+    The logs are allocated on the heap when the first register write is
+    logged. A log starts with room for M6581_LOG_WRITES register writes,
+    and doubles its size when it is full, so no register write is ever
+    dropped, no matter how many writes happen between two calls to
+    m6581_log_swap(). Only the log which is filled by m6581_tick() is
+    resized, never the log owned by the synthesis. Call m6581_discard()
+    to free the logs.
+
+    The logs are not part of a snapshot. Before a deferred m6581_t is saved,
+    call:
+
+    ~~~C
+    void m6581_snapshot_onsave(m6581_t* snapshot, m6581_t* synth)
+    ~~~
+        snapshot and synth are the saved copies of the deferred instance
+        and the synthesis state. This synthesizes the pending parts of
+        both logs on the saved synthesis state (without output), so
+        that the saved synthesis state is exactly in sync with the
+        emulation, and clears the logs in the saved copy.
+
+    ~~~C
+    void m6581_snapshot_onload(m6581_t* snapshot, m6581_t* sys)
+    ~~~
+        Call this on the snapshot before it is copied back into the
+        running instance 'sys', this keeps the log memory of 'sys'.
+
+    m6581_synth() must not run while a snapshot is saved or loaded.
+
+    ## Headless Mode
+
+    If m6581_t.headless is set to true, the filter, mixer and sample
+    generation are skipped, and the M6581_SAMPLE pin is never set. The
+    wave and envelope generators keep running because the OSC3 and ENV3
+    registers are readable. This is useful for running the emulation
+    as fast as possible when nobody listens (for instance in automated
+    tests). The flag can be toggled at any time.
+
     ## Links
 
     - http://blog.kevtris.org/?p=13
@@ -147,11 +236,15 @@ extern "C" {
 #define M6581_FILTER_HP     (1<<2)
 #define M6581_FILTER_3OFF   (1<<3)
 
+/* initial number of register writes in a deferred synthesis log (grows when needed) */
+#define M6581_LOG_WRITES (1024)
+
 /* setup parameters for m6581_init() */
 typedef struct {
     int tick_hz;        /* frequency at which m6581_tick() will be called in Hz */
     int sound_hz;       /* sound sample frequency */
     float magnitude;    /* output sample magnitude (0=silence to 1=max volume) */
+    bool deferred;      /* if true, only log register writes for m6581_synth() */
 } m6581_desc_t;
 
 /* envelope generator state */
@@ -201,6 +294,23 @@ typedef struct {
     int v_lp;
 } m6581_filter_t;
 
+/* a logged register write for deferred synthesis */
+typedef struct {
+    uint32_t tick;      /* number of ticks before the write happened */
+    uint8_t reg;
+    uint8_t data;
+} m6581_write_t;
+
+/* a deferred synthesis log, see m6581_log_swap() */
+typedef struct {
+    uint32_t num_ticks;     /* number of ticks in the log */
+    uint32_t num_writes;    /* number of register writes in the log */
+    uint32_t max_writes;    /* number of register writes the log has room for */
+    uint32_t synth_pos;     /* number of ticks already synthesized */
+    uint32_t write_pos;     /* index of next register write to synthesize */
+    m6581_write_t* writes;  /* heap-allocated, grows when full */
+} m6581_log_t;
+
 /* m6581 instance state */
 typedef struct {
     int sound_hz;
@@ -220,16 +330,38 @@ typedef struct {
     float sample_accum_count;
     float sample_mag;
     float sample;
+    bool headless;              /* if true, skip filter, mixer and sample generation */
+    /* deferred synthesis state */
+    bool deferred;
+    uint32_t log_index;         /* index of the log filled by m6581_tick() */
+    uint32_t shadow_log;        /* index of the log the shadow state is positioned in */
+    uint32_t shadow_pos;        /* number of logged ticks applied to the shadow state */
+    uint32_t shadow_write_pos;  /* index of next logged write to apply to the shadow state */
+    m6581_log_t log[2];
     /* debug inspection */
     uint64_t pins;
 } m6581_t;
 
 /* initialize a new m6581_t instance */
 void m6581_init(m6581_t* sid, const m6581_desc_t* desc);
+/* discard a m6581_t instance, frees the deferred synthesis logs */
+void m6581_discard(m6581_t* sid);
 /* reset a m6581_t instance */
 void m6581_reset(m6581_t* sid);
 /* tick a m6581_t instance */
 uint64_t m6581_tick(m6581_t* sid, uint64_t pins);
+/* hand the deferred synthesis log over to the synthesis, and start a new log */
+m6581_log_t* m6581_log_swap(m6581_t* sid, const m6581_t* synth);
+/* synthesize a deferred synthesis log, return number of samples written */
+int m6581_synth(m6581_t* synth, m6581_log_t* log, float* out_samples, int max_samples);
+/* return true if a deferred synthesis log hasn't been completely synthesized */
+static inline bool m6581_synth_pending(const m6581_log_t* log) {
+    return (log->synth_pos < log->num_ticks) || (log->write_pos < log->num_writes);
+}
+/* bring the synthesis state in a snapshot up to date and clear the logs (deferred mode only) */
+void m6581_snapshot_onsave(m6581_t* snapshot, m6581_t* synth);
+/* keep the log memory of the running instance before loading a snapshot */
+void m6581_snapshot_onload(m6581_t* snapshot, m6581_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -238,6 +370,7 @@ uint64_t m6581_tick(m6581_t* sid, uint64_t pins);
 /*-- IMPLEMENTATION ----------------------------------------------------------*/
 #ifdef CHIPS_IMPL
 #include <string.h>
+#include <stdlib.h> /* realloc, free */
 #ifdef _MSC_VER
 #define _USE_MATH_DEFINES
 #endif
@@ -321,6 +454,7 @@ void m6581_init(m6581_t* sid, const m6581_desc_t* desc) {
     sid->sample_counter = sid->sample_period;
     sid->sample_mag = desc->magnitude;
     sid->sample_accum_count = 1.0f;
+    sid->deferred = desc->deferred;
     for (int i = 0; i < 3; i++) {
         _m6581_init_voice(&sid->voice[i]);
     }
@@ -328,8 +462,16 @@ void m6581_init(m6581_t* sid, const m6581_desc_t* desc) {
     _m6581_init_filter(&sid->filter, sid->sound_hz);
 }
 
-void m6581_reset(m6581_t* sid) {
+void m6581_discard(m6581_t* sid) {
     CHIPS_ASSERT(sid);
+    for (int i = 0; i < 2; i++) {
+        free(sid->log[i].writes);
+        memset(&sid->log[i], 0, sizeof(m6581_log_t));
+    }
+}
+
+/* reset the sound generation state (shared by m6581_reset() and m6581_synth()) */
+static void _m6581_reset_state(m6581_t* sid) {
     sid->bus_value = 0;
     sid->bus_decay = 0x2000;
     for (int i = 0; i < 3; i++) {
@@ -340,6 +482,17 @@ void m6581_reset(m6581_t* sid) {
     sid->sample = 0.0f;
     sid->sample_accum = 0.0f;
     sid->sample_accum_count = 1.0f;
+}
+
+static void _m6581_log_reset(m6581_t* sid);
+
+void m6581_reset(m6581_t* sid) {
+    CHIPS_ASSERT(sid);
+    if (sid->deferred) {
+        /* the synthesis state is reset when the reset is reached in the log */
+        _m6581_log_reset(sid);
+    }
+    _m6581_reset_state(sid);
     sid->pins = 0;
 }
 
@@ -626,6 +779,17 @@ static inline int _m6581_filter_output(m6581_filter_t* f, int vi) {
     return vf * (1<<7);
 }
 
+/* tick the wave and envelope generators */
+static inline void _m6581_tick_voices(m6581_t* sid) {
+    for (int i = 0; i < 3; i++) {
+        _m6581_voice_tick(sid, i);
+    }
+    /* handle voice synchronization */
+    for (int i = 0; i < 3; i++) {
+        _m6581_voice_sync(sid, i);
+    }
+}
+
 /* tick the sound generation, return true when new sample ready */
 static uint64_t _m6581_tick(m6581_t* sid, uint64_t pins) {
     /* decay the last written register value */
@@ -636,12 +800,10 @@ static uint64_t _m6581_tick(m6581_t* sid, uint64_t pins) {
     }
 
     /* tick wave and envelope generators */
-    for (int i = 0; i < 3; i++) {
-        _m6581_voice_tick(sid, i);
-    }
-    /* handle voice synchronization */
-    for (int i = 0; i < 3; i++) {
-        _m6581_voice_sync(sid, i);
+    _m6581_tick_voices(sid);
+    if (sid->headless) {
+        pins &= ~M6581_SAMPLE;
+        return pins;
     }
     /* filter */
     int sum_filtered_outp = 0;
@@ -711,12 +873,8 @@ static uint64_t _m6581_read(m6581_t* sid, uint64_t pins) {
     return pins;
 }
 
-/* write a register */
-static void _m6581_write(m6581_t* sid, uint64_t pins) {
-    uint8_t reg = pins & M6581_ADDR_MASK;
-    uint8_t data = M6581_GET_DATA(pins);
-    sid->bus_value = data;
-    sid->bus_decay = 0x2000;
+/* write a register without updating the bus value */
+static void _m6581_write_reg(m6581_t* sid, uint8_t reg, uint8_t data) {
     switch (reg) {
         case M6581_V1_FREQ_LO:
             _m6581_set_freq_lo(&sid->voice[0], data);
@@ -796,10 +954,117 @@ static void _m6581_write(m6581_t* sid, uint64_t pins) {
     }
 }
 
+/* write a register */
+static void _m6581_write(m6581_t* sid, uint8_t reg, uint8_t data) {
+    sid->bus_value = data;
+    sid->bus_decay = 0x2000;
+    _m6581_write_reg(sid, reg, data);
+}
+
+/* a logged m6581_reset() (register numbers are 5 bits) */
+#define _M6581_LOG_RESET (0xFF)
+
+/* apply all logged register writes which happened after 'synth_pos' ticks */
+static void _m6581_synth_writes(m6581_t* synth, m6581_log_t* log) {
+    while ((log->write_pos < log->num_writes) && (log->writes[log->write_pos].tick == log->synth_pos)) {
+        const m6581_write_t* wr = &log->writes[log->write_pos++];
+        if (wr->reg == _M6581_LOG_RESET) {
+            _m6581_reset_state(synth);
+        }
+        else {
+            _m6581_write(synth, wr->reg, wr->data);
+        }
+    }
+}
+
+/* append a register write to a log, grow the log if it is full */
+static m6581_write_t* _m6581_log_push(m6581_log_t* log) {
+    if (log->num_writes == log->max_writes) {
+        const uint32_t max_writes = (log->max_writes > 0) ? (2 * log->max_writes) : M6581_LOG_WRITES;
+        m6581_write_t* writes = (m6581_write_t*) realloc(log->writes, max_writes * sizeof(m6581_write_t));
+        CHIPS_ASSERT(writes);
+        log->writes = writes;
+        log->max_writes = max_writes;
+    }
+    return &log->writes[log->num_writes++];
+}
+
+/* advance the shadow voice state to the end of a log, only voice
+   registers are applied, the bus value is updated by m6581_tick()
+*/
+static void _m6581_shadow_advance(m6581_t* sid, const m6581_log_t* log) {
+    while (sid->shadow_pos < log->num_ticks) {
+        _m6581_tick_voices(sid);
+        sid->shadow_pos++;
+        while ((sid->shadow_write_pos < log->num_writes) && (log->writes[sid->shadow_write_pos].tick == sid->shadow_pos)) {
+            const m6581_write_t* wr = &log->writes[sid->shadow_write_pos++];
+            if (wr->reg < M6581_FC_LO) {
+                _m6581_write_reg(sid, wr->reg, wr->data);
+            }
+        }
+    }
+}
+
+/* catch up the shadow voice state with the current log */
+static void _m6581_shadow_catchup(m6581_t* sid) {
+    if (sid->shadow_log != sid->log_index) {
+        /* the shadow state still lags behind in the log which has been
+           handed over to the synthesis, the synthesis only modifies the
+           log's progress counters, not the logged ticks and writes
+        */
+        _m6581_shadow_advance(sid, &sid->log[sid->shadow_log]);
+        sid->shadow_log = sid->log_index;
+        sid->shadow_pos = sid->shadow_write_pos = 0;
+    }
+    _m6581_shadow_advance(sid, &sid->log[sid->log_index]);
+}
+
+/* record a reset in the current log, this also moves the shadow state to the end of the log */
+static void _m6581_log_reset(m6581_t* sid) {
+    m6581_log_t* log = &sid->log[sid->log_index];
+    m6581_write_t* wr = _m6581_log_push(log);
+    wr->tick = log->num_ticks;
+    wr->reg = _M6581_LOG_RESET;
+    wr->data = 0;
+    sid->shadow_log = sid->log_index;
+    sid->shadow_pos = log->num_ticks;
+    sid->shadow_write_pos = log->num_writes;
+}
+
 /* the all-in-one tick function */
 uint64_t m6581_tick(m6581_t* sid, uint64_t pins) {
     CHIPS_ASSERT(sid);
 
+    /* in deferred mode, only log the tick and register writes, register
+       reads are served from the bus value and the shadow generator state
+    */
+    if (sid->deferred) {
+        m6581_log_t* log = &sid->log[sid->log_index];
+        log->num_ticks++;
+        if (sid->bus_decay > 0) {
+            if (--sid->bus_decay == 0) {
+                sid->bus_value = 0;
+            }
+        }
+        if (pins & M6581_CS) {
+            if (pins & M6581_RW) {
+                _m6581_shadow_catchup(sid);
+                pins = _m6581_read(sid, pins);
+            }
+            else {
+                sid->bus_value = M6581_GET_DATA(pins);
+                sid->bus_decay = 0x2000;
+                m6581_write_t* wr = _m6581_log_push(log);
+                wr->tick = log->num_ticks;
+                wr->reg = pins & M6581_ADDR_MASK;
+                wr->data = M6581_GET_DATA(pins);
+            }
+        }
+        pins &= ~M6581_SAMPLE;
+        sid->pins = pins;
+        return pins;
+    }
+
     /* first perform the regular per-tick actions */
     pins = _m6581_tick(sid, pins);
 
@@ -809,11 +1074,87 @@ uint64_t m6581_tick(m6581_t* sid, uint64_t pins) {
             pins = _m6581_read(sid, pins);
         }
         else {
-            _m6581_write(sid, pins);
+            _m6581_write(sid, pins & M6581_ADDR_MASK, M6581_GET_DATA(pins));
         }
     }
     sid->pins = pins;
     return pins;
 }
 
+m6581_log_t* m6581_log_swap(m6581_t* sid, const m6581_t* synth) {
+    CHIPS_ASSERT(sid && sid->deferred);
+    const uint32_t back_index = sid->log_index ^ 1;
+    if (sid->shadow_log == back_index) {
+        /* no register has been read since the last swap, and the shadow
+           state still lags behind in the log which is about to be reused,
+           if that log has been completely synthesized, the generator state
+           of the synthesis is exactly where the shadow state needs to be
+        */
+        const m6581_log_t* back = &sid->log[back_index];
+        if (synth && !m6581_synth_pending(back)) {
+            memcpy(sid->voice, synth->voice, sizeof(sid->voice));
+        }
+        else {
+            _m6581_shadow_advance(sid, back);
+        }
+        sid->shadow_log = sid->log_index;
+        sid->shadow_pos = sid->shadow_write_pos = 0;
+    }
+    m6581_log_t* log = &sid->log[sid->log_index];
+    sid->log_index = back_index;
+    m6581_log_t* next = &sid->log[sid->log_index];
+    next->num_ticks = next->num_writes = 0;
+    next->synth_pos = next->write_pos = 0;
+    return log;
+}
+
+int m6581_synth(m6581_t* synth, m6581_log_t* log, float* out_samples, int max_samples) {
+    CHIPS_ASSERT(synth && !synth->deferred && log && out_samples && (max_samples > 0));
+    int num_samples = 0;
+    _m6581_synth_writes(synth, log);
+    while ((log->synth_pos < log->num_ticks) && (num_samples < max_samples)) {
+        const uint64_t pins = _m6581_tick(synth, 0);
+        log->synth_pos++;
+        _m6581_synth_writes(synth, log);
+        if (pins & M6581_SAMPLE) {
+            out_samples[num_samples++] = synth->sample;
+        }
+    }
+    return num_samples;
+}
+
+void m6581_snapshot_onsave(m6581_t* snapshot, m6581_t* synth) {
+    CHIPS_ASSERT(snapshot);
+    if (!snapshot->deferred) {
+        return;
+    }
+    CHIPS_ASSERT(synth && !synth->deferred);
+    /* the logs are not part of the snapshot, synthesize the rest of the
+       handed-over log and the current log on the saved synthesis state
+       instead, the log memory is only read
+    */
+    float samples[64];
+    for (int i = 0; i < 2; i++) {
+        m6581_log_t* log = &snapshot->log[snapshot->log_index ^ 1 ^ i];
+        while (m6581_synth_pending(log)) {
+            m6581_synth(synth, log, samples, 64);
+        }
+        memset(log, 0, sizeof(m6581_log_t));
+    }
+    /* the generator state of the synthesis is where the shadow state needs to be */
+    memcpy(snapshot->voice, synth->voice, sizeof(snapshot->voice));
+    snapshot->shadow_log = snapshot->log_index;
+    snapshot->shadow_pos = snapshot->shadow_write_pos = 0;
+}
+
+void m6581_snapshot_onload(m6581_t* snapshot, m6581_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    for (int i = 0; i < 2; i++) {
+        snapshot->log[i].writes = sys->log[i].writes;
+        snapshot->log[i].max_writes = sys->log[i].max_writes;
+        snapshot->log[i].num_ticks = snapshot->log[i].num_writes = 0;
+        snapshot->log[i].synth_pos = snapshot->log[i].write_pos = 0;
+    }
+}
+
 #endif /* CHIPS_IMPL */
@@ -30,6 +30,13 @@
 
     FIXME: documentation
 
+    HEADLESS MODE:
+
+    If mc6847_t.headless is set to true, no scanlines are decoded into
+    the framebuffer (and the fetch callback isn't called), but the
+    HS and FS output pins are generated as usual. The flag can be
+    toggled at any time.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -232,6 +239,8 @@ typedef struct {
 
     /* true during field-sync */
     bool fs;
+    /* if true, don't decode scanlines into the framebuffer */
+    bool headless;
 
     /* the fetch callback function */
     mc6847_fetch_t fetch_cb;
@@ -248,6 +257,11 @@ void mc6847_reset(mc6847_t* vdg);
 /* tick the mc6847_t instance, this will call the fetch_cb and generate the image */
 uint64_t mc6847_tick(mc6847_t* vdg, uint64_t pins);
 
+/* clear host pointers in a snapshot before saving */
+void mc6847_snapshot_onsave(mc6847_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void mc6847_snapshot_onload(mc6847_t* snapshot, mc6847_t* sys);
+
 #ifdef __cplusplus
 } /* extern "C" */
 #endif
@@ -602,7 +616,10 @@ uint64_t mc6847_tick(mc6847_t* vdg, uint64_t pins) {
             vdg->l_count = 0;
             vdg->fs = false;
         }
-        if (vdg->l_count < MC6847_VBLANK_LINES) {
+        if (vdg->headless) {
+            /* headless mode, no video decoding */
+        }
+        else if (vdg->l_count < MC6847_VBLANK_LINES) {
             /* inside vblank area, nothing to do */
         }
         else if (vdg->l_count < MC6847_DISPLAY_START) {
@@ -625,4 +642,18 @@ uint64_t mc6847_tick(mc6847_t* vdg, uint64_t pins) {
     return pins;
 }
 
+void mc6847_snapshot_onsave(mc6847_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->fetch_cb = 0;
+    snapshot->user_data = 0;
+    snapshot->rgba8_buffer = 0;
+}
+
+void mc6847_snapshot_onload(mc6847_t* snapshot, mc6847_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->fetch_cb = sys->fetch_cb;
+    snapshot->user_data = sys->user_data;
+    snapshot->rgba8_buffer = sys->rgba8_buffer;
+}
+
 # endif /* CHIPS_IMPL */
@@ -25,6 +25,8 @@
     - memory pages can be mapped as RAM, ROM or RAM-behind-ROM (where
       read accesses are mapped to a different memory page then write accesses)
     - 4 independent page-table layers to simplify bank-switching implementations
+    - per-page write watch flags to get notified about CPU writes (for
+      instance for debugger watchpoints)
 
     ## Usage
 
@@ -82,6 +84,20 @@
     - **unmapped page**: the read-pointer points to the internal junk-read-page, and
       the write-pointer to the internal junk-write-page
 
+    ## Write Watches
+
+    Pages in the CPU-visible address space can be flagged as 'watched',
+    all writes into watched pages through mem_wr() (and the helper
+    functions which call mem_wr()) will then go through a slower code path
+    which performs the write and then invokes a user-provided callback
+    with the address and written byte value. Writes to unwatched pages
+    only pay for a single bit-test.
+
+    The watch flags belong to the CPU-visible address space, not to the
+    layers, so they are not affected by changing the memory mapping.
+    Writes through mem_layer_wr() are not watched. Note that mem_init()
+    clears all watch flags and the watch callback.
+
     ## Functions
     ~~~C
     void mem_init(mem_t* mem);
@@ -139,6 +155,17 @@
     address for a read-access. Careful, this will return a pointer into the 
     internal read-junk-page if the page item is unmapped.
 
+    ~~~C
+    uint8_t* mem_bulk_ptr(mem_t* mem, uint16_t addr, uint32_t num_bytes, bool write)
+    ~~~
+    Returns the host-memory location of a 16-bit address for a direct
+    read or write access to num_bytes bytes, or a null pointer if the
+    address range crosses a memory page boundary, or if write is true
+    and the page is watched (see mem_watch()). This is intended as
+    helper for the block instruction fast path in the CPU emulators
+    (see z80_bulk_cb() in z80.h). Writes to ROM or unmapped pages
+    go into the internal write-junk-page, same as mem_wr().
+
     ~~~C
     void mem_write_range(mem_t* mem, uint16_t addr, const uint8_t* src, int num_bytes)
     ~~~
@@ -157,6 +184,43 @@
     A helper function to read a 16-bit value in little-endian format.
     This will do 2 calls to mem_rd().
 
+    ~~~C
+    void mem_watch_cb(mem_t* mem, mem_watch_t cb, void* user_data)
+    ~~~
+    Set the callback which is invoked after each write to a watched
+    page, or 0 to remove the callback. The callback looks like this:
+
+        void my_watch_cb(uint16_t addr, uint8_t data, void* user_data)
+
+    ~~~C
+    void mem_watch(mem_t* mem, uint16_t addr, uint32_t size)
+    ~~~
+    Flag all CPU-visible pages which overlap the address range as
+    watched. Unlike the mapping functions, addr and size don't need to be
+    page-aligned, but the granularity is still 1 KByte, so the callback
+    must filter the addresses it is interested in.
+
+    ~~~C
+    void mem_unwatch_all(mem_t* mem)
+    ~~~
+    Clear all page watch flags.
+
+    ~~~C
+    void mem_snapshot_onsave(mem_t* snapshot, void* base)
+    void mem_snapshot_onload(mem_t* snapshot, mem_t* sys, void* base)
+    ~~~
+    Helper functions for saving and loading system snapshots. A snapshot
+    of a mem_t is a plain copy of the struct, mem_snapshot_onsave() must
+    be called on the copy to convert the page pointers into offsets
+    relative to 'base' (usually a pointer to the system struct which
+    contains the mem_t and all mapped memory). Before a snapshot is copied
+    back into a running system, call mem_snapshot_onload() on the snapshot
+    to convert the offsets back into pointers relative to the new base.
+    Unmapped layer pages (null pointers) stay null, so a snapshot can be
+    loaded into a different instance than the one it was saved from.
+    The write watches (flags and callback) are debugging state and are
+    taken over from the running mem_t instance 'sys'.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -200,6 +264,9 @@ typedef struct {
     uint8_t* write_ptr;
 } mem_page_t;
 
+/* callback for writes to watched pages */
+typedef void (*mem_watch_t)(uint16_t addr, uint8_t data, void* user_data);
+
 /* a memory instance is a 2-dimensional table of memory pages */
 typedef struct {
     /* memory-mapped layers, layer 0 is highest priority */
@@ -210,6 +277,10 @@ typedef struct {
     uint8_t unmapped_page[MEM_PAGE_SIZE];
     /* a write-only 'junk table' for writes to ROM areas */
     uint8_t junk_page[MEM_PAGE_SIZE];
+    /* one bit per CPU-visible page, writes to watched pages invoke watch_cb */
+    uint64_t watch_pages;
+    mem_watch_t watch_cb;
+    void* watch_user_data;
 } mem_t;
 
 /* initialize a new mem instance */
@@ -226,8 +297,22 @@ void mem_unmap_layer(mem_t* mem, int layer);
 void mem_unmap_all(mem_t* mem);
 /* get the host-memory read-ptr of an emulator memory address */
 uint8_t* mem_readptr(mem_t* mem, uint16_t addr);
+/* get the host-memory location for a direct access to a range of bytes in the same page (or null) */
+uint8_t* mem_bulk_ptr(mem_t* mem, uint16_t addr, uint32_t num_bytes, bool write);
 /* copy a range of bytes into memory via mem_wr() */
 void mem_write_range(mem_t* mem, uint16_t addr, const uint8_t* src, int num_bytes);
+/* set the callback for writes to watched pages */
+void mem_watch_cb(mem_t* mem, mem_watch_t cb, void* user_data);
+/* flag all pages overlapping an address range as watched */
+void mem_watch(mem_t* mem, uint16_t addr, uint32_t size);
+/* clear all page watch flags */
+void mem_unwatch_all(mem_t* mem);
+/* slow-path for writes to watched pages (called by mem_wr()) */
+void mem_wr_watched(mem_t* mem, uint16_t addr, uint8_t data);
+/* convert page pointers in a snapshot into offsets relative to base */
+void mem_snapshot_onsave(mem_t* snapshot, void* base);
+/* convert offsets in a snapshot back into pointers, and restore the watches from the running instance */
+void mem_snapshot_onload(mem_t* snapshot, mem_t* sys, void* base);
 
 /* read a byte at 16-bit address */
 static inline uint8_t mem_rd(mem_t* mem, uint16_t addr) {
@@ -235,7 +320,12 @@ static inline uint8_t mem_rd(mem_t* mem, uint16_t addr) {
 }
 /* write a byte to 16-bit address */
 static inline void mem_wr(mem_t* mem, uint16_t addr, uint8_t data) {
-    mem->page_table[addr>>MEM_PAGE_SHIFT].write_ptr[addr & MEM_PAGE_MASK] = data;
+    if (mem->watch_pages & (1ULL<<(addr>>MEM_PAGE_SHIFT))) {
+        mem_wr_watched(mem, addr, data);
+    }
+    else {
+        mem->page_table[addr>>MEM_PAGE_SHIFT].write_ptr[addr & MEM_PAGE_MASK] = data;
+    }
 }
 /* helper method to write a 16-bit value, does 2 mem_wr() */
 static inline void mem_wr16(mem_t* mem, uint16_t addr, uint16_t data) {
@@ -363,12 +453,59 @@ uint8_t* mem_readptr(mem_t* m, uint16_t addr) {
     return (uint8_t*) &(m->page_table[addr>>MEM_PAGE_SHIFT].read_ptr[addr&MEM_PAGE_MASK]);
 } 
 
+uint8_t* mem_bulk_ptr(mem_t* m, uint16_t addr, uint32_t num_bytes, bool write) {
+    CHIPS_ASSERT(m && (num_bytes > 0));
+    const uint32_t page_index = addr>>MEM_PAGE_SHIFT;
+    if ((((uint32_t)addr + num_bytes - 1)>>MEM_PAGE_SHIFT) != page_index) {
+        return 0;
+    }
+    const mem_page_t* page = &m->page_table[page_index];
+    if (write) {
+        if (m->watch_pages & (1ULL<<page_index)) {
+            return 0;
+        }
+        return &(page->write_ptr[addr&MEM_PAGE_MASK]);
+    }
+    else {
+        return (uint8_t*) &(page->read_ptr[addr&MEM_PAGE_MASK]);
+    }
+}
+
 void mem_write_range(mem_t* m, uint16_t addr, const uint8_t* src, int num_bytes) {
     for (int i = 0; i < num_bytes; i++) {
         mem_wr(m, addr++, src[i]);
     }
 }
 
+void mem_watch_cb(mem_t* m, mem_watch_t cb, void* user_data) {
+    CHIPS_ASSERT(m);
+    m->watch_cb = cb;
+    m->watch_user_data = user_data;
+}
+
+void mem_watch(mem_t* m, uint16_t addr, uint32_t size) {
+    CHIPS_ASSERT(m);
+    CHIPS_ASSERT((size > 0) && (size <= MEM_ADDR_RANGE));
+    const uint32_t first_page = addr>>MEM_PAGE_SHIFT;
+    const uint32_t last_page = (addr + size - 1)>>MEM_PAGE_SHIFT;
+    for (uint32_t page = first_page; page <= last_page; page++) {
+        /* the page index will wrap-around */
+        m->watch_pages |= 1ULL<<(page & (MEM_NUM_PAGES-1));
+    }
+}
+
+void mem_unwatch_all(mem_t* m) {
+    CHIPS_ASSERT(m);
+    m->watch_pages = 0;
+}
+
+void mem_wr_watched(mem_t* m, uint16_t addr, uint8_t data) {
+    m->page_table[addr>>MEM_PAGE_SHIFT].write_ptr[addr & MEM_PAGE_MASK] = data;
+    if (m->watch_cb) {
+        m->watch_cb(addr, data, m->watch_user_data);
+    }
+}
+
 uint8_t mem_layer_rd(mem_t* mem, int layer, uint16_t addr) {
     CHIPS_ASSERT((layer >= 0) && (layer < MEM_NUM_LAYERS));
     if (mem->layers[layer][addr>>MEM_PAGE_SHIFT].read_ptr) {
@@ -386,4 +523,46 @@ void mem_layer_wr(mem_t* mem, int layer, uint16_t addr, uint8_t data) {
     }
 }
 
+/* relocate a page pointer, null pointers (unmapped layer pages) stay null */
+static inline uintptr_t _mem_relocate_ptr(uintptr_t ptr, uintptr_t from, uintptr_t to) {
+    if (0 == ptr) {
+        return 0;
+    }
+    /* a mapped pointer must not turn into a null offset */
+    CHIPS_ASSERT(ptr != from);
+    return ptr - from + to;
+}
+
+/* relocate all page pointers */
+static void _mem_relocate(mem_t* m, uintptr_t from, uintptr_t to) {
+    for (int layer = 0; layer < MEM_NUM_LAYERS; layer++) {
+        for (int i = 0; i < MEM_NUM_PAGES; i++) {
+            mem_page_t* page = &m->layers[layer][i];
+            page->read_ptr = (const uint8_t*) _mem_relocate_ptr((uintptr_t)page->read_ptr, from, to);
+            page->write_ptr = (uint8_t*) _mem_relocate_ptr((uintptr_t)page->write_ptr, from, to);
+        }
+    }
+    for (int i = 0; i < MEM_NUM_PAGES; i++) {
+        mem_page_t* page = &m->page_table[i];
+        page->read_ptr = (const uint8_t*) _mem_relocate_ptr((uintptr_t)page->read_ptr, from, to);
+        page->write_ptr = (uint8_t*) _mem_relocate_ptr((uintptr_t)page->write_ptr, from, to);
+    }
+}
+
+void mem_snapshot_onsave(mem_t* snapshot, void* base) {
+    CHIPS_ASSERT(snapshot && base);
+    _mem_relocate(snapshot, (uintptr_t)base, 0);
+    snapshot->watch_pages = 0;
+    snapshot->watch_cb = 0;
+    snapshot->watch_user_data = 0;
+}
+
+void mem_snapshot_onload(mem_t* snapshot, mem_t* sys, void* base) {
+    CHIPS_ASSERT(snapshot && sys && base);
+    _mem_relocate(snapshot, 0, (uintptr_t)base);
+    snapshot->watch_pages = sys->watch_pages;
+    snapshot->watch_cb = sys->watch_cb;
+    snapshot->watch_user_data = sys->watch_user_data;
+}
+
 #endif /* CHIPS_IMPL */
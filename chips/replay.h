@@ -0,0 +1,488 @@
+#pragma once
+/*#
+    # replay.h
+
+    Record and deterministically replay the input events of an emulator
+    session, and seek to any point in a recording.
+
+    Do this:
+    ~~~C
+    #define CHIPS_IMPL
+    ~~~
+    before you include this file in *one* C or C++ file to create the
+    implementation.
+
+    Optionally provide the following macros with your own implementation
+
+    ~~~C
+    CHIPS_ASSERT(c)
+    ~~~
+        your own assert macro (default: assert(c))
+
+    ## Overview
+
+    The emulators are deterministic: the same start state and the same
+    sequence of calls to xxx_exec(), xxx_key_down(), xxx_key_up() and
+    xxx_joystick() always result in the same system state. The replay
+    recorder sits between the host application and the emulator and
+    records this sequence as an event log, each event is stamped with the
+    CPU tick count at which it happened. The events are applied to the
+    emulator through a host-provided callback, both while recording and
+    while replaying.
+
+    While the recording or replay advances, a system snapshot is taken
+    in regular intervals (through a host-provided callback, usually
+    calling xxx_save_snapshot()). To seek to any tick position, the
+    nearest snapshot before the seek position is loaded, and the events
+    from there up to the seek position are applied with the emulator
+    switched to headless mode, which is much faster than real time.
+    When the snapshot memory is full, every other snapshot is dropped
+    and the snapshot interval is doubled, so that a long session can
+    be recorded with a fixed amount of snapshot memory.
+
+    Recording new events after seeking back drops the rest of the
+    recording (and the snapshots which have been taken after the seek
+    position), this can be used to implement rollback.
+
+    Input events are applied between calls to xxx_exec(), that's also
+    where the host application feeds them into the emulator when running
+    normally, so an event is stamped with the tick count at the end of
+    the previous frame.
+
+    ## Functions
+
+    ~~~C
+    void replay_init(replay_t* rp, const replay_desc_t* desc)
+    ~~~
+        Initialize a replay_t instance. The emulator must be initialized
+        first, since the current emulator state is saved as the first
+        snapshot at tick 0. The replay_desc_t struct must be filled
+        with the following items:
+
+        tick_hz         - the CPU frequency of the emulator in Hz, used to
+                          convert the frame time of exec events into ticks
+        events          - pointer to the memory for the event log
+        max_events      - max number of events in the event log
+        snapshot_buffer - pointer to the memory for system snapshots
+        snapshot_buffer_size - size of the snapshot memory in bytes
+        snapshot_size   - size of one snapshot in bytes (e.g. sizeof(zx_t))
+        snapshot_interval_us - the initial snapshot interval in micro-seconds
+                          of emulated time (default: 1 second)
+        event_cb        - called to apply an event to the emulator
+        save_cb         - called to save a snapshot of the emulator
+        load_cb         - called to load a snapshot into the emulator
+        headless_cb     - called to switch the emulator's headless mode
+                          on before fast-forwarding, and off afterwards
+        user_data       - optional user-data for the callbacks
+
+        The snapshot buffer must have room for at least 2 snapshots, at
+        most REPLAY_MAX_SNAPSHOTS (default: 64) snapshots are used,
+        define REPLAY_MAX_SNAPSHOTS before including replay.h to change
+        this.
+
+    ~~~C
+    bool replay_record(replay_t* rp, uint32_t type, uint32_t value)
+    ~~~
+        Apply an event to the emulator and append it to the event log.
+        If the current position isn't at the end of the event log
+        (after replay_seek() or replay_play()), the remaining events are
+        dropped first. Returns false if the event log is full, the event
+        is still applied in this case. The event types are:
+
+        REPLAY_EVENT_EXEC       - run the emulator, value is the frame
+                                  time in micro-seconds
+        REPLAY_EVENT_KEY_DOWN   - value is the key code
+        REPLAY_EVENT_KEY_UP     - value is the key code
+        REPLAY_EVENT_JOYSTICK   - value is the joystick mask
+        REPLAY_EVENT_USER       - first system-specific event type
+
+    ~~~C
+    bool replay_play(replay_t* rp, uint32_t micro_seconds)
+    ~~~
+        Apply the recorded events for the next micro_seconds of
+        emulated time. Returns false when the end of the event log
+        has been reached.
+
+    ~~~C
+    void replay_seek(replay_t* rp, uint64_t tick)
+    ~~~
+        Seek to a tick position by loading the nearest snapshot and
+        fast-forwarding to the first frame boundary at or after the tick
+        position (or the end of the event log).
+
+    ~~~C
+    void replay_restart(replay_t* rp, const replay_event_t* events, int num_events)
+    ~~~
+        Start replaying an event log which was recorded elsewhere (for
+        instance loaded from a file). The event log is copied, and the
+        current emulator state becomes the start state of the recording,
+        so the emulator must be put into the same state as at the start
+        of the recording before calling replay_restart().
+
+    ~~~C
+    uint64_t replay_tick(replay_t* rp)
+    ~~~
+        Return the current tick position.
+
+    ~~~C
+    uint64_t replay_end_tick(replay_t* rp)
+    ~~~
+        Return the tick position at the end of the event log.
+
+    ~~~C
+    int replay_num_events(replay_t* rp)
+    ~~~
+        Return the number of events in the event log, the events can
+        be accessed (e.g. to write them to a file) in replay_t.events.
+
+    ## Example
+
+    ~~~C
+    static void event_cb(const replay_event_t* ev, void* user_data) {
+        zx_t* zx = (zx_t*) user_data;
+        switch (ev->type) {
+            case REPLAY_EVENT_EXEC: zx_exec(zx, ev->value); break;
+            case REPLAY_EVENT_KEY_DOWN: zx_key_down(zx, (int)ev->value); break;
+            case REPLAY_EVENT_KEY_UP: zx_key_up(zx, (int)ev->value); break;
+            case REPLAY_EVENT_JOYSTICK: zx_joystick(zx, (uint8_t)ev->value); break;
+        }
+    }
+    static void save_cb(void* snapshot, void* user_data) {
+        zx_save_snapshot((zx_t*)user_data, (zx_t*)snapshot);
+    }
+    static void load_cb(const void* snapshot, void* user_data) {
+        zx_load_snapshot((zx_t*)user_data, ZX_SNAPSHOT_VERSION, (const zx_t*)snapshot);
+    }
+    static void headless_cb(bool headless, void* user_data) {
+        zx_set_headless((zx_t*)user_data, headless);
+    }
+
+    replay_init(&rp, &(replay_desc_t){
+        .tick_hz = 3500000,
+        .events = events,
+        .max_events = MAX_EVENTS,
+        .snapshot_buffer = snapshots,
+        .snapshot_buffer_size = sizeof(snapshots),
+        .snapshot_size = sizeof(zx_t),
+        .event_cb = event_cb,
+        .save_cb = save_cb,
+        .load_cb = load_cb,
+        .headless_cb = headless_cb,
+        .user_data = &zx
+    });
+
+    // once per frame, instead of calling zx_key_down() etc and zx_exec() directly:
+    replay_record(&rp, REPLAY_EVENT_KEY_DOWN, ZX_KEY_...);
+    replay_record(&rp, REPLAY_EVENT_EXEC, frame_time_us);
+    ~~~
+
+    ## zlib/libpng license
+
+    Copyright (c) 2020 Andre Weissflog
+    This software is provided 'as-is', without any express or implied warranty.
+    In no event will the authors be held liable for any damages arising from the
+    use of this software.
+    Permission is granted to anyone to use this software for any purpose,
+    including commercial applications, and to alter it and redistribute it
+    freely, subject to the following restrictions:
+        1. The origin of this software must not be misrepresented; you must not
+        claim that you wrote the original software. If you use this software in a
+        product, an acknowledgment in the product documentation would be
+        appreciated but is not required.
+        2. Altered source versions must be plainly marked as such, and must not
+        be misrepresented as being the original software.
+        3. This notice may not be removed or altered from any source
+        distribution.
+#*/
+#include <stdint.h>
+#include <stdbool.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/* max number of snapshots, can be overridden */
+#ifndef REPLAY_MAX_SNAPSHOTS
+#define REPLAY_MAX_SNAPSHOTS (64)
+#endif
+
+#define REPLAY_DEFAULT_SNAPSHOT_INTERVAL_US (1000000)
+
+/* event types */
+#define REPLAY_EVENT_EXEC       (0)     /* value: frame time in micro-seconds */
+#define REPLAY_EVENT_KEY_DOWN   (1)     /* value: key code */
+#define REPLAY_EVENT_KEY_UP     (2)     /* value: key code */
+#define REPLAY_EVENT_JOYSTICK   (3)     /* value: joystick mask */
+#define REPLAY_EVENT_USER       (16)    /* first system-specific event type */
+
+/* a recorded event */
+typedef struct {
+    uint64_t tick;          /* CPU tick count when the event happened */
+    uint32_t type;          /* REPLAY_EVENT_* */
+    uint32_t value;
+} replay_event_t;
+
+/* callback to apply an event to the emulator */
+typedef void (*replay_event_cb_t)(const replay_event_t* event, void* user_data);
+/* callback to save a snapshot of the emulator */
+typedef void (*replay_save_cb_t)(void* snapshot, void* user_data);
+/* callback to load a snapshot into the emulator */
+typedef void (*replay_load_cb_t)(const void* snapshot, void* user_data);
+/* callback to switch the emulator's headless mode on and off */
+typedef void (*replay_headless_cb_t)(bool headless, void* user_data);
+
+/* config parameters for replay_init() */
+typedef struct {
+    uint32_t tick_hz;               /* CPU frequency in Hz */
+    replay_event_t* events;         /* memory for the event log */
+    int max_events;                 /* max number of events in the event log */
+    void* snapshot_buffer;          /* memory for the snapshots */
+    int snapshot_buffer_size;       /* size of snapshot memory in bytes */
+    int snapshot_size;              /* size of one snapshot in bytes */
+    uint32_t snapshot_interval_us;  /* initial snapshot interval, default is 1 second */
+    replay_event_cb_t event_cb;
+    replay_save_cb_t save_cb;
+    replay_load_cb_t load_cb;
+    replay_headless_cb_t headless_cb;
+    void* user_data;
+} replay_desc_t;
+
+/* a snapshot taken at an event position */
+typedef struct {
+    uint64_t tick;          /* tick position of the snapshot */
+    int event_index;        /* index of the next event after the snapshot */
+} replay_snapshot_t;
+
+/* replay state */
+typedef struct {
+    uint32_t tick_hz;
+    replay_event_t* events;
+    int max_events;
+    int num_events;
+    int pos;                /* index of the next event to apply */
+    uint64_t tick;          /* current tick position */
+    uint8_t* snapshot_buffer;
+    int snapshot_size;
+    int max_snapshots;
+    int num_snapshots;
+    uint64_t snapshot_interval;     /* current snapshot interval in ticks */
+    replay_event_cb_t event_cb;
+    replay_save_cb_t save_cb;
+    replay_load_cb_t load_cb;
+    replay_headless_cb_t headless_cb;
+    void* user_data;
+    replay_snapshot_t snapshots[REPLAY_MAX_SNAPSHOTS];
+} replay_t;
+
+/* initialize a new replay_t instance, the current emulator state is the start state */
+void replay_init(replay_t* rp, const replay_desc_t* desc);
+/* apply an event and append it to the event log, returns false if the event log is full */
+bool replay_record(replay_t* rp, uint32_t type, uint32_t value);
+/* apply recorded events for the next micro_seconds, returns false at the end of the event log */
+bool replay_play(replay_t* rp, uint32_t micro_seconds);
+/* seek to a tick position */
+void replay_seek(replay_t* rp, uint64_t tick);
+/* start replaying an event log, the current emulator state is the start state */
+void replay_restart(replay_t* rp, const replay_event_t* events, int num_events);
+/* return the current tick position */
+uint64_t replay_tick(replay_t* rp);
+/* return the tick position at the end of the event log */
+uint64_t replay_end_tick(replay_t* rp);
+/* return the number of events in the event log */
+int replay_num_events(replay_t* rp);
+
+#ifdef __cplusplus
+} /* extern "C" */
+#endif
+
+/*-- IMPLEMENTATION ----------------------------------------------------------*/
+#ifdef CHIPS_IMPL
+#include <string.h>
+#ifndef CHIPS_ASSERT
+    #include <assert.h>
+    #define CHIPS_ASSERT(c) assert(c)
+#endif
+
+#define _REPLAY_DEF(val,def) (((val) == 0) ? (def) : (val))
+
+static uint64_t _replay_us_to_ticks(replay_t* rp, uint32_t micro_seconds) {
+    return ((uint64_t)micro_seconds * rp->tick_hz) / 1000000;
+}
+
+static uint8_t* _replay_snapshot_ptr(replay_t* rp, int index) {
+    return rp->snapshot_buffer + (size_t)index * rp->snapshot_size;
+}
+
+/* save a snapshot at the current position */
+static void _replay_save_snapshot(replay_t* rp) {
+    if (rp->num_snapshots == rp->max_snapshots) {
+        /* keep every other snapshot and double the interval */
+        int num = 0;
+        for (int i = 0; i < rp->num_snapshots; i += 2, num++) {
+            if (i != num) {
+                rp->snapshots[num] = rp->snapshots[i];
+                memcpy(_replay_snapshot_ptr(rp, num), _replay_snapshot_ptr(rp, i), rp->snapshot_size);
+            }
+        }
+        rp->num_snapshots = num;
+        rp->snapshot_interval *= 2;
+        /* the new snapshot might now be too close to the last one */
+        const replay_snapshot_t* last = &rp->snapshots[rp->num_snapshots - 1];
+        if (rp->tick < (last->tick + rp->snapshot_interval)) {
+            return;
+        }
+    }
+    replay_snapshot_t* snap = &rp->snapshots[rp->num_snapshots];
+    snap->tick = rp->tick;
+    snap->event_index = rp->pos;
+    rp->save_cb(_replay_snapshot_ptr(rp, rp->num_snapshots), rp->user_data);
+    rp->num_snapshots++;
+}
+
+/* apply the event at the current position and advance the position */
+static void _replay_apply(replay_t* rp) {
+    CHIPS_ASSERT(rp->pos < rp->num_events);
+    const replay_event_t* ev = &rp->events[rp->pos];
+    if (ev->type == REPLAY_EVENT_EXEC) {
+        const replay_snapshot_t* last = &rp->snapshots[rp->num_snapshots - 1];
+        if ((rp->pos > last->event_index) && (rp->tick >= (last->tick + rp->snapshot_interval))) {
+            _replay_save_snapshot(rp);
+        }
+        rp->event_cb(ev, rp->user_data);
+        rp->tick = ev->tick + _replay_us_to_ticks(rp, ev->value);
+    }
+    else {
+        rp->event_cb(ev, rp->user_data);
+    }
+    rp->pos++;
+}
+
+/* drop all events and snapshots after the current position */
+static void _replay_truncate(replay_t* rp) {
+    rp->num_events = rp->pos;
+    while ((rp->num_snapshots > 1) && (rp->snapshots[rp->num_snapshots - 1].event_index > rp->pos)) {
+        rp->num_snapshots--;
+    }
+}
+
+/* reset to the start state, the current emulator state is saved as first snapshot */
+static void _replay_reset(replay_t* rp) {
+    rp->pos = 0;
+    rp->tick = 0;
+    rp->num_snapshots = 0;
+    _replay_save_snapshot(rp);
+}
+
+void replay_init(replay_t* rp, const replay_desc_t* desc) {
+    CHIPS_ASSERT(rp && desc);
+    CHIPS_ASSERT(desc->tick_hz > 0);
+    CHIPS_ASSERT(desc->events && (desc->max_events > 0));
+    CHIPS_ASSERT(desc->snapshot_buffer && (desc->snapshot_size > 0));
+    CHIPS_ASSERT(desc->snapshot_buffer_size >= (2 * desc->snapshot_size));
+    CHIPS_ASSERT(desc->event_cb && desc->save_cb && desc->load_cb && desc->headless_cb);
+    memset(rp, 0, sizeof(replay_t));
+    rp->tick_hz = desc->tick_hz;
+    rp->events = desc->events;
+    rp->max_events = desc->max_events;
+    rp->snapshot_buffer = (uint8_t*) desc->snapshot_buffer;
+    rp->snapshot_size = desc->snapshot_size;
+    rp->max_snapshots = desc->snapshot_buffer_size / desc->snapshot_size;
+    if (rp->max_snapshots > REPLAY_MAX_SNAPSHOTS) {
+        rp->max_snapshots = REPLAY_MAX_SNAPSHOTS;
+    }
+    rp->snapshot_interval = _replay_us_to_ticks(rp, _REPLAY_DEF(desc->snapshot_interval_us, REPLAY_DEFAULT_SNAPSHOT_INTERVAL_US));
+    rp->event_cb = desc->event_cb;
+    rp->save_cb = desc->save_cb;
+    rp->load_cb = desc->load_cb;
+    rp->headless_cb = desc->headless_cb;
+    rp->user_data = desc->user_data;
+    _replay_reset(rp);
+}
+
+bool replay_record(replay_t* rp, uint32_t type, uint32_t value) {
+    CHIPS_ASSERT(rp && rp->events);
+    if (rp->pos < rp->num_events) {
+        _replay_truncate(rp);
+    }
+    replay_event_t ev;
+    ev.tick = rp->tick;
+    ev.type = type;
+    ev.value = value;
+    if (rp->num_events < rp->max_events) {
+        rp->events[rp->num_events++] = ev;
+        _replay_apply(rp);
+        return true;
+    }
+    else {
+        /* event log is full, only apply the event */
+        rp->event_cb(&ev, rp->user_data);
+        if (type == REPLAY_EVENT_EXEC) {
+            rp->tick += _replay_us_to_ticks(rp, value);
+        }
+        return false;
+    }
+}
+
+bool replay_play(replay_t* rp, uint32_t micro_seconds) {
+    CHIPS_ASSERT(rp && rp->events);
+    const uint64_t end_tick = rp->tick + _replay_us_to_ticks(rp, micro_seconds);
+    while ((rp->pos < rp->num_events) && (rp->events[rp->pos].tick < end_tick)) {
+        _replay_apply(rp);
+    }
+    return rp->pos < rp->num_events;
+}
+
+void replay_seek(replay_t* rp, uint64_t tick) {
+    CHIPS_ASSERT(rp && rp->events);
+    int snap_index = 0;
+    for (int i = rp->num_snapshots - 1; i >= 0; i--) {
+        if (rp->snapshots[i].tick <= tick) {
+            snap_index = i;
+            break;
+        }
+    }
+    /* only go back to the snapshot if the seek position is in the past or behind the snapshot */
+    const replay_snapshot_t* snap = &rp->snapshots[snap_index];
+    if ((tick < rp->tick) || (snap->event_index > rp->pos)) {
+        rp->load_cb(_replay_snapshot_ptr(rp, snap_index), rp->user_data);
+        rp->pos = snap->event_index;
+        rp->tick = snap->tick;
+    }
+    rp->headless_cb(true, rp->user_data);
+    while ((rp->pos < rp->num_events) && (rp->events[rp->pos].tick < tick)) {
+        _replay_apply(rp);
+    }
+    rp->headless_cb(false, rp->user_data);
+}
+
+void replay_restart(replay_t* rp, const replay_event_t* events, int num_events) {
+    CHIPS_ASSERT(rp && rp->events && events);
+    CHIPS_ASSERT((num_events >= 0) && (num_events <= rp->max_events));
+    memcpy(rp->events, events, num_events * sizeof(replay_event_t));
+    rp->num_events = num_events;
+    _replay_reset(rp);
+}
+
+uint64_t replay_tick(replay_t* rp) {
+    CHIPS_ASSERT(rp);
+    return rp->tick;
+}
+
+uint64_t replay_end_tick(replay_t* rp) {
+    CHIPS_ASSERT(rp);
+    if (rp->num_events > 0) {
+        const replay_event_t* ev = &rp->events[rp->num_events - 1];
+        if (ev->type == REPLAY_EVENT_EXEC) {
+            return ev->tick + _replay_us_to_ticks(rp, ev->value);
+        }
+        return ev->tick;
+    }
+    return 0;
+}
+
+int replay_num_events(replay_t* rp) {
+    CHIPS_ASSERT(rp);
+    return rp->num_events;
+}
+
+#endif /* CHIPS_IMPL */
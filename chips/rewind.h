@@ -0,0 +1,397 @@
+#pragma once
+/*#
+    # rewind.h
+
+    A ring buffer of delta-compressed system snapshots for rewinding
+    an emulator frame by frame.
+
+    Do this:
+    ~~~C
+    #define CHIPS_IMPL
+    ~~~
+    before you include this file in *one* C or C++ file to create the
+    implementation.
+
+    Optionally provide the following macros with your own implementation
+
+    ~~~C
+    CHIPS_ASSERT(c)
+    ~~~
+        your own assert macro (default: assert(c))
+
+    ## Overview
+
+    The rewind buffer works on opaque snapshots of a fixed size, usually
+    created with one of the xxx_save_snapshot() system functions.
+
+    Only the newest snapshot is kept in full (in the 'keyframe' area at
+    the start of the buffer). When a new snapshot is pushed, the
+    difference to the newest snapshot is XOR-ed and stored run-length
+    encoded in the ring buffer, and the new snapshot becomes the newest
+    snapshot. Since an XOR delta works in both directions, popping a
+    snapshot applies the newest delta to the keyframe, which then
+    contains the previous snapshot again. If the ring buffer runs out of
+    space, the oldest deltas are dropped.
+
+    Unchanged data is skipped 8 bytes at a time and doesn't take up any
+    space in the ring buffer, so the memory required per frame only
+    depends on how much of the system state has changed during the frame
+    (typically a few KBytes), not on the snapshot size.
+
+    The memory for the rewind buffer is provided by the caller, it must
+    be big enough for the keyframe and at least one worst-case delta,
+    use rewind_min_buffer_size() to compute the minimal size.
+
+    The number of deltas in the ring buffer is limited to
+    REWIND_MAX_FRAMES (default: 1024), define REWIND_MAX_FRAMES before
+    including rewind.h to change this.
+
+    ## Functions
+
+    ~~~C
+    void rewind_init(rewind_t* rw, const rewind_desc_t* desc)
+    ~~~
+        Initialize a rewind_t instance with the snapshot size and
+        a pointer to the memory buffer.
+
+    ~~~C
+    void rewind_clear(rewind_t* rw)
+    ~~~
+        Drop all snapshots.
+
+    ~~~C
+    void rewind_push(rewind_t* rw, const void* snapshot)
+    ~~~
+        Push a new snapshot, this will drop the oldest snapshots if the
+        ring buffer is full.
+
+    ~~~C
+    const void* rewind_pop(rewind_t* rw)
+    ~~~
+        Drop the newest snapshot and return a pointer to the previous
+        snapshot (which is now the newest snapshot), or a null pointer if
+        there is no previous snapshot. The returned pointer is valid until
+        the next call to rewind_push(), rewind_pop() or rewind_clear().
+
+    ~~~C
+    const void* rewind_peek(rewind_t* rw)
+    ~~~
+        Return a pointer to the newest snapshot, or a null pointer if
+        the rewind buffer is empty.
+
+    ~~~C
+    int rewind_num_snapshots(rewind_t* rw)
+    ~~~
+        Return the number of snapshots in the rewind buffer.
+
+    ~~~C
+    int rewind_min_buffer_size(int snapshot_size)
+    ~~~
+        Return the minimal buffer size for a snapshot size.
+
+    ## Example
+
+    ~~~C
+    static uint8_t buf[16<<20];
+    static zx_t snapshot;
+    rewind_t rw;
+    rewind_init(&rw, &(rewind_desc_t){
+        .snapshot_size = sizeof(zx_t),
+        .buffer = buf,
+        .buffer_size = sizeof(buf)
+    });
+
+    // once per frame:
+    if (rewinding) {
+        const zx_t* prev = (const zx_t*) rewind_pop(&rw);
+        if (prev) {
+            zx_load_snapshot(&zx, ZX_SNAPSHOT_VERSION, prev);
+        }
+    }
+    else {
+        zx_exec(&zx, frame_time_us);
+        zx_save_snapshot(&zx, &snapshot);
+        rewind_push(&rw, &snapshot);
+    }
+    ~~~
+
+    ## zlib/libpng license
+
+    Copyright (c) 2020 Andre Weissflog
+    This software is provided 'as-is', without any express or implied warranty.
+    In no event will the authors be held liable for any damages arising from the
+    use of this software.
+    Permission is granted to anyone to use this software for any purpose,
+    including commercial applications, and to alter it and redistribute it
+    freely, subject to the following restrictions:
+        1. The origin of this software must not be misrepresented; you must not
+        claim that you wrote the original software. If you use this software in a
+        product, an acknowledgment in the product documentation would be
+        appreciated but is not required.
+        2. Altered source versions must be plainly marked as such, and must not
+        be misrepresented as being the original software.
+        3. This notice may not be removed or altered from any source
+        distribution.
+#*/
+#include <stdint.h>
+#include <stdbool.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/* max number of deltas in the ring buffer, can be overridden */
+#ifndef REWIND_MAX_FRAMES
+#define REWIND_MAX_FRAMES (1024)
+#endif
+
+/* config parameters for rewind_init() */
+typedef struct {
+    int snapshot_size;      /* size of one snapshot in bytes */
+    void* buffer;           /* memory for the keyframe and ring buffer */
+    int buffer_size;        /* size of buffer in bytes, at least rewind_min_buffer_size() */
+} rewind_desc_t;
+
+/* a delta in the ring buffer */
+typedef struct {
+    int offset;             /* byte offset in the ring buffer */
+    int size;               /* encoded size in bytes */
+} rewind_delta_t;
+
+/* rewind buffer state */
+typedef struct {
+    int snapshot_size;
+    uint8_t* keyframe;      /* the newest snapshot */
+    uint8_t* ring;          /* the ring buffer for deltas */
+    int ring_size;
+    int max_delta_size;     /* worst-case encoded size of a delta */
+    bool has_keyframe;
+    int head;               /* byte offset where the next delta is written */
+    uint32_t first;         /* index of the oldest delta */
+    uint32_t num;           /* number of deltas */
+    rewind_delta_t deltas[REWIND_MAX_FRAMES];
+} rewind_t;
+
+/* initialize a new rewind_t instance */
+void rewind_init(rewind_t* rw, const rewind_desc_t* desc);
+/* drop all snapshots */
+void rewind_clear(rewind_t* rw);
+/* push a new snapshot */
+void rewind_push(rewind_t* rw, const void* snapshot);
+/* drop the newest snapshot and return the previous snapshot, or 0 */
+const void* rewind_pop(rewind_t* rw);
+/* return the newest snapshot, or 0 */
+const void* rewind_peek(rewind_t* rw);
+/* return the number of snapshots */
+int rewind_num_snapshots(rewind_t* rw);
+/* return the minimal buffer size for a snapshot size */
+int rewind_min_buffer_size(int snapshot_size);
+
+#ifdef __cplusplus
+} /* extern "C" */
+#endif
+
+/*-- IMPLEMENTATION ----------------------------------------------------------*/
+#ifdef CHIPS_IMPL
+#include <string.h>
+#ifndef CHIPS_ASSERT
+    #include <assert.h>
+    #define CHIPS_ASSERT(c) assert(c)
+#endif
+
+/*
+    Delta encoding: a sequence of runs, each run starts with a header of
+    two 32-bit words (number of unchanged 8-byte words to skip, and the
+    number of following XOR-ed 8-byte words), a header with zero XOR-ed
+    words ends the sequence. The trailing bytes of a snapshot which
+    don't fill a complete 8-byte word are always stored as XOR-ed bytes
+    after the end header. Single unchanged words between changed words
+    are stored as part of the run (this costs the same as a new run
+    header), so that the encoded size is never bigger than the snapshot
+    size plus 3 headers.
+*/
+#define _REWIND_MASK (REWIND_MAX_FRAMES-1)
+#define _REWIND_ALIGN(x) (((x)+7)&~7)
+
+static inline uint64_t _rewind_ld(const uint8_t* ptr) {
+    uint64_t v;
+    memcpy(&v, ptr, sizeof(v));
+    return v;
+}
+
+static inline void _rewind_st(uint8_t* ptr, uint64_t v) {
+    memcpy(ptr, &v, sizeof(v));
+}
+
+static inline void _rewind_st_header(uint8_t* ptr, uint32_t skip, uint32_t num) {
+    memcpy(ptr, &skip, sizeof(skip));
+    memcpy(ptr + 4, &num, sizeof(num));
+}
+
+static int _rewind_max_delta_size(int snapshot_size) {
+    return _REWIND_ALIGN(snapshot_size + 3*8);
+}
+
+int rewind_min_buffer_size(int snapshot_size) {
+    return _REWIND_ALIGN(snapshot_size) + _rewind_max_delta_size(snapshot_size);
+}
+
+void rewind_init(rewind_t* rw, const rewind_desc_t* desc) {
+    CHIPS_ASSERT(rw && desc);
+    CHIPS_ASSERT(0 == (REWIND_MAX_FRAMES & (REWIND_MAX_FRAMES-1)));
+    CHIPS_ASSERT(desc->buffer && (desc->snapshot_size > 0));
+    CHIPS_ASSERT(desc->buffer_size >= rewind_min_buffer_size(desc->snapshot_size));
+    memset(rw, 0, sizeof(rewind_t));
+    rw->snapshot_size = desc->snapshot_size;
+    rw->keyframe = (uint8_t*) desc->buffer;
+    rw->ring = rw->keyframe + _REWIND_ALIGN(desc->snapshot_size);
+    rw->ring_size = desc->buffer_size - _REWIND_ALIGN(desc->snapshot_size);
+    rw->max_delta_size = _rewind_max_delta_size(desc->snapshot_size);
+}
+
+void rewind_clear(rewind_t* rw) {
+    CHIPS_ASSERT(rw);
+    rw->has_keyframe = false;
+    rw->head = 0;
+    rw->first = 0;
+    rw->num = 0;
+}
+
+/* XOR the new snapshot into the keyframe, write the encoded delta to dst, and return its size */
+static int _rewind_encode(rewind_t* rw, const uint8_t* src, uint8_t* dst) {
+    uint8_t* key = rw->keyframe;
+    const int num_words = rw->snapshot_size / 8;
+    int pos = 0;
+    int last = 0;
+    int i = 0;
+    while (i < num_words) {
+        /* skip unchanged words */
+        while ((i < num_words) &&(_rewind_ld(key + i*8) == _rewind_ld(src + i*8))) {
+            i++;
+        }
+        if (i == num_words) {
+            break;
+        }
+        /* a run of changed words, including single unchanged words */
+        const int hdr_pos = pos;
+        const int start = i;
+        pos += 8;
+        while (i < num_words) {
+            const uint64_t s = _rewind_ld(src + i*8);
+            const uint64_t k = _rewind_ld(key + i*8);
+            if (s == k) {
+                if (((i + 1) < num_words) && (_rewind_ld(src + (i+1)*8) != _rewind_ld(key + (i+1)*8))) {
+                    _rewind_st(dst + pos, 0);
+                    pos += 8;
+                    i++;
+                    continue;
+                }
+                break;
+            }
+            _rewind_st(dst + pos, s ^ k);
+            _rewind_st(key + i*8, s);
+            pos += 8;
+            i++;
+        }
+        _rewind_st_header(dst + hdr_pos, (uint32_t)(start - last), (uint32_t)(i - start));
+        last = i;
+    }
+    _rewind_st_header(dst + pos, 0, 0);
+    pos += 8;
+    /* trailing bytes */
+    for (int bi = num_words * 8; bi < rw->snapshot_size; bi++) {
+        dst[pos++] = key[bi] ^ src[bi];
+        key[bi] = src[bi];
+    }
+    CHIPS_ASSERT(pos <= rw->max_delta_size);
+    return _REWIND_ALIGN(pos);
+}
+
+/* XOR an encoded delta into the keyframe */
+static void _rewind_decode(rewind_t* rw, const uint8_t* src) {
+    uint8_t* key = rw->keyframe;
+    const int num_words = rw->snapshot_size / 8;
+    int i = 0;
+    while (true) {
+        uint32_t skip, num;
+        memcpy(&skip, src, sizeof(skip));
+        memcpy(&num, src + 4, sizeof(num));
+        src += 8;
+        if (0 == num) {
+            break;
+        }
+        i += (int)skip;
+        CHIPS_ASSERT((i + (int)num) <= num_words);
+        for (uint32_t wi = 0; wi < num; wi++, i++, src += 8) {
+            _rewind_st(key + i*8, _rewind_ld(key + i*8) ^ _rewind_ld(src));
+        }
+    }
+    for (int bi = num_words * 8; bi < rw->snapshot_size; bi++) {
+        key[bi] ^= *src++;
+    }
+}
+
+static void _rewind_drop_oldest(rewind_t* rw) {
+    CHIPS_ASSERT(rw->num > 0);
+    rw->first++;
+    rw->num--;
+}
+
+void rewind_push(rewind_t* rw, const void* snapshot) {
+    CHIPS_ASSERT(rw && snapshot);
+    if (!rw->has_keyframe) {
+        memcpy(rw->keyframe, snapshot, rw->snapshot_size);
+        rw->has_keyframe = true;
+        return;
+    }
+    /* find room for a worst-case delta, wrap around at the end of the ring buffer */
+    int pos = rw->head;
+    if ((pos + rw->max_delta_size) > rw->ring_size) {
+        /* the deltas between head and the end of the ring buffer are the oldest */
+        while ((rw->num > 0) && (rw->deltas[rw->first & _REWIND_MASK].offset >= pos)) {
+            _rewind_drop_oldest(rw);
+        }
+        pos = 0;
+    }
+    while ((rw->num > 0) && (rw->num >= REWIND_MAX_FRAMES)) {
+        _rewind_drop_oldest(rw);
+    }
+    while (rw->num > 0) {
+        const int offset = rw->deltas[rw->first & _REWIND_MASK].offset;
+        if ((offset >= pos) && (offset < (pos + rw->max_delta_size))) {
+            _rewind_drop_oldest(rw);
+        }
+        else {
+            break;
+        }
+    }
+    rewind_delta_t* delta = &rw->deltas[(rw->first + rw->num) & _REWIND_MASK];
+    delta->offset = pos;
+    delta->size = _rewind_encode(rw, (const uint8_t*)snapshot, rw->ring + pos);
+    rw->num++;
+    rw->head = pos + delta->size;
+}
+
+const void* rewind_pop(rewind_t* rw) {
+    CHIPS_ASSERT(rw);
+    if (0 == rw->num) {
+        return 0;
+    }
+    const rewind_delta_t* delta = &rw->deltas[(rw->first + rw->num - 1) & _REWIND_MASK];
+    _rewind_decode(rw, rw->ring + delta->offset);
+    rw->head = delta->offset;
+    rw->num--;
+    return rw->keyframe;
+}
+
+const void* rewind_peek(rewind_t* rw) {
+    CHIPS_ASSERT(rw);
+    return rw->has_keyframe ? rw->keyframe : 0;
+}
+
+int rewind_num_snapshots(rewind_t* rw) {
+    CHIPS_ASSERT(rw);
+    return rw->has_keyframe ? (int)rw->num + 1 : 0;
+}
+
+#endif /* CHIPS_IMPL */
@@ -0,0 +1,245 @@
+#pragma once
+/*#
+    # syncq.h
+
+    Timestamped event queue for communication between emulated CPUs
+    which run at different clock frequencies (for instance the main
+    and sound boards of arcade machines).
+
+    Do this:
+    ~~~C
+    #define CHIPS_IMPL
+    ~~~
+    before you include this file in *one* C or C++ file to create the
+    implementation.
+
+    Optionally provide the following macros with your own implementation
+
+    ~~~C
+    CHIPS_ASSERT(c)
+    ~~~
+        your own assert macro (default: assert(c))
+
+    ## Overview
+
+    Multi-CPU systems are usually emulated by running the CPUs interleaved
+    in small time slices, so that a value written by one CPU into a shared
+    latch is seen by the other CPU 'roughly at the right time'. The smaller
+    the time slices, the more accurate the communication, but the more
+    often the emulator needs to switch between CPUs.
+
+    With syncq.h, the CPU which writes to the shared communication point
+    (the 'producer') records the written values together with its current
+    tick count in a queue, and the CPU which reads the communication point
+    (the 'consumer') pops all values which have a timestamp in its
+    past right before it reads the communication point. This way, both
+    CPUs can run a whole frame in one go, and the consumer still sees
+    each written value exactly at the time it was written.
+
+    This works without rollback as long as communication only flows from
+    the producer to the consumer, and the producer is run first. If the
+    consumer has run ahead of the producer (so that a pushed event has a
+    timestamp in the consumer's past), the event is delivered on the next
+    pop, and the conflict is counted in syncq_t.num_conflicts.
+
+    If the consumer needs to stop right at the next communication point
+    (instead of polling a latch), use syncq_ticks_until() to compute
+    the number of ticks it can run before the next event is due.
+
+    The queue has room for SYNCQ_MAX_EVENTS pending events (default: 64),
+    define SYNCQ_MAX_EVENTS before including syncq.h to change this. If
+    an event is pushed into a full queue, the oldest pending event is
+    dropped (so that the remaining events are still delivered in the
+    order they were written), and the overflow is counted in
+    syncq_t.num_overflows.
+
+    ## Functions
+
+    ~~~C
+    void syncq_init(syncq_t* q, const syncq_desc_t* desc)
+    ~~~
+        Initialize a new syncq_t instance with the producer and consumer
+        clock frequencies in Hz.
+
+    ~~~C
+    void syncq_reset(syncq_t* q)
+    ~~~
+        Drop all pending events.
+
+    ~~~C
+    bool syncq_push(syncq_t* q, uint64_t src_tick, uint32_t data)
+    ~~~
+        Push an event with a 32-bit user-defined payload, the timestamp
+        is the producer's running tick count. Returns false if the queue
+        was full (in this case the oldest pending event has been dropped
+        to make room for the new event).
+
+    ~~~C
+    bool syncq_pop(syncq_t* q, uint64_t dst_tick, uint32_t* out_data)
+    ~~~
+        Pop the next event if its timestamp (converted to consumer ticks)
+        is not after dst_tick (the consumer's running tick count). Returns
+        false if no event is due.
+
+    ~~~C
+    uint32_t syncq_ticks_until(syncq_t* q, uint64_t dst_tick)
+    ~~~
+        Return the number of consumer ticks until the next event is due,
+        or SYNCQ_NO_EVENT if the queue is empty.
+
+    ## zlib/libpng license
+
+    Copyright (c) 2020 Andre Weissflog
+    This software is provided 'as-is', without any express or implied warranty.
+    In no event will the authors be held liable for any damages arising from the
+    use of this software.
+    Permission is granted to anyone to use this software for any purpose,
+    including commercial applications, and to alter it and redistribute it
+    freely, subject to the following restrictions:
+        1. The origin of this software must not be misrepresented; you must not
+        claim that you wrote the original software. If you use this software in a
+        product, an acknowledgment in the product documentation would be
+        appreciated but is not required.
+        2. Altered source versions must be plainly marked as such, and must not
+        be misrepresented as being the original software.
+        3. This notice may not be removed or altered from any source
+        distribution.
+#*/
+#include <stdint.h>
+#include <stdbool.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/* max number of pending events (must be 2^N), can be overridden */
+#ifndef SYNCQ_MAX_EVENTS
+#define SYNCQ_MAX_EVENTS (64)
+#endif
+/* returned by syncq_ticks_until() if the queue is empty */
+#define SYNCQ_NO_EVENT (0xFFFFFFFF)
+
+/* config parameters for syncq_init() */
+typedef struct {
+    uint32_t src_freq_hz;   /* producer clock frequency */
+    uint32_t dst_freq_hz;   /* consumer clock frequency */
+} syncq_desc_t;
+
+/* a queued event */
+typedef struct {
+    uint64_t tick;          /* timestamp in consumer clock ticks */
+    uint32_t data;          /* user-defined payload */
+} syncq_event_t;
+
+/* syncq state */
+typedef struct {
+    uint64_t src_freq_hz;
+    uint64_t dst_freq_hz;
+    uint32_t head;          /* next event is pushed here */
+    uint32_t tail;          /* next event is popped from here */
+    uint32_t num_conflicts; /* number of events which arrived in the consumer's past */
+    uint32_t num_overflows; /* number of events dropped because the queue was full */
+    uint64_t last_pop_tick; /* consumer tick count of last pop */
+    syncq_event_t events[SYNCQ_MAX_EVENTS];
+} syncq_t;
+
+/* initialize a new syncq_t instance */
+void syncq_init(syncq_t* q, const syncq_desc_t* desc);
+/* drop all pending events */
+void syncq_reset(syncq_t* q);
+/* push an event with a producer timestamp, return false if the oldest event was dropped */
+bool syncq_push(syncq_t* q, uint64_t src_tick, uint32_t data);
+/* pop the next event if it is due at the consumer tick count */
+bool syncq_pop(syncq_t* q, uint64_t dst_tick, uint32_t* out_data);
+/* number of consumer ticks until the next event is due */
+uint32_t syncq_ticks_until(syncq_t* q, uint64_t dst_tick);
+/* return true if the queue is empty */
+static inline bool syncq_empty(syncq_t* q) {
+    return q->head == q->tail;
+}
+
+#ifdef __cplusplus
+} /* extern "C" */
+#endif
+
+/*-- IMPLEMENTATION ----------------------------------------------------------*/
+#ifdef CHIPS_IMPL
+#include <string.h>
+#ifndef CHIPS_ASSERT
+    #include <assert.h>
+    #define CHIPS_ASSERT(c) assert(c)
+#endif
+
+#define _SYNCQ_MASK (SYNCQ_MAX_EVENTS-1)
+
+void syncq_init(syncq_t* q, const syncq_desc_t* desc) {
+    CHIPS_ASSERT(q && desc);
+    CHIPS_ASSERT((desc->src_freq_hz > 0) && (desc->dst_freq_hz > 0));
+    memset(q, 0, sizeof(syncq_t));
+    q->src_freq_hz = desc->src_freq_hz;
+    q->dst_freq_hz = desc->dst_freq_hz;
+}
+
+void syncq_reset(syncq_t* q) {
+    CHIPS_ASSERT(q);
+    q->head = q->tail = 0;
+    q->num_conflicts = 0;
+    q->num_overflows = 0;
+    q->last_pop_tick = 0;
+}
+
+/* convert producer ticks to consumer ticks without 64-bit overflow */
+static uint64_t _syncq_dst_tick(syncq_t* q, uint64_t src_tick) {
+    const uint64_t secs = src_tick / q->src_freq_hz;
+    const uint64_t rem = src_tick % q->src_freq_hz;
+    return secs * q->dst_freq_hz + (rem * q->dst_freq_hz) / q->src_freq_hz;
+}
+
+bool syncq_push(syncq_t* q, uint64_t src_tick, uint32_t data) {
+    CHIPS_ASSERT(q);
+    bool res = true;
+    if ((q->head - q->tail) >= SYNCQ_MAX_EVENTS) {
+        /* queue is full, drop the oldest event */
+        q->tail++;
+        q->num_overflows++;
+        res = false;
+    }
+    syncq_event_t* ev = &q->events[q->head++ & _SYNCQ_MASK];
+    ev->tick = _syncq_dst_tick(q, src_tick);
+    ev->data = data;
+    if (ev->tick < q->last_pop_tick) {
+        /* the consumer has already run past this event */
+        q->num_conflicts++;
+    }
+    return res;
+}
+
+bool syncq_pop(syncq_t* q, uint64_t dst_tick, uint32_t* out_data) {
+    CHIPS_ASSERT(q && out_data);
+    q->last_pop_tick = dst_tick;
+    if (q->head == q->tail) {
+        return false;
+    }
+    const syncq_event_t* ev = &q->events[q->tail & _SYNCQ_MASK];
+    if (ev->tick > dst_tick) {
+        return false;
+    }
+    *out_data = ev->data;
+    q->tail++;
+    return true;
+}
+
+uint32_t syncq_ticks_until(syncq_t* q, uint64_t dst_tick) {
+    CHIPS_ASSERT(q);
+    if (q->head == q->tail) {
+        return SYNCQ_NO_EVENT;
+    }
+    const syncq_event_t* ev = &q->events[q->tail & _SYNCQ_MASK];
+    if (ev->tick <= dst_tick) {
+        return 0;
+    }
+    const uint64_t ticks = ev->tick - dst_tick;
+    return (ticks < SYNCQ_NO_EVENT) ? (uint32_t)ticks : (SYNCQ_NO_EVENT - 1);
+}
+
+#endif /* CHIPS_IMPL */
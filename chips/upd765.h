@@ -26,6 +26,25 @@
         - no DMA mode
         - no interrupt-driven operation
 
+    ## Fast Data Transfer
+
+    In the READ DATA execution phase, the CPU usually polls the main status
+    register and reads the sector data byte by byte through the data
+    register. If the system emulator detects that the CPU sits in such
+    a polling loop, it may call:
+
+    ~~~C
+    int upd765_read_bytes(upd765_t* upd, uint8_t* dst, int max_bytes)
+    ~~~
+
+    This performs the same sequence of status and data register reads as
+    the polling loop for up to max_bytes sector data bytes, and stops
+    when the controller leaves the execution phase (so that the CPU
+    reads the final status and result bytes itself). Returns the number
+    of bytes written to dst. The controller state after the call is
+    identical to the state after the CPU polling loop, except for the
+    debug-inspection pin mask in upd765_t.pins.
+
     ## TODO
         - DOCS!
         - cleanup callbacks
@@ -243,6 +262,13 @@ void upd765_init(upd765_t* upd, const upd765_desc_t* desc);
 void upd765_reset(upd765_t* upd);
 /* perform an IO request on the upd765 */
 uint64_t upd765_iorq(upd765_t* upd, uint64_t pins);
+/* transfer sector data bytes like a CPU polling loop in the READ DATA exec phase */
+int upd765_read_bytes(upd765_t* upd, uint8_t* dst, int max_bytes);
+
+/* clear host pointers in a snapshot before saving */
+void upd765_snapshot_onsave(upd765_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void upd765_snapshot_onload(upd765_t* snapshot, upd765_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -670,4 +696,36 @@ uint64_t upd765_iorq(upd765_t* upd, uint64_t pins) {
     }
     return pins;
 }
+
+int upd765_read_bytes(upd765_t* upd, uint8_t* dst, int max_bytes) {
+    CHIPS_ASSERT(upd && dst && (max_bytes >= 0));
+    int num_bytes = 0;
+    while ((num_bytes < max_bytes) && (UPD765_PHASE_EXEC == upd->phase) && (UPD765_CMD_READ_DATA == upd->cmd)) {
+        /* the polling loop reads the status register before each data byte */
+        upd->status = _upd765_read_status(upd);
+        dst[num_bytes++] = _upd765_read_data(upd);
+    }
+    return num_bytes;
+}
+
+void upd765_snapshot_onsave(upd765_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->seektrack_cb = 0;
+    snapshot->seeksector_cb = 0;
+    snapshot->read_cb = 0;
+    snapshot->trackinfo_cb = 0;
+    snapshot->driveinfo_cb = 0;
+    snapshot->user_data = 0;
+}
+
+void upd765_snapshot_onload(upd765_t* snapshot, upd765_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->seektrack_cb = sys->seektrack_cb;
+    snapshot->seeksector_cb = sys->seeksector_cb;
+    snapshot->read_cb = sys->read_cb;
+    snapshot->trackinfo_cb = sys->trackinfo_cb;
+    snapshot->driveinfo_cb = sys->driveinfo_cb;
+    snapshot->user_data = sys->user_data;
+}
+
 #endif /* CHIPS_IMPL */
@@ -104,6 +104,58 @@
         Set a null ptr as trap callback disables the trap checking.
         To get the current trap callback, simply access z80_t.trap_cb directly.
 
+    ~~~C
+    void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data)
+    ~~~
+        Set an optional callback which enables a fast path for the repeating
+        block instructions LDIR, LDDR, CPIR and CPDR. After the first
+        iteration of such an instruction, the CPU asks the callback for
+        direct access to the memory which the following iterations will
+        read or write:
+
+            ~~~C
+            uint8_t* bulk_cb(uint16_t addr, uint16_t* num_bytes, bool write, void* user_data)
+            ~~~
+
+        The requested range starts at 'addr', is *num_bytes long and never
+        crosses a 256-byte page boundary (for LDDR and CPDR the range ends
+        at the current HL or DE register value). The callback should return
+        a host pointer to the memory byte at 'addr' if the whole range is
+        plain memory without side effects on reads and writes (and without
+        wait states), otherwise it should return a null pointer. The
+        callback may reduce *num_bytes (but not to zero) to limit the number
+        of bytes the CPU processes in one go, for instance to limit the
+        number of ticks until the system needs to see the next tick
+        callback (each byte takes Z80_BULK_TICKS ticks), the returned
+        pointer must still be valid for the whole requested range.
+
+        If both the source and destination range are accessible, the CPU
+        performs the iterations directly on host memory, updates the
+        registers and flags exactly like the regular instruction
+        execution, and invokes the tick callback once for all the ticks of
+        the iterations (without control pins set). The memory accesses and
+        opcode fetches of those iterations aren't visible to the tick
+        callback, and the trap callback is only called once per chunk of
+        iterations. Interrupt requests are checked between chunks. If the
+        callback returns a null pointer the remaining iterations are
+        executed normally. The fast path is never used for INIR, INDR,
+        OTIR and OTDR, since IO requests must always go through the tick
+        callback.
+
+        The memory system in mem.h has a helper function mem_bulk_ptr()
+        to implement the callback.
+
+    ~~~C
+    void z80_snapshot_onsave(z80_t* snapshot)
+    void z80_snapshot_onload(z80_t* snapshot, z80_t* sys)
+    ~~~
+        Helper functions for saving and loading system snapshots. A snapshot
+        of a z80_t is a plain copy of the struct, call z80_snapshot_onsave()
+        on the copy to clear the host pointers (tick- and trap-callbacks, and
+        their user data). Before a snapshot is copied back into a running
+        z80_t instance, call z80_snapshot_onload() on the snapshot to take
+        the host pointers over from the running instance.
+
     ## Macros
     ~~~C
     Z80_SET_ADDR(pins, addr)
@@ -311,6 +363,10 @@ extern "C" {
 /*--- callback function typedefs ---*/
 typedef uint64_t (*z80_tick_t)(int num_ticks, uint64_t pins, void* user_data);
 typedef int (*z80_trap_t)(uint16_t pc, uint32_t ticks, uint64_t pins, void* trap_user_data);
+typedef uint8_t* (*z80_bulk_t)(uint16_t addr, uint16_t* num_bytes, bool write, void* bulk_user_data);
+
+/* number of ticks per byte in the LDIR/LDDR/CPIR/CPDR fast path */
+#define Z80_BULK_TICKS (21)
 
 /*--- address bus pins ---*/
 #define Z80_A0  (1ULL<<0)
@@ -399,6 +455,8 @@ typedef struct {
     z80_trap_t trap_cb;
     void* trap_user_data;
     int trap_id;                /* != 0 if a trap has been hit */
+    z80_bulk_t bulk_cb;
+    void* bulk_user_data;
 } z80_t;
 
 /* initialize a new z80 instance */
@@ -407,10 +465,16 @@ void z80_init(z80_t* cpu, const z80_desc_t* desc);
 void z80_reset(z80_t* cpu);
 /* set optional trap callback function */
 void z80_trap_cb(z80_t* cpu, z80_trap_t trap_cb, void* trap_user_data);
+/* set optional callback for the LDIR/LDDR/CPIR/CPDR fast path */
+void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data);
 /* execute instructions for at least 'ticks', but at least one, return executed ticks */
 uint32_t z80_exec(z80_t* cpu, uint32_t ticks);
 /* return false if z80_exec() returned in the middle of an extended instruction */
 bool z80_opdone(z80_t* cpu);
+/* clear host pointers in a snapshot before saving */
+void z80_snapshot_onsave(z80_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void z80_snapshot_onload(z80_t* snapshot, z80_t* sys);
 
 /* register access functions */
 void z80_set_a(z80_t* cpu, uint8_t v);
@@ -505,6 +569,18 @@ bool z80_ei_pending(z80_t* cpu);
     #define CHIPS_ASSERT(c) assert(c)
 #endif
 
+/* 1 if z80_exec() keeps the registers in separate local variables
+   instead of the 64-bit register banks (z80_gen.py --regs locals)
+*/
+#define _Z80_REGS_LOCALS (0)
+/* 1 if the 8-bit ADD, ADC, SUB, SBC, CP, NEG and DAA instructions get
+   their flags from lookup tables (z80_gen.py --alu-flags table)
+*/
+#define _Z80_FLAG_TABLES (0)
+#if _Z80_FLAG_TABLES
+static void _z80_init_flag_tables(void);
+#endif
+
 /* register locations in register banks */
 #define _A (0)
 #define _F (8)
@@ -540,6 +616,54 @@ bool z80_ei_pending(z80_t* cpu);
 #define _BITS_USE_IXIY  (_BIT_USE_IX|_BIT_USE_IY)
 
 /* register setter/getter shortcut macros */
+#if _Z80_REGS_LOCALS
+/* HL is the 'working set' HL which is renamed to IX or IY by the DD and FD
+   prefixes, while a prefix is active reg_hl holds the actual HL register
+*/
+#define _S_A(val)  reg_a=(uint8_t)(val)
+#define _S_F(val)  reg_f=(uint8_t)(val)
+#define _S_L(val)  reg_l=(uint8_t)(val)
+#define _S_H(val)  reg_h=(uint8_t)(val)
+#define _S_E(val)  reg_e=(uint8_t)(val)
+#define _S_D(val)  reg_d=(uint8_t)(val)
+#define _S_C(val)  reg_c=(uint8_t)(val)
+#define _S_B(val)  reg_b=(uint8_t)(val)
+#define _S_FA(val) {const uint16_t _v16=(uint16_t)(val);reg_f=(uint8_t)(_v16>>8);reg_a=(uint8_t)_v16;}
+#define _S_HL(val) {const uint16_t _v16=(uint16_t)(val);reg_h=(uint8_t)(_v16>>8);reg_l=(uint8_t)_v16;}
+#define _S_DE(val) {const uint16_t _v16=(uint16_t)(val);reg_d=(uint8_t)(_v16>>8);reg_e=(uint8_t)_v16;}
+#define _S_BC(val) {const uint16_t _v16=(uint16_t)(val);reg_b=(uint8_t)(_v16>>8);reg_c=(uint8_t)_v16;}
+#define _S_WZ(val) reg_wz=(uint16_t)(val)
+#define _S_IX(val) reg_ix=(uint16_t)(val)
+#define _S_IY(val) reg_iy=(uint16_t)(val)
+#define _S_SP(val) reg_sp=(uint16_t)(val)
+#define _S_IM(val) reg_im=(uint8_t)(val)
+#define _S_I(val)  reg_i=(uint8_t)(val)
+#define _S_R(val)  reg_r=(uint8_t)(val)
+#define _S_H0(val) reg_hl=(uint16_t)((reg_hl&0x00FF)|(((val)&0xFF)<<8))
+#define _S_L0(val) reg_hl=(uint16_t)((reg_hl&0xFF00)|((val)&0xFF))
+#define _G_A()  reg_a
+#define _G_F()  reg_f
+#define _G_L()  reg_l
+#define _G_H()  reg_h
+#define _G_E()  reg_e
+#define _G_D()  reg_d
+#define _G_C()  reg_c
+#define _G_B()  reg_b
+#define _G_FA() ((uint16_t)((reg_f<<8)|reg_a))
+#define _G_HL() ((uint16_t)((reg_h<<8)|reg_l))
+#define _G_DE() ((uint16_t)((reg_d<<8)|reg_e))
+#define _G_BC() ((uint16_t)((reg_b<<8)|reg_c))
+#define _G_WZ() reg_wz
+#define _G_IX() reg_ix
+#define _G_IY() reg_iy
+#define _G_SP() reg_sp
+#define _G_IM() reg_im
+#define _G_I()  reg_i
+#define _G_R()  reg_r
+#define _G_IR() ((uint16_t)((reg_i<<8)|reg_r))
+#define _G_H0() ((uint8_t)(reg_hl>>8))
+#define _G_L0() ((uint8_t)reg_hl)
+#else
 #define _S_A(val)  _S8(ws,_A,val)
 #define _S_F(val)  _S8(ws,_F,val)
 #define _S_L(val)  _S8(ws,_L,val)
@@ -560,7 +684,6 @@ bool z80_ei_pending(z80_t* cpu);
 #define _S_I(val)  _S8(r2,_I,val)
 #define _S_R(val)  _S8(r2,_R,val)
 #define _S_IR(val) _S16(r2,_IR,val)
-#define _S_PC(val) _S16(r2,_PC,val)
 #define _G_A()  _G8(ws,_A)
 #define _G_F()  _G8(ws,_F)
 #define _G_L()  _G8(ws,_L)
@@ -581,7 +704,12 @@ bool z80_ei_pending(z80_t* cpu);
 #define _G_I()  _G8(r2,_I)
 #define _G_R()  _G8(r2,_R)
 #define _G_IR() _G16(r2,_IR)
-#define _G_PC() _G16(r2,_PC)
+/* the actual H and L registers while an index prefix is active */
+#define _S_H0(val) _S8(r0,_H,val)
+#define _S_L0(val) _S8(r0,_L,val)
+#define _G_H0() _G8(r0,_H)
+#define _G_L0() _G8(r0,_L)
+#endif
 
 /* set 8-bit immediate value in 64-bit register bank */
 #define _S8(bank,shift,val) bank=(((bank)&~(0xFFULL<<(shift)))|(((val)&0xFFULL)<<(shift)))
@@ -620,9 +748,13 @@ bool z80_ei_pending(z80_t* cpu);
 /* true if current op is an indexed op */
 #define _IDX() (0!=(r2&_BITS_USE_IXIY))
 /* generate effective address for (HL), (IX+d), (IY+d) */
-#define _ADDR(addr,ext_ticks) {addr=_G16(ws,_HL);if(_IDX()){int8_t d;_MR(pc++,d);addr+=d;_S_WZ(addr);_T(ext_ticks);}}
+#define _ADDR(addr,ext_ticks) {addr=_G_HL();if(_IDX()){int8_t d;_MR(pc++,d);addr+=d;_S_WZ(addr);_T(ext_ticks);}}
 /* helper macro to bump R register */
+#if _Z80_REGS_LOCALS
+#define _BUMPR() reg_r=(reg_r&0x80)|((reg_r+1)&0x7F)
+#else
 #define _BUMPR() d8=_G8(r2,_R);d8=(d8&0x80)|((d8+1)&0x7F);_S8(r2,_R,d8)
+#endif
 /* a normal opcode fetch, bump R */
 #ifdef CHIPS_Z80_RFSH
 #define _FETCH(op) {_SA(pc++);_TWM(3,Z80_M1|Z80_MREQ|Z80_RD);op=_GD();_SA(_G_I()<<8|_G_R());_TM(1,Z80_MREQ|Z80_RFSH);_BUMPR();}
@@ -631,6 +763,16 @@ bool z80_ei_pending(z80_t* cpu);
 #endif
 /* special opcode fetch for CB prefix, only bump R if not a DD/FD+CB 'double prefix' op */
 #define _FETCH_CB(op) {_SA(pc++);_TWM(4,Z80_M1|Z80_MREQ|Z80_RD);op=_GD();if(!_IDX()){_BUMPR();}}
+/* true if the end-of-instruction checks would do nothing (no interrupt
+   request, no index prefix, and the tick budget isn't exhausted), so that
+   the first instruction of a fused pair may directly continue with the
+   next instruction
+*/
+#define _CHAIN() ((ticks<num_ticks)&&!_IDX()&&!(pins&(Z80_INT|Z80_NMI)))
+/* true if the block instruction fast path may execute the next chunk */
+#define _BULK() (bulk&&(ticks<num_ticks)&&!(pins&(Z80_INT|Z80_NMI)))
+/* call the trap callback at the end of a chained instruction */
+#define _TRAP() if(trap){int trap_id=trap(pc,ticks,pins,cpu->trap_user_data);if(trap_id){cpu->trap_id=trap_id;goto trapped;}}
 /* evaluate S+Z flags */
 #define _SZ(val) ((val&0xFF)?(val&Z80_SF):Z80_ZF)
 /* evaluate SZYXCH flags */
@@ -711,6 +853,9 @@ void z80_init(z80_t* cpu, const z80_desc_t* desc) {
     CHIPS_ASSERT(cpu && desc);
     CHIPS_ASSERT(desc->tick_cb);
     memset(cpu, 0, sizeof(*cpu));
+    #if _Z80_FLAG_TABLES
+    _z80_init_flag_tables();
+    #endif
     z80_reset(cpu);
     cpu->tick_cb = desc->tick_cb;
     cpu->user_data = desc->user_data;
@@ -742,10 +887,50 @@ void z80_trap_cb(z80_t* cpu, z80_trap_t trap_cb, void* trap_user_data) {
     cpu->trap_user_data = trap_user_data;
 }
 
+void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data) {
+    CHIPS_ASSERT(cpu);
+    cpu->bulk_cb = bulk_cb;
+    cpu->bulk_user_data = bulk_user_data;
+}
+
 bool z80_opdone(z80_t* cpu) {
     return 0 == (cpu->im_ir_pc_bits & _BITS_USE_IXIY);
 }
 
+void z80_snapshot_onsave(z80_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->tick_cb = 0;
+    snapshot->user_data = 0;
+    snapshot->trap_cb = 0;
+    snapshot->trap_user_data = 0;
+    snapshot->bulk_cb = 0;
+    snapshot->bulk_user_data = 0;
+}
+
+void z80_snapshot_onload(z80_t* snapshot, z80_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->tick_cb = sys->tick_cb;
+    snapshot->user_data = sys->user_data;
+    snapshot->trap_cb = sys->trap_cb;
+    snapshot->trap_user_data = sys->trap_user_data;
+    snapshot->bulk_cb = sys->bulk_cb;
+    snapshot->bulk_user_data = sys->bulk_user_data;
+}
+
+/* get a host pointer to the byte at addr for the next num bytes (ascending),
+   or the previous num bytes (descending) of a bulk block instruction
+*/
+static inline uint8_t* _z80_bulk_ptr(z80_t* cpu, uint16_t addr, uint16_t* num, bool write, bool desc) {
+    if (desc) {
+        const uint16_t num_req = *num;
+        uint8_t* ptr = cpu->bulk_cb((uint16_t)(addr-num_req+1), num, write, cpu->bulk_user_data);
+        return ptr ? (ptr + num_req - 1) : 0;
+    }
+    else {
+        return cpu->bulk_cb(addr, num, write, cpu->bulk_user_data);
+    }
+}
+
 /* sign+zero+parity lookup table */
 static uint8_t _z80_szp[256] = {
   0x44,0x00,0x00,0x04,0x00,0x04,0x04,0x00,0x08,0x0c,0x0c,0x08,0x0c,0x08,0x08,0x0c,
@@ -766,11 +951,9 @@ static uint8_t _z80_szp[256] = {
   0xa4,0xa0,0xa0,0xa4,0xa0,0xa4,0xa4,0xa0,0xa8,0xac,0xac,0xa8,0xac,0xa8,0xa8,0xac,
 };
 
-/* DAA instruction */
-static inline uint64_t _z80_daa(uint64_t ws) {
-    uint8_t a = _G8(ws,_A);
+/* DAA instruction, returns the new F and A register values (F in the upper byte) */
+static inline uint16_t _z80_daa(uint8_t a, uint8_t f) {
     uint8_t v = a;
-    uint8_t f = _G8(ws,_F);
     if (f & Z80_NF) {
         if (((a & 0xF)>0x9) || (f & Z80_HF)) {
             v -= 0x06;
@@ -791,11 +974,48 @@ static inline uint64_t _z80_daa(uint64_t ws) {
     f |= (a>0x99) ? Z80_CF : 0;
     f |= (a ^ v) & Z80_HF;
     f |= _z80_szp[v];
-    _S8(ws,_A,v);
-    _S8(ws,_F,f);
-    return ws;
+    return (uint16_t)((f<<8)|v);
 }
 
+#if _Z80_FLAG_TABLES
+/* flags of the 8-bit add and subtract instructions, indexed by
+   (carry-in<<16)|(A<<8)|operand (128 KBytes each), and result F and A
+   of DAA (F in the upper byte), indexed by the N, H and C flags and A
+   (4 KBytes), initialized by the first call to z80_init()
+*/
+static uint8_t _z80_add_flags[1<<17];
+static uint8_t _z80_sub_flags[1<<17];
+static uint16_t _z80_daa_fa[1<<11];
+static bool _z80_flag_tables_valid;
+
+#define _DAA_INDEX(a,f) (((((f)&Z80_HF)>>2)|((f)&(Z80_NF|Z80_CF)))<<8|(a))
+
+static void _z80_init_flag_tables(void) {
+    if (_z80_flag_tables_valid) {
+        return;
+    }
+    for (uint32_t c = 0; c < 2; c++) {
+        for (uint32_t acc = 0; acc < 256; acc++) {
+            for (uint32_t val = 0; val < 256; val++) {
+                const uint32_t i = (c<<16)|(acc<<8)|val;
+                const uint32_t add_res = acc + val + c;
+                const uint32_t sub_res = (uint32_t)((int)acc - (int)val - (int)c);
+                _z80_add_flags[i] = (uint8_t) _ADD_FLAGS(acc,val,add_res);
+                _z80_sub_flags[i] = (uint8_t) _SUB_FLAGS(acc,val,sub_res);
+            }
+        }
+    }
+    for (uint32_t f = 0; f < 256; f++) {
+        if ((f & ~(Z80_NF|Z80_HF|Z80_CF)) == 0) {
+            for (uint32_t a = 0; a < 256; a++) {
+                _z80_daa_fa[_DAA_INDEX(a,f)] = _z80_daa((uint8_t)a, (uint8_t)f);
+            }
+        }
+    }
+    _z80_flag_tables_valid = true;
+}
+#endif
+
 /* get 'working set' register bank with renamed HL <=> IX/IY */
 static inline uint64_t _z80_map_regs(uint64_t r0, uint64_t r1, uint64_t r2) {
     uint64_t ws = r0;
@@ -836,20 +1056,42 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
     uint64_t r1 = cpu->wz_ix_iy_sp;
     uint64_t r2 = cpu->im_ir_pc_bits;
     uint64_t r3 = cpu->bc_de_hl_fa_;
+#if _Z80_REGS_LOCALS
+    /* unpack the register banks into local variables, from here on
+       only the state bits in r2 and the shadow registers in r3 are used
+    */
+    uint8_t reg_a = _G8(r0,_A), reg_f = _G8(r0,_F);
+    uint8_t reg_b = _G8(r0,_B), reg_c = _G8(r0,_C);
+    uint8_t reg_d = _G8(r0,_D), reg_e = _G8(r0,_E);
+    uint8_t reg_h = _G8(r0,_H), reg_l = _G8(r0,_L);
+    uint16_t reg_hl = _G16(r0,_HL);
+    uint16_t reg_wz = _G16(r1,_WZ), reg_ix = _G16(r1,_IX);
+    uint16_t reg_iy = _G16(r1,_IY), reg_sp = _G16(r1,_SP);
+    uint8_t reg_i = _G8(r2,_I), reg_r = _G8(r2,_R), reg_im = _G8(r2,_IM);
+    if (r2 & _BIT_USE_IX) {
+        _S_HL(reg_ix);
+    }
+    else if (r2 & _BIT_USE_IY) {
+        _S_HL(reg_iy);
+    }
+#else
     uint64_t ws = _z80_map_regs(r0, r1, r2);
+#endif
     uint64_t map_bits = r2 & _BITS_USE_IXIY;
     uint64_t pins = cpu->pins;
     const z80_tick_t tick = cpu->tick_cb;
     const z80_trap_t trap = cpu->trap_cb;
+    const z80_bulk_t bulk = cpu->bulk_cb;
     void* ud = cpu->user_data;
     uint32_t ticks = 0;
     uint8_t op = 0, d8 = 0;
     uint16_t addr = 0, d16 = 0;
-    uint16_t pc = _G_PC();
+    uint16_t pc = _G16(r2,_PC);
     uint64_t pre_pins = pins;
     do {
         /* fetch next opcode byte */
         _FETCH(op)
+    decode_op:
         /* special case ED-prefixed instruction: cancel effect of DD/FD prefix */
         if (op == 0xED) {
             map_bits &= ~_BITS_USE_IXIY;
@@ -857,10 +1099,32 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
         /* handle HL <=> IX/IY renaming for indexed ops */
         if (map_bits != (r2 & _BITS_USE_IXIY)) {
             const uint64_t old_map_bits = r2 & _BITS_USE_IXIY;
+#if _Z80_REGS_LOCALS
+            if (old_map_bits & _BIT_USE_IX) {
+                reg_ix = _G_HL();
+            }
+            else if (old_map_bits & _BIT_USE_IY) {
+                reg_iy = _G_HL();
+            }
+            else {
+                reg_hl = _G_HL();
+            }
+            r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
+            if (map_bits & _BIT_USE_IX) {
+                _S_HL(reg_ix);
+            }
+            else if (map_bits & _BIT_USE_IY) {
+                _S_HL(reg_iy);
+            }
+            else {
+                _S_HL(reg_hl);
+            }
+#else
             r0 = _z80_flush_r0(ws, r0, old_map_bits);
             r1 = _z80_flush_r1(ws, r1, old_map_bits);
             r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
             ws = _z80_map_regs(r0, r1, r2);
+#endif
         }
         /* decode instruction */
         switch (op) {
@@ -869,7 +1133,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0x2:/*LD (BC),A*/addr=_G_BC();d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));break;
             case 0x3:/*INC BC*/_T(2);_S_BC(_G_BC()+1);break;
             case 0x4:/*INC B*/d8=_G_B();{uint8_t r=d8+1;uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x80){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_B(d8);break;
-            case 0x5:/*DEC B*/d8=_G_B();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_B(d8);break;
+            case 0x5:/*DEC B; JR NZ,d*/d8=_G_B();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_B(d8);if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x20){{{int8_t d;_IMM8(d);if(!(_G_F()&Z80_ZF)){pc+=d;_S_WZ(pc);_T(5);}}}}else{goto decode_op;}}break;
             case 0x6:/*LD B,n*/_IMM8(d8);_S_B(d8);break;
             case 0x7:/*RLCA*/{uint8_t a=_G_A();uint8_t f=_G_F();uint8_t r=(a<<1)|(a>>7);f=((a>>7)&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));_S_A(r);_S_F(f);}break;
             case 0x8:/*EX AF,AF'*/{r0=_z80_flush_r0(ws,r0,r2);uint16_t fa=_G16(r0,_FA);uint16_t fa_=_G16(r3,_FA);_S16(r0,_FA,fa_);_S16(r3,_FA,fa);ws=_z80_map_regs(r0,r1,r2);}break;
@@ -877,12 +1141,12 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xa:/*LD A,(BC)*/addr=_G_BC();_MR(addr++,d8);_S_A(d8);_S_WZ(addr);break;
             case 0xb:/*DEC BC*/_T(2);_S_BC(_G_BC()-1);break;
             case 0xc:/*INC C*/d8=_G_C();{uint8_t r=d8+1;uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x80){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_C(d8);break;
-            case 0xd:/*DEC C*/d8=_G_C();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_C(d8);break;
+            case 0xd:/*DEC C; JR NZ,d*/d8=_G_C();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_C(d8);if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x20){{{int8_t d;_IMM8(d);if(!(_G_F()&Z80_ZF)){pc+=d;_S_WZ(pc);_T(5);}}}}else{goto decode_op;}}break;
             case 0xe:/*LD C,n*/_IMM8(d8);_S_C(d8);break;
             case 0xf:/*RRCA*/{uint8_t a=_G_A();uint8_t f=_G_F();uint8_t r=(a>>1)|(a<<7);f=(a&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));_S_A(r);_S_F(f);}break;
-            case 0x10:/*DJNZ*/{_T(1);int8_t d;_IMM8(d);d8=_G_B()-1;_S_B(d8);if(d8>0){pc+=d;_S_WZ(pc);_T(5);}}break;
+            case 0x10:/*DJNZ; DJNZ*/{_T(1);int8_t d;_IMM8(d);d8=_G_B()-1;_S_B(d8);if(d8>0){pc+=d;_S_WZ(pc);_T(5);}}if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x10){{{_T(1);int8_t d;_IMM8(d);d8=_G_B()-1;_S_B(d8);if(d8>0){pc+=d;_S_WZ(pc);_T(5);}}}}else{goto decode_op;}}break;
             case 0x11:/*LD DE,nn*/_IMM16(d16);_S_DE(d16);break;
-            case 0x12:/*LD (DE),A*/addr=_G_DE();d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));break;
+            case 0x12:/*LD (DE),A; INC DE*/addr=_G_DE();d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x13){{_T(2);_S_DE(_G_DE()+1);}}else{goto decode_op;}}break;
             case 0x13:/*INC DE*/_T(2);_S_DE(_G_DE()+1);break;
             case 0x14:/*INC D*/d8=_G_D();{uint8_t r=d8+1;uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x80){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_D(d8);break;
             case 0x15:/*DEC D*/d8=_G_D();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_D(d8);break;
@@ -899,11 +1163,11 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0x20:/*JR NZ,d*/{int8_t d;_IMM8(d);if(!(_G_F()&Z80_ZF)){pc+=d;_S_WZ(pc);_T(5);}}break;
             case 0x21:/*LD HL,nn*/_IMM16(d16);_S_HL(d16);break;
             case 0x22:/*LD (nn),HL*/_IMM16(addr);_MW(addr++,_G_L());_MW(addr,_G_H());_S_WZ(addr);break;
-            case 0x23:/*INC HL*/_T(2);_S_HL(_G_HL()+1);break;
+            case 0x23:/*INC HL; DJNZ*/_T(2);_S_HL(_G_HL()+1);if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x10){{{_T(1);int8_t d;_IMM8(d);d8=_G_B()-1;_S_B(d8);if(d8>0){pc+=d;_S_WZ(pc);_T(5);}}}}else{goto decode_op;}}break;
             case 0x24:/*INC H*/d8=_G_H();{uint8_t r=d8+1;uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x80){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_H(d8);break;
             case 0x25:/*DEC H*/d8=_G_H();{uint8_t r=d8-1;uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);if(r==0x7F){f|=Z80_VF;}_S_F(f|(_G_F()&Z80_CF));d8=r;}_S_H(d8);break;
             case 0x26:/*LD H,n*/_IMM8(d8);_S_H(d8);break;
-            case 0x27:/*DAA*/ws=_z80_daa(ws);break;
+            case 0x27:/*DAA*/_S_FA(_z80_daa(_G_A(),_G_F()));break;
             case 0x28:/*JR Z,d*/{int8_t d;_IMM8(d);if((_G_F()&Z80_ZF)){pc+=d;_S_WZ(pc);_T(5);}}break;
             case 0x29:/*ADD HL,HL*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_HL();uint32_t r=acc+d16;_S_HL(r);uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_VF);f|=((acc^r^d16)>>8)&Z80_HF;f|=((r>>16)&Z80_CF)|((r>>8)&(Z80_YF|Z80_XF));_S_F(f);_T(7);}break;
             case 0x2a:/*LD HL,(nn)*/_IMM16(addr);_MR(addr++,d8);_S_L(d8);_MR(addr,d8);_S_H(d8);_S_WZ(addr);break;
@@ -966,7 +1230,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0x63:/*LD H,E*/_S_H(_G_E());break;
             case 0x64:/*LD H,H*/_S_H(_G_H());break;
             case 0x65:/*LD H,L*/_S_H(_G_L());break;
-            case 0x66:/*LD H,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);if(_IDX()){_S8(r0,_H,d8);}else{_S_H(d8);}break;
+            case 0x66:/*LD H,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);if(_IDX()){_S_H0(d8);}else{_S_H(d8);}break;
             case 0x67:/*LD H,A*/_S_H(_G_A());break;
             case 0x68:/*LD L,B*/_S_L(_G_B());break;
             case 0x69:/*LD L,C*/_S_L(_G_C());break;
@@ -974,23 +1238,23 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0x6b:/*LD L,E*/_S_L(_G_E());break;
             case 0x6c:/*LD L,H*/_S_L(_G_H());break;
             case 0x6d:/*LD L,L*/_S_L(_G_L());break;
-            case 0x6e:/*LD L,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);if(_IDX()){_S8(r0,_L,d8);}else{_S_L(d8);}break;
+            case 0x6e:/*LD L,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);if(_IDX()){_S_L0(d8);}else{_S_L(d8);}break;
             case 0x6f:/*LD L,A*/_S_L(_G_A());break;
             case 0x70:/*LD (HL/IX+d/IY+d),B*/d8=_G_B();_ADDR(addr,5);_MW(addr,d8);break;
             case 0x71:/*LD (HL/IX+d/IY+d),C*/d8=_G_C();_ADDR(addr,5);_MW(addr,d8);break;
             case 0x72:/*LD (HL/IX+d/IY+d),D*/d8=_G_D();_ADDR(addr,5);_MW(addr,d8);break;
             case 0x73:/*LD (HL/IX+d/IY+d),E*/d8=_G_E();_ADDR(addr,5);_MW(addr,d8);break;
-            case 0x74:/*LD (HL/IX+d/IY+d),H*/d8=_IDX()?_G8(r0,_H):_G_H();_ADDR(addr,5);_MW(addr,d8);break;
-            case 0x75:/*LD (HL/IX+d/IY+d),L*/d8=_IDX()?_G8(r0,_L):_G_L();_ADDR(addr,5);_MW(addr,d8);break;
+            case 0x74:/*LD (HL/IX+d/IY+d),H*/d8=_IDX()?_G_H0():_G_H();_ADDR(addr,5);_MW(addr,d8);break;
+            case 0x75:/*LD (HL/IX+d/IY+d),L*/d8=_IDX()?_G_L0():_G_L();_ADDR(addr,5);_MW(addr,d8);break;
             case 0x76:/*HALT*/pins|=Z80_HALT;pc--;break;
-            case 0x77:/*LD (HL/IX+d/IY+d),A*/d8=_G_A();_ADDR(addr,5);_MW(addr,d8);break;
+            case 0x77:/*LD (HL/IX+d/IY+d),A; INC HL*/d8=_G_A();_ADDR(addr,5);_MW(addr,d8);if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x23){{_T(2);_S_HL(_G_HL()+1);}}else{goto decode_op;}}break;
             case 0x78:/*LD A,B*/_S_A(_G_B());break;
             case 0x79:/*LD A,C*/_S_A(_G_C());break;
             case 0x7a:/*LD A,D*/_S_A(_G_D());break;
             case 0x7b:/*LD A,E*/_S_A(_G_E());break;
             case 0x7c:/*LD A,H*/_S_A(_G_H());break;
             case 0x7d:/*LD A,L*/_S_A(_G_L());break;
-            case 0x7e:/*LD A,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);_S_A(d8);break;
+            case 0x7e:/*LD A,(HL/IX+d/IY+d); INC HL*/_ADDR(addr,5);_MR(addr,d8);_S_A(d8);if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0x23){{_T(2);_S_HL(_G_HL()+1);}}else{goto decode_op;}}break;
             case 0x7f:/*LD A,A*/_S_A(_G_A());break;
             case 0x80:/*ADD B*/d8=_G_B();{uint8_t acc=_G_A();uint32_t res=acc+d8;_S_F(_ADD_FLAGS(acc,d8,res));_S_A(res);}break;
             case 0x81:/*ADD C*/d8=_G_C();{uint8_t acc=_G_A();uint32_t res=acc+d8;_S_F(_ADD_FLAGS(acc,d8,res));_S_A(res);}break;
@@ -1047,7 +1311,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xb4:/*OR H*/d8=_G_H();{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
             case 0xb5:/*OR L*/d8=_G_L();{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
             case 0xb6:/*OR,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
-            case 0xb7:/*OR A*/d8=_G_A();{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
+            case 0xb7:/*OR A; RET Z*/d8=_G_A();{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}if(_CHAIN()){_TRAP();pre_pins=pins;_FETCH(op);if(op==0xc8){{_T(1);if((_G_F()&Z80_ZF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}}}else{goto decode_op;}}break;
             case 0xb8:/*CP B*/d8=_G_B();{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
             case 0xb9:/*CP C*/d8=_G_C();{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
             case 0xba:/*CP D*/d8=_G_D();{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
@@ -1056,7 +1320,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xbd:/*CP L*/d8=_G_L();{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
             case 0xbe:/*CP,(HL/IX+d/IY+d)*/_ADDR(addr,5);_MR(addr,d8);{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
             case 0xbf:/*CP A*/d8=_G_A();{uint8_t acc=_G_A();int32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_CP_FLAGS(acc,d8,res));}break;
-            case 0xc0:/*RET NZ*/_T(1);if (!(_G_F()&Z80_ZF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xc0:/*RET NZ*/_T(1);if(!(_G_F()&Z80_ZF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xc1:/*POP BC*/addr=_G_SP();_MR(addr++,d8);d16=d8;_MR(addr++,d8);d16|=d8<<8;_S_BC(d16);_S_SP(addr);break;
             case 0xc2:/*JP NZ,nn*/_IMM16(addr);if(!(_G_F()&Z80_ZF)){pc=addr;}break;
             case 0xc3:/*JP nn*/_IMM16(pc);break;
@@ -1064,7 +1328,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xc5:/*PUSH BC*/_T(1);addr=_G_SP();d16=_G_BC();_MW(--addr,d16>>8);_MW(--addr,d16);_S_SP(addr);break;
             case 0xc6:/*ADD n*/_IMM8(d8);{uint8_t acc=_G_A();uint32_t res=acc+d8;_S_F(_ADD_FLAGS(acc,d8,res));_S_A(res);}break;
             case 0xc7:/*RST 0x0*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x0;_S_WZ(pc);break;
-            case 0xc8:/*RET Z*/_T(1);if ((_G_F()&Z80_ZF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xc8:/*RET Z*/_T(1);if((_G_F()&Z80_ZF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xc9:/*RET*/d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);break;
             case 0xca:/*JP Z,nn*/_IMM16(addr);if((_G_F()&Z80_ZF)){pc=addr;}break;
             case 0xCB: {
@@ -1159,7 +1423,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xcd:/*CALL nn*/_IMM16(addr);_T(1);d16=_G_SP();_MW(--d16,pc>>8);_MW(--d16,pc);_S_SP(d16);pc=addr;break;
             case 0xce:/*ADC n*/_IMM8(d8);{uint8_t acc=_G_A();uint32_t res=acc+d8+(_G_F()&Z80_CF);_S_F(_ADD_FLAGS(acc,d8,res));_S_A(res);}break;
             case 0xcf:/*RST 0x8*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x8;_S_WZ(pc);break;
-            case 0xd0:/*RET NC*/_T(1);if (!(_G_F()&Z80_CF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xd0:/*RET NC*/_T(1);if(!(_G_F()&Z80_CF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xd1:/*POP DE*/addr=_G_SP();_MR(addr++,d8);d16=d8;_MR(addr++,d8);d16|=d8<<8;_S_DE(d16);_S_SP(addr);break;
             case 0xd2:/*JP NC,nn*/_IMM16(addr);if(!(_G_F()&Z80_CF)){pc=addr;}break;
             case 0xd3:/*OUT (n),A*/{_IMM8(d8);uint8_t a=_G_A();addr=(a<<8)|d8;_OUT(addr,a);_S_WZ((addr&0xFF00)|((addr+1)&0x00FF));}break;
@@ -1167,7 +1431,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xd5:/*PUSH DE*/_T(1);addr=_G_SP();d16=_G_DE();_MW(--addr,d16>>8);_MW(--addr,d16);_S_SP(addr);break;
             case 0xd6:/*SUB n*/_IMM8(d8);{uint8_t acc=_G_A();uint32_t res=(uint32_t)((int)acc-(int)d8);_S_F(_SUB_FLAGS(acc,d8,res));_S_A(res);}break;
             case 0xd7:/*RST 0x10*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x10;_S_WZ(pc);break;
-            case 0xd8:/*RET C*/_T(1);if ((_G_F()&Z80_CF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xd8:/*RET C*/_T(1);if((_G_F()&Z80_CF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xd9:/*EXX*/{r0=_z80_flush_r0(ws,r0,r2);const uint64_t rx=r3;r3=(r3&0xffff)|(r0&0xffffffffffff0000);r0=(r0&0xffff)|(rx&0xffffffffffff0000);ws=_z80_map_regs(r0, r1, r2);}break;
             case 0xda:/*JP C,nn*/_IMM16(addr);if((_G_F()&Z80_CF)){pc=addr;}break;
             case 0xdb:/*IN A,(n)*/{_IMM8(d8);uint8_t a=_G_A();addr=(a<<8)|d8;_IN(addr++,a);_S_A(a);_S_WZ(addr);}break;
@@ -1175,7 +1439,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xdd:/*DD prefix*/map_bits|=_BIT_USE_IX;continue;break;
             case 0xde:/*SBC n*/_IMM8(d8);{uint8_t acc=_G_A();uint32_t res=(uint32_t)((int)acc-(int)d8-(_G_F()&Z80_CF));_S_F(_SUB_FLAGS(acc,d8,res));_S_A(res);}break;
             case 0xdf:/*RST 0x18*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x18;_S_WZ(pc);break;
-            case 0xe0:/*RET PO*/_T(1);if (!(_G_F()&Z80_PF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xe0:/*RET PO*/_T(1);if(!(_G_F()&Z80_PF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xe1:/*POP HL*/addr=_G_SP();_MR(addr++,d8);d16=d8;_MR(addr++,d8);d16|=d8<<8;_S_HL(d16);_S_SP(addr);break;
             case 0xe2:/*JP PO,nn*/_IMM16(addr);if(!(_G_F()&Z80_PF)){pc=addr;}break;
             case 0xe3:/*EX (SP),HL*/{_T(3);addr=_G_SP();d16=_G_HL();uint8_t l,h;_MR(addr,l);_MR(addr+1,h);_MW(addr,d16);_MW(addr+1,d16>>8);d16=(h<<8)|l;_S_HL(d16);_S_WZ(d16);}break;
@@ -1183,7 +1447,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xe5:/*PUSH HL*/_T(1);addr=_G_SP();d16=_G_HL();_MW(--addr,d16>>8);_MW(--addr,d16);_S_SP(addr);break;
             case 0xe6:/*AND n*/_IMM8(d8);{d8&=_G_A();_S_F(_z80_szp[d8]|Z80_HF);_S_A(d8);}break;
             case 0xe7:/*RST 0x20*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x20;_S_WZ(pc);break;
-            case 0xe8:/*RET PE*/_T(1);if ((_G_F()&Z80_PF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xe8:/*RET PE*/_T(1);if((_G_F()&Z80_PF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xe9:/*JP HL*/pc=_G_HL();break;
             case 0xea:/*JP PE,nn*/_IMM16(addr);if((_G_F()&Z80_PF)){pc=addr;}break;
             case 0xeb:/*EX DE,HL*/{r0=_z80_flush_r0(ws,r0,r2);uint16_t de=_G16(r0,_DE);uint16_t hl=_G16(r0,_HL);_S16(r0,_DE,hl);_S16(r0,_HL,de);ws=_z80_map_regs(r0,r1,r2);}break;
@@ -1191,7 +1455,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xED: {
                 _FETCH(op);
                 switch(op) {
-                    case 0x40:/*IN B,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_B(d8);}break;
+                    case 0x40:/*IN B,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_B(d8);}break;
                     case 0x41:/*OUT (C),B*/addr=_G_BC();_OUT(addr++,_G_B());_S_WZ(addr);break;
                     case 0x42:/*SBC HL,BC*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_BC();uint32_t r=acc-d16-(_G_F()&Z80_CF);uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);_S_HL(r);f|=((acc^r^d16)>>8) & Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x43:/*LD (nn),BC*/_IMM16(addr);d16=_G_BC();_MW(addr++,d16&0xFF);_MW(addr,d16>>8);_S_WZ(addr);break;
@@ -1199,7 +1463,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x45:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x46:/*IM 0*/_S_IM(0);break;
                     case 0x47:/*LD I,A*/_T(1);_S_I(_G_A());break;
-                    case 0x48:/*IN C,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_C(d8);}break;
+                    case 0x48:/*IN C,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_C(d8);}break;
                     case 0x49:/*OUT (C),C*/addr=_G_BC();_OUT(addr++,_G_C());_S_WZ(addr);break;
                     case 0x4a:/*ADC HL,BC*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_BC();uint32_t r=acc+d16+(_G_F()&Z80_CF);_S_HL(r);uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;f|=((acc^r^d16)>>8)&Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x4b:/*LD BC,(nn)*/_IMM16(addr);_MR(addr++,d8);d16=d8;_MR(addr,d8);d16|=d8<<8;_S_BC(d16);_S_WZ(addr);break;
@@ -1207,7 +1471,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x4d:/*RETI*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x4e:/*IM 0*/_S_IM(0);break;
                     case 0x4f:/*LD R,A*/_T(1);_S_R(_G_A());break;
-                    case 0x50:/*IN D,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_D(d8);}break;
+                    case 0x50:/*IN D,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_D(d8);}break;
                     case 0x51:/*OUT (C),D*/addr=_G_BC();_OUT(addr++,_G_D());_S_WZ(addr);break;
                     case 0x52:/*SBC HL,DE*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_DE();uint32_t r=acc-d16-(_G_F()&Z80_CF);uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);_S_HL(r);f|=((acc^r^d16)>>8) & Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x53:/*LD (nn),DE*/_IMM16(addr);d16=_G_DE();_MW(addr++,d16&0xFF);_MW(addr,d16>>8);_S_WZ(addr);break;
@@ -1215,7 +1479,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x55:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x56:/*IM 1*/_S_IM(1);break;
                     case 0x57:/*LD A,I*/_T(1);d8=_G_I();_S_A(d8);_S_F(_SZIFF2_FLAGS(d8));break;
-                    case 0x58:/*IN E,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_E(d8);}break;
+                    case 0x58:/*IN E,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_E(d8);}break;
                     case 0x59:/*OUT (C),E*/addr=_G_BC();_OUT(addr++,_G_E());_S_WZ(addr);break;
                     case 0x5a:/*ADC HL,DE*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_DE();uint32_t r=acc+d16+(_G_F()&Z80_CF);_S_HL(r);uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;f|=((acc^r^d16)>>8)&Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x5b:/*LD DE,(nn)*/_IMM16(addr);_MR(addr++,d8);d16=d8;_MR(addr,d8);d16|=d8<<8;_S_DE(d16);_S_WZ(addr);break;
@@ -1223,7 +1487,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x5d:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x5e:/*IM 2*/_S_IM(2);break;
                     case 0x5f:/*LD A,R*/_T(1);d8=_G_R();_S_A(d8);_S_F(_SZIFF2_FLAGS(d8));break;
-                    case 0x60:/*IN H,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_H(d8);}break;
+                    case 0x60:/*IN H,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_H(d8);}break;
                     case 0x61:/*OUT (C),H*/addr=_G_BC();_OUT(addr++,_G_H());_S_WZ(addr);break;
                     case 0x62:/*SBC HL,HL*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_HL();uint32_t r=acc-d16-(_G_F()&Z80_CF);uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);_S_HL(r);f|=((acc^r^d16)>>8) & Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x63:/*LD (nn),HL*/_IMM16(addr);d16=_G_HL();_MW(addr++,d16&0xFF);_MW(addr,d16>>8);_S_WZ(addr);break;
@@ -1231,7 +1495,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x65:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x66:/*IM 0*/_S_IM(0);break;
                     case 0x67:/*RRD*/{addr=_G_HL();uint8_t a=_G_A();_MR(addr,d8);uint8_t l=a&0x0F;a=(a&0xF0)|(d8&0x0F);_S_A(a);d8=(d8>>4)|(l<<4);_MW(addr++,d8);_S_WZ(addr);_S_F((_G_F()&Z80_CF)|_z80_szp[a]);_T(4);}break;
-                    case 0x68:/*IN L,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_L(d8);}break;
+                    case 0x68:/*IN L,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_L(d8);}break;
                     case 0x69:/*OUT (C),L*/addr=_G_BC();_OUT(addr++,_G_L());_S_WZ(addr);break;
                     case 0x6a:/*ADC HL,HL*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_HL();uint32_t r=acc+d16+(_G_F()&Z80_CF);_S_HL(r);uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;f|=((acc^r^d16)>>8)&Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x6b:/*LD HL,(nn)*/_IMM16(addr);_MR(addr++,d8);d16=d8;_MR(addr,d8);d16|=d8<<8;_S_HL(d16);_S_WZ(addr);break;
@@ -1239,7 +1503,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x6d:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x6e:/*IM 0*/_S_IM(0);break;
                     case 0x6f:/*RLD*/{addr=_G_HL();uint8_t a=_G_A();_MR(addr,d8);uint8_t l=a&0x0F;a=(a&0xF0)|(d8>>4);_S_A(a);d8=(d8<<4)|l;_MW(addr++,d8);_S_WZ(addr);_S_F((_G_F()&Z80_CF)|_z80_szp[a]);_T(4);}break;
-                    case 0x70:/*IN HL,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);}break;
+                    case 0x70:/*IN HL,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);}break;
                     case 0x71:/*OUT (C),HL*/addr=_G_BC();_OUT(addr++,0);_S_WZ(addr);break;
                     case 0x72:/*SBC HL,SP*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_SP();uint32_t r=acc-d16-(_G_F()&Z80_CF);uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);_S_HL(r);f|=((acc^r^d16)>>8) & Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x73:/*LD (nn),SP*/_IMM16(addr);d16=_G_SP();_MW(addr++,d16&0xFF);_MW(addr,d16>>8);_S_WZ(addr);break;
@@ -1247,7 +1511,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x75:/*RETN*/pins|=Z80_RETI;d16=_G_SP();_MR(d16++,d8);pc=d8;_MR(d16++,d8);pc|=d8<<8;_S_SP(d16);_S_WZ(pc);if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}break;
                     case 0x76:/*IM 1*/_S_IM(1);break;
                     case 0x77:/*NOP (ED)*/ break;
-                    case 0x78:/*IN A,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S8(ws,_F,f);_S_A(d8);}break;
+                    case 0x78:/*IN A,(C)*/{addr=_G_BC();_IN(addr++,d8);_S_WZ(addr);uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];_S_F(f);_S_A(d8);}break;
                     case 0x79:/*OUT (C),A*/addr=_G_BC();_OUT(addr++,_G_A());_S_WZ(addr);break;
                     case 0x7a:/*ADC HL,SP*/{uint16_t acc=_G_HL();_S_WZ(acc+1);d16=_G_SP();uint32_t r=acc+d16+(_G_F()&Z80_CF);_S_HL(r);uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;f|=((acc^r^d16)>>8)&Z80_HF;f|=(r>>16)&Z80_CF;f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);f|=(r&0xFFFF)?0:Z80_ZF;_S_F(f);_T(7);}break;
                     case 0x7b:/*LD SP,(nn)*/_IMM16(addr);_MR(addr++,d8);d16=d8;_MR(addr,d8);d16|=d8<<8;_S_SP(d16);_S_WZ(addr);break;
@@ -1256,19 +1520,19 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
                     case 0x7e:/*IM 2*/_S_IM(2);break;
                     case 0x7f:/*NOP (ED)*/ break;
                     case 0xa0:/*LDI*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl++;de++;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);}break;
-                    case 0xa1:/*CPI*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl++;wz++;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S8(ws,_F,f);}break;
+                    case 0xa1:/*CPI*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl++;wz++;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);}break;
                     case 0xa2:/*INI*/{_T(1);addr=_G_BC();uint16_t hl=_G_HL();_IN(addr,d8);_MW(hl,d8);uint8_t b=_G_B();uint8_t c=_G_C();b--;addr++;hl++;c++;_S_B(b);_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)(c&0xFF)+d8;if(t&0x100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);}break;
                     case 0xa3:/*OUTI*/{_T(1);uint16_t hl=_G_HL();_MR(hl,d8);uint8_t b=_G_B();b--;_S_B(b);addr=_G_BC();_OUT(addr,d8);addr++; hl++;_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;if (t&0x0100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);}break;
                     case 0xa8:/*LDD*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl--;de--;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);}break;
-                    case 0xa9:/*CPD*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl--;wz--;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S8(ws,_F,f);}break;
+                    case 0xa9:/*CPD*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl--;wz--;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);}break;
                     case 0xaa:/*IND*/{_T(1);addr=_G_BC();uint16_t hl=_G_HL();_IN(addr,d8);_MW(hl,d8);uint8_t b=_G_B();uint8_t c=_G_C();b--;addr--;hl--;c--;_S_B(b);_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)(c&0xFF)+d8;if(t&0x100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);}break;
                     case 0xab:/*OUTD*/{_T(1);uint16_t hl=_G_HL();_MR(hl,d8);uint8_t b=_G_B();b--;_S_B(b);addr=_G_BC();_OUT(addr,d8);addr--;hl--;_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;if (t&0x0100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);}break;
-                    case 0xb0:/*LDIR*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl++;de++;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc){pc-=2;_S_WZ(pc+1);_T(5);}}break;
-                    case 0xb1:/*CPIR*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl++;wz++;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S8(ws,_F,f);if(bc&&!(f&Z80_ZF)){pc-=2;_S_WZ(pc+1);_T(5);}}break;
+                    case 0xb0:/*LDIR*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl++;de++;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc){pc-=2;_S_WZ(pc+1);_T(5);while(bc&&_BULK()){_TRAP();uint16_t n=bc;uint32_t nt=(num_ticks-ticks+Z80_BULK_TICKS-1)/Z80_BULK_TICKS;if(nt<n){n=(uint16_t)nt;}if((0x100-(hl&0xFF))<n){n=(0x100-(hl&0xFF));}if((0x100-(de&0xFF))<n){n=(0x100-(de&0xFF));}if(((uint16_t)(pc-de)<n)||((uint16_t)(pc+1-de)<n)){break;}const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,false);if(!src||!n){break;}uint8_t* dst=_z80_bulk_ptr(cpu,de,&n,true,false);if(!dst||!n){break;}for(uint16_t i=0;i<n;i++){d8=*src++;*dst++=d8;}hl+=n;de+=n;bc-=n;_S_HL(hl);_S_DE(de);_S_BC(bc);_S_R((_G_R()&0x80)|((_G_R()+2*n)&0x7F));_SAD(de-1,d8);d8+=_G_A();f&=(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}if(bc){f|=Z80_VF;}_S_F(f);uint32_t t=n*Z80_BULK_TICKS;if(!bc){t-=5;pc+=2;}_T(t);}}}break;
+                    case 0xb1:/*CPIR*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl++;wz++;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc&&!(f&Z80_ZF)){pc-=2;_S_WZ(pc+1);_T(5);while(bc&&!(f&Z80_ZF)&&_BULK()){_TRAP();uint16_t n=bc;uint32_t nt=(num_ticks-ticks+Z80_BULK_TICKS-1)/Z80_BULK_TICKS;if(nt<n){n=(uint16_t)nt;}if((0x100-(hl&0xFF))<n){n=(0x100-(hl&0xFF));}const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,false);if(!src||!n){break;}const uint8_t a=_G_A();uint16_t i=0;do{d8=*src++;i++;}while((d8!=a)&&(i<n));hl+=i;bc-=i;_S_HL(hl);_S_BC(bc);_S_R((_G_R()&0x80)|((_G_R()+2*i)&0x7F));_SAD(hl-1,d8);r=((int)a)-d8;f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(a&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}if(bc){f|=Z80_VF;}_S_F(f);uint32_t t=i*Z80_BULK_TICKS;if(!bc||(f&Z80_ZF)){t-=5;pc+=2;_S_WZ(pc);}_T(t);}}}break;
                     case 0xb2:/*INIR*/{_T(1);addr=_G_BC();uint16_t hl=_G_HL();_IN(addr,d8);_MW(hl,d8);uint8_t b=_G_B();uint8_t c=_G_C();b--;addr++;hl++;c++;_S_B(b);_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)(c&0xFF)+d8;if(t&0x100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);if(b){pc-=2;_T(5);}}break;
                     case 0xb3:/*OTIR*/{_T(1);uint16_t hl=_G_HL();_MR(hl,d8);uint8_t b=_G_B();b--;_S_B(b);addr=_G_BC();_OUT(addr,d8);addr++; hl++;_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;if (t&0x0100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);if(b){pc-=2;_T(5);}}break;
-                    case 0xb8:/*LDDR*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl--;de--;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc){pc-=2;_S_WZ(pc+1);_T(5);}}break;
-                    case 0xb9:/*CPDR*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl--;wz--;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S8(ws,_F,f);if(bc&&!(f&Z80_ZF)){pc-=2;_S_WZ(pc+1);_T(5);}}break;
+                    case 0xb8:/*LDDR*/{uint16_t hl=_G_HL();uint16_t de=_G_DE();_MR(hl,d8);_MW(de,d8);hl--;de--;_S_HL(hl);_S_DE(de);_T(2);d8+=_G_A();uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc){pc-=2;_S_WZ(pc+1);_T(5);while(bc&&_BULK()){_TRAP();uint16_t n=bc;uint32_t nt=(num_ticks-ticks+Z80_BULK_TICKS-1)/Z80_BULK_TICKS;if(nt<n){n=(uint16_t)nt;}if(((hl&0xFF)+1)<n){n=((hl&0xFF)+1);}if(((de&0xFF)+1)<n){n=((de&0xFF)+1);}if(((uint16_t)(de-pc)<n)||((uint16_t)(de-pc-1)<n)){break;}const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,true);if(!src||!n){break;}uint8_t* dst=_z80_bulk_ptr(cpu,de,&n,true,true);if(!dst||!n){break;}for(uint16_t i=0;i<n;i++){d8=*src--;*dst--=d8;}hl-=n;de-=n;bc-=n;_S_HL(hl);_S_DE(de);_S_BC(bc);_S_R((_G_R()&0x80)|((_G_R()+2*n)&0x7F));_SAD(de+1,d8);d8+=_G_A();f&=(Z80_SF|Z80_ZF|Z80_CF);if(d8&0x02){f|=Z80_YF;}if(d8&0x08){f|=Z80_XF;}if(bc){f|=Z80_VF;}_S_F(f);uint32_t t=n*Z80_BULK_TICKS;if(!bc){t-=5;pc+=2;}_T(t);}}}break;
+                    case 0xb9:/*CPDR*/{uint16_t hl = _G_HL();_MR(hl,d8);uint16_t wz = _G_WZ();hl--;wz--;_S_WZ(wz);_S_HL(hl);_T(5);int r=((int)_G_A())-d8;uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(_G_A()&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}uint16_t bc=_G_BC();bc--;_S_BC(bc);if(bc){f|=Z80_VF;}_S_F(f);if(bc&&!(f&Z80_ZF)){pc-=2;_S_WZ(pc+1);_T(5);while(bc&&!(f&Z80_ZF)&&_BULK()){_TRAP();uint16_t n=bc;uint32_t nt=(num_ticks-ticks+Z80_BULK_TICKS-1)/Z80_BULK_TICKS;if(nt<n){n=(uint16_t)nt;}if(((hl&0xFF)+1)<n){n=((hl&0xFF)+1);}const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,true);if(!src||!n){break;}const uint8_t a=_G_A();uint16_t i=0;do{d8=*src--;i++;}while((d8!=a)&&(i<n));hl-=i;bc-=i;_S_HL(hl);_S_BC(bc);_S_R((_G_R()&0x80)|((_G_R()+2*i)&0x7F));_SAD(hl+1,d8);r=((int)a)-d8;f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);if((r&0x0F)>(a&0x0F)){f|=Z80_HF;r--;}if(r&0x02){f|=Z80_YF;}if(r&0x08){f|=Z80_XF;}if(bc){f|=Z80_VF;}_S_F(f);uint32_t t=i*Z80_BULK_TICKS;if(!bc||(f&Z80_ZF)){t-=5;pc+=2;_S_WZ(pc-2);}_T(t);}}}break;
                     case 0xba:/*INDR*/{_T(1);addr=_G_BC();uint16_t hl=_G_HL();_IN(addr,d8);_MW(hl,d8);uint8_t b=_G_B();uint8_t c=_G_C();b--;addr--;hl--;c--;_S_B(b);_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)(c&0xFF)+d8;if(t&0x100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);if(b){pc-=2;_T(5);}}break;
                     case 0xbb:/*OTDR*/{_T(1);uint16_t hl=_G_HL();_MR(hl,d8);uint8_t b=_G_B();b--;_S_B(b);addr=_G_BC();_OUT(addr,d8);addr--;hl--;_S_HL(hl);_S_WZ(addr);uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));if(d8&Z80_SF){f|=Z80_NF;}uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;if (t&0x0100){f|=Z80_HF|Z80_CF;}f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;_S_F(f);if(b){pc-=2;_T(5);}}break;
                     default: break;
@@ -1277,7 +1541,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             break;
             case 0xee:/*XOR n*/_IMM8(d8);{d8^=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
             case 0xef:/*RST 0x28*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x28;_S_WZ(pc);break;
-            case 0xf0:/*RET P*/_T(1);if (!(_G_F()&Z80_SF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xf0:/*RET P*/_T(1);if(!(_G_F()&Z80_SF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xf1:/*POP FA*/addr=_G_SP();_MR(addr++,d8);d16=d8<<8;_MR(addr++,d8);d16|=d8;_S_FA(d16);_S_SP(addr);break;
             case 0xf2:/*JP P,nn*/_IMM16(addr);if(!(_G_F()&Z80_SF)){pc=addr;}break;
             case 0xf3:/*DI*/r2&=~(_BIT_IFF1|_BIT_IFF2);break;
@@ -1285,7 +1549,7 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             case 0xf5:/*PUSH FA*/_T(1);addr=_G_SP();d16=_G_FA();_MW(--addr,d16);_MW(--addr,d16>>8);_S_SP(addr);break;
             case 0xf6:/*OR n*/_IMM8(d8);{d8|=_G_A();_S_F(_z80_szp[d8]);_S_A(d8);}break;
             case 0xf7:/*RST 0x30*/_T(1);d16= _G_SP();_MW(--d16, pc>>8);_MW(--d16, pc);_S_SP(d16);pc=0x30;_S_WZ(pc);break;
-            case 0xf8:/*RET M*/_T(1);if ((_G_F()&Z80_SF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
+            case 0xf8:/*RET M*/_T(1);if((_G_F()&Z80_SF)){uint8_t w,z;d16=_G_SP();_MR(d16++,z);_MR(d16++,w);_S_SP(d16);pc=(w<<8)|z;_S_WZ(pc);}break;
             case 0xf9:/*LD SP,HL*/_T(2);_S_SP(_G_HL());break;
             case 0xfa:/*JP M,nn*/_IMM16(addr);if((_G_F()&Z80_SF)){pc=addr;}break;
             case 0xfb:/*EI*/r2=(r2&~(_BIT_IFF1|_BIT_IFF2))|_BIT_EI;break;
@@ -1392,16 +1656,36 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
             if (trap_id) {
                 cpu->trap_id=trap_id;
                 pins &= ~Z80_INT;
-                break;
+                goto trapped;
             }
         }
         pins &= ~Z80_INT;
         pre_pins = pins;
     } while (ticks < num_ticks);
+trapped:
     /* flush local state back to persistent CPU state before leaving */
-    _S_PC(pc);
+#if _Z80_REGS_LOCALS
+    if (r2 & _BIT_USE_IX) {
+        reg_ix = _G_HL();
+    }
+    else if (r2 & _BIT_USE_IY) {
+        reg_iy = _G_HL();
+    }
+    else {
+        reg_hl = _G_HL();
+    }
+    _S8(r0,_A,reg_a); _S8(r0,_F,reg_f);
+    _S8(r0,_B,reg_b); _S8(r0,_C,reg_c);
+    _S8(r0,_D,reg_d); _S8(r0,_E,reg_e);
+    _S16(r0,_HL,reg_hl);
+    _S16(r1,_WZ,reg_wz); _S16(r1,_IX,reg_ix);
+    _S16(r1,_IY,reg_iy); _S16(r1,_SP,reg_sp);
+    _S8(r2,_I,reg_i); _S8(r2,_R,reg_r); _S8(r2,_IM,reg_im);
+#else
     r0 = _z80_flush_r0(ws, r0, r2);
     r1 = _z80_flush_r1(ws, r1, r2);
+#endif
+    _S16(r2,_PC,pc);
     r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
     cpu->bc_de_hl_fa = r0;
     cpu->wz_ix_iy_sp = r1;
@@ -1464,6 +1748,9 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
 #undef _BUMPR
 #undef _FETCH
 #undef _FETCH_CB
+#undef _CHAIN
+#undef _BULK
+#undef _TRAP
 #undef _SZ
 #undef _SZYXCH
 #undef _ADD_FLAGS
@@ -1508,6 +1795,12 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
 #undef _G_I
 #undef _G_R
 #undef _G_IR 
-#undef _G_PC 
+#undef _S_H0
+#undef _S_L0
+#undef _G_H0
+#undef _G_L0
+#undef _Z80_REGS_LOCALS
+#undef _Z80_FLAG_TABLES
+#undef _DAA_INDEX
 
 #endif /* CHIPS_IMPL */
@@ -119,6 +119,14 @@
         Handle the daisy-chain interrupt protocol. See the z80.h header
         for details.
 
+    ~~~C
+    void z80pio_snapshot_onsave(z80pio_t* snapshot)
+    void z80pio_snapshot_onload(z80pio_t* snapshot, z80pio_t* sys)
+    ~~~
+        Helpers for saving and loading system snapshots, these clear the
+        port callbacks and user data in a snapshot copy of a z80pio_t, and
+        take them over from the running instance before loading.
+
     ## Macros
 
     ~~~C
@@ -398,6 +406,11 @@ static inline uint64_t z80pio_int(z80pio_t* pio, uint64_t pins) {
     return pins;
 }
 
+/* clear host pointers in a snapshot before saving */
+void z80pio_snapshot_onsave(z80pio_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void z80pio_snapshot_onload(z80pio_t* snapshot, z80pio_t* sys);
+
 #ifdef __cplusplus
 } /* extern "C" */
 #endif
@@ -622,4 +635,18 @@ void z80pio_write_port(z80pio_t* pio, int port_id, uint8_t data) {
     }
 }
 
+void z80pio_snapshot_onsave(z80pio_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->in_cb = 0;
+    snapshot->out_cb = 0;
+    snapshot->user_data = 0;
+}
+
+void z80pio_snapshot_onload(z80pio_t* snapshot, z80pio_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->in_cb = sys->in_cb;
+    snapshot->out_cb = sys->out_cb;
+    snapshot->user_data = sys->user_data;
+}
+
 #endif /* CHIPS_IMPL */
@@ -0,0 +1,181 @@
+#-------------------------------------------------------------------------------
+#   ir.py
+#   Intermediate representation for the z80_gen.py and m6502_gen.py code
+#   generators.
+#
+#   Instructions are described as lists of micro-ops (memory and IO
+#   accesses, filler ticks, register moves, flag updates and embedded C
+#   code), the 6502 generator additionally splits each instruction into
+#   a list of cycles. Passes which analyse or transform instructions work
+#   on the micro-op lists, the C source code is only created at the very
+#   end by an Emitter subclass which maps micro-ops to the macros of the
+#   respective emulator.
+#-------------------------------------------------------------------------------
+
+class Op(object) :
+    '''base class of all micro-ops'''
+    __slots__ = ()
+
+    def __repr__(self) :
+        args = ', '.join('{}={!r}'.format(s, getattr(self, s)) for s in self.__slots__)
+        return '{}({})'.format(type(self).__name__, args)
+
+class Code(Op) :
+    '''embedded C code which doesn't fit any of the other micro-ops'''
+    __slots__ = ('src',)
+    def __init__(self, src) :
+        self.src = src
+
+class Tick(Op) :
+    '''filler ticks without bus activity'''
+    __slots__ = ('num',)
+    def __init__(self, num) :
+        self.num = num
+
+class Read(Op) :
+    '''memory read from addr into dst (dst is None if the data is picked
+    up in the next cycle from the data bus)'''
+    __slots__ = ('addr', 'dst')
+    def __init__(self, addr, dst=None) :
+        self.addr = addr
+        self.dst = dst
+
+class Write(Op) :
+    '''memory write of data to addr (addr is None if the address has
+    already been put on the address bus)'''
+    __slots__ = ('addr', 'data')
+    def __init__(self, addr, data) :
+        self.addr = addr
+        self.data = data
+
+class Imm(Op) :
+    '''read an 8- or 16-bit immediate operand into dst'''
+    __slots__ = ('dst', 'bits')
+    def __init__(self, dst, bits=8) :
+        self.dst = dst
+        self.bits = bits
+
+class In(Op) :
+    '''IO read from port addr into dst'''
+    __slots__ = ('addr', 'dst')
+    def __init__(self, addr, dst) :
+        self.addr = addr
+        self.dst = dst
+
+class Out(Op) :
+    '''IO write of data to port addr'''
+    __slots__ = ('addr', 'data')
+    def __init__(self, addr, data) :
+        self.addr = addr
+        self.data = data
+
+class Move(Op) :
+    '''assign src to a register (upper-case name) or a C variable'''
+    __slots__ = ('dst', 'src')
+    def __init__(self, dst, src) :
+        self.dst = dst
+        self.src = src
+
+class Flags(Op) :
+    '''a flag update, src is either the new flags value or a complete
+    C statement (in that case stmt is True), writes and reads are the
+    bit masks of the affected flags, keep is True if src has other side
+    effects than updating the flags, and alt is an optional cheaper
+    Flags op with the same side effects which only writes a subset of
+    the flags'''
+    __slots__ = ('src', 'writes', 'reads', 'stmt', 'keep', 'alt')
+    def __init__(self, src, writes, reads=0, stmt=False, keep=False, alt=None) :
+        self.src = src
+        self.writes = writes
+        self.reads = reads
+        self.stmt = stmt
+        self.keep = keep
+        self.alt = alt
+
+class Fetch(Op) :
+    '''the opcode fetch which ends an instruction'''
+    __slots__ = ()
+
+class If(Op) :
+    '''conditional micro-ops'''
+    __slots__ = ('cond', 'body', 'orelse')
+    def __init__(self, cond, body, orelse=None) :
+        self.cond = cond
+        self.body = body
+        self.orelse = orelse
+
+class Block(Op) :
+    '''a group of micro-ops in their own C scope (for local variables)'''
+    __slots__ = ('body',)
+    def __init__(self, body) :
+        self.body = body
+
+#-------------------------------------------------------------------------------
+def walk(ops) :
+    '''iterate over micro-ops, including nested ops'''
+    for op in ops :
+        yield op
+        if isinstance(op, If) :
+            for o in walk(op.body) :
+                yield o
+            if op.orelse :
+                for o in walk(op.orelse) :
+                    yield o
+        elif isinstance(op, Block) :
+            for o in walk(op.body) :
+                yield o
+
+def count(ops, cls) :
+    '''count the micro-ops of a type, including nested ops'''
+    return sum(1 for op in walk(ops) if isinstance(op, cls))
+
+def elim_dead_flags(ops, live, reads) :
+    '''remove flag updates which are overwritten before they are read,
+    live is the mask of flags which are needed after the ops, reads(op)
+    returns the mask of flags read by an op which isn't a Flags op (for
+    a Fetch this must be all flags), returns the new op list and the
+    mask of flags which are needed before the ops'''
+    res = []
+    for op in reversed(ops) :
+        if isinstance(op, Flags) :
+            while op.alt and (op.writes & live) & ~op.alt.writes == 0 :
+                op = op.alt
+            if (op.writes & live) == 0 and not op.keep :
+                continue
+            live = (live & ~op.writes) | op.reads
+        elif isinstance(op, If) :
+            body, body_live = elim_dead_flags(op.body, live, reads)
+            if op.orelse :
+                orelse, else_live = elim_dead_flags(op.orelse, live, reads)
+            else :
+                orelse, else_live = None, live
+            op = If(op.cond, body, orelse)
+            live = body_live | else_live | reads(op)
+        elif isinstance(op, Block) :
+            body, live = elim_dead_flags(op.body, live, reads)
+            op = Block(body)
+        else :
+            live |= reads(op)
+        res.append(op)
+    res.reverse()
+    return res, live
+
+#-------------------------------------------------------------------------------
+class Emitter(object) :
+    '''base class for backends, dispatches micro-ops to the method
+    named after the micro-op class, each returning a C source string'''
+
+    def emit(self, ops) :
+        return ''.join([getattr(self, type(op).__name__)(op) for op in ops])
+
+    def Code(self, op) :
+        return op.src
+
+    def If(self, op) :
+        src = 'if(' + op.cond + '){' + self.emit(op.body) + '}'
+        if op.orelse :
+            src += 'else{' + self.emit(op.orelse) + '}'
+        return src
+
+    def Block(self, op) :
+        return '{' + self.emit(op.body) + '}'
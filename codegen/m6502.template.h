@@ -137,6 +137,20 @@
         m6502_set_pc(next_pc);
         ~~~~
 
+    ## NZ flag caching
+
+    Define M6502_NZ_CACHE before including the implementation to keep
+    the N and Z flags out of the status register: instead of updating
+    two bits in P after each load, transfer, logic and arithmetic
+    instruction, the emulator only stores the result byte, and N and
+    Z are derived from it when they are actually needed (by the branch
+    instructions, PHP, BRK and interrupts, and the m6502_p() function).
+    With the define, the N and Z bits in m6502_t.P are meaningless while
+    the CPU is running, always read and write the status register
+    through m6502_p() and m6502_set_p(). Snapshots contain the complete
+    status register in P, so that they can be exchanged between
+    emulators compiled with and without M6502_NZ_CACHE.
+
     ## Functions
     ~~~C
     uint64_t m6502_init(m6502_t* cpu, const m6502_desc_t* desc)
@@ -181,6 +195,16 @@
     ~~~
         Set and get 6502 registers and flags.
 
+    ~~~C
+    void m6502_snapshot_onsave(m6502_t* snapshot)
+    void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys)
+    ~~~
+        Helper functions for saving and loading system snapshots. A snapshot
+        of a m6502_t is a plain copy of the struct, call m6502_snapshot_onsave()
+        on the copy to clear the m6510 port IO callbacks and their user data.
+        Before a snapshot is copied back into a running m6502_t instance,
+        call m6502_snapshot_onload() on the snapshot to take the callbacks
+        over from the running instance.
 
     ## zlib/libpng license
 
@@ -291,6 +315,7 @@ typedef struct {
     uint16_t PC;        /* internal program counter register */
     uint16_t AD;        /* ADL/ADH internal register */
     uint8_t A,X,Y,S,P;  /* regular registers */
+    uint16_t nz;        /* N and Z flag source with M6502_NZ_CACHE */
     uint64_t PINS;      /* last stored pin state (do NOT modify) */
     uint16_t irq_pip;
     uint16_t nmi_pip;
@@ -315,6 +340,10 @@ uint64_t m6502_init(m6502_t* cpu, const m6502_desc_t* desc);
 uint64_t m6502_tick(m6502_t* cpu, uint64_t pins);
 /* perform m6510 port IO (only call this if M6510_CHECK_IO(pins) is true) */
 uint64_t m6510_iorq(m6502_t* cpu, uint64_t pins);
+/* clear host pointers in a snapshot before saving */
+void m6502_snapshot_onsave(m6502_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys);
 
 /* register access functions */
 void m6502_set_a(m6502_t* cpu, uint8_t v);
@@ -359,23 +388,50 @@ uint16_t m6502_pc(m6502_t* cpu);
     #define CHIPS_ASSERT(c) assert(c)
 #endif
 
+#if defined(M6502_NZ_CACHE)
+/*
+    The N and Z flags are kept in cpu->nz: Z is set if the lower 8 bits
+    are zero, and N is set if bit 7 or bit 8 is set (bit 8 is only needed
+    for the combination of N and Z set, which isn't the result of an
+    instruction, but can be loaded into the status register).
+*/
+static inline uint8_t _m6502_get_p(const m6502_t* cpu) {
+    return (cpu->P & ~(M6502_NF|M6502_ZF)) |
+           ((cpu->nz & 0xFF) ? 0 : M6502_ZF) |
+           ((cpu->nz | (cpu->nz >> 1)) & M6502_NF);
+}
+static inline void _m6502_set_p(m6502_t* cpu, uint8_t v) {
+    cpu->P = v;
+    cpu->nz = ((v & M6502_ZF) ? 0 : 1) | ((v & M6502_NF) << ((v & M6502_ZF) ? 1 : 0));
+}
+#define _M6502_NZ(p,v) (cpu->nz=(uint8_t)(v),(p))
+#define _M6502_SYNC_NZ() _m6502_set_p(cpu, cpu->P)
+#else
+static inline uint8_t _m6502_get_p(const m6502_t* cpu) {
+    return cpu->P;
+}
+static inline void _m6502_set_p(m6502_t* cpu, uint8_t v) {
+    cpu->P = v;
+}
+#define _M6502_NZ(p,v) ((p&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
+#define _M6502_SYNC_NZ()
+#endif
+
 /* register access functions */
 void m6502_set_a(m6502_t* cpu, uint8_t v) { cpu->A = v; }
 void m6502_set_x(m6502_t* cpu, uint8_t v) { cpu->X = v; }
 void m6502_set_y(m6502_t* cpu, uint8_t v) { cpu->Y = v; }
 void m6502_set_s(m6502_t* cpu, uint8_t v) { cpu->S = v; }
-void m6502_set_p(m6502_t* cpu, uint8_t v) { cpu->P = v; }
+void m6502_set_p(m6502_t* cpu, uint8_t v) { _m6502_set_p(cpu, v); }
 void m6502_set_pc(m6502_t* cpu, uint16_t v) { cpu->PC = v; }
 uint8_t m6502_a(m6502_t* cpu) { return cpu->A; }
 uint8_t m6502_x(m6502_t* cpu) { return cpu->X; }
 uint8_t m6502_y(m6502_t* cpu) { return cpu->Y; }
 uint8_t m6502_s(m6502_t* cpu) { return cpu->S; }
-uint8_t m6502_p(m6502_t* cpu) { return cpu->P; }
+uint8_t m6502_p(m6502_t* cpu) { return _m6502_get_p(cpu); }
 uint16_t m6502_pc(m6502_t* cpu) { return cpu->PC; }
 
-/* helper macros and functions for code-generated instruction decoder */
-#define _M6502_NZ(p,v) ((p&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
-
+/* helper functions for code-generated instruction decoder */
 static inline void _m6502_adc(m6502_t* cpu, uint8_t val) {
     if (cpu->bcd_enabled && (cpu->P & M6502_DF)) {
         /* decimal mode (credit goes to MAME) */
@@ -402,6 +458,7 @@ static inline void _m6502_adc(m6502_t* cpu, uint8_t val) {
             cpu->P |= M6502_CF;
         }
         cpu->A = (ah<<4) | (al & 0x0F);
+        _M6502_SYNC_NZ();
     }
     else {
         /* default mode */
@@ -445,6 +502,7 @@ static inline void _m6502_sbc(m6502_t* cpu, uint8_t val) {
             ah -= 6;
         }
         cpu->A = (ah<<4) | (al & 0x0F);
+        _M6502_SYNC_NZ();
     }
     else {
         /* default mode */
@@ -511,6 +569,7 @@ static inline void _m6502_bit(m6502_t* cpu, uint8_t v) {
         cpu->P |= M6502_ZF;
     }
     cpu->P |= v & (M6502_NF|M6502_VF);
+    _M6502_SYNC_NZ();
 }
 
 static inline void _m6502_arr(m6502_t* cpu) {
@@ -569,11 +628,12 @@ static inline void _m6502_sbx(m6502_t* cpu, uint8_t v) {
     cpu->X = (uint8_t)t;
 }
 #undef _M6502_NZ
+#undef _M6502_SYNC_NZ
 
 uint64_t m6502_init(m6502_t* c, const m6502_desc_t* desc) {
     CHIPS_ASSERT(c && desc);
     memset(c, 0, sizeof(*c));
-    c->P = M6502_ZF;
+    _m6502_set_p(c, M6502_ZF);
     c->bcd_enabled = !desc->bcd_disabled;
     c->PINS = M6502_RW | M6502_SYNC | M6502_RES;
     c->in_cb = desc->m6510_in_cb;
@@ -584,6 +644,22 @@ uint64_t m6502_init(m6502_t* c, const m6502_desc_t* desc) {
     return c->PINS;
 }
 
+void m6502_snapshot_onsave(m6502_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->user_data = 0;
+    snapshot->in_cb = 0;
+    snapshot->out_cb = 0;
+    snapshot->P = _m6502_get_p(snapshot);
+}
+
+void m6502_snapshot_onload(m6502_t* snapshot, m6502_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->user_data = sys->user_data;
+    snapshot->in_cb = sys->in_cb;
+    snapshot->out_cb = sys->out_cb;
+    _m6502_set_p(snapshot, snapshot->P);
+}
+
 /* only call this when accessing address 0 or 1 (M6510_CHECK_IO(pins) evaluates to true) */
 uint64_t m6510_iorq(m6502_t* c, uint64_t pins) {
     CHIPS_ASSERT(c->in_cb && c->out_cb);
@@ -640,8 +716,17 @@ uint64_t m6510_iorq(m6502_t* c, uint64_t pins) {
 #define _RD() _ON(M6502_RW);
 /* a memory write tick */
 #define _WR() _OFF(M6502_RW);
+#if defined(M6502_NZ_CACHE)
+/* set N and Z flags depending on value */
+#define _NZ(v) c->nz=(uint8_t)(v)
+#else
 /* set N and Z flags depending on value */
 #define _NZ(v) c->P=((c->P&~(M6502_NF|M6502_ZF))|((v&0xFF)?(v&M6502_NF):M6502_ZF))
+#endif
+/* get the complete status register */
+#define _GP() _m6502_get_p(c)
+/* set the complete status register */
+#define _SP(v) _m6502_set_p(c,v)
 
 #if defined(_MSC_VER)
 #pragma warning(push)
@@ -733,4 +818,6 @@ $decode_block
 #undef _RD
 #undef _WR
 #undef _NZ
+#undef _GP
+#undef _SP
 #endif /* CHIPS_IMPL */
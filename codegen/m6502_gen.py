@@ -4,6 +4,7 @@
 #-------------------------------------------------------------------------------
 import sys
 from string import Template
+from ir import *
 
 InpPath = 'm6502.template.h'
 OutPath = '../chips/m6502.h'
@@ -17,6 +18,7 @@ BF = (1<<4)
 XF = (1<<5)
 VF = (1<<6)
 NF = (1<<7)
+AllFlags = 0xFF
 
 def flag_name(f):
     if f == CF: return 'C'
@@ -113,34 +115,119 @@ ops = [
     ]
 ]
 
+#-------------------------------------------------------------------------------
+#   An opcode is described by a list of cycles, and each cycle is a list
+#   of micro-ops (see ir.py). The t() method starts a new cycle, and ta()
+#   appends micro-ops to the current cycle.
+#
 class opcode:
+    __slots__ = ('code', 'cmt', 'cycles')
     def __init__(self, op):
         self.code = op
         self.cmt = None
-        self.i = 0
-        self.src = [None] * 8
-    def t(self, src):
-        self.src[self.i] = src
-        self.i += 1
-    def ta(self, src):
-        self.src[self.i-1] += src
+        self.cycles = []
+    def t(self, *ops):
+        self.cycles.append(list(ops))
+    def ta(self, *ops):
+        self.cycles[-1].extend(ops)
+
+#-------------------------------------------------------------------------------
+#   micro-op helpers
+#
+def SA(addr):
+    # put an address on the address bus, reads are the default
+    return Read(addr)
+
+def SAD(addr, data):
+    # put address and data on the bus, and set the write pin
+    return Write(addr, data)
+
+def SD(data):
+    # write data to the address that's already on the address bus
+    return Write(None, data)
+
+def GD():
+    # the data bus value of the previous cycle
+    return '_GD()'
+
+def NZ(val):
+    return Flags('_NZ({});'.format(val), NF|ZF, stmt=True)
+
+def ALU(src, writes, reads=0, keep=True, alt=None):
+    # call an ALU helper function which updates the status flags, keep
+    # is False if the helper has no other side effects
+    return Flags(src, writes, reads, stmt=True, keep=keep, alt=alt)
+
+def CARRY(src):
+    # a shift or rotate which only updates the carry flag, used instead of
+    # the ALU helper when the N and Z results are overwritten anyway
+    return Flags(src, CF, CF, stmt=True, keep=True)
+
+def P(val, writes=0xFF):
+    # assign a new value to the status register
+    return Flags(val, writes)
+
+def reads_flags(op):
+    # the flags read by a micro-op which isn't a Flags op, embedded C code
+    # which looks at the status register may read any flag
+    if isinstance(op, Fetch):
+        return AllFlags
+    if isinstance(op, If):
+        srcs = [op.cond]
+    else:
+        srcs = [getattr(op, s) for s in op.__slots__]
+    for src in srcs:
+        if isinstance(src, str) and ('c->P' in src or '_GP()' in src or 'c->IR' in src):
+            return AllFlags
+    return 0
+
+def elim_flags(o):
+    # remove flag updates which are overwritten within the same
+    # instruction, all flags are live at the opcode fetch
+    live = AllFlags
+    for i in reversed(range(len(o.cycles))):
+        o.cycles[i], live = elim_dead_flags(o.cycles[i], live, reads_flags)
+
+def WR():
+    # set the write pin, with the data already on the data bus
+    return Code('_WR();')
+
+def C(src):
+    return Code(src)
+
+#-------------------------------------------------------------------------------
+#   the C backend
+#
+class CEmitter(Emitter):
+    def Read(self, op):
+        return '_SA({});'.format(op.addr)
+    def Write(self, op):
+        if op.addr is None:
+            return '_SD({});_WR();'.format(op.data)
+        else:
+            return '_SAD({},{});_WR();'.format(op.addr, op.data)
+    def Move(self, op):
+        return '{}={};'.format(op.dst, op.src)
+    def Flags(self, op):
+        return op.src if op.stmt else '_SP({});'.format(op.src)
+    def Fetch(self, op):
+        return '_FETCH();'
 
 #-------------------------------------------------------------------------------
 #   output a src line
 #
-out_lines = ''
+out_lines = []
 def l(s) :
-    global out_lines
-    out_lines += s + '\n'
+    out_lines.append(s + '\n')
 
 #-------------------------------------------------------------------------------
-def write_op(op):
+def write_op(op, emitter):
     if not op.cmt:
         op.cmt = '???'
     l('    /* {} */'.format(op.cmt if op.cmt else '???'))
     for t in range(0, 8):
-        if t < op.i:
-            l('        case (0x{:02X}<<3)|{}: {}break;'.format(op.code, t, op.src[t]))
+        if t < len(op.cycles):
+            l('        case (0x{:02X}<<3)|{}: {}break;'.format(op.code, t, emitter.emit(op.cycles[t])))
         else:
             l('        case (0x{:02X}<<3)|{}: assert(false);break;'.format(op.code, t))
 
@@ -172,69 +259,69 @@ def enc_addr(op, addr_mode, mem_access):
     if addr_mode == A____:
         # no addressing, this still puts the PC on the address bus without 
         # incrementing the PC
-        op.t('_SA(c->PC);')
+        op.t(SA('c->PC'))
     elif addr_mode == A_IMM:
         # immediate mode
-        op.t('_SA(c->PC++);')
+        op.t(SA('c->PC++'))
     elif addr_mode == A_ZER:
         # zero page
-        op.t('_SA(c->PC++);')
-        op.t('_SA(_GD());')
+        op.t(SA('c->PC++'))
+        op.t(SA(GD()))
     elif addr_mode == A_ZPX:
         # zero page + X
-        op.t('_SA(c->PC++);')
-        op.t('c->AD=_GD();_SA(c->AD);')
-        op.t('_SA((c->AD+c->X)&0x00FF);')
+        op.t(SA('c->PC++'))
+        op.t(Move('c->AD',GD()), SA('c->AD'))
+        op.t(SA('(c->AD+c->X)&0x00FF'))
     elif addr_mode == A_ZPY:
         # zero page + Y
-        op.t('_SA(c->PC++);')
-        op.t('c->AD=_GD();_SA(c->AD);')
-        op.t('_SA((c->AD+c->Y)&0x00FF);')
+        op.t(SA('c->PC++'))
+        op.t(Move('c->AD',GD()), SA('c->AD'))
+        op.t(SA('(c->AD+c->Y)&0x00FF'))
     elif addr_mode == A_ABS:
         # absolute
-        op.t('_SA(c->PC++);')
-        op.t('_SA(c->PC++);c->AD=_GD();')
-        op.t('_SA((_GD()<<8)|c->AD);')
+        op.t(SA('c->PC++'))
+        op.t(SA('c->PC++'), Move('c->AD',GD()))
+        op.t(SA('(_GD()<<8)|c->AD'))
     elif addr_mode == A_ABX:
         # absolute + X
         # this needs to check if a page boundary is crossed, which costs
         # and additional cycle, but this early-out only happens when the
         # instruction doesn't need to write back to memory
-        op.t('_SA(c->PC++);')
-        op.t('_SA(c->PC++);c->AD=_GD();')
-        op.t('c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->X)&0xFF));')
+        op.t(SA('c->PC++'))
+        op.t(SA('c->PC++'), Move('c->AD',GD()))
+        op.t(C('c->AD|=_GD()<<8;'), SA('(c->AD&0xFF00)|((c->AD+c->X)&0xFF)'))
         if mem_access == M_R_:
             # skip next tick if read access and page not crossed
-            op.ta('c->IR+=(~((c->AD>>8)-((c->AD+c->X)>>8)))&1;')
-        op.t('_SA(c->AD+c->X);')
+            op.ta(C('c->IR+=(~((c->AD>>8)-((c->AD+c->X)>>8)))&1;'))
+        op.t(SA('c->AD+c->X'))
     elif addr_mode == A_ABY:
         # absolute + Y
         # same page-boundary-crossed special case as absolute+X
-        op.t('_SA(c->PC++);')
-        op.t('_SA(c->PC++);c->AD=_GD();')
-        op.t('c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));')
+        op.t(SA('c->PC++'))
+        op.t(SA('c->PC++'), Move('c->AD',GD()))
+        op.t(C('c->AD|=_GD()<<8;'), SA('(c->AD&0xFF00)|((c->AD+c->Y)&0xFF)'))
         if mem_access == M_R_:
             # skip next tick if read access and page not crossed
-            op.ta('c->IR+=(~((c->AD>>8)-((c->AD+c->Y)>>8)))&1;')
-        op.t('_SA(c->AD+c->Y);')
+            op.ta(C('c->IR+=(~((c->AD>>8)-((c->AD+c->Y)>>8)))&1;'))
+        op.t(SA('c->AD+c->Y'))
     elif addr_mode == A_IDX:
         # (zp,X)
-        op.t('_SA(c->PC++);')
-        op.t('c->AD=_GD();_SA(c->AD);')
-        op.t('c->AD=(c->AD+c->X)&0xFF;_SA(c->AD);')
-        op.t('_SA((c->AD+1)&0xFF);c->AD=_GD();')
-        op.t('_SA((_GD()<<8)|c->AD);')
+        op.t(SA('c->PC++'))
+        op.t(Move('c->AD',GD()), SA('c->AD'))
+        op.t(Move('c->AD','(c->AD+c->X)&0xFF'), SA('c->AD'))
+        op.t(SA('(c->AD+1)&0xFF'), Move('c->AD',GD()))
+        op.t(SA('(_GD()<<8)|c->AD'))
     elif addr_mode == A_IDY:
         # (zp),Y
         # same page-boundary-crossed special case as absolute+X
-        op.t('_SA(c->PC++);')
-        op.t('c->AD=_GD();_SA(c->AD);')
-        op.t('_SA((c->AD+1)&0xFF);c->AD=_GD();')
-        op.t('c->AD|=_GD()<<8;_SA((c->AD&0xFF00)|((c->AD+c->Y)&0xFF));')
+        op.t(SA('c->PC++'))
+        op.t(Move('c->AD',GD()), SA('c->AD'))
+        op.t(SA('(c->AD+1)&0xFF'), Move('c->AD',GD()))
+        op.t(C('c->AD|=_GD()<<8;'), SA('(c->AD&0xFF00)|((c->AD+c->Y)&0xFF)'))
         if mem_access == M_R_:
             # skip next tick if read access and page not crossed
-            op.ta('c->IR+=(~((c->AD>>8)-((c->AD+c->Y)>>8)))&1;')
-        op.t('_SA(c->AD+c->Y);')
+            op.ta(C('c->IR+=(~((c->AD>>8)-((c->AD+c->Y)>>8)))&1;'))
+        op.t(SA('c->AD+c->Y'))
     elif addr_mode == A_JMP:
         # jmp is completely handled in instruction decoding
         pass
@@ -248,389 +335,394 @@ def enc_addr(op, addr_mode, mem_access):
 #-------------------------------------------------------------------------------
 def i_brk(o):
     cmt(o, 'BRK')
-    o.t('if(0==(c->brk_flags&(M6502_BRK_IRQ|M6502_BRK_NMI))){c->PC++;}_SAD(0x0100|c->S--,c->PC>>8);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}')
-    o.t('_SAD(0x0100|c->S--,c->PC);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}')
-    o.t('_SAD(0x0100|c->S--,c->P|M6502_XF);if(c->brk_flags&M6502_BRK_RESET){c->AD=0xFFFC;}else{_WR();if(c->brk_flags&M6502_BRK_NMI){c->AD=0xFFFA;}else{c->AD=0xFFFE;}}')
-    o.t('_SA(c->AD++);c->P|=(M6502_IF|M6502_BF);c->brk_flags=0; /* RES/NMI hijacking */')
-    o.t('_SA(c->AD);c->AD=_GD(); /* NMI "half-hijacking" not possible */')
-    o.t('c->PC=(_GD()<<8)|c->AD;')
+    o.t(C('if(0==(c->brk_flags&(M6502_BRK_IRQ|M6502_BRK_NMI))){c->PC++;}_SAD(0x0100|c->S--,c->PC>>8);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}'))
+    o.t(C('_SAD(0x0100|c->S--,c->PC);if(0==(c->brk_flags&M6502_BRK_RESET)){_WR();}'))
+    o.t(C('_SAD(0x0100|c->S--,_GP()|M6502_XF);if(c->brk_flags&M6502_BRK_RESET){c->AD=0xFFFC;}else{_WR();if(c->brk_flags&M6502_BRK_NMI){c->AD=0xFFFA;}else{c->AD=0xFFFE;}}'))
+    o.t(SA('c->AD++'), Flags('c->P|=(M6502_IF|M6502_BF);', IF|BF, stmt=True), C('c->brk_flags=0; /* RES/NMI hijacking */'))
+    o.t(SA('c->AD'), C('c->AD=_GD(); /* NMI "half-hijacking" not possible */'))
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_nop(o):
     cmt(o,'NOP')
-    o.t('')
+    o.t()
 
 #-------------------------------------------------------------------------------
 def u_nop(o):
     u_cmt(o,'NOP')
-    o.t('')
+    o.t()
 
 #-------------------------------------------------------------------------------
 def i_lda(o):
     cmt(o,'LDA')
-    o.t('c->A=_GD();_NZ(c->A);')
+    o.t(Move('c->A',GD()), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_ldx(o):
     cmt(o,'LDX')
-    o.t('c->X=_GD();_NZ(c->X);')
+    o.t(Move('c->X',GD()), NZ('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_ldy(o):
     cmt(o,'LDY')
-    o.t('c->Y=_GD();_NZ(c->Y);')
+    o.t(Move('c->Y',GD()), NZ('c->Y'))
 
 #-------------------------------------------------------------------------------
 def u_lax(o):
     u_cmt(o,'LAX')
-    o.t('c->A=c->X=_GD();_NZ(c->A);')
+    o.t(Move('c->A=c->X',GD()), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def x_lxa(o):
     # undocumented LXA
     # and immediate byte with A, then load X with A
     u_cmt(o,'LXA')
-    o.t('c->A=c->X=(c->A|0xEE)&_GD();_NZ(c->A);')
+    o.t(Move('c->A=c->X','(c->A|0xEE)&_GD()'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_sta(o):
     cmt(o,'STA')
-    o.ta('_SD(c->A);_WR();')
+    o.ta(SD('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_stx(o):
     cmt(o,'STX')
-    o.ta('_SD(c->X);_WR();')
+    o.ta(SD('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_sty(o):
     cmt(o,'STY')
-    o.ta('_SD(c->Y);_WR();')
+    o.ta(SD('c->Y'))
 
 #-------------------------------------------------------------------------------
 def u_sax(o):
     u_cmt(o,'SAX')
-    o.ta('_SD(c->A&c->X);_WR();')
+    o.ta(SD('c->A&c->X'))
 
 #-------------------------------------------------------------------------------
 def i_tax(o):
     cmt(o,'TAX')
-    o.t('c->X=c->A;_NZ(c->X);')
+    o.t(Move('c->X','c->A'), NZ('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_tay(o):
     cmt(o,'TAY')
-    o.t('c->Y=c->A;_NZ(c->Y);')
+    o.t(Move('c->Y','c->A'), NZ('c->Y'))
 
 #-------------------------------------------------------------------------------
 def i_txa(o):
     cmt(o,'TXA')
-    o.t('c->A=c->X;_NZ(c->A);')
+    o.t(Move('c->A','c->X'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_tya(o):
     cmt(o,'TYA')
-    o.t('c->A=c->Y;_NZ(c->A);')
+    o.t(Move('c->A','c->Y'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_txs(o):
     cmt(o,'TXS')
-    o.t('c->S=c->X;')
+    o.t(Move('c->S','c->X'))
 
 #-------------------------------------------------------------------------------
 def i_tsx(o):
     cmt(o,'TSX')
-    o.t('c->X=c->S;_NZ(c->X);')
+    o.t(Move('c->X','c->S'), NZ('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_php(o):
     cmt(o,'PHP')
-    o.t('_SAD(0x0100|c->S--,c->P|M6502_XF);_WR();')
+    o.t(SAD('0x0100|c->S--','_GP()|M6502_XF'))
 
 #-------------------------------------------------------------------------------
 def i_plp(o):
     cmt(o,'PLP')
-    o.t('_SA(0x0100|c->S++);')   # read junk byte from current SP
-    o.t('_SA(0x0100|c->S);')     # read actual byte  
-    o.t('c->P=(_GD()|M6502_BF)&~M6502_XF;');
+    o.t(SA('0x0100|c->S++'))   # read junk byte from current SP
+    o.t(SA('0x0100|c->S'))     # read actual byte  
+    o.t(P('(_GD()|M6502_BF)&~M6502_XF'))
 
 #-------------------------------------------------------------------------------
 def i_pha(o):
     cmt(o,'PHA')
-    o.t('_SAD(0x0100|c->S--,c->A);_WR();')
+    o.t(SAD('0x0100|c->S--','c->A'))
 
 #-------------------------------------------------------------------------------
 def i_pla(o):
     cmt(o,'PLA')
-    o.t('_SA(0x0100|c->S++);') # read junk byte from current SP
-    o.t('_SA(0x0100|c->S);')   # read actual byte
-    o.t('c->A=_GD();_NZ(c->A);')
+    o.t(SA('0x0100|c->S++')) # read junk byte from current SP
+    o.t(SA('0x0100|c->S'))   # read actual byte
+    o.t(Move('c->A',GD()), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_se(o, f):
     cmt(o,'SE'+flag_name(f))
-    o.t('c->P|='+hex(f)+';')
+    o.t(Flags('c->P|='+hex(f)+';', f, stmt=True))
 
 #-------------------------------------------------------------------------------
 def i_cl(o, f):
     cmt(o,'CL'+flag_name(f))
-    o.t('c->P&=~'+hex(f)+';')
+    o.t(Flags('c->P&=~'+hex(f)+';', f, stmt=True))
 
 #-------------------------------------------------------------------------------
 def i_br(o, m, v):
     cmt(o,branch_name(m,v))
-    # if branch not taken?
-    o.t('_SA(c->PC);c->AD=c->PC+(int8_t)_GD();if((c->P&'+hex(m)+')!='+hex(v)+'){_FETCH();};')
+    # if branch not taken? (N and Z must go through _GP() for the NZ cache)
+    p = '_GP()' if m in (NF, ZF) else 'c->P'
+    o.t(SA('c->PC'), Move('c->AD','c->PC+(int8_t)_GD()'), If('('+p+'&'+hex(m)+')!='+hex(v), [Fetch()]), C(';'))
     # branch taken: shortcut if page not crossed, 'branchquirk' interrupt fix
-    o.t('_SA((c->PC&0xFF00)|(c->AD&0x00FF));if((c->AD&0xFF00)==(c->PC&0xFF00)){c->PC=c->AD;c->irq_pip>>=1;c->nmi_pip>>=1;_FETCH();};')
+    o.t(SA('(c->PC&0xFF00)|(c->AD&0x00FF)'), If('(c->AD&0xFF00)==(c->PC&0xFF00)', [Move('c->PC','c->AD'), C('c->irq_pip>>=1;c->nmi_pip>>=1;'), Fetch()]), C(';'))
     # page crossed extra cycle:
-    o.t('c->PC=c->AD;')
+    o.t(Move('c->PC','c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_jmp(o):
     cmt(o,'JMP')
-    o.t('_SA(c->PC++);')
-    o.t('_SA(c->PC++);c->AD=_GD();')
-    o.t('c->PC=(_GD()<<8)|c->AD;')
+    o.t(SA('c->PC++'))
+    o.t(SA('c->PC++'), Move('c->AD',GD()))
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_jmpi(o):
     cmt(o,'JMPI')
-    o.t('_SA(c->PC++);')
-    o.t('_SA(c->PC++);c->AD=_GD();')
-    o.t('c->AD|=_GD()<<8;_SA(c->AD);')
-    o.t('_SA((c->AD&0xFF00)|((c->AD+1)&0x00FF));c->AD=_GD();')
-    o.t('c->PC=(_GD()<<8)|c->AD;')
+    o.t(SA('c->PC++'))
+    o.t(SA('c->PC++'), Move('c->AD',GD()))
+    o.t(C('c->AD|=_GD()<<8;'), SA('c->AD'))
+    o.t(SA('(c->AD&0xFF00)|((c->AD+1)&0x00FF)'), Move('c->AD',GD()))
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_jsr(o):
     cmt(o,'JSR')
     # read low byte of target address
-    o.t('_SA(c->PC++);')
+    o.t(SA('c->PC++'))
     # put SP on addr bus, next cycle is a junk read
-    o.t('_SA(0x0100|c->S);c->AD=_GD();')
+    o.t(SA('0x0100|c->S'), Move('c->AD',GD()))
     # write PC high byte to stack
-    o.t('_SAD(0x0100|c->S--,c->PC>>8);_WR();')
+    o.t(SAD('0x0100|c->S--','c->PC>>8'))
     # write PC low byte to stack
-    o.t('_SAD(0x0100|c->S--,c->PC);_WR();')
+    o.t(SAD('0x0100|c->S--','c->PC'))
     # load target address high byte
-    o.t('_SA(c->PC);')
+    o.t(SA('c->PC'))
     # load PC and done
-    o.t('c->PC=(_GD()<<8)|c->AD;')
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_rts(o):
     cmt(o,'RTS')
     # put SP on stack and do a junk read
-    o.t('_SA(0x0100|c->S++);')
+    o.t(SA('0x0100|c->S++'))
     # load return address low byte from stack
-    o.t('_SA(0x0100|c->S++);')
+    o.t(SA('0x0100|c->S++'))
     # load return address high byte from stack
-    o.t('_SA(0x0100|c->S);c->AD=_GD();')
+    o.t(SA('0x0100|c->S'), Move('c->AD',GD()))
     # put return address in PC, this is one byte before next op, do junk read from PC
-    o.t('c->PC=(_GD()<<8)|c->AD;_SA(c->PC++);')
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'), SA('c->PC++'))
     # next tick is opcode fetch
-    o.t('');
+    o.t()
 
 #-------------------------------------------------------------------------------
 def i_rti(o):
     cmt(o,'RTI')
     # put SP on stack and do a junk read
-    o.t('_SA(0x0100|c->S++);')
+    o.t(SA('0x0100|c->S++'))
     # load processor status flag from stack
-    o.t('_SA(0x0100|c->S++);')
+    o.t(SA('0x0100|c->S++'))
     # load return address low byte from stack
-    o.t('_SA(0x0100|c->S++);c->P=(_GD()|M6502_BF)&~M6502_XF;')
+    o.t(SA('0x0100|c->S++'), P('(_GD()|M6502_BF)&~M6502_XF'))
     # load return address high byte from stack
-    o.t('_SA(0x0100|c->S);c->AD=_GD();')
+    o.t(SA('0x0100|c->S'), Move('c->AD',GD()))
     # update PC (which is already placed on the right return-to instruction)
-    o.t('c->PC=(_GD()<<8)|c->AD;')
+    o.t(Move('c->PC','(_GD()<<8)|c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_ora(o):
     cmt(o,'ORA')
-    o.t('c->A|=_GD();_NZ(c->A);')
+    o.t(C('c->A|=_GD();'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_and(o):
     cmt(o,'AND')
-    o.t('c->A&=_GD();_NZ(c->A);')
+    o.t(C('c->A&=_GD();'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_eor(o):
     cmt(o,'EOR')
-    o.t('c->A^=_GD();_NZ(c->A);')
+    o.t(C('c->A^=_GD();'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def i_adc(o):
     cmt(o,'ADC')
-    o.t('_m6502_adc(c,_GD());')
+    o.t(ALU('_m6502_adc(c,_GD());', NF|VF|ZF|CF, CF|DF))
 
 #-------------------------------------------------------------------------------
 def i_sbc(o):
     cmt(o,'SBC')
-    o.t('_m6502_sbc(c,_GD());')
+    o.t(ALU('_m6502_sbc(c,_GD());', NF|VF|ZF|CF, CF|DF))
 
 #-------------------------------------------------------------------------------
 def u_sbc(o):
     u_cmt(o,'SBC')
-    o.t('_m6502_sbc(c,_GD());')
+    o.t(ALU('_m6502_sbc(c,_GD());', NF|VF|ZF|CF, CF|DF))
 
 #-------------------------------------------------------------------------------
 def i_cmp(o):
     cmt(o,'CMP')
-    o.t('_m6502_cmp(c, c->A, _GD());')
+    o.t(ALU('_m6502_cmp(c, c->A, _GD());', NF|ZF|CF, keep=False))
 
 #-------------------------------------------------------------------------------
 def i_cpx(o):
     cmt(o,'CPX')
-    o.t('_m6502_cmp(c, c->X, _GD());')
+    o.t(ALU('_m6502_cmp(c, c->X, _GD());', NF|ZF|CF, keep=False))
 
 #-------------------------------------------------------------------------------
 def i_cpy(o):
     cmt(o,'CPY')
-    o.t('_m6502_cmp(c, c->Y, _GD());')
+    o.t(ALU('_m6502_cmp(c, c->Y, _GD());', NF|ZF|CF, keep=False))
 
 #-------------------------------------------------------------------------------
 def u_dcp(o):
     # undocumented 'decrement and compare'
     u_cmt(o,'DCP')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD--;_NZ(c->AD);_SD(c->AD);_m6502_cmp(c, c->A, c->AD);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(C('c->AD--;'), NZ('c->AD'), ALU('_m6502_cmp(c, c->A, c->AD);', NF|ZF|CF, keep=False), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def x_sbx(o):
     u_cmt(o,'SBX')
-    o.t('_m6502_sbx(c, _GD());')
+    o.t(ALU('_m6502_sbx(c, _GD());', NF|ZF|CF))
 
 #-------------------------------------------------------------------------------
 def i_dec(o):
     cmt(o,'DEC')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD--;_NZ(c->AD);_SD(c->AD);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(C('c->AD--;'), NZ('c->AD'), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_inc(o):
     cmt(o,'INC')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD++;_NZ(c->AD);_SD(c->AD);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(C('c->AD++;'), NZ('c->AD'), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_dex(o):
     cmt(o,'DEX')
-    o.t('c->X--;_NZ(c->X);')
+    o.t(C('c->X--;'), NZ('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_dey(o):
     cmt(o,'DEY')
-    o.t('c->Y--;_NZ(c->Y);')
+    o.t(C('c->Y--;'), NZ('c->Y'))
 
 #-------------------------------------------------------------------------------
 def i_inx(o):
     cmt(o,'INX')
-    o.t('c->X++;_NZ(c->X);')
+    o.t(C('c->X++;'), NZ('c->X'))
 
 #-------------------------------------------------------------------------------
 def i_iny(o):
     cmt(o,'INY')
-    o.t('c->Y++;_NZ(c->Y);')
+    o.t(C('c->Y++;'), NZ('c->Y'))
 
 #-------------------------------------------------------------------------------
 def u_isb(o):
     # undocumented INC+SBC instruction
     u_cmt(o,'ISB')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD++;_SD(c->AD);_m6502_sbc(c,c->AD);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(C('c->AD++;'), ALU('_m6502_sbc(c,c->AD);', NF|VF|ZF|CF, CF|DF), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_asl(o):
     cmt(o,'ASL')
-    o.t('c->AD=_GD();_WR();')
-    o.t('_SD(_m6502_asl(c,c->AD));_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('_SD(_m6502_asl(c,c->AD));', NF|ZF|CF), WR())
 
 #-------------------------------------------------------------------------------
 def i_asla(o):
     cmt(o,'ASLA')
-    o.t('c->A=_m6502_asl(c,c->A);')
+    o.t(ALU('c->A=_m6502_asl(c,c->A);', NF|ZF|CF))
 
 #-------------------------------------------------------------------------------
 def i_lsr(o):
     cmt(o,'LSR')
-    o.t('c->AD=_GD();_WR();')
-    o.t('_SD(_m6502_lsr(c,c->AD));_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('_SD(_m6502_lsr(c,c->AD));', NF|ZF|CF), WR())
 
 #-------------------------------------------------------------------------------
 def i_lsra(o):
     cmt(o,'LSRA')
-    o.t('c->A=_m6502_lsr(c,c->A);')
+    o.t(ALU('c->A=_m6502_lsr(c,c->A);', NF|ZF|CF))
 
 #-------------------------------------------------------------------------------
 def u_slo(o):
     # undocumented ASL+OR
     u_cmt(o,'SLO')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD=_m6502_asl(c,c->AD);_SD(c->AD);c->A|=c->AD;_NZ(c->A);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('c->AD=_m6502_asl(c,c->AD);', NF|ZF|CF,
+        alt=CARRY('c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=(c->AD<<1)&0xFF;')), C('c->A|=c->AD;'), NZ('c->A'), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def x_asr(o):
     # undocumented AND+LSR
     u_cmt(o, 'ASR')
-    o.t('c->A&=_GD();c->A=_m6502_lsr(c,c->A);')
+    o.t(C('c->A&=_GD();'), ALU('c->A=_m6502_lsr(c,c->A);', NF|ZF|CF))
 
 #-------------------------------------------------------------------------------
 def u_sre(o):
     # undocumented LSR+EOR
     u_cmt(o,'SRE')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD=_m6502_lsr(c,c->AD);_SD(c->AD);c->A^=c->AD;_NZ(c->A);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('c->AD=_m6502_lsr(c,c->AD);', NF|ZF|CF,
+        alt=CARRY('c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD>>=1;')), C('c->A^=c->AD;'), NZ('c->A'), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_rol(o):
     cmt(o,'ROL')
-    o.t('c->AD=_GD();_WR();')
-    o.t('_SD(_m6502_rol(c,c->AD));_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('_SD(_m6502_rol(c,c->AD));', NF|ZF|CF, CF), WR())
 
 #-------------------------------------------------------------------------------
 def i_rola(o):
     cmt(o,'ROLA')
-    o.t('c->A=_m6502_rol(c,c->A);')
+    o.t(ALU('c->A=_m6502_rol(c,c->A);', NF|ZF|CF, CF))
 
 #-------------------------------------------------------------------------------
 def u_rla(o):
     # uncodumented ROL+AND
     u_cmt(o,'RLA')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD=_m6502_rol(c,c->AD);_SD(c->AD);c->A&=c->AD;_NZ(c->A);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('c->AD=_m6502_rol(c,c->AD);', NF|ZF|CF, CF,
+        alt=CARRY('{const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|((c->AD>>7)&M6502_CF);c->AD=((c->AD<<1)|ci)&0xFF;}')), C('c->A&=c->AD;'), NZ('c->A'), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def i_ror(o):
     cmt(o,'ROR')
-    o.t('c->AD=_GD();_WR();')
-    o.t('_SD(_m6502_ror(c,c->AD));_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('_SD(_m6502_ror(c,c->AD));', NF|ZF|CF, CF), WR())
 
 #-------------------------------------------------------------------------------
 def i_rora(o):
     cmt(o,'RORA')
-    o.t('c->A=_m6502_ror(c,c->A);')
+    o.t(ALU('c->A=_m6502_ror(c,c->A);', NF|ZF|CF, CF))
 
 #-------------------------------------------------------------------------------
 def u_rra(o):
     # undocumented ROR+ADC
     u_cmt(o,'RRA')
-    o.t('c->AD=_GD();_WR();')
-    o.t('c->AD=_m6502_ror(c,c->AD);_SD(c->AD);_m6502_adc(c,c->AD);_WR();')
+    o.t(Move('c->AD',GD()), WR())
+    o.t(ALU('c->AD=_m6502_ror(c,c->AD);', NF|ZF|CF, CF,
+        alt=CARRY('{const uint8_t ci=c->P&M6502_CF;c->P=(c->P&~M6502_CF)|(c->AD&M6502_CF);c->AD=(c->AD>>1)|(ci<<7);}')), ALU('_m6502_adc(c,c->AD);', NF|VF|ZF|CF, CF|DF), SD('c->AD'))
 
 #-------------------------------------------------------------------------------
 def x_arr(o):
     # undocumented AND+ROR
     u_cmt(o,'ARR')
-    o.t('c->A&=_GD();_m6502_arr(c);')
+    o.t(C('c->A&=_GD();'), ALU('_m6502_arr(c);', NF|VF|ZF|CF, CF|DF))
 
 #-------------------------------------------------------------------------------
 def x_ane(o):
     # undocumented ANE
     u_cmt(o,'ANE')
-    o.t('c->A=(c->A|0xEE)&c->X&_GD();_NZ(c->A);')
+    o.t(Move('c->A','(c->A|0xEE)&c->X&_GD()'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def x_sha(o):
@@ -639,7 +731,7 @@ def x_sha(o):
     #  the operand +1 in memory
     #
     u_cmt(o,'SHA')
-    o.ta('_SD(c->A&c->X&(uint8_t)((_GA()>>8)+1));_WR();')
+    o.ta(SD('c->A&c->X&(uint8_t)((_GA()>>8)+1)'))
 
 #-------------------------------------------------------------------------------
 def x_shx(o):
@@ -648,7 +740,7 @@ def x_shx(o):
     # argument + 1. Store the result in memory.
     #
     u_cmt(o, 'SHX')
-    o.ta('_SD(c->X&(uint8_t)((_GA()>>8)+1));_WR();')
+    o.ta(SD('c->X&(uint8_t)((_GA()>>8)+1)'))
 
 #-------------------------------------------------------------------------------
 def x_shy(o):
@@ -657,7 +749,7 @@ def x_shy(o):
     # argument + 1. Store the result in memory.
     #
     u_cmt(o, 'SHY')
-    o.ta('_SD(c->Y&(uint8_t)((_GA()>>8)+1));_WR();')
+    o.ta(SD('c->Y&(uint8_t)((_GA()>>8)+1)'))
 
 #-------------------------------------------------------------------------------
 def x_shs(o):
@@ -667,7 +759,7 @@ def x_shs(o):
     # argument + 1. Store result in memory.
     #
     u_cmt(o, 'SHS')
-    o.ta('c->S=c->A&c->X;_SD(c->S&(uint8_t)((_GA()>>8)+1));_WR();')
+    o.ta(Move('c->S','c->A&c->X'), SD('c->S&(uint8_t)((_GA()>>8)+1)'))
 
 #-------------------------------------------------------------------------------
 def x_anc(o):
@@ -675,7 +767,7 @@ def x_anc(o):
     # AND byte with accumulator. If result is negative then carry is set.
     #
     u_cmt(o, 'ANC')
-    o.t('c->A&=_GD();_NZ(c->A);if(c->A&0x80){c->P|=M6502_CF;}else{c->P&=~M6502_CF;}')
+    o.t(C('c->A&=_GD();'), NZ('c->A'), Flags('if(c->A&0x80){c->P|=M6502_CF;}else{c->P&=~M6502_CF;}', CF, stmt=True))
 
 #-------------------------------------------------------------------------------
 def x_las(o):
@@ -684,19 +776,19 @@ def x_las(o):
     # register and stack pointer.
     #
     u_cmt(o, 'LAS')
-    o.t('c->A=c->X=c->S=_GD()&c->S;_NZ(c->A);')
+    o.t(Move('c->A=c->X=c->S','_GD()&c->S'), NZ('c->A'))
 
 #-------------------------------------------------------------------------------
 def x_jam(o):
     # undocumented JAM, next opcode byte read, data and addr bus set to all 1, execution stops
     u_cmt(o, 'JAM')
-    o.t('_SA(c->PC);')
-    o.t('_SAD(0xFFFF,0xFF);c->IR--;')
+    o.t(SA('c->PC'))
+    o.t(C('_SAD(0xFFFF,0xFF);c->IR--;'))
 
 #-------------------------------------------------------------------------------
 def i_bit(o):
     cmt(o,'BIT')
-    o.t('_m6502_bit(c,_GD());')
+    o.t(ALU('_m6502_bit(c,_GD());', NF|VF|ZF, keep=False))
 
 #-------------------------------------------------------------------------------
 def enc_op(op):
@@ -843,19 +935,21 @@ def enc_op(op):
             else:           u_isb(o)
     # fetch next opcode byte
     if mem_access in [M_R_,M___]:
-        o.ta('_FETCH();')
+        o.ta(Fetch())
     else:
-        o.t('_FETCH();')
+        o.t(Fetch())
+    elim_flags(o)
     return o
 
 #-------------------------------------------------------------------------------
 #   execution starts here
 #
+emitter = CEmitter()
 for op in range(0, 256):
-    write_op(enc_op(op))
+    write_op(enc_op(op), emitter)
 
 with open(InpPath, 'r') as inf:
     templ = Template(inf.read())
-    c_src = templ.safe_substitute(decode_block=out_lines)
+    c_src = templ.safe_substitute(decode_block=''.join(out_lines))
     with open(OutPath, 'w') as outf:
         outf.write(c_src)
@@ -0,0 +1,219 @@
+/*
+    pycpu.c
+
+    Shared library wrapper around the generated Z80 and 6502 emulators
+    for the Python module pycpu.py (which also builds this file).
+
+    Each CPU is attached to 64 KBytes of RAM, the Z80 additionally has
+    64K IO ports, reads and writes go straight into those arrays. The
+    host memory and the trap table live in the same struct as the CPU
+    state, so that Python can access them through zero-copy views, and
+    the run functions execute whole batches of ticks without calling
+    back into Python.
+
+    A trap is hit when an instruction at an address with a non-zero entry
+    in the traps table is about to be executed, the run functions return
+    early with the trap id in trap_id.
+
+    The Z80 can optionally use the LDIR/LDDR/CPIR/CPDR fast path (see
+    z80_bulk_cb() in z80.h), the results must be identical with and
+    without the fast path.
+*/
+#define CHIPS_IMPL
+#include "../chips/z80.h"
+#include "../chips/m6502.h"
+
+#if defined(_WIN32)
+#define PYCPU_API __declspec(dllexport)
+#else
+#define PYCPU_API __attribute__((visibility("default")))
+#endif
+
+/*=== Z80 ====================================================================*/
+typedef struct {
+    z80_t cpu;
+    uint64_t ticks;             /* total number of executed ticks */
+    uint8_t mem[1<<16];
+    uint8_t io[1<<16];          /* IO port values, written by OUT, read by IN */
+    uint8_t traps[1<<16];       /* trap id by instruction address, 0 for no trap */
+} pyz80_t;
+
+static uint64_t _pyz80_tick(int num_ticks, uint64_t pins, void* user_data) {
+    pyz80_t* sys = (pyz80_t*) user_data;
+    sys->ticks += num_ticks;
+    const uint16_t addr = Z80_GET_ADDR(pins);
+    if (pins & Z80_MREQ) {
+        if (pins & Z80_RD) {
+            Z80_SET_DATA(pins, sys->mem[addr]);
+        }
+        else if (pins & Z80_WR) {
+            sys->mem[addr] = Z80_GET_DATA(pins);
+        }
+    }
+    else if ((pins & (Z80_IORQ|Z80_M1)) == Z80_IORQ) {
+        if (pins & Z80_RD) {
+            Z80_SET_DATA(pins, sys->io[addr]);
+        }
+        else if (pins & Z80_WR) {
+            sys->io[addr] = Z80_GET_DATA(pins);
+        }
+    }
+    return pins;
+}
+
+static uint8_t* _pyz80_bulk(uint16_t addr, uint16_t* num_bytes, bool write, void* user_data) {
+    (void)num_bytes; (void)write;
+    return &((pyz80_t*)user_data)->mem[addr];
+}
+
+static int _pyz80_trap(uint16_t pc, uint32_t ticks, uint64_t pins, void* user_data) {
+    (void)ticks; (void)pins;
+    return ((pyz80_t*)user_data)->traps[pc];
+}
+
+PYCPU_API int pyz80_sizeof(void) {
+    return (int) sizeof(pyz80_t);
+}
+
+PYCPU_API void pyz80_init(pyz80_t* sys) {
+    memset(sys, 0, sizeof(pyz80_t));
+    z80_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.tick_cb = _pyz80_tick;
+    desc.user_data = sys;
+    z80_init(&sys->cpu, &desc);
+    z80_trap_cb(&sys->cpu, _pyz80_trap, sys);
+}
+
+/* run at least num_ticks, or until a trap is hit, returns executed ticks */
+PYCPU_API uint32_t pyz80_run(pyz80_t* sys, uint32_t num_ticks) {
+    return z80_exec(&sys->cpu, num_ticks);
+}
+
+/* enable or disable the block instruction fast path */
+PYCPU_API void pyz80_set_bulk(pyz80_t* sys, bool enabled) {
+    z80_bulk_cb(&sys->cpu, enabled ? _pyz80_bulk : 0, sys);
+}
+
+PYCPU_API bool pyz80_bulk(pyz80_t* sys) {
+    return 0 != sys->cpu.bulk_cb;
+}
+
+PYCPU_API int pyz80_trap_id(pyz80_t* sys) {
+    return sys->cpu.trap_id;
+}
+
+PYCPU_API uint64_t pyz80_ticks(pyz80_t* sys) {
+    return sys->ticks;
+}
+
+PYCPU_API z80_t* pyz80_cpu(pyz80_t* sys) {
+    return &sys->cpu;
+}
+
+PYCPU_API uint8_t* pyz80_mem(pyz80_t* sys) {
+    return sys->mem;
+}
+
+PYCPU_API uint8_t* pyz80_io(pyz80_t* sys) {
+    return sys->io;
+}
+
+PYCPU_API uint8_t* pyz80_traps(pyz80_t* sys) {
+    return sys->traps;
+}
+
+PYCPU_API void pyz80_save(pyz80_t* sys, pyz80_t* dst) {
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+}
+
+PYCPU_API void pyz80_load(pyz80_t* sys, const pyz80_t* src) {
+    z80_t cpu = sys->cpu;
+    *sys = *src;
+    z80_snapshot_onload(&sys->cpu, &cpu);
+}
+
+/*=== 6502 ===================================================================*/
+typedef struct {
+    m6502_t cpu;
+    uint64_t pins;
+    uint64_t ticks;             /* total number of executed ticks */
+    int trap_id;
+    uint8_t mem[1<<16];
+    uint8_t traps[1<<16];       /* trap id by instruction address, 0 for no trap */
+} pym6502_t;
+
+PYCPU_API int pym6502_sizeof(void) {
+    return (int) sizeof(pym6502_t);
+}
+
+/* the CPU starts with the reset sequence (which reads the reset vector at 0xFFFC) */
+PYCPU_API void pym6502_init(pym6502_t* sys) {
+    memset(sys, 0, sizeof(pym6502_t));
+    m6502_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    sys->pins = m6502_init(&sys->cpu, &desc);
+}
+
+/* run num_ticks, or until a trap is hit, returns executed ticks */
+PYCPU_API uint32_t pym6502_run(pym6502_t* sys, uint32_t num_ticks) {
+    uint64_t pins = sys->pins;
+    uint32_t ticks = 0;
+    sys->trap_id = 0;
+    while (ticks < num_ticks) {
+        pins = m6502_tick(&sys->cpu, pins);
+        const uint16_t addr = M6502_GET_ADDR(pins);
+        if (pins & M6502_RW) {
+            M6502_SET_DATA(pins, sys->mem[addr]);
+        }
+        else {
+            sys->mem[addr] = M6502_GET_DATA(pins);
+        }
+        ticks++;
+        if ((pins & M6502_SYNC) && sys->traps[addr]) {
+            sys->trap_id = sys->traps[addr];
+            break;
+        }
+    }
+    sys->pins = pins;
+    sys->ticks += ticks;
+    return ticks;
+}
+
+/* continue execution at a new address (only between instructions) */
+PYCPU_API void pym6502_set_pc(pym6502_t* sys, uint16_t pc) {
+    m6502_set_pc(&sys->cpu, pc);
+    sys->pins = M6502_MAKE_PINS(M6502_SYNC|M6502_RW, pc, sys->mem[pc]);
+}
+
+PYCPU_API int pym6502_trap_id(pym6502_t* sys) {
+    return sys->trap_id;
+}
+
+PYCPU_API uint64_t pym6502_ticks(pym6502_t* sys) {
+    return sys->ticks;
+}
+
+PYCPU_API m6502_t* pym6502_cpu(pym6502_t* sys) {
+    return &sys->cpu;
+}
+
+PYCPU_API uint8_t* pym6502_mem(pym6502_t* sys) {
+    return sys->mem;
+}
+
+PYCPU_API uint8_t* pym6502_traps(pym6502_t* sys) {
+    return sys->traps;
+}
+
+PYCPU_API void pym6502_save(pym6502_t* sys, pym6502_t* dst) {
+    *dst = *sys;
+    m6502_snapshot_onsave(&dst->cpu);
+}
+
+PYCPU_API void pym6502_load(pym6502_t* sys, const pym6502_t* src) {
+    m6502_t cpu = sys->cpu;
+    *sys = *src;
+    m6502_snapshot_onload(&sys->cpu, &cpu);
+}
@@ -0,0 +1,224 @@
+#-------------------------------------------------------------------------------
+#   pycpu.py
+#   Python bindings for the generated Z80 and 6502 emulators.
+#
+#   Run 'python pycpu.py' to compile pycpu.c (with chips/z80.h and
+#   chips/m6502.h) into a shared library next to this file, the library
+#   is also (re-)built automatically when the module is first used and
+#   the library is missing or older than its sources. Set the CC
+#   environment variable to use a different C compiler than 'cc'.
+#
+#   The CPU state, memory, IO ports and trap tables are exposed as
+#   memoryviews directly on the emulator's memory (no copying), use
+#   numpy.frombuffer(cpu.mem, dtype=numpy.uint8) to get a numpy array
+#   on the same memory. The run(ticks) functions execute a whole batch
+#   of ticks in C, without calling back into Python.
+#
+#   Example:
+#
+#       from pycpu import Z80
+#       cpu = Z80()
+#       cpu.mem[0x0100:0x0100+len(prog)] = prog
+#       cpu.traps[0x0000] = 1
+#       cpu.pc = 0x0100
+#       while cpu.trap_id == 0:
+#           cpu.run(100000)
+#-------------------------------------------------------------------------------
+import ctypes
+import os
+import subprocess
+import sys
+
+Dir = os.path.dirname(os.path.abspath(__file__))
+SrcPath = os.path.join(Dir, 'pycpu.c')
+Deps = [SrcPath, os.path.join(Dir, '../chips/z80.h'), os.path.join(Dir, '../chips/m6502.h')]
+if sys.platform == 'win32':
+    LibPath = os.path.join(Dir, 'pycpu.dll')
+elif sys.platform == 'darwin':
+    LibPath = os.path.join(Dir, 'libpycpu.dylib')
+else:
+    LibPath = os.path.join(Dir, 'libpycpu.so')
+
+# register accessor functions, name => (ctypes type, has setter)
+Z80Regs = {
+    'a': (ctypes.c_uint8, True), 'f': (ctypes.c_uint8, True),
+    'b': (ctypes.c_uint8, True), 'c': (ctypes.c_uint8, True),
+    'd': (ctypes.c_uint8, True), 'e': (ctypes.c_uint8, True),
+    'h': (ctypes.c_uint8, True), 'l': (ctypes.c_uint8, True),
+    'af': (ctypes.c_uint16, True), 'bc': (ctypes.c_uint16, True),
+    'de': (ctypes.c_uint16, True), 'hl': (ctypes.c_uint16, True),
+    'af_': (ctypes.c_uint16, True), 'bc_': (ctypes.c_uint16, True),
+    'de_': (ctypes.c_uint16, True), 'hl_': (ctypes.c_uint16, True),
+    'ix': (ctypes.c_uint16, True), 'iy': (ctypes.c_uint16, True),
+    'sp': (ctypes.c_uint16, True), 'pc': (ctypes.c_uint16, True),
+    'wz': (ctypes.c_uint16, True), 'ir': (ctypes.c_uint16, False),
+    'i': (ctypes.c_uint8, True), 'r': (ctypes.c_uint8, True),
+    'im': (ctypes.c_uint8, True),
+    'iff1': (ctypes.c_bool, True), 'iff2': (ctypes.c_bool, True),
+    'ei_pending': (ctypes.c_bool, True),
+}
+M6502Regs = {
+    'a': (ctypes.c_uint8, True), 'x': (ctypes.c_uint8, True),
+    'y': (ctypes.c_uint8, True), 's': (ctypes.c_uint8, True),
+    'p': (ctypes.c_uint8, True), 'pc': (ctypes.c_uint16, False),
+}
+
+_lib = None
+
+#-------------------------------------------------------------------------------
+def build(force=False) :
+    '''compile the shared library if it is missing or outdated'''
+    if not force and os.path.exists(LibPath) :
+        lib_time = os.path.getmtime(LibPath)
+        if all(os.path.getmtime(dep) <= lib_time for dep in Deps) :
+            return LibPath
+    cc = os.environ.get('CC', 'cc')
+    cmd = [cc, '-O2', '-shared', '-fPIC', '-o', LibPath, SrcPath]
+    subprocess.check_call(cmd)
+    return LibPath
+
+#-------------------------------------------------------------------------------
+def _declare(lib, prefix, regs) :
+    '''declare the argument and result types of the library functions'''
+    # NOTE: lib[name] would return a new function object each time, only
+    # the function objects returned by getattr() keep the declared types
+    p = ctypes.c_void_p
+    def fn(name, argtypes, restype=None) :
+        f = getattr(lib, name)
+        f.argtypes = argtypes
+        f.restype = restype
+    fn(prefix+'sizeof', [], ctypes.c_int)
+    fn(prefix+'init', [p])
+    fn(prefix+'run', [p, ctypes.c_uint32], ctypes.c_uint32)
+    fn(prefix+'trap_id', [p], ctypes.c_int)
+    fn(prefix+'ticks', [p], ctypes.c_uint64)
+    for name in ['cpu', 'mem', 'traps'] :
+        fn(prefix+name, [p], p)
+    for name in ['save', 'load'] :
+        fn(prefix+name, [p, p])
+    cpu_prefix = prefix[2:]
+    for reg, (ctype, has_setter) in regs.items() :
+        fn(cpu_prefix+reg, [p], ctype)
+        if has_setter :
+            fn(cpu_prefix+'set_'+reg, [p, ctype])
+
+def load() :
+    '''build if necessary, and load the shared library'''
+    global _lib
+    if _lib is None :
+        lib = ctypes.CDLL(build())
+        _declare(lib, 'pyz80_', Z80Regs)
+        lib.pyz80_io.argtypes = [ctypes.c_void_p]
+        lib.pyz80_io.restype = ctypes.c_void_p
+        lib.pyz80_set_bulk.argtypes = [ctypes.c_void_p, ctypes.c_bool]
+        lib.pyz80_bulk.argtypes = [ctypes.c_void_p]
+        lib.pyz80_bulk.restype = ctypes.c_bool
+        _declare(lib, 'pym6502_', M6502Regs)
+        lib.pym6502_set_pc.argtypes = [ctypes.c_void_p, ctypes.c_uint16]
+        _lib = lib
+    return _lib
+
+def _view(owner, addr, size) :
+    '''a writable byte memoryview on emulator memory, keeps the owner alive'''
+    arr = (ctypes.c_uint8 * size).from_address(addr)
+    arr._owner = owner
+    return memoryview(arr).cast('B')
+
+def _reg_property(cpu_prefix, reg, has_setter) :
+    getter = cpu_prefix + reg
+    setter = cpu_prefix + 'set_' + reg
+    def get(self) :
+        return getattr(self._lib, getter)(self._cpu)
+    def set(self, val) :
+        getattr(self._lib, setter)(self._cpu, val)
+    return property(get, set if has_setter else None)
+
+#-------------------------------------------------------------------------------
+class _CPU(object) :
+    '''common base class of the Z80 and M6502 classes'''
+    _prefix = None
+
+    def __init__(self) :
+        self._lib = load()
+        self._size = self._fn('sizeof')()
+        self._buf = ctypes.create_string_buffer(self._size)
+        self._ptr = ctypes.addressof(self._buf)
+        self._fn('init')(self._ptr)
+        self._cpu = self._fn('cpu')(self._ptr)
+        self._run = self._fn('run')
+        self.mem = _view(self._buf, self._fn('mem')(self._ptr), 1<<16)
+        self.traps = _view(self._buf, self._fn('traps')(self._ptr), 1<<16)
+
+    def _fn(self, name) :
+        return getattr(self._lib, self._prefix + name)
+
+    def run(self, ticks) :
+        '''run for at least the number of ticks or until a trap is hit, returns executed ticks'''
+        return self._run(self._ptr, ticks)
+
+    @property
+    def trap_id(self) :
+        '''the trap id set by the last run() call, 0 if no trap was hit'''
+        return self._fn('trap_id')(self._ptr)
+
+    @property
+    def ticks(self) :
+        '''the total number of executed ticks'''
+        return self._fn('ticks')(self._ptr)
+
+    @property
+    def state(self) :
+        '''a memoryview on the complete emulator state (CPU, memory and traps)'''
+        return _view(self._buf, self._ptr, self._size)
+
+    def save(self) :
+        '''return a snapshot of the emulator state as bytes'''
+        dst = ctypes.create_string_buffer(self._size)
+        self._fn('save')(self._ptr, ctypes.addressof(dst))
+        return dst.raw
+
+    def load(self, snapshot) :
+        '''load a snapshot created by save() (also from another instance)'''
+        assert len(snapshot) == self._size
+        src = ctypes.create_string_buffer(bytes(snapshot), self._size)
+        self._fn('load')(self._ptr, ctypes.addressof(src))
+
+class Z80(_CPU) :
+    '''a Z80 CPU with 64 KBytes RAM and 64K IO ports'''
+    _prefix = 'pyz80_'
+
+    def __init__(self) :
+        super(Z80, self).__init__()
+        self.io = _view(self._buf, self._lib.pyz80_io(self._ptr), 1<<16)
+
+    @property
+    def bulk(self) :
+        '''True if the LDIR/LDDR/CPIR/CPDR fast path is enabled'''
+        return self._lib.pyz80_bulk(self._ptr)
+
+    @bulk.setter
+    def bulk(self, enabled) :
+        self._lib.pyz80_set_bulk(self._ptr, enabled)
+
+class M6502(_CPU) :
+    '''a 6502 CPU with 64 KBytes RAM, starts with the reset sequence'''
+    _prefix = 'pym6502_'
+
+    @property
+    def pc(self) :
+        return self._lib.m6502_pc(self._cpu)
+
+    @pc.setter
+    def pc(self, val) :
+        '''continue execution at a new address'''
+        self._lib.pym6502_set_pc(self._ptr, val)
+
+for reg, (ctype, has_setter) in Z80Regs.items() :
+    setattr(Z80, reg, _reg_property('z80_', reg, has_setter))
+for reg, (ctype, has_setter) in M6502Regs.items() :
+    if reg != 'pc' :
+        setattr(M6502, reg, _reg_property('m6502_', reg, has_setter))
+
+#-------------------------------------------------------------------------------
+if __name__ == '__main__' :
+    print(build(force=True))
@@ -0,0 +1,201 @@
+#-------------------------------------------------------------------------------
+#   pycpu_runner.py
+#   Run a corpus of test programs on the generated emulators in parallel.
+#
+#   Usage:
+#
+#       python pycpu_runner.py corpus.json [-j jobs] [-o results.jsonl] [--bless out.json]
+#
+#   The corpus is a JSON file with a list of jobs, each job is a dictionary
+#   with the following items (numbers can also be hex strings like "0x100",
+#   file paths are relative to the corpus file):
+#
+#       name:       unique name of the test
+#       cpu:        "z80" or "6502"
+#       file:       a binary file loaded into memory at 'load'
+#       load:       the load address (default 0x0100 for CP/M, otherwise 0)
+#       start:      start address (default: the load address on Z80,
+#                   the reset vector at 0xFFFC on the 6502)
+#       snapshot:   instead of file/load/start, a snapshot file written by
+#                   the save() method of pycpu.Z80 or pycpu.M6502
+#       cpm:        true to run a Z80 CP/M program (console output through
+#                   BDOS functions 2 and 9, exit through a jump to 0x0000)
+#       exit:       list of addresses which end the test (status 'done')
+#       pass:       list of addresses which end the test with status 'pass'
+#       fail:       list of addresses which end the test with status 'fail'
+#       max_ticks:  the test ends with status 'timeout' after this number
+#                   of ticks (default: 10^10)
+#       crc_range:  [start, end) memory range included in the result CRC
+#       crc:        the expected result CRC, a mismatch results in 'fail'
+#
+#   The result CRC is the CRC32 over the console output followed by the
+#   crc_range memory bytes. The jobs are distributed over a pool of worker
+#   processes (one per CPU core by default), and each finished job is written
+#   immediately as one JSON line to the results file (or stdout), so that
+#   partial results are available while the corpus is still running.
+#
+#   The typical workflow to check a code generator change is to run the
+#   corpus once before the change with '--bless', which writes a copy of
+#   the corpus with the observed CRCs as expected values, and then
+#   run the blessed corpus after the change.
+#-------------------------------------------------------------------------------
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+
+import pycpu
+
+# trap ids
+TrapExit = 1
+TrapPass = 2
+TrapFail = 3
+TrapBDOS = 4
+TrapStatus = { TrapExit: 'done', TrapPass: 'pass', TrapFail: 'fail' }
+
+# number of ticks executed per run() call
+TicksPerRun = 1<<20
+DefaultMaxTicks = 10000000000
+
+#-------------------------------------------------------------------------------
+def num(val) :
+    '''convert a JSON number or hex string to an int'''
+    return int(val, 0) if isinstance(val, str) else int(val)
+
+def setup(job, base_dir) :
+    '''create and initialize the emulator for a job'''
+    if job['cpu'] == 'z80' :
+        cpu = pycpu.Z80()
+    elif job['cpu'] == '6502' :
+        cpu = pycpu.M6502()
+    else :
+        raise ValueError("unknown cpu '{}'".format(job['cpu']))
+    cpm = job.get('cpm', False)
+    if 'snapshot' in job :
+        with open(os.path.join(base_dir, job['snapshot']), 'rb') as f :
+            cpu.load(f.read())
+    else :
+        with open(os.path.join(base_dir, job['file']), 'rb') as f :
+            data = f.read()
+        load = num(job.get('load', 0x0100 if cpm else 0))
+        cpu.mem[load:load+len(data)] = data
+        if 'start' in job :
+            cpu.pc = num(job['start'])
+        elif job['cpu'] == 'z80' :
+            cpu.pc = load
+        if cpm :
+            # stack below the BDOS entry, which is a trap followed by a RET
+            cpu.mem[0x0005] = 0xC9
+            cpu.mem[0x0006] = 0x00
+            cpu.mem[0x0007] = 0xF0
+            cpu.sp = 0xF000
+    if cpm :
+        cpu.traps[0x0000] = TrapExit
+        cpu.traps[0x0005] = TrapBDOS
+    for key, trap_id in (('exit', TrapExit), ('pass', TrapPass), ('fail', TrapFail)) :
+        for addr in job.get(key, []) :
+            cpu.traps[num(addr)] = trap_id
+    return cpu
+
+def bdos(cpu, output) :
+    '''handle a CP/M BDOS call, the RET at 0x0005 returns to the caller'''
+    if cpu.c == 2 :
+        output.append(cpu.e)
+    elif cpu.c == 9 :
+        addr = cpu.de
+        while cpu.mem[addr] != ord('$') :
+            output.append(cpu.mem[addr])
+            addr = (addr + 1) & 0xFFFF
+    # step over the trap, the next run() executes the RET
+    cpu.traps[0x0005] = 0
+    cpu.run(1)
+    cpu.traps[0x0005] = TrapBDOS
+
+def run_job(args) :
+    '''run a single job in a worker process, returns the result dictionary'''
+    job, base_dir = args
+    result = { 'name': job['name'] }
+    start_time = time.time()
+    try :
+        cpu = setup(job, base_dir)
+        max_ticks = num(job.get('max_ticks', DefaultMaxTicks))
+        output = bytearray()
+        status = 'timeout'
+        while cpu.ticks < max_ticks :
+            cpu.run(min(TicksPerRun, max_ticks - cpu.ticks))
+            trap_id = cpu.trap_id
+            if trap_id == TrapBDOS :
+                bdos(cpu, output)
+            elif trap_id != 0 :
+                status = TrapStatus[trap_id]
+                break
+        crc = zlib.crc32(bytes(output))
+        if 'crc_range' in job :
+            start, end = [num(x) for x in job['crc_range']]
+            crc = zlib.crc32(cpu.mem[start:end], crc)
+        if 'crc' in job and status in ('done', 'pass') and num(job['crc']) != crc :
+            status = 'fail'
+        result['status'] = status
+        result['crc'] = '0x{:08X}'.format(crc)
+        result['ticks'] = cpu.ticks
+        result['pc'] = cpu.pc
+        if output :
+            result['output'] = output.decode('latin-1')
+    except Exception as e :
+        result['status'] = 'error'
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = round(time.time() - start_time, 3)
+    return result
+
+#-------------------------------------------------------------------------------
+def main() :
+    parser = argparse.ArgumentParser(description='run a test program corpus on the generated emulators')
+    parser.add_argument('corpus', help='JSON file with the list of jobs')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-o', '--output', help='JSON lines results file (default: stdout)')
+    parser.add_argument('--bless', metavar='PATH', help='write the corpus with the observed CRCs as expected values')
+    args = parser.parse_args()
+
+    with open(args.corpus, 'r') as f :
+        jobs = json.load(f)
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names) :
+        sys.exit('error: job names in {} are not unique'.format(args.corpus))
+    base_dir = os.path.dirname(os.path.abspath(args.corpus))
+
+    # build the library once before the worker processes start
+    pycpu.build()
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    counts = {}
+    crcs = {}
+    pool = multiprocessing.Pool(args.jobs)
+    try :
+        for result in pool.imap_unordered(run_job, [(job, base_dir) for job in jobs]) :
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            if result['status'] in ('done', 'pass') :
+                crcs[result['name']] = result['crc']
+    finally :
+        pool.close()
+        pool.join()
+        if out is not sys.stdout :
+            out.close()
+    summary = ', '.join('{} {}'.format(n, s) for s, n in sorted(counts.items()))
+    sys.stderr.write('{} jobs: {}\n'.format(len(jobs), summary))
+
+    if args.bless :
+        for job in jobs :
+            if job['name'] in crcs :
+                job['crc'] = crcs[job['name']]
+        with open(args.bless, 'w') as f :
+            json.dump(jobs, f, indent=2)
+    bad = sum(n for s, n in counts.items() if s not in ('done', 'pass'))
+    sys.exit(1 if bad else 0)
+
+if __name__ == '__main__' :
+    main()
@@ -104,6 +104,58 @@
         Set a null ptr as trap callback disables the trap checking.
         To get the current trap callback, simply access z80_t.trap_cb directly.
 
+    ~~~C
+    void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data)
+    ~~~
+        Set an optional callback which enables a fast path for the repeating
+        block instructions LDIR, LDDR, CPIR and CPDR. After the first
+        iteration of such an instruction, the CPU asks the callback for
+        direct access to the memory which the following iterations will
+        read or write:
+
+            ~~~C
+            uint8_t* bulk_cb(uint16_t addr, uint16_t* num_bytes, bool write, void* user_data)
+            ~~~
+
+        The requested range starts at 'addr', is *num_bytes long and never
+        crosses a 256-byte page boundary (for LDDR and CPDR the range ends
+        at the current HL or DE register value). The callback should return
+        a host pointer to the memory byte at 'addr' if the whole range is
+        plain memory without side effects on reads and writes (and without
+        wait states), otherwise it should return a null pointer. The
+        callback may reduce *num_bytes (but not to zero) to limit the number
+        of bytes the CPU processes in one go, for instance to limit the
+        number of ticks until the system needs to see the next tick
+        callback (each byte takes Z80_BULK_TICKS ticks), the returned
+        pointer must still be valid for the whole requested range.
+
+        If both the source and destination range are accessible, the CPU
+        performs the iterations directly on host memory, updates the
+        registers and flags exactly like the regular instruction
+        execution, and invokes the tick callback once for all the ticks of
+        the iterations (without control pins set). The memory accesses and
+        opcode fetches of those iterations aren't visible to the tick
+        callback, and the trap callback is only called once per chunk of
+        iterations. Interrupt requests are checked between chunks. If the
+        callback returns a null pointer the remaining iterations are
+        executed normally. The fast path is never used for INIR, INDR,
+        OTIR and OTDR, since IO requests must always go through the tick
+        callback.
+
+        The memory system in mem.h has a helper function mem_bulk_ptr()
+        to implement the callback.
+
+    ~~~C
+    void z80_snapshot_onsave(z80_t* snapshot)
+    void z80_snapshot_onload(z80_t* snapshot, z80_t* sys)
+    ~~~
+        Helper functions for saving and loading system snapshots. A snapshot
+        of a z80_t is a plain copy of the struct, call z80_snapshot_onsave()
+        on the copy to clear the host pointers (tick- and trap-callbacks, and
+        their user data). Before a snapshot is copied back into a running
+        z80_t instance, call z80_snapshot_onload() on the snapshot to take
+        the host pointers over from the running instance.
+
     ## Macros
     ~~~C
     Z80_SET_ADDR(pins, addr)
@@ -311,6 +363,10 @@ extern "C" {
 /*--- callback function typedefs ---*/
 typedef uint64_t (*z80_tick_t)(int num_ticks, uint64_t pins, void* user_data);
 typedef int (*z80_trap_t)(uint16_t pc, uint32_t ticks, uint64_t pins, void* trap_user_data);
+typedef uint8_t* (*z80_bulk_t)(uint16_t addr, uint16_t* num_bytes, bool write, void* bulk_user_data);
+
+/* number of ticks per byte in the LDIR/LDDR/CPIR/CPDR fast path */
+#define Z80_BULK_TICKS (21)
 
 /*--- address bus pins ---*/
 #define Z80_A0  (1ULL<<0)
@@ -399,6 +455,8 @@ typedef struct {
     z80_trap_t trap_cb;
     void* trap_user_data;
     int trap_id;                /* != 0 if a trap has been hit */
+    z80_bulk_t bulk_cb;
+    void* bulk_user_data;
 } z80_t;
 
 /* initialize a new z80 instance */
@@ -407,10 +465,16 @@ void z80_init(z80_t* cpu, const z80_desc_t* desc);
 void z80_reset(z80_t* cpu);
 /* set optional trap callback function */
 void z80_trap_cb(z80_t* cpu, z80_trap_t trap_cb, void* trap_user_data);
+/* set optional callback for the LDIR/LDDR/CPIR/CPDR fast path */
+void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data);
 /* execute instructions for at least 'ticks', but at least one, return executed ticks */
 uint32_t z80_exec(z80_t* cpu, uint32_t ticks);
 /* return false if z80_exec() returned in the middle of an extended instruction */
 bool z80_opdone(z80_t* cpu);
+/* clear host pointers in a snapshot before saving */
+void z80_snapshot_onsave(z80_t* snapshot);
+/* restore host pointers in a snapshot from the running instance before loading */
+void z80_snapshot_onload(z80_t* snapshot, z80_t* sys);
 
 /* register access functions */
 void z80_set_a(z80_t* cpu, uint8_t v);
@@ -505,6 +569,18 @@ bool z80_ei_pending(z80_t* cpu);
     #define CHIPS_ASSERT(c) assert(c)
 #endif
 
+/* 1 if z80_exec() keeps the registers in separate local variables
+   instead of the 64-bit register banks (z80_gen.py --regs locals)
+*/
+#define _Z80_REGS_LOCALS ($regs_locals)
+/* 1 if the 8-bit ADD, ADC, SUB, SBC, CP, NEG and DAA instructions get
+   their flags from lookup tables (z80_gen.py --alu-flags table)
+*/
+#define _Z80_FLAG_TABLES ($flag_tables)
+#if _Z80_FLAG_TABLES
+static void _z80_init_flag_tables(void);
+#endif
+
 /* register locations in register banks */
 #define _A (0)
 #define _F (8)
@@ -540,6 +616,54 @@ bool z80_ei_pending(z80_t* cpu);
 #define _BITS_USE_IXIY  (_BIT_USE_IX|_BIT_USE_IY)
 
 /* register setter/getter shortcut macros */
+#if _Z80_REGS_LOCALS
+/* HL is the 'working set' HL which is renamed to IX or IY by the DD and FD
+   prefixes, while a prefix is active reg_hl holds the actual HL register
+*/
+#define _S_A(val)  reg_a=(uint8_t)(val)
+#define _S_F(val)  reg_f=(uint8_t)(val)
+#define _S_L(val)  reg_l=(uint8_t)(val)
+#define _S_H(val)  reg_h=(uint8_t)(val)
+#define _S_E(val)  reg_e=(uint8_t)(val)
+#define _S_D(val)  reg_d=(uint8_t)(val)
+#define _S_C(val)  reg_c=(uint8_t)(val)
+#define _S_B(val)  reg_b=(uint8_t)(val)
+#define _S_FA(val) {const uint16_t _v16=(uint16_t)(val);reg_f=(uint8_t)(_v16>>8);reg_a=(uint8_t)_v16;}
+#define _S_HL(val) {const uint16_t _v16=(uint16_t)(val);reg_h=(uint8_t)(_v16>>8);reg_l=(uint8_t)_v16;}
+#define _S_DE(val) {const uint16_t _v16=(uint16_t)(val);reg_d=(uint8_t)(_v16>>8);reg_e=(uint8_t)_v16;}
+#define _S_BC(val) {const uint16_t _v16=(uint16_t)(val);reg_b=(uint8_t)(_v16>>8);reg_c=(uint8_t)_v16;}
+#define _S_WZ(val) reg_wz=(uint16_t)(val)
+#define _S_IX(val) reg_ix=(uint16_t)(val)
+#define _S_IY(val) reg_iy=(uint16_t)(val)
+#define _S_SP(val) reg_sp=(uint16_t)(val)
+#define _S_IM(val) reg_im=(uint8_t)(val)
+#define _S_I(val)  reg_i=(uint8_t)(val)
+#define _S_R(val)  reg_r=(uint8_t)(val)
+#define _S_H0(val) reg_hl=(uint16_t)((reg_hl&0x00FF)|(((val)&0xFF)<<8))
+#define _S_L0(val) reg_hl=(uint16_t)((reg_hl&0xFF00)|((val)&0xFF))
+#define _G_A()  reg_a
+#define _G_F()  reg_f
+#define _G_L()  reg_l
+#define _G_H()  reg_h
+#define _G_E()  reg_e
+#define _G_D()  reg_d
+#define _G_C()  reg_c
+#define _G_B()  reg_b
+#define _G_FA() ((uint16_t)((reg_f<<8)|reg_a))
+#define _G_HL() ((uint16_t)((reg_h<<8)|reg_l))
+#define _G_DE() ((uint16_t)((reg_d<<8)|reg_e))
+#define _G_BC() ((uint16_t)((reg_b<<8)|reg_c))
+#define _G_WZ() reg_wz
+#define _G_IX() reg_ix
+#define _G_IY() reg_iy
+#define _G_SP() reg_sp
+#define _G_IM() reg_im
+#define _G_I()  reg_i
+#define _G_R()  reg_r
+#define _G_IR() ((uint16_t)((reg_i<<8)|reg_r))
+#define _G_H0() ((uint8_t)(reg_hl>>8))
+#define _G_L0() ((uint8_t)reg_hl)
+#else
 #define _S_A(val)  _S8(ws,_A,val)
 #define _S_F(val)  _S8(ws,_F,val)
 #define _S_L(val)  _S8(ws,_L,val)
@@ -560,7 +684,6 @@ bool z80_ei_pending(z80_t* cpu);
 #define _S_I(val)  _S8(r2,_I,val)
 #define _S_R(val)  _S8(r2,_R,val)
 #define _S_IR(val) _S16(r2,_IR,val)
-#define _S_PC(val) _S16(r2,_PC,val)
 #define _G_A()  _G8(ws,_A)
 #define _G_F()  _G8(ws,_F)
 #define _G_L()  _G8(ws,_L)
@@ -581,7 +704,12 @@ bool z80_ei_pending(z80_t* cpu);
 #define _G_I()  _G8(r2,_I)
 #define _G_R()  _G8(r2,_R)
 #define _G_IR() _G16(r2,_IR)
-#define _G_PC() _G16(r2,_PC)
+/* the actual H and L registers while an index prefix is active */
+#define _S_H0(val) _S8(r0,_H,val)
+#define _S_L0(val) _S8(r0,_L,val)
+#define _G_H0() _G8(r0,_H)
+#define _G_L0() _G8(r0,_L)
+#endif
 
 /* set 8-bit immediate value in 64-bit register bank */
 #define _S8(bank,shift,val) bank=(((bank)&~(0xFFULL<<(shift)))|(((val)&0xFFULL)<<(shift)))
@@ -620,9 +748,13 @@ bool z80_ei_pending(z80_t* cpu);
 /* true if current op is an indexed op */
 #define _IDX() (0!=(r2&_BITS_USE_IXIY))
 /* generate effective address for (HL), (IX+d), (IY+d) */
-#define _ADDR(addr,ext_ticks) {addr=_G16(ws,_HL);if(_IDX()){int8_t d;_MR(pc++,d);addr+=d;_S_WZ(addr);_T(ext_ticks);}}
+#define _ADDR(addr,ext_ticks) {addr=_G_HL();if(_IDX()){int8_t d;_MR(pc++,d);addr+=d;_S_WZ(addr);_T(ext_ticks);}}
 /* helper macro to bump R register */
+#if _Z80_REGS_LOCALS
+#define _BUMPR() reg_r=(reg_r&0x80)|((reg_r+1)&0x7F)
+#else
 #define _BUMPR() d8=_G8(r2,_R);d8=(d8&0x80)|((d8+1)&0x7F);_S8(r2,_R,d8)
+#endif
 /* a normal opcode fetch, bump R */
 #ifdef CHIPS_Z80_RFSH
 #define _FETCH(op) {_SA(pc++);_TWM(3,Z80_M1|Z80_MREQ|Z80_RD);op=_GD();_SA(_G_I()<<8|_G_R());_TM(1,Z80_MREQ|Z80_RFSH);_BUMPR();}
@@ -631,6 +763,16 @@ bool z80_ei_pending(z80_t* cpu);
 #endif
 /* special opcode fetch for CB prefix, only bump R if not a DD/FD+CB 'double prefix' op */
 #define _FETCH_CB(op) {_SA(pc++);_TWM(4,Z80_M1|Z80_MREQ|Z80_RD);op=_GD();if(!_IDX()){_BUMPR();}}
+/* true if the end-of-instruction checks would do nothing (no interrupt
+   request, no index prefix, and the tick budget isn't exhausted), so that
+   the first instruction of a fused pair may directly continue with the
+   next instruction
+*/
+#define _CHAIN() ((ticks<num_ticks)&&!_IDX()&&!(pins&(Z80_INT|Z80_NMI)))
+/* true if the block instruction fast path may execute the next chunk */
+#define _BULK() (bulk&&(ticks<num_ticks)&&!(pins&(Z80_INT|Z80_NMI)))
+/* call the trap callback at the end of a chained instruction */
+#define _TRAP() if(trap){int trap_id=trap(pc,ticks,pins,cpu->trap_user_data);if(trap_id){cpu->trap_id=trap_id;goto trapped;}}
 /* evaluate S+Z flags */
 #define _SZ(val) ((val&0xFF)?(val&Z80_SF):Z80_ZF)
 /* evaluate SZYXCH flags */
@@ -711,6 +853,9 @@ void z80_init(z80_t* cpu, const z80_desc_t* desc) {
     CHIPS_ASSERT(cpu && desc);
     CHIPS_ASSERT(desc->tick_cb);
     memset(cpu, 0, sizeof(*cpu));
+    #if _Z80_FLAG_TABLES
+    _z80_init_flag_tables();
+    #endif
     z80_reset(cpu);
     cpu->tick_cb = desc->tick_cb;
     cpu->user_data = desc->user_data;
@@ -742,10 +887,50 @@ void z80_trap_cb(z80_t* cpu, z80_trap_t trap_cb, void* trap_user_data) {
     cpu->trap_user_data = trap_user_data;
 }
 
+void z80_bulk_cb(z80_t* cpu, z80_bulk_t bulk_cb, void* bulk_user_data) {
+    CHIPS_ASSERT(cpu);
+    cpu->bulk_cb = bulk_cb;
+    cpu->bulk_user_data = bulk_user_data;
+}
+
 bool z80_opdone(z80_t* cpu) {
     return 0 == (cpu->im_ir_pc_bits & _BITS_USE_IXIY);
 }
 
+void z80_snapshot_onsave(z80_t* snapshot) {
+    CHIPS_ASSERT(snapshot);
+    snapshot->tick_cb = 0;
+    snapshot->user_data = 0;
+    snapshot->trap_cb = 0;
+    snapshot->trap_user_data = 0;
+    snapshot->bulk_cb = 0;
+    snapshot->bulk_user_data = 0;
+}
+
+void z80_snapshot_onload(z80_t* snapshot, z80_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->tick_cb = sys->tick_cb;
+    snapshot->user_data = sys->user_data;
+    snapshot->trap_cb = sys->trap_cb;
+    snapshot->trap_user_data = sys->trap_user_data;
+    snapshot->bulk_cb = sys->bulk_cb;
+    snapshot->bulk_user_data = sys->bulk_user_data;
+}
+
+/* get a host pointer to the byte at addr for the next num bytes (ascending),
+   or the previous num bytes (descending) of a bulk block instruction
+*/
+static inline uint8_t* _z80_bulk_ptr(z80_t* cpu, uint16_t addr, uint16_t* num, bool write, bool desc) {
+    if (desc) {
+        const uint16_t num_req = *num;
+        uint8_t* ptr = cpu->bulk_cb((uint16_t)(addr-num_req+1), num, write, cpu->bulk_user_data);
+        return ptr ? (ptr + num_req - 1) : 0;
+    }
+    else {
+        return cpu->bulk_cb(addr, num, write, cpu->bulk_user_data);
+    }
+}
+
 /* sign+zero+parity lookup table */
 static uint8_t _z80_szp[256] = {
   0x44,0x00,0x00,0x04,0x00,0x04,0x04,0x00,0x08,0x0c,0x0c,0x08,0x0c,0x08,0x08,0x0c,
@@ -766,11 +951,9 @@ static uint8_t _z80_szp[256] = {
   0xa4,0xa0,0xa0,0xa4,0xa0,0xa4,0xa4,0xa0,0xa8,0xac,0xac,0xa8,0xac,0xa8,0xa8,0xac,
 };
 
-/* DAA instruction */
-static inline uint64_t _z80_daa(uint64_t ws) {
-    uint8_t a = _G8(ws,_A);
+/* DAA instruction, returns the new F and A register values (F in the upper byte) */
+static inline uint16_t _z80_daa(uint8_t a, uint8_t f) {
     uint8_t v = a;
-    uint8_t f = _G8(ws,_F);
     if (f & Z80_NF) {
         if (((a & 0xF)>0x9) || (f & Z80_HF)) {
             v -= 0x06;
@@ -791,11 +974,48 @@ static inline uint64_t _z80_daa(uint64_t ws) {
     f |= (a>0x99) ? Z80_CF : 0;
     f |= (a ^ v) & Z80_HF;
     f |= _z80_szp[v];
-    _S8(ws,_A,v);
-    _S8(ws,_F,f);
-    return ws;
+    return (uint16_t)((f<<8)|v);
 }
 
+#if _Z80_FLAG_TABLES
+/* flags of the 8-bit add and subtract instructions, indexed by
+   (carry-in<<16)|(A<<8)|operand (128 KBytes each), and result F and A
+   of DAA (F in the upper byte), indexed by the N, H and C flags and A
+   (4 KBytes), initialized by the first call to z80_init()
+*/
+static uint8_t _z80_add_flags[1<<17];
+static uint8_t _z80_sub_flags[1<<17];
+static uint16_t _z80_daa_fa[1<<11];
+static bool _z80_flag_tables_valid;
+
+#define _DAA_INDEX(a,f) (((((f)&Z80_HF)>>2)|((f)&(Z80_NF|Z80_CF)))<<8|(a))
+
+static void _z80_init_flag_tables(void) {
+    if (_z80_flag_tables_valid) {
+        return;
+    }
+    for (uint32_t c = 0; c < 2; c++) {
+        for (uint32_t acc = 0; acc < 256; acc++) {
+            for (uint32_t val = 0; val < 256; val++) {
+                const uint32_t i = (c<<16)|(acc<<8)|val;
+                const uint32_t add_res = acc + val + c;
+                const uint32_t sub_res = (uint32_t)((int)acc - (int)val - (int)c);
+                _z80_add_flags[i] = (uint8_t) _ADD_FLAGS(acc,val,add_res);
+                _z80_sub_flags[i] = (uint8_t) _SUB_FLAGS(acc,val,sub_res);
+            }
+        }
+    }
+    for (uint32_t f = 0; f < 256; f++) {
+        if ((f & ~(Z80_NF|Z80_HF|Z80_CF)) == 0) {
+            for (uint32_t a = 0; a < 256; a++) {
+                _z80_daa_fa[_DAA_INDEX(a,f)] = _z80_daa((uint8_t)a, (uint8_t)f);
+            }
+        }
+    }
+    _z80_flag_tables_valid = true;
+}
+#endif
+
 /* get 'working set' register bank with renamed HL <=> IX/IY */
 static inline uint64_t _z80_map_regs(uint64_t r0, uint64_t r1, uint64_t r2) {
     uint64_t ws = r0;
@@ -836,31 +1056,74 @@ uint32_t z80_exec(z80_t* cpu, uint32_t num_ticks) {
     uint64_t r1 = cpu->wz_ix_iy_sp;
     uint64_t r2 = cpu->im_ir_pc_bits;
     uint64_t r3 = cpu->bc_de_hl_fa_;
+#if _Z80_REGS_LOCALS
+    /* unpack the register banks into local variables, from here on
+       only the state bits in r2 and the shadow registers in r3 are used
+    */
+    uint8_t reg_a = _G8(r0,_A), reg_f = _G8(r0,_F);
+    uint8_t reg_b = _G8(r0,_B), reg_c = _G8(r0,_C);
+    uint8_t reg_d = _G8(r0,_D), reg_e = _G8(r0,_E);
+    uint8_t reg_h = _G8(r0,_H), reg_l = _G8(r0,_L);
+    uint16_t reg_hl = _G16(r0,_HL);
+    uint16_t reg_wz = _G16(r1,_WZ), reg_ix = _G16(r1,_IX);
+    uint16_t reg_iy = _G16(r1,_IY), reg_sp = _G16(r1,_SP);
+    uint8_t reg_i = _G8(r2,_I), reg_r = _G8(r2,_R), reg_im = _G8(r2,_IM);
+    if (r2 & _BIT_USE_IX) {
+        _S_HL(reg_ix);
+    }
+    else if (r2 & _BIT_USE_IY) {
+        _S_HL(reg_iy);
+    }
+#else
     uint64_t ws = _z80_map_regs(r0, r1, r2);
+#endif
     uint64_t map_bits = r2 & _BITS_USE_IXIY;
     uint64_t pins = cpu->pins;
     const z80_tick_t tick = cpu->tick_cb;
     const z80_trap_t trap = cpu->trap_cb;
+    const z80_bulk_t bulk = cpu->bulk_cb;
     void* ud = cpu->user_data;
     uint32_t ticks = 0;
     uint8_t op = 0, d8 = 0;
     uint16_t addr = 0, d16 = 0;
-    uint16_t pc = _G_PC();
+    uint16_t pc = _G16(r2,_PC);
     uint64_t pre_pins = pins;
     do {
         /* fetch next opcode byte */
         _FETCH(op)
-        /* special case ED-prefixed instruction: cancel effect of DD/FD prefix */
+$chain_label        /* special case ED-prefixed instruction: cancel effect of DD/FD prefix */
         if (op == 0xED) {
             map_bits &= ~_BITS_USE_IXIY;
         }
         /* handle HL <=> IX/IY renaming for indexed ops */
         if (map_bits != (r2 & _BITS_USE_IXIY)) {
             const uint64_t old_map_bits = r2 & _BITS_USE_IXIY;
+#if _Z80_REGS_LOCALS
+            if (old_map_bits & _BIT_USE_IX) {
+                reg_ix = _G_HL();
+            }
+            else if (old_map_bits & _BIT_USE_IY) {
+                reg_iy = _G_HL();
+            }
+            else {
+                reg_hl = _G_HL();
+            }
+            r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
+            if (map_bits & _BIT_USE_IX) {
+                _S_HL(reg_ix);
+            }
+            else if (map_bits & _BIT_USE_IY) {
+                _S_HL(reg_iy);
+            }
+            else {
+                _S_HL(reg_hl);
+            }
+#else
             r0 = _z80_flush_r0(ws, r0, old_map_bits);
             r1 = _z80_flush_r1(ws, r1, old_map_bits);
             r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
             ws = _z80_map_regs(r0, r1, r2);
+#endif
         }
         /* decode instruction */
         switch (op) {
@@ -963,16 +1226,36 @@ $decode_block
             if (trap_id) {
                 cpu->trap_id=trap_id;
                 pins &= ~Z80_INT;
-                break;
+                goto trapped;
             }
         }
         pins &= ~Z80_INT;
         pre_pins = pins;
     } while (ticks < num_ticks);
+trapped:
     /* flush local state back to persistent CPU state before leaving */
-    _S_PC(pc);
+#if _Z80_REGS_LOCALS
+    if (r2 & _BIT_USE_IX) {
+        reg_ix = _G_HL();
+    }
+    else if (r2 & _BIT_USE_IY) {
+        reg_iy = _G_HL();
+    }
+    else {
+        reg_hl = _G_HL();
+    }
+    _S8(r0,_A,reg_a); _S8(r0,_F,reg_f);
+    _S8(r0,_B,reg_b); _S8(r0,_C,reg_c);
+    _S8(r0,_D,reg_d); _S8(r0,_E,reg_e);
+    _S16(r0,_HL,reg_hl);
+    _S16(r1,_WZ,reg_wz); _S16(r1,_IX,reg_ix);
+    _S16(r1,_IY,reg_iy); _S16(r1,_SP,reg_sp);
+    _S8(r2,_I,reg_i); _S8(r2,_R,reg_r); _S8(r2,_IM,reg_im);
+#else
     r0 = _z80_flush_r0(ws, r0, r2);
     r1 = _z80_flush_r1(ws, r1, r2);
+#endif
+    _S16(r2,_PC,pc);
     r2 = (r2 & ~_BITS_USE_IXIY) | map_bits;
     cpu->bc_de_hl_fa = r0;
     cpu->wz_ix_iy_sp = r1;
@@ -1035,6 +1318,9 @@ $decode_block
 #undef _BUMPR
 #undef _FETCH
 #undef _FETCH_CB
+#undef _CHAIN
+#undef _BULK
+#undef _TRAP
 #undef _SZ
 #undef _SZYXCH
 #undef _ADD_FLAGS
@@ -1079,6 +1365,12 @@ $decode_block
 #undef _G_I
 #undef _G_R
 #undef _G_IR 
-#undef _G_PC 
+#undef _S_H0
+#undef _S_L0
+#undef _G_H0
+#undef _G_L0
+#undef _Z80_REGS_LOCALS
+#undef _Z80_FLAG_TABLES
+#undef _DAA_INDEX
 
 #endif /* CHIPS_IMPL */
@@ -7,13 +7,23 @@
 #       http://www.z80.info/zip/z80-documented.pdf
 #       https://www.omnimaga.org/asm-language/bit-n-(hl)-flags/5/?wap2
 #-------------------------------------------------------------------------------
+import argparse
 import sys
 from string import Template
+from ir import *
 
 TabWidth = 4
 InpPath = 'z80.template.h'
 OutPath = '../chips/z80.h'
 
+# register representation in z80_exec(), 'banks' for the 64-bit register
+# banks, or 'locals' for separate 8- and 16-bit local variables
+Regs = 'banks'
+
+# flag computation of the 8-bit add/subtract instructions and DAA,
+# 'arith' for bit arithmetic, or 'table' for lookup tables
+AluFlags = 'arith'
+
 # 8-bit register table, the 'HL' entry is for instructions that use
 # (HL), (IX+d) and (IY+d)
 r = [ 'B', 'C', 'D', 'E', 'H', 'L', 'HL', 'A' ]
@@ -24,6 +34,17 @@ rp = [ 'BC', 'DE', 'HL', 'SP' ]
 # 16-bit register table, with AF (only used for PUSH/POP)
 rp2 = [ 'BC', 'DE', 'HL', 'FA' ]
 
+# flag bits
+CF = (1<<0)
+NF = (1<<1)
+VF = (1<<2)
+PF = (1<<2)
+XF = (1<<3)
+HF = (1<<4)
+YF = (1<<5)
+ZF = (1<<6)
+SF = (1<<7)
+
 # condition-code table (for conditional jumps etc)
 cond = [
     '!(_G_F()&Z80_ZF)',  # NZ
@@ -45,16 +66,62 @@ alu_cmt = [ 'ADD', 'ADC', 'SUB', 'SBC', 'AND', 'XOR', 'OR', 'CP' ]
 # rot and shift instruction command names
 rot_cmt = [ 'RLC', 'RRC', 'RL', 'RR', 'SLA', 'SRA', 'SLL', 'SRL' ]
 
+# fused instruction pairs (first opcode, second opcode) if no profile is
+# given, these are typical for the inner loops of block copy, screen
+# clearing, decompression and delay routines
+DefaultPairs = [
+    (0x7E, 0x23),   # LD A,(HL); INC HL
+    (0x77, 0x23),   # LD (HL),A; INC HL
+    (0x12, 0x13),   # LD (DE),A; INC DE
+    (0x05, 0x20),   # DEC B; JR NZ
+    (0x0D, 0x20),   # DEC C; JR NZ
+    (0xB7, 0xC8),   # OR A; RET Z
+    (0x23, 0x10),   # INC HL; DJNZ
+    (0x10, 0x10),   # DJNZ; DJNZ (DJNZ $ delay loops)
+]
+
+# opcodes which can't be the first instruction of a fused pair (the
+# prefixes, and instructions which need the end-of-instruction checks)
+NoFuseFirst = [ 0x76, 0xCB, 0xDD, 0xED, 0xFB, 0xFD ]
+# opcodes which can't be the second instruction of a fused pair
+NoFuseSecond = [ 0xCB, 0xDD, 0xED, 0xFD ]
+
 # an 'opcode' wraps the instruction byte, human-readable asm mnemonics,
-# and the source code which implements the instruction
+# and the list of micro-ops (see ir.py) which implement the instruction
 class opcode :
+    __slots__ = ('byte', 'cmt', 'ops')
     def __init__(self, op) :
         self.byte = op
         self.cmt = None
-        self.src = None
+        self.ops = None
+
+#-------------------------------------------------------------------------------
+#   the C backend, maps micro-ops to the macros in z80.template.h
+#
+class CEmitter(Emitter) :
+    def Tick(self, op) :
+        return '_T({});'.format(op.num)
+    def Read(self, op) :
+        return '_MR({},{});'.format(op.addr, op.dst)
+    def Write(self, op) :
+        return '_MW({},{});'.format(op.addr, op.data)
+    def Imm(self, op) :
+        return '_IMM{}({});'.format(op.bits, op.dst)
+    def In(self, op) :
+        return '_IN({},{});'.format(op.addr, op.dst)
+    def Out(self, op) :
+        return '_OUT({},{});'.format(op.addr, op.data)
+    def Move(self, op) :
+        # upper-case destinations are registers, everything else is a C variable
+        if op.dst.isupper() :
+            return '_S_{}({});'.format(op.dst, op.src)
+        else :
+            return '{}={};'.format(op.dst, op.src)
+    def Flags(self, op) :
+        return op.src if op.stmt else '_S_F({});'.format(op.src)
 
 indent = 0
-out_lines = ''
+out_lines = []
 
 def inc_indent():
     global indent
@@ -68,28 +135,30 @@ def tab() :
     return ' '*TabWidth*indent
 
 def l(s) :
-    global out_lines
-    out_lines += tab() + s + '\n'
+    out_lines.append(tab() + s + '\n')
+
+# all flag bits, for Flags micro-ops which overwrite the complete F register
+AllFlags = 0xFF
 
 #-------------------------------------------------------------------------------
-# Return code to setup an address variable 'a' with the address of HL
+# Return micro-ops to setup an address variable 'a' with the address of HL
 # or (IX+d), (IY+d). For the index instructions also update WZ with
 # IX+d or IY+d
 #
 def addr(ext_ticks) :
-    return '_ADDR(addr,'+str(ext_ticks)+');'
+    return Code('_ADDR(addr,'+str(ext_ticks)+');')
 
 #-------------------------------------------------------------------------------
 # Write the ED extended instruction block.
 #
-def write_ed_ops():
+def write_ed_ops(emitter):
     l('case 0xED: {')
     inc_indent()
     l('_FETCH(op);')
     l('switch(op) {')
     inc_indent()
     for i in range(0, 256):
-        write_op(enc_ed_op(i))
+        write_op(enc_ed_op(i), emitter)
     l('default: break;');
     dec_indent()
     l('}')
@@ -117,7 +186,8 @@ def write_cb_ops():
     l('const uint8_t x = op>>6;')
     l('const uint8_t y = (op>>3)&7;')
     l('const uint8_t z = op&7;')
-    l('const int rz = (7-z)<<3;')
+    if Regs == 'banks':
+        l('const int rz = (7-z)<<3;')
     l('/* load the operand (for indexed ops, always from memory!) */')
     l('if ((z == 6) || _IDX()) {')
     l('  _T(1);')
@@ -131,7 +201,14 @@ def write_cb_ops():
     l('}')
     l('else {')
     l('  /* simple non-indexed, non-(HL): load register value */')
-    l('  d8 = _G8(ws,rz);')
+    if Regs == 'banks':
+        l('  d8 = _G8(ws,rz);')
+    else:
+        l('  switch (z) {')
+        for i in range(0, 8):
+            if i != 6:
+                l('    case {}: d8=_G_{}(); break;'.format(i, r[i]))
+        l('  }')
     l('}')
     l('uint8_t f = _G_F();')
     l('uint8_t r;')
@@ -180,10 +257,20 @@ def write_cb_ops():
     l('  if (z != 6) {')
     l('    /* write result back to register (special case for indexed + H/L! */')
     l('    if (_IDX() && ((z==4)||(z==5))) {')
-    l('      _S8(r0,rz,r);')
+    if Regs == 'banks':
+        l('      _S8(r0,rz,r);')
+    else:
+        l('      if (z==4) { _S_H0(r); } else { _S_L0(r); }')
     l('    }')
     l('    else {')
-    l('      _S8(ws,rz,r);')
+    if Regs == 'banks':
+        l('      _S8(ws,rz,r);')
+    else:
+        l('      switch (z) {')
+        for i in range(0, 8):
+            if i != 6:
+                l('        case {}: _S_{}(r); break;'.format(i, r[i]))
+        l('      }')
     l('    }')
     l('  }')
     l('}')
@@ -198,14 +285,13 @@ def write_cb_ops():
 #   Generate code for OUT (n),A
 #
 def out_n_a():
-    src = '{'
-    src += '_IMM8(d8);'
-    src += 'uint8_t a=_G_A();'
-    src += 'addr=(a<<8)|d8;'
-    src += '_OUT(addr,a);'
-    src += '_S_WZ((addr&0xFF00)|((addr+1)&0x00FF));'
-    src += '}'
-    return src
+    return [Block([
+        Imm('d8'),
+        Code('uint8_t a=_G_A();'),
+        Move('addr','(a<<8)|d8'),
+        Out('addr','a'),
+        Move('WZ','(addr&0xFF00)|((addr+1)&0x00FF)'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   in_A_n
@@ -213,15 +299,14 @@ def out_n_a():
 #   Generate code for IN A,(n)
 #
 def in_n_a():
-    src = '{'
-    src += '_IMM8(d8);'
-    src += 'uint8_t a=_G_A();'
-    src += 'addr=(a<<8)|d8;'
-    src += '_IN(addr++,a);'
-    src += '_S_A(a);'
-    src += '_S_WZ(addr);'
-    src += '}'
-    return src
+    return [Block([
+        Imm('d8'),
+        Code('uint8_t a=_G_A();'),
+        Move('addr','(a<<8)|d8'),
+        In('addr++','a'),
+        Move('A','a'),
+        Move('WZ','addr'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   ex_af
@@ -229,15 +314,20 @@ def in_n_a():
 #   Generate code for EX AF,AF'
 #
 def ex_af():
-    src ='{'
-    src+='r0=_z80_flush_r0(ws,r0,r2);'
-    src+='uint16_t fa=_G16(r0,_FA);'
-    src+='uint16_t fa_=_G16(r3,_FA);'
-    src+='_S16(r0,_FA,fa_);'
-    src+='_S16(r3,_FA,fa);'
-    src+='ws=_z80_map_regs(r0,r1,r2);'
-    src+='}'
-    return src
+    if Regs == 'locals':
+        return [Block([
+            Code('uint16_t fa=_G_FA();'),
+            Move('FA','_G16(r3,_FA)'),
+            Code('_S16(r3,_FA,fa);'),
+        ])]
+    return [Block([
+        Code('r0=_z80_flush_r0(ws,r0,r2);'),
+        Code('uint16_t fa=_G16(r0,_FA);'),
+        Code('uint16_t fa_=_G16(r3,_FA);'),
+        Code('_S16(r0,_FA,fa_);'),
+        Code('_S16(r3,_FA,fa);'),
+        Code('ws=_z80_map_regs(r0,r1,r2);'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   ex_de_hl
@@ -245,15 +335,26 @@ def ex_af():
 #   Generate code for EX DE,HL
 #
 def ex_de_hl():
-    src ='{'
-    src+='r0=_z80_flush_r0(ws,r0,r2);'
-    src+='uint16_t de=_G16(r0,_DE);'
-    src+='uint16_t hl=_G16(r0,_HL);'
-    src+='_S16(r0,_DE,hl);'
-    src+='_S16(r0,_HL,de);'
-    src+='ws=_z80_map_regs(r0,r1,r2);'
-    src+='}'
-    return src
+    if Regs == 'locals':
+        # NOTE: EX DE,HL isn't affected by the DD and FD prefixes
+        return [Block([
+            Code('uint16_t de=_G_DE();'),
+            If('_IDX()', [
+                Move('DE','reg_hl'),
+                Code('reg_hl=de;'),
+            ], [
+                Move('DE','_G_HL()'),
+                Move('HL','de'),
+            ]),
+        ])]
+    return [Block([
+        Code('r0=_z80_flush_r0(ws,r0,r2);'),
+        Code('uint16_t de=_G16(r0,_DE);'),
+        Code('uint16_t hl=_G16(r0,_HL);'),
+        Code('_S16(r0,_DE,hl);'),
+        Code('_S16(r0,_HL,de);'),
+        Code('ws=_z80_map_regs(r0,r1,r2);'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   ex_sp_dd
@@ -261,20 +362,19 @@ def ex_de_hl():
 #   Generate code for EX (SP),HL; EX (SP),IX and EX (SP),IY
 #
 def ex_sp_dd():
-    src ='{'
-    src+='_T(3);'
-    src+='addr=_G_SP();'
-    src+='d16=_G_HL();'
-    src+='uint8_t l,h;'
-    src+='_MR(addr,l);'
-    src+='_MR(addr+1,h);'
-    src+='_MW(addr,d16);'
-    src+='_MW(addr+1,d16>>8);'
-    src+='d16=(h<<8)|l;'
-    src+='_S_HL(d16);'
-    src+='_S_WZ(d16);'
-    src+='}'
-    return src
+    return [Block([
+        Tick(3),
+        Move('addr','_G_SP()'),
+        Move('d16','_G_HL()'),
+        Code('uint8_t l,h;'),
+        Read('addr','l'),
+        Read('addr+1','h'),
+        Write('addr','d16'),
+        Write('addr+1','d16>>8'),
+        Move('d16','(h<<8)|l'),
+        Move('HL','d16'),
+        Move('WZ','d16'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   exx
@@ -282,14 +382,28 @@ def ex_sp_dd():
 #   Generate code for EXX
 #
 def exx():
-    src ='{'
-    src+='r0=_z80_flush_r0(ws,r0,r2);'
-    src+='const uint64_t rx=r3;'
-    src+='r3=(r3&0xffff)|(r0&0xffffffffffff0000);'
-    src+='r0=(r0&0xffff)|(rx&0xffffffffffff0000);'
-    src+='ws=_z80_map_regs(r0, r1, r2);'
-    src+='}'
-    return src
+    if Regs == 'locals':
+        return [Block([
+            Code('const uint64_t rx=r3;'),
+            Code('_S16(r3,_BC,_G_BC());'),
+            Code('_S16(r3,_DE,_G_DE());'),
+            Move('BC','_G16(rx,_BC)'),
+            Move('DE','_G16(rx,_DE)'),
+            If('_IDX()', [
+                Code('_S16(r3,_HL,reg_hl);'),
+                Code('reg_hl=_G16(rx,_HL);'),
+            ], [
+                Code('_S16(r3,_HL,_G_HL());'),
+                Move('HL','_G16(rx,_HL)'),
+            ]),
+        ])]
+    return [Block([
+        Code('r0=_z80_flush_r0(ws,r0,r2);'),
+        Code('const uint64_t rx=r3;'),
+        Code('r3=(r3&0xffff)|(r0&0xffffffffffff0000);'),
+        Code('r0=(r0&0xffff)|(rx&0xffffffffffff0000);'),
+        Code('ws=_z80_map_regs(r0, r1, r2);'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   pop_dd
@@ -297,21 +411,16 @@ def exx():
 #   Generate code for POP dd.
 #
 def pop_dd(p):
-    src ='addr=_G_SP();'
-    src+='_MR(addr++,d8);'
     # special case POP AF, F<=>A
-    if p==3:
-        src+='d16=d8<<8;'
-    else:
-        src+='d16=d8;'
-    src+='_MR(addr++,d8);'
-    if p==3:
-        src+='d16|=d8;'
-    else:
-        src+='d16|=d8<<8;'
-    src+='_S_'+rp2[p]+'(d16);'
-    src+='_S_SP(addr);'
-    return src
+    return [
+        Move('addr','_G_SP()'),
+        Read('addr++','d8'),
+        Move('d16','d8<<8' if p==3 else 'd8'),
+        Read('addr++','d8'),
+        Code('d16|=d8;' if p==3 else 'd16|=d8<<8;'),
+        Move(rp2[p],'d16'),
+        Move('SP','addr'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   push_dd
@@ -319,42 +428,44 @@ def pop_dd(p):
 #   Generate code for PUSH dd
 #
 def push_dd(p):
-    src ='_T(1);'
-    src+='addr=_G_SP();'
-    src+='d16=_G_'+rp2[p]+'();'
+    ops = [
+        Tick(1),
+        Move('addr','_G_SP()'),
+        Move('d16','_G_'+rp2[p]+'()'),
+    ]
     # special case PUSH AF, F<=>A
     if p==3:
-        src+='_MW(--addr,d16);'
-        src+='_MW(--addr,d16>>8);'
+        ops += [ Write('--addr','d16'), Write('--addr','d16>>8') ]
     else:
-        src+='_MW(--addr,d16>>8);'
-        src+='_MW(--addr,d16);'
-    src+='_S_SP(addr);'
-    return src
+        ops += [ Write('--addr','d16>>8'), Write('--addr','d16') ]
+    ops.append(Move('SP','addr'))
+    return ops
 
 #-------------------------------------------------------------------------------
 #   ld_inn_dd
 #   LD (nn),dd
 #
 def ld_inn_dd(p):
-    src  = '_IMM16(addr);'
-    src += 'd16=_G_'+rp[p]+'();'
-    src += '_MW(addr++,d16&0xFF);'
-    src += '_MW(addr,d16>>8);'
-    src += '_S_WZ(addr);'
-    return src
+    return [
+        Imm('addr',16),
+        Move('d16','_G_'+rp[p]+'()'),
+        Write('addr++','d16&0xFF'),
+        Write('addr','d16>>8'),
+        Move('WZ','addr'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   ld_dd_inn
 #   LD dd,(nn)
 #
 def ld_dd_inn(p):
-    src  = '_IMM16(addr);'
-    src += '_MR(addr++,d8);d16=d8;'
-    src += '_MR(addr,d8);d16|=d8<<8;'
-    src += '_S_'+rp[p]+'(d16);'
-    src += '_S_WZ(addr);'
-    return src
+    return [
+        Imm('addr',16),
+        Read('addr++','d8'), Move('d16','d8'),
+        Read('addr','d8'), Code('d16|=d8<<8;'),
+        Move(rp[p],'d16'),
+        Move('WZ','addr'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   call_nn
@@ -362,14 +473,15 @@ def ld_dd_inn(p):
 #   Generate code for CALL nn
 #
 def call_nn():
-    src ='_IMM16(addr);'
-    src+='_T(1);'
-    src+='d16=_G_SP();'
-    src+='_MW(--d16,pc>>8);'
-    src+='_MW(--d16,pc);'
-    src+='_S_SP(d16);'
-    src+='pc=addr;'
-    return src
+    return [
+        Imm('addr',16),
+        Tick(1),
+        Move('d16','_G_SP()'),
+        Write('--d16','pc>>8'),
+        Write('--d16','pc'),
+        Move('SP','d16'),
+        Move('pc','addr'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   call_cc_nn
@@ -377,16 +489,17 @@ def call_nn():
 #   Generate code for CALL cc,nn
 #
 def call_cc_nn(y):
-    src ='_IMM16(addr);'
-    src+='if('+cond[y]+'){'
-    src+='_T(1);'
-    src+='uint16_t sp=_G_SP();'
-    src+='_MW(--sp,pc>>8);'
-    src+='_MW(--sp,pc);'
-    src+='_S_SP(sp);'
-    src+='pc=addr;'
-    src+='}'
-    return src
+    return [
+        Imm('addr',16),
+        If(cond[y], [
+            Tick(1),
+            Code('uint16_t sp=_G_SP();'),
+            Write('--sp','pc>>8'),
+            Write('--sp','pc'),
+            Move('SP','sp'),
+            Move('pc','addr'),
+        ])
+    ]
 
 #-------------------------------------------------------------------------------
 #   ldi_ldd_ldir_lddr()
@@ -394,34 +507,87 @@ def call_cc_nn(y):
 #   Generate code for LDI, LDIR, LDD, LDDR
 #
 def ldi_ldd_ldir_lddr(y):
-    src ='{'
-    src+='uint16_t hl=_G_HL();'
-    src+='uint16_t de=_G_DE();'
-    src+='_MR(hl,d8);'
-    src+='_MW(de,d8);'
-    if y & 1:
-        src+='hl--;de--;'
-    else:
-        src+='hl++;de++;'
-    src+='_S_HL(hl);'
-    src+='_S_DE(de);'
-    src+='_T(2);'
-    src+='d8+=_G_A();'
-    src+='uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);'
-    src+='if(d8&0x02){f|=Z80_YF;}'
-    src+='if(d8&0x08){f|=Z80_XF;}'
-    src+='uint16_t bc=_G_BC();'
-    src+='bc--;'
-    src+='_S_BC(bc);'
-    src+='if(bc){f|=Z80_VF;}'
-    src+='_S_F(f);'
+    ops = [
+        Code('uint16_t hl=_G_HL();'),
+        Code('uint16_t de=_G_DE();'),
+        Read('hl','d8'),
+        Write('de','d8'),
+        Code('hl--;de--;' if y & 1 else 'hl++;de++;'),
+        Move('HL','hl'),
+        Move('DE','de'),
+        Tick(2),
+        Code('d8+=_G_A();'),
+        Code('uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_CF);'),
+        Code('if(d8&0x02){f|=Z80_YF;}'),
+        Code('if(d8&0x08){f|=Z80_XF;}'),
+        Code('uint16_t bc=_G_BC();'),
+        Code('bc--;'),
+        Move('BC','bc'),
+        Code('if(bc){f|=Z80_VF;}'),
+        Flags('f', AllFlags, SF|ZF|CF),
+    ]
     if y >= 6:
-        src+='if(bc){'
-        src+='pc-=2;'
-        src+='_S_WZ(pc+1);'
-        src+='_T(5);'
-        src+='}'
-    src+='}'
+        ops.append(If('bc', [
+            Code('pc-=2;'),
+            Move('WZ','pc+1'),
+            Tick(5),
+            Code(ldir_lddr_bulk(y)),
+        ]))
+    return [Block(ops)]
+
+#-------------------------------------------------------------------------------
+#   bulk_count()
+#
+#   C code which computes the number of iterations 'n' for the next chunk
+#   of a block instruction fast path: limited by BC, the remaining ticks,
+#   and the 256-byte pages of the address registers
+#
+def bulk_count(y, regs):
+    src = 'uint16_t n=bc;'
+    src += 'uint32_t nt=(num_ticks-ticks+Z80_BULK_TICKS-1)/Z80_BULK_TICKS;if(nt<n){n=(uint16_t)nt;}'
+    for reg in regs:
+        page_n = '(({}&0xFF)+1)'.format(reg) if y & 1 else '(0x100-({}&0xFF))'.format(reg)
+        src += 'if({0}<n){{n={0};}}'.format(page_n)
+    return src
+
+#-------------------------------------------------------------------------------
+#   ldir_lddr_bulk()
+#
+#   C code for the LDIR/LDDR fast path (see z80_bulk_cb()), executed after
+#   an iteration which repeats the instruction. Copies chunks of bytes on
+#   host memory and updates the CPU state like the same number of regular
+#   iterations would
+#
+def ldir_lddr_bulk(y):
+    dec = y & 1
+    step = '--' if dec else '++'
+    src = 'while(bc&&_BULK()){'
+    src += '_TRAP();'
+    src += bulk_count(y, ['hl', 'de'])
+    # the fast path can't overwrite the instruction itself
+    if dec:
+        src += 'if(((uint16_t)(de-pc)<n)||((uint16_t)(de-pc-1)<n)){break;}'
+    else:
+        src += 'if(((uint16_t)(pc-de)<n)||((uint16_t)(pc+1-de)<n)){break;}'
+    src += 'const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,{});if(!src||!n){{break;}}'.format('true' if dec else 'false')
+    src += 'uint8_t* dst=_z80_bulk_ptr(cpu,de,&n,true,{});if(!dst||!n){{break;}}'.format('true' if dec else 'false')
+    src += 'for(uint16_t i=0;i<n;i++){{d8=*src{0};*dst{0}=d8;}}'.format(step)
+    if dec:
+        src += 'hl-=n;de-=n;'
+    else:
+        src += 'hl+=n;de+=n;'
+    src += 'bc-=n;_S_HL(hl);_S_DE(de);_S_BC(bc);'
+    src += '_S_R((_G_R()&0x80)|((_G_R()+2*n)&0x7F));'
+    src += '_SAD(de{}1,d8);'.format('+' if dec else '-')
+    src += 'd8+=_G_A();'
+    src += 'f&=(Z80_SF|Z80_ZF|Z80_CF);'
+    src += 'if(d8&0x02){f|=Z80_YF;}'
+    src += 'if(d8&0x08){f|=Z80_XF;}'
+    src += 'if(bc){f|=Z80_VF;}'
+    src += '_S_F(f);'
+    src += 'uint32_t t=n*Z80_BULK_TICKS;if(!bc){t-=5;pc+=2;}'
+    src += '_T(t);'
+    src += '}'
     return src
 
 #-------------------------------------------------------------------------------
@@ -430,37 +596,70 @@ def ldi_ldd_ldir_lddr(y):
 #   Generate code for CPI, CPD, CPIR, CPDR
 #
 def cpi_cpd_cpir_cpdr(y):
-    src ='{'
-    src+='uint16_t hl = _G_HL();'
-    src+='_MR(hl,d8);'
-    src+='uint16_t wz = _G_WZ();'
-    if y & 1:
-        src+='hl--;wz--;'
-    else:
-        src+='hl++;wz++;'
-    src+='_S_WZ(wz);'
-    src+='_S_HL(hl);'
-    src+='_T(5);'
-    src+='int r=((int)_G_A())-d8;'
-    src+='uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);'
-    src+='if((r&0x0F)>(_G_A()&0x0F)){'
-    src+='f|=Z80_HF;'
-    src+='r--;'
-    src+='}'
-    src+='if(r&0x02){f|=Z80_YF;}'
-    src+='if(r&0x08){f|=Z80_XF;}'
-    src+='uint16_t bc=_G_BC();'
-    src+='bc--;'
-    src+='_S_BC(bc);'
-    src+='if(bc){f|=Z80_VF;}'
-    src+='_S8(ws,_F,f);'
+    ops = [
+        Code('uint16_t hl = _G_HL();'),
+        Read('hl','d8'),
+        Code('uint16_t wz = _G_WZ();'),
+        Code('hl--;wz--;' if y & 1 else 'hl++;wz++;'),
+        Move('WZ','wz'),
+        Move('HL','hl'),
+        Tick(5),
+        Code('int r=((int)_G_A())-d8;'),
+        Code('uint8_t f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);'),
+        If('(r&0x0F)>(_G_A()&0x0F)', [
+            Code('f|=Z80_HF;'),
+            Code('r--;'),
+        ]),
+        Code('if(r&0x02){f|=Z80_YF;}'),
+        Code('if(r&0x08){f|=Z80_XF;}'),
+        Code('uint16_t bc=_G_BC();'),
+        Code('bc--;'),
+        Move('BC','bc'),
+        Code('if(bc){f|=Z80_VF;}'),
+        Flags('f', AllFlags, CF),
+    ]
     if y >= 6:
-        src+='if(bc&&!(f&Z80_ZF)){'
-        src+='pc-=2;'
-        src+='_S_WZ(pc+1);'
-        src+='_T(5);'
-        src+='}'
-    src+='}'
+        ops.append(If('bc&&!(f&Z80_ZF)', [
+            Code('pc-=2;'),
+            Move('WZ','pc+1'),
+            Tick(5),
+            Code(cpir_cpdr_bulk(y)),
+        ]))
+    return [Block(ops)]
+
+#-------------------------------------------------------------------------------
+#   cpir_cpdr_bulk()
+#
+#   C code for the CPIR/CPDR fast path, scans chunks of bytes on host
+#   memory until a byte matches the A register
+#
+def cpir_cpdr_bulk(y):
+    dec = y & 1
+    src = 'while(bc&&!(f&Z80_ZF)&&_BULK()){'
+    src += '_TRAP();'
+    src += bulk_count(y, ['hl'])
+    src += 'const uint8_t* src=_z80_bulk_ptr(cpu,hl,&n,false,{});if(!src||!n){{break;}}'.format('true' if dec else 'false')
+    src += 'const uint8_t a=_G_A();'
+    src += 'uint16_t i=0;'
+    src += 'do{{d8=*src{};i++;}}while((d8!=a)&&(i<n));'.format('--' if dec else '++')
+    if dec:
+        src += 'hl-=i;'
+    else:
+        src += 'hl+=i;'
+    src += 'bc-=i;_S_HL(hl);_S_BC(bc);'
+    src += '_S_R((_G_R()&0x80)|((_G_R()+2*i)&0x7F));'
+    src += '_SAD(hl{}1,d8);'.format('+' if dec else '-')
+    src += 'r=((int)a)-d8;'
+    src += 'f=(_G_F()&Z80_CF)|Z80_NF|_SZ(r);'
+    src += 'if((r&0x0F)>(a&0x0F)){f|=Z80_HF;r--;}'
+    src += 'if(r&0x02){f|=Z80_YF;}'
+    src += 'if(r&0x08){f|=Z80_XF;}'
+    src += 'if(bc){f|=Z80_VF;}'
+    src += '_S_F(f);'
+    src += 'uint32_t t=i*Z80_BULK_TICKS;'
+    src += 'if(!bc||(f&Z80_ZF)){{t-=5;pc+=2;_S_WZ({});}}'.format('pc-2' if dec else 'pc')
+    src += '_T(t);'
+    src += '}'
     return src
 
 #-------------------------------------------------------------------------------
@@ -469,35 +668,32 @@ def cpi_cpd_cpir_cpdr(y):
 #   Generate code for INI, IND, INIR, INDR
 #
 def ini_ind_inir_indr(y):
-    src ='{'
-    src+='_T(1);'
-    src+='addr=_G_BC();'
-    src+='uint16_t hl=_G_HL();'
-    src+='_IN(addr,d8);'
-    src+='_MW(hl,d8);'
-    src+='uint8_t b=_G_B();'
-    src+='uint8_t c=_G_C();'
-    src+='b--;'
-    if y & 1:
-        src+='addr--;hl--;c--;'
-    else:
-        src+='addr++;hl++;c++;'
-    src+='_S_B(b);'
-    src+='_S_HL(hl);'
-    src+='_S_WZ(addr);'
-    src+='uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));'
-    src+='if(d8&Z80_SF){f|=Z80_NF;}'
-    src+='uint32_t t=(uint32_t)(c&0xFF)+d8;'
-    src+='if(t&0x100){f|=Z80_HF|Z80_CF;}'
-    src+='f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;'
-    src+='_S_F(f);'
+    ops = [
+        Tick(1),
+        Move('addr','_G_BC()'),
+        Code('uint16_t hl=_G_HL();'),
+        In('addr','d8'),
+        Write('hl','d8'),
+        Code('uint8_t b=_G_B();'),
+        Code('uint8_t c=_G_C();'),
+        Code('b--;'),
+        Code('addr--;hl--;c--;' if y & 1 else 'addr++;hl++;c++;'),
+        Move('B','b'),
+        Move('HL','hl'),
+        Move('WZ','addr'),
+        Code('uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));'),
+        Code('if(d8&Z80_SF){f|=Z80_NF;}'),
+        Code('uint32_t t=(uint32_t)(c&0xFF)+d8;'),
+        Code('if(t&0x100){f|=Z80_HF|Z80_CF;}'),
+        Code('f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;'),
+        Flags('f', AllFlags),
+    ]
     if y >= 6:
-        src+='if(b){'
-        src+='pc-=2;'
-        src+='_T(5);'
-        src+='}'
-    src+='}'
-    return src
+        ops.append(If('b', [
+            Code('pc-=2;'),
+            Tick(5),
+        ]))
+    return [Block(ops)]
 
 #-------------------------------------------------------------------------------
 #   outi_outd_otir_otdr()
@@ -505,89 +701,87 @@ def ini_ind_inir_indr(y):
 #   Generate code OUTI, OUTD, OTIR, OTDR
 #
 def outi_outd_otir_otdr(y):
-    src ='{'
-    src+='_T(1);'
-    src+='uint16_t hl=_G_HL();'
-    src+='_MR(hl,d8);'
-    src+='uint8_t b=_G_B();'
-    src+='b--;'
-    src+='_S_B(b);'
-    src+='addr=_G_BC();'
-    src+='_OUT(addr,d8);'
-    if y & 1:
-        src+='addr--;hl--;'
-    else:
-        src+='addr++; hl++;'
-    src+='_S_HL(hl);'
-    src+='_S_WZ(addr);'
-    src+='uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));'
-    src+='if(d8&Z80_SF){f|=Z80_NF;}'
-    src+='uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;'
-    src+='if (t&0x0100){f|=Z80_HF|Z80_CF;}'
-    src+='f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;'
-    src+='_S_F(f);'
+    ops = [
+        Tick(1),
+        Code('uint16_t hl=_G_HL();'),
+        Read('hl','d8'),
+        Code('uint8_t b=_G_B();'),
+        Code('b--;'),
+        Move('B','b'),
+        Move('addr','_G_BC()'),
+        Out('addr','d8'),
+        Code('addr--;hl--;' if y & 1 else 'addr++; hl++;'),
+        Move('HL','hl'),
+        Move('WZ','addr'),
+        Code('uint8_t f=(b?(b&Z80_SF):Z80_ZF)|(b&(Z80_XF|Z80_YF));'),
+        Code('if(d8&Z80_SF){f|=Z80_NF;}'),
+        Code('uint32_t t=(uint32_t)_G_L()+(uint32_t)d8;'),
+        Code('if (t&0x0100){f|=Z80_HF|Z80_CF;}'),
+        Code('f|=_z80_szp[((uint8_t)(t&0x07))^b]&Z80_PF;'),
+        Flags('f', AllFlags),
+    ]
     if y >= 6:
-        src+='if(b){'
-        src+='pc-=2;'
-        src+='_T(5);'
-        src+='}'
-    src+='}'
-    return src
+        ops.append(If('b', [
+            Code('pc-=2;'),
+            Tick(5),
+        ]))
+    return [Block(ops)]
 
 #-------------------------------------------------------------------------------
 #   djnz()
 #
 def djnz():
-    src ='{'
-    src+='_T(1);'
-    src+='int8_t d;_IMM8(d);'
-    src+='d8=_G_B()-1;'
-    src+='_S_B(d8);'
-    src+='if(d8>0){pc+=d;_S_WZ(pc);_T(5);}'
-    src+='}'
-    return src
+    return [Block([
+        Tick(1),
+        Code('int8_t d;'), Imm('d'),
+        Move('d8','_G_B()-1'),
+        Move('B','d8'),
+        If('d8>0', [Code('pc+=d;'), Move('WZ','pc'), Tick(5)]),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   jr()
 #
 def jr():
-    return '{int8_t d;_IMM8(d);pc+=d;_S_WZ(pc);_T(5);}'
+    return [Block([Code('int8_t d;'), Imm('d'), Code('pc+=d;'), Move('WZ','pc'), Tick(5)])]
 
 #-------------------------------------------------------------------------------
 #   jr_cc()
 #
 def jr_cc(y):
-    src ='{int8_t d;_IMM8(d);'
-    src+='if('+cond[y-4]+'){pc+=d;_S_WZ(pc);_T(5);}'
-    src+='}'
-    return src
+    return [Block([
+        Code('int8_t d;'), Imm('d'),
+        If(cond[y-4], [Code('pc+=d;'), Move('WZ','pc'), Tick(5)]),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   ret()
 #
 def ret():
-    src  = 'd16=_G_SP();'
-    src += '_MR(d16++,d8);pc=d8;'
-    src += '_MR(d16++,d8);pc|=d8<<8;'
-    src += '_S_SP(d16);'
-    src += '_S_WZ(pc);'
-    return src
+    return [
+        Move('d16','_G_SP()'),
+        Read('d16++','d8'), Move('pc','d8'),
+        Read('d16++','d8'), Code('pc|=d8<<8;'),
+        Move('SP','d16'),
+        Move('WZ','pc'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   ret_cc()
 #
 def ret_cc(y):
-    src ='_T(1);'
-    src+='if ('+cond[y]+'){'
-    src+='uint8_t w,z;'
-    src+='d16=_G_SP();'
-    src+='_MR(d16++,z);'
-    src+='_MR(d16++,w);'
-    src+='_S_SP(d16);'
-    src+='pc=(w<<8)|z;'
-    src+='_S_WZ(pc);'
-    src+='}'
-    return src
+    return [
+        Tick(1),
+        If(cond[y], [
+            Code('uint8_t w,z;'),
+            Move('d16','_G_SP()'),
+            Read('d16++','z'),
+            Read('d16++','w'),
+            Move('SP','d16'),
+            Move('pc','(w<<8)|z'),
+            Move('WZ','pc'),
+        ])
+    ]
 
 #-------------------------------------------------------------------------------
 #   retin()
@@ -598,129 +792,147 @@ def ret_cc(y):
 #
 def retin():
     # same as RET, but also set the virtual Z80_RETI pin
-    src  = 'pins|=Z80_RETI;'
-    src += 'd16=_G_SP();'
-    src += '_MR(d16++,d8);pc=d8;'
-    src += '_MR(d16++,d8);pc|=d8<<8;'
-    src += '_S_SP(d16);'
-    src += '_S_WZ(pc);'
-    src += 'if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}'
-    return src
+    return [Code('pins|=Z80_RETI;')] + ret() + [
+        Code('if (r2&_BIT_IFF2){r2|=_BIT_IFF1;}else{r2&=~_BIT_IFF1;}')
+    ]
 
 #-------------------------------------------------------------------------------
 #   rst()
 #
 def rst(y):
-    src ='_T(1);'
-    src+='d16= _G_SP();'
-    src+='_MW(--d16, pc>>8);'
-    src+='_MW(--d16, pc);'
-    src+='_S_SP(d16);'
-    src+='pc='+hex(y*8)+';'
-    src+='_S_WZ(pc);'
-    return src
+    return [
+        Tick(1),
+        Move('d16',' _G_SP()'),
+        Write('--d16',' pc>>8'),
+        Write('--d16',' pc'),
+        Move('SP','d16'),
+        Move('pc',hex(y*8)),
+        Move('WZ','pc'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   in_r_ic
 #   IN r,(C)
 #
 def in_r_ic(y):
-    src ='{'
-    src+='addr=_G_BC();'
-    src+='_IN(addr++,d8);'
-    src+='_S_WZ(addr);'
-    src+='uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];'
-    src+='_S8(ws,_F,f);'
+    ops = [
+        Move('addr','_G_BC()'),
+        In('addr++','d8'),
+        Move('WZ','addr'),
+        Code('uint8_t f=(_G_F()&Z80_CF)|_z80_szp[d8];'),
+        Flags('f', AllFlags, CF),
+    ]
     # handle undocumented special case IN F,(C): 
     # only set flags, don't store result
     if (y != 6):
-        src+='_S_'+r[y]+'(d8);'
-    src+='}'
-    return src
+        ops.append(Move(r[y],'d8'))
+    return [Block(ops)]
 
 #-------------------------------------------------------------------------------
 #   out_r_ic()
 #   OUT r,(C)
 #
 def out_r_ic(y):
-    src ='addr=_G_BC();'
-    if y == 6:
-        src+='_OUT(addr++,0);'
-    else:
-        src+='_OUT(addr++,_G_'+r[y]+'());'
-    src+='_S_WZ(addr);'
-    return src
+    return [
+        Move('addr','_G_BC()'),
+        Out('addr++','0' if y == 6 else '_G_'+r[y]+'()'),
+        Move('WZ','addr'),
+    ]
 
 #-------------------------------------------------------------------------------
 #   ALU functions.
 #
 def add8():
-    src ='{'
-    src+='uint8_t acc=_G_A();'
-    src+='uint32_t res=acc+d8;'
-    src+='_S_F(_ADD_FLAGS(acc,d8,res));'
-    src+='_S_A(res);'
-    src+='}'
-    return src
+    if AluFlags == 'table':
+        return [Block([
+            Code('uint8_t acc=_G_A();'),
+            Flags('_z80_add_flags[(acc<<8)|d8]', AllFlags),
+            Move('A','acc+d8'),
+        ])]
+    return [Block([
+        Code('uint8_t acc=_G_A();'),
+        Code('uint32_t res=acc+d8;'),
+        Flags('_ADD_FLAGS(acc,d8,res)', AllFlags),
+        Move('A','res'),
+    ])]
 
 def adc8():
-    src ='{'
-    src+='uint8_t acc=_G_A();'
-    src+='uint32_t res=acc+d8+(_G_F()&Z80_CF);'
-    src+='_S_F(_ADD_FLAGS(acc,d8,res));'
-    src+='_S_A(res);'
-    src+='}'
-    return src
+    if AluFlags == 'table':
+        return [Block([
+            Code('uint8_t acc=_G_A();'),
+            Code('uint32_t c=_G_F()&Z80_CF;'),
+            Flags('_z80_add_flags[(c<<16)|(acc<<8)|d8]', AllFlags, CF),
+            Move('A','acc+d8+c'),
+        ])]
+    return [Block([
+        Code('uint8_t acc=_G_A();'),
+        Code('uint32_t res=acc+d8+(_G_F()&Z80_CF);'),
+        Flags('_ADD_FLAGS(acc,d8,res)', AllFlags, CF),
+        Move('A','res'),
+    ])]
 
 def sub8():
-    src ='{'
-    src+='uint8_t acc=_G_A();'
-    src+='uint32_t res=(uint32_t)((int)acc-(int)d8);'
-    src+='_S_F(_SUB_FLAGS(acc,d8,res));'
-    src+='_S_A(res);'
-    src+='}'
-    return src
+    if AluFlags == 'table':
+        return [Block([
+            Code('uint8_t acc=_G_A();'),
+            Flags('_z80_sub_flags[(acc<<8)|d8]', AllFlags),
+            Move('A','acc-d8'),
+        ])]
+    return [Block([
+        Code('uint8_t acc=_G_A();'),
+        Code('uint32_t res=(uint32_t)((int)acc-(int)d8);'),
+        Flags('_SUB_FLAGS(acc,d8,res)', AllFlags),
+        Move('A','res'),
+    ])]
 
 def sbc8():
-    src ='{'
-    src+='uint8_t acc=_G_A();'
-    src+='uint32_t res=(uint32_t)((int)acc-(int)d8-(_G_F()&Z80_CF));'
-    src+='_S_F(_SUB_FLAGS(acc,d8,res));'
-    src+='_S_A(res);'
-    src+='}'
-    return src
+    if AluFlags == 'table':
+        return [Block([
+            Code('uint8_t acc=_G_A();'),
+            Code('uint32_t c=_G_F()&Z80_CF;'),
+            Flags('_z80_sub_flags[(c<<16)|(acc<<8)|d8]', AllFlags, CF),
+            Move('A','acc-d8-c'),
+        ])]
+    return [Block([
+        Code('uint8_t acc=_G_A();'),
+        Code('uint32_t res=(uint32_t)((int)acc-(int)d8-(_G_F()&Z80_CF));'),
+        Flags('_SUB_FLAGS(acc,d8,res)', AllFlags, CF),
+        Move('A','res'),
+    ])]
 
 def and8():
-    src ='{'
-    src+='d8&=_G_A();'
-    src+='_S_F(_z80_szp[d8]|Z80_HF);'
-    src+='_S_A(d8);'
-    src+='}'
-    return src
+    return [Block([
+        Code('d8&=_G_A();'),
+        Flags('_z80_szp[d8]|Z80_HF', AllFlags),
+        Move('A','d8'),
+    ])]
 
 def xor8():
-    src ='{'
-    src+='d8^=_G_A();'
-    src+='_S_F(_z80_szp[d8]);'
-    src+='_S_A(d8);'
-    src+='}'
-    return src
+    return [Block([
+        Code('d8^=_G_A();'),
+        Flags('_z80_szp[d8]', AllFlags),
+        Move('A','d8'),
+    ])]
 
 def or8():
-    src ='{'
-    src+='d8|=_G_A();'
-    src+='_S_F(_z80_szp[d8]);'
-    src+='_S_A(d8);'
-    src+='}'
-    return src
+    return [Block([
+        Code('d8|=_G_A();'),
+        Flags('_z80_szp[d8]', AllFlags),
+        Move('A','d8'),
+    ])]
 
 def cp8():
-    src ='{'
-    src+='uint8_t acc=_G_A();'
-    src+='int32_t res=(uint32_t)((int)acc-(int)d8);'
-    src+='_S_F(_CP_FLAGS(acc,d8,res));'
-    src+='}'
-    return src
+    if AluFlags == 'table':
+        # CP takes the undocumented X and Y flags from the operand
+        return [Block([
+            Code('uint8_t acc=_G_A();'),
+            Flags('(_z80_sub_flags[(acc<<8)|d8]&~(Z80_YF|Z80_XF))|(d8&(Z80_YF|Z80_XF))', AllFlags),
+        ])]
+    return [Block([
+        Code('uint8_t acc=_G_A();'),
+        Code('int32_t res=(uint32_t)((int)acc-(int)d8);'),
+        Flags('_CP_FLAGS(acc,d8,res)', AllFlags),
+    ])]
 
 def alu8(y):
     if (y==0):
@@ -741,30 +953,30 @@ def alu8(y):
         return cp8()
 
 def neg8():
-    src ='d8=_G_A();'
-    src+='_S_A(0);'
-    src+=sub8();
-    return src
+    return [Move('d8','_G_A()'), Move('A','0')] + sub8()
+
+def daa():
+    if AluFlags == 'table':
+        return Flags('_S_FA(_z80_daa_fa[_DAA_INDEX(_G_A(),_G_F())]);', AllFlags, CF|NF|HF, stmt=True)
+    return Flags('_S_FA(_z80_daa(_G_A(),_G_F()));', AllFlags, CF|NF|HF, stmt=True)
 
 def inc8():
-    src ='{'
-    src+='uint8_t r=d8+1;'
-    src+='uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);'
-    src+='if(r==0x80){f|=Z80_VF;}'
-    src+='_S_F(f|(_G_F()&Z80_CF));'
-    src+='d8=r;'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint8_t r=d8+1;'),
+        Code('uint8_t f=_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);'),
+        Code('if(r==0x80){f|=Z80_VF;}'),
+        Flags('f|(_G_F()&Z80_CF)', AllFlags, CF),
+        Move('d8','r'),
+    ])]
 
 def dec8():
-    src ='{'
-    src+='uint8_t r=d8-1;'
-    src+='uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);'
-    src+='if(r==0x7F){f|=Z80_VF;}'
-    src+='_S_F(f|(_G_F()&Z80_CF));'
-    src+='d8=r;'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint8_t r=d8-1;'),
+        Code('uint8_t f=Z80_NF|_SZ(r)|(r&(Z80_XF|Z80_YF))|((r^d8)&Z80_HF);'),
+        Code('if(r==0x7F){f|=Z80_VF;}'),
+        Flags('f|(_G_F()&Z80_CF)', AllFlags, CF),
+        Move('d8','r'),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   16-bit add,adc,sbc
@@ -772,132 +984,106 @@ def dec8():
 #   flags computation taken from MAME
 #
 def add16(p):
-    src ='{'
-    src+='uint16_t acc=_G_HL();'
-    src+='_S_WZ(acc+1);'
-    src+='d16=_G_'+rp[p]+'();'
-    src+='uint32_t r=acc+d16;'
-    src+='_S_HL(r);'
-    src+='uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_VF);'
-    src+='f|=((acc^r^d16)>>8)&Z80_HF;'
-    src+='f|=((r>>16)&Z80_CF)|((r>>8)&(Z80_YF|Z80_XF));'
-    src+='_S_F(f);'
-    src+='_T(7);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint16_t acc=_G_HL();'),
+        Move('WZ','acc+1'),
+        Move('d16','_G_'+rp[p]+'()'),
+        Code('uint32_t r=acc+d16;'),
+        Move('HL','r'),
+        Code('uint8_t f=_G_F()&(Z80_SF|Z80_ZF|Z80_VF);'),
+        Code('f|=((acc^r^d16)>>8)&Z80_HF;'),
+        Code('f|=((r>>16)&Z80_CF)|((r>>8)&(Z80_YF|Z80_XF));'),
+        Flags('f', AllFlags, SF|ZF|VF),
+        Tick(7),
+    ])]
 
 def adc16(p):
-    src ='{'
-    src+='uint16_t acc=_G_HL();'
-    src+='_S_WZ(acc+1);'
-    src+='d16=_G_'+rp[p]+'();'
-    src+='uint32_t r=acc+d16+(_G_F()&Z80_CF);'
-    src+='_S_HL(r);'
-    src+='uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;'
-    src+='f|=((acc^r^d16)>>8)&Z80_HF;'
-    src+='f|=(r>>16)&Z80_CF;'
-    src+='f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);'
-    src+='f|=(r&0xFFFF)?0:Z80_ZF;'
-    src+='_S_F(f);'
-    src+='_T(7);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint16_t acc=_G_HL();'),
+        Move('WZ','acc+1'),
+        Move('d16','_G_'+rp[p]+'()'),
+        Code('uint32_t r=acc+d16+(_G_F()&Z80_CF);'),
+        Move('HL','r'),
+        Code('uint8_t f=((d16^acc^0x8000)&(d16^r)&0x8000)>>13;'),
+        Code('f|=((acc^r^d16)>>8)&Z80_HF;'),
+        Code('f|=(r>>16)&Z80_CF;'),
+        Code('f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);'),
+        Code('f|=(r&0xFFFF)?0:Z80_ZF;'),
+        Flags('f', AllFlags, CF),
+        Tick(7),
+    ])]
 
 def sbc16(p):
-    src ='{'
-    src+='uint16_t acc=_G_HL();'
-    src+='_S_WZ(acc+1);'
-    src+='d16=_G_'+rp[p]+'();'
-    src+='uint32_t r=acc-d16-(_G_F()&Z80_CF);'
-    src+='uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);'
-    src+='_S_HL(r);'
-    src+='f|=((acc^r^d16)>>8) & Z80_HF;'
-    src+='f|=(r>>16)&Z80_CF;'
-    src+='f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);'
-    src+='f|=(r&0xFFFF)?0:Z80_ZF;'
-    src+='_S_F(f);'
-    src+='_T(7);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint16_t acc=_G_HL();'),
+        Move('WZ','acc+1'),
+        Move('d16','_G_'+rp[p]+'()'),
+        Code('uint32_t r=acc-d16-(_G_F()&Z80_CF);'),
+        Code('uint8_t f=Z80_NF|(((d16^acc)&(acc^r)&0x8000)>>13);'),
+        Move('HL','r'),
+        Code('f|=((acc^r^d16)>>8) & Z80_HF;'),
+        Code('f|=(r>>16)&Z80_CF;'),
+        Code('f|=(r>>8)&(Z80_SF|Z80_YF|Z80_XF);'),
+        Code('f|=(r&0xFFFF)?0:Z80_ZF;'),
+        Flags('f', AllFlags, CF),
+        Tick(7),
+    ])]
 
 #-------------------------------------------------------------------------------
 #   rotate and shift functions
 #
 def rrd():
-    src ='{'
-    src+='addr=_G_HL();'
-    src+='uint8_t a=_G_A();'
-    src+='_MR(addr,d8);'
-    src+='uint8_t l=a&0x0F;'
-    src+='a=(a&0xF0)|(d8&0x0F);'
-    src+='_S_A(a);'
-    src+='d8=(d8>>4)|(l<<4);'
-    src+='_MW(addr++,d8);'
-    src+='_S_WZ(addr);'
-    src+='_S_F((_G_F()&Z80_CF)|_z80_szp[a]);'
-    src+='_T(4);'
-    src+='}'
-    return src
+    return [Block([
+        Move('addr','_G_HL()'),
+        Code('uint8_t a=_G_A();'),
+        Read('addr','d8'),
+        Code('uint8_t l=a&0x0F;'),
+        Move('a','(a&0xF0)|(d8&0x0F)'),
+        Move('A','a'),
+        Move('d8','(d8>>4)|(l<<4)'),
+        Write('addr++','d8'),
+        Move('WZ','addr'),
+        Flags('(_G_F()&Z80_CF)|_z80_szp[a]', AllFlags, CF),
+        Tick(4),
+    ])]
 
 def rld():
-    src ='{'
-    src+='addr=_G_HL();'
-    src+='uint8_t a=_G_A();'
-    src+='_MR(addr,d8);'
-    src+='uint8_t l=a&0x0F;'
-    src+='a=(a&0xF0)|(d8>>4);'
-    src+='_S_A(a);'
-    src+='d8=(d8<<4)|l;'
-    src+='_MW(addr++,d8);'
-    src+='_S_WZ(addr);'
-    src+='_S_F((_G_F()&Z80_CF)|_z80_szp[a]);'
-    src+='_T(4);'
-    src+='}'
-    return src
+    return [Block([
+        Move('addr','_G_HL()'),
+        Code('uint8_t a=_G_A();'),
+        Read('addr','d8'),
+        Code('uint8_t l=a&0x0F;'),
+        Move('a','(a&0xF0)|(d8>>4)'),
+        Move('A','a'),
+        Move('d8','(d8<<4)|l'),
+        Write('addr++','d8'),
+        Move('WZ','addr'),
+        Flags('(_G_F()&Z80_CF)|_z80_szp[a]', AllFlags, CF),
+        Tick(4),
+    ])]
+
+def rot_a(res, carry):
+    # shared code for RLCA, RRCA, RLA, RRA
+    return [Block([
+        Code('uint8_t a=_G_A();'),
+        Code('uint8_t f=_G_F();'),
+        Code('uint8_t r='+res+';'),
+        Move('f',carry+'|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF))'),
+        Move('A','r'),
+        Flags('f', AllFlags, SF|ZF|PF|CF),
+    ])]
 
 def rlca():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='uint8_t r=(a<<1)|(a>>7);'
-    src+='f=((a>>7)&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));'
-    src+='_S_A(r);'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return rot_a('(a<<1)|(a>>7)', '((a>>7)&Z80_CF)')
 
 def rrca():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='uint8_t r=(a>>1)|(a<<7);'
-    src+='f=(a&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));'
-    src+='_S_A(r);'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return rot_a('(a>>1)|(a<<7)', '(a&Z80_CF)')
 
 def rla():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='uint8_t r=(a<<1)|(f&Z80_CF);'
-    src+='f=((a>>7)&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));'
-    src+='_S_A(r);'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return rot_a('(a<<1)|(f&Z80_CF)', '((a>>7)&Z80_CF)')
 
 def rra():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='uint8_t r=(a>>1)|((f&Z80_CF)<<7);'
-    src+='f=(a&Z80_CF)|(f&(Z80_SF|Z80_ZF|Z80_PF))|(r&(Z80_YF|Z80_XF));'
-    src+='_S_A(r);'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return rot_a('(a>>1)|((f&Z80_CF)<<7)', '(a&Z80_CF)')
 
 #-------------------------------------------------------------------------------
 #   misc ops
@@ -907,46 +1093,43 @@ def rra():
 #   Undocumented Z80 Documented)
 #
 def halt():
-    return 'pins|=Z80_HALT;pc--;'
+    return [Code('pins|=Z80_HALT;pc--;')]
 
 def di():
-    return 'r2&=~(_BIT_IFF1|_BIT_IFF2);'
+    return [Code('r2&=~(_BIT_IFF1|_BIT_IFF2);')]
 
 def ei():
-    return 'r2=(r2&~(_BIT_IFF1|_BIT_IFF2))|_BIT_EI;'
+    return [Code('r2=(r2&~(_BIT_IFF1|_BIT_IFF2))|_BIT_EI;')]
 
 def cpl():
-    src ='{'
-    src+='uint8_t a=_G_A()^0xFF;'
-    src+='_S_A(a);'
-    src+='uint8_t f=_G_F();'
-    src+='f=(f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|Z80_HF|Z80_NF|(a&(Z80_YF|Z80_XF));'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint8_t a=_G_A()^0xFF;'),
+        Move('A','a'),
+        Code('uint8_t f=_G_F();'),
+        Move('f','(f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|Z80_HF|Z80_NF|(a&(Z80_YF|Z80_XF))'),
+        Flags('f', AllFlags, SF|ZF|PF|CF),
+    ])]
 
 def scf():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='f=(f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|Z80_CF|(a&(Z80_YF|Z80_XF));'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint8_t a=_G_A();'),
+        Code('uint8_t f=_G_F();'),
+        Move('f','(f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|Z80_CF|(a&(Z80_YF|Z80_XF))'),
+        Flags('f', AllFlags, SF|ZF|PF),
+    ])]
 
 def ccf():
-    src ='{'
-    src+='uint8_t a=_G_A();'
-    src+='uint8_t f=_G_F();'
-    src+='f=((f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|((f&Z80_CF)<<4)|(a&(Z80_YF|Z80_XF)))^Z80_CF;'
-    src+='_S_F(f);'
-    src+='}'
-    return src
+    return [Block([
+        Code('uint8_t a=_G_A();'),
+        Code('uint8_t f=_G_F();'),
+        Move('f','((f&(Z80_SF|Z80_ZF|Z80_PF|Z80_CF))|((f&Z80_CF)<<4)|(a&(Z80_YF|Z80_XF)))^Z80_CF'),
+        Flags('f', AllFlags, SF|ZF|PF|CF),
+    ])]
 
 #-------------------------------------------------------------------------------
 # Encode a main instruction, or an DD or FD prefix instruction.
 # Takes an opcode byte and returns an opcode object, for invalid instructions
-# the opcode object will be in its default state (opcode.src==None).
+# the opcode object will be in its default state (opcode.ops==None).
 # cc is the name of the cycle-count table.
 #
 def enc_op(op) :
@@ -970,39 +1153,39 @@ def enc_op(op) :
             if z == 6:
                 # special case: LD (HL),(HL) is HALT
                 o.cmt = 'HALT'
-                o.src = halt()
+                o.ops = halt()
             else:
                 # LD (HL),r; LD (IX+d),r; LD (IX+d),r
                 o.cmt = 'LD (HL/IX+d/IY+d),'+r[z]
                 # special case LD (IX+d),L LD (IX+d),H
                 if z in [4,5]:
-                    o.src = 'd8=_IDX()?_G8(r0,_'+r[z]+'):_G_'+r[z]+'();'
+                    o.ops = [Move('d8','_IDX()?_G_'+r[z]+'0():_G_'+r[z]+'()')]
                 else:
-                    o.src = 'd8=_G_'+r[z]+'();'
-                o.src += addr(5)+'_MW(addr,d8);'
+                    o.ops = [Move('d8','_G_'+r[z]+'()')]
+                o.ops += [addr(5), Write('addr','d8')]
         elif z == 6:
             # LD r,(HL); LD r,(IX+d); LD r,(IY+d)
             o.cmt = 'LD '+r[y]+',(HL/IX+d/IY+d)'
-            o.src = addr(5)+'_MR(addr,d8);'
+            o.ops = [addr(5), Read('addr','d8')]
             if y in [4,5]:
-                o.src += 'if(_IDX()){_S8(r0,_'+r[y]+',d8);}else{_S_'+r[y]+'(d8);}'
+                o.ops.append(If('_IDX()', [Move(r[y]+'0','d8')], [Move(r[y],'d8')]))
             else:
-                o.src += '_S_'+r[y]+'(d8);'
+                o.ops.append(Move(r[y],'d8'))
         else:
             # LD r,s
             o.cmt = 'LD '+r[y]+','+r[z]
-            o.src = '_S_'+r[y]+'(_G_'+r[z]+'());'
+            o.ops = [Move(r[y],'_G_'+r[z]+'()')]
 
     #---- block 2: 8-bit ALU instructions (ADD, ADC, SUB, SBC, AND, XOR, OR, CP)
     elif x == 2:
         if z == 6:
             # ALU (HL); ALU (IX+d); ALU (IY+d)
             o.cmt = alu_cmt[y]+',(HL/IX+d/IY+d)'
-            o.src = addr(5) + '_MR(addr,d8);'+alu8(y)
+            o.ops = [addr(5), Read('addr','d8')] + alu8(y)
         else:
             # ALU r
             o.cmt = alu_cmt[y]+' '+r[z]
-            o.src = 'd8=_G_'+r[z]+'();'+alu8(y)
+            o.ops = [Move('d8','_G_'+r[z]+'()')] + alu8(y)
 
     #---- block 0: misc ops
     elif x == 0:
@@ -1010,74 +1193,74 @@ def enc_op(op) :
             if y == 0:
                 # NOP
                 o.cmt = 'NOP'
-                o.src = ' '
+                o.ops = [Code(' ')]
             elif y == 1:
                 # EX AF,AF'
                 o.cmt = "EX AF,AF'"
-                o.src = ex_af()
+                o.ops = ex_af()
             elif y == 2:
                 # DJNZ d
                 o.cmt = 'DJNZ'
-                o.src = djnz()
+                o.ops = djnz()
             elif  y == 3:
                 # JR d
                 o.cmt = 'JR d'
-                o.src = jr()
+                o.ops = jr()
             else:
                 # JR cc,d
                 o.cmt = 'JR '+cond_cmt[y-4]+',d'
-                o.src = jr_cc(y)
+                o.ops = jr_cc(y)
         elif z == 1:
             if q == 0:
                 # 16-bit immediate loads
                 o.cmt = 'LD '+rp[p]+',nn'
-                o.src = '_IMM16(d16);_S_'+rp[p]+'(d16);'
+                o.ops = [Imm('d16',16), Move(rp[p],'d16')]
             else :
                 # ADD HL,rr; ADD IX,rr; ADD IY,rr
                 o.cmt = 'ADD '+rp[2]+','+rp[p]
-                o.src = add16(p)
+                o.ops = add16(p)
         elif z == 2:
             # indirect loads
             op_tbl = [
-                [ 'LD (BC),A',          'addr=_G_BC();d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));' ],
-                [ 'LD A,(BC)',          'addr=_G_BC();_MR(addr++,d8);_S_A(d8);_S_WZ(addr);' ],
-                [ 'LD (DE),A',          'addr=_G_DE();d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));' ],
-                [ 'LD A,(DE)',          'addr=_G_DE();_MR(addr++,d8);_S_A(d8);_S_WZ(addr);' ],
-                [ 'LD (nn),'+rp[2],     '_IMM16(addr);_MW(addr++,_G_L());_MW(addr,_G_H());_S_WZ(addr);' ],
-                [ 'LD '+rp[2]+',(nn)',  '_IMM16(addr);_MR(addr++,d8);_S_L(d8);_MR(addr,d8);_S_H(d8);_S_WZ(addr);' ],
-                [ 'LD (nn),A',          '_IMM16(addr);d8=_G_A();_MW(addr++,d8);_S_WZ((d8<<8)|(addr&0x00FF));' ],
-                [ 'LD A,(nn)',          '_IMM16(addr);_MR(addr++,d8);_S_A(d8);_S_WZ(addr);' ],
+                [ 'LD (BC),A',          [Move('addr','_G_BC()'),Move('d8','_G_A()'),Write('addr++','d8'),Move('WZ','(d8<<8)|(addr&0x00FF)')] ],
+                [ 'LD A,(BC)',          [Move('addr','_G_BC()'),Read('addr++','d8'),Move('A','d8'),Move('WZ','addr')] ],
+                [ 'LD (DE),A',          [Move('addr','_G_DE()'),Move('d8','_G_A()'),Write('addr++','d8'),Move('WZ','(d8<<8)|(addr&0x00FF)')] ],
+                [ 'LD A,(DE)',          [Move('addr','_G_DE()'),Read('addr++','d8'),Move('A','d8'),Move('WZ','addr')] ],
+                [ 'LD (nn),'+rp[2],     [Imm('addr',16),Write('addr++','_G_L()'),Write('addr','_G_H()'),Move('WZ','addr')] ],
+                [ 'LD '+rp[2]+',(nn)',  [Imm('addr',16),Read('addr++','d8'),Move('L','d8'),Read('addr','d8'),Move('H','d8'),Move('WZ','addr')] ],
+                [ 'LD (nn),A',          [Imm('addr',16),Move('d8','_G_A()'),Write('addr++','d8'),Move('WZ','(d8<<8)|(addr&0x00FF)')] ],
+                [ 'LD A,(nn)',          [Imm('addr',16),Read('addr++','d8'),Move('A','d8'),Move('WZ','addr')] ],
             ]
             o.cmt = op_tbl[y][0]
-            o.src = op_tbl[y][1]
+            o.ops = op_tbl[y][1]
         elif z == 3:
             # 16-bit INC/DEC 
             if q == 0:
                 o.cmt = 'INC '+rp[p]
-                o.src = '_T(2);_S_'+rp[p]+'(_G_'+rp[p]+'()+1);'
+                o.ops = [Tick(2), Move(rp[p],'_G_'+rp[p]+'()+1')]
             else:
                 o.cmt = 'DEC '+rp[p]
-                o.src = '_T(2);_S_'+rp[p]+'(_G_'+rp[p]+'()-1);'
+                o.ops = [Tick(2), Move(rp[p],'_G_'+rp[p]+'()-1')]
         elif z == 4 or z == 5:
             cmt = 'INC' if z == 4 else 'DEC'
             fn = inc8() if z==4 else dec8()
             if y == 6:
                 # INC/DEC (HL)/(IX+d)/(IY+d)
                 o.cmt = cmt+' (HL/IX+d/IY+d)'
-                o.src = addr(5)+'_T(1);_MR(addr,d8);'+fn+'_MW(addr,d8);'
+                o.ops = [addr(5), Tick(1), Read('addr','d8')] + fn + [Write('addr','d8')]
             else:
                 # INC/DEC r
                 o.cmt = cmt+' '+r[y]
-                o.src = 'd8=_G_'+r[y]+'();'+fn+'_S_'+r[y]+'(d8);'
+                o.ops = [Move('d8','_G_'+r[y]+'()')] + fn + [Move(r[y],'d8')]
         elif z == 6:
             if y == 6:
                 # LD (HL),n; LD (IX+d),n; LD (IY+d),n
                 o.cmt = 'LD (HL/IX+d/IY+d),n'
-                o.src = addr(2) + '_IMM8(d8);_MW(addr,d8);'
+                o.ops = [addr(2), Imm('d8'), Write('addr','d8')]
             else:
                 # LD r,n
                 o.cmt = 'LD '+r[y]+',n'
-                o.src = '_IMM8(d8);_S_'+r[y]+'(d8);'
+                o.ops = [Imm('d8'), Move(r[y],'d8')]
         elif z == 7:
             # misc ops on A and F
             op_tbl = [
@@ -1085,43 +1268,43 @@ def enc_op(op) :
                 [ 'RRCA', rrca() ],
                 [ 'RLA',  rla() ],
                 [ 'RRA',  rra() ],
-                [ 'DAA',  'ws=_z80_daa(ws);' ],
+                [ 'DAA',  [daa()] ],
                 [ 'CPL',  cpl() ],
                 [ 'SCF',  scf() ],
                 [ 'CCF',  ccf() ]
             ]
             o.cmt = op_tbl[y][0]
-            o.src = op_tbl[y][1]
+            o.ops = op_tbl[y][1]
 
     #--- block 3: misc and extended ops
     elif x == 3:
         if z == 0:
             # RET cc
             o.cmt = 'RET '+cond_cmt[y]
-            o.src = ret_cc(y)
+            o.ops = ret_cc(y)
         if z == 1:
             if q == 0:
                 # POP BC,DE,HL,IX,IY,AF
                 o.cmt = 'POP '+rp2[p]
-                o.src = pop_dd(p)
+                o.ops = pop_dd(p)
             else:
                 # misc ops
                 op_tbl = [
                     [ 'RET', ret() ],
                     [ 'EXX', exx() ],
-                    [ 'JP '+rp[2], 'pc=_G_HL();' ],
-                    [ 'LD SP,'+rp[2], '_T(2);_S_SP(_G_HL());' ]
+                    [ 'JP '+rp[2], [Move('pc','_G_HL()')] ],
+                    [ 'LD SP,'+rp[2], [Tick(2), Move('SP','_G_HL()')] ]
                 ]
                 o.cmt = op_tbl[p][0]
-                o.src = op_tbl[p][1]
+                o.ops = op_tbl[p][1]
         if z == 2:
             # JP cc,nn
             o.cmt = 'JP {},nn'.format(cond_cmt[y])
-            o.src = '_IMM16(addr);if('+cond[y]+'){pc=addr;}'
+            o.ops = [Imm('addr',16), If(cond[y], [Move('pc','addr')])]
         if z == 3:
             # misc ops
             op_tbl = [
-                [ 'JP nn', '_IMM16(pc);' ],
+                [ 'JP nn', [Imm('pc',16)] ],
                 [ None, None ], # CB prefix instructions
                 [ 'OUT (n),A', out_n_a() ],
                 [ 'IN A,(n)', in_n_a() ],
@@ -1131,33 +1314,33 @@ def enc_op(op) :
                 [ 'EI', ei() ]
             ]
             o.cmt = op_tbl[y][0]
-            o.src = op_tbl[y][1]
+            o.ops = op_tbl[y][1]
         if z == 4:
             # CALL cc,nn
             o.cmt = 'CALL {},nn'.format(cond_cmt[y])
-            o.src = call_cc_nn(y)
+            o.ops = call_cc_nn(y)
         if z == 5:
             if q == 0:
                 # PUSH BC,DE,HL,IX,IY,AF
                 o.cmt = 'PUSH {}'.format(rp2[p])
-                o.src = push_dd(p)
+                o.ops = push_dd(p)
             else:
                 op_tbl = [
                     [ 'CALL nn', call_nn() ],
-                    [ 'DD prefix', 'map_bits|=_BIT_USE_IX;continue;' ],
+                    [ 'DD prefix', [Code('map_bits|=_BIT_USE_IX;continue;')] ],
                     [ None, None ], # ED prefix instructions
-                    [ 'FD prefix', 'map_bits|=_BIT_USE_IY;continue;'],
+                    [ 'FD prefix', [Code('map_bits|=_BIT_USE_IY;continue;')] ],
                 ]
                 o.cmt = op_tbl[p][0]
-                o.src = op_tbl[p][1]
+                o.ops = op_tbl[p][1]
         if z == 6:
             # ALU n
             o.cmt = '{} n'.format(alu_cmt[y])
-            o.src = '_IMM8(d8);'+alu8(y)
+            o.ops = [Imm('d8')] + alu8(y)
         if z == 7:
             # RST
             o.cmt = 'RST {}'.format(hex(y*8))
-            o.src = rst(y)
+            o.ops = rst(y)
 
     return o
 
@@ -1204,64 +1387,64 @@ def enc_ed_op(op) :
                 ]
             ]
             o.cmt = op_tbl[z][y-4][0]
-            o.src = op_tbl[z][y-4][1]
+            o.ops = op_tbl[z][y-4][1]
 
     if x == 1:
         # misc ops
         if z == 0:
             # IN r,(C)
             o.cmt = 'IN {},(C)'.format(r[y])
-            o.src = in_r_ic(y)
+            o.ops = in_r_ic(y)
         if z == 1:
             # OUT (C),r
             o.cmt = 'OUT (C),{}'.format(r[y])
-            o.src = out_r_ic(y)
+            o.ops = out_r_ic(y)
         if z == 2:
             # SBC/ADC HL,rr
             if q==0:
                 o.cmt = 'SBC HL,'+rp[p]
-                o.src = sbc16(p)
+                o.ops = sbc16(p)
             else:
                 o.cmt = 'ADC HL,'+rp[p]
-                o.src = adc16(p)
+                o.ops = adc16(p)
         if z == 3:
             # 16-bit immediate address load/store
             if q == 0:
                 o.cmt = 'LD (nn),{}'.format(rp[p])
-                o.src = ld_inn_dd(p)
+                o.ops = ld_inn_dd(p)
             else:
                 o.cmt = 'LD {},(nn)'.format(rp[p])
-                o.src = ld_dd_inn(p)
+                o.ops = ld_dd_inn(p)
         if z == 4:
             # NEG
             o.cmt = 'NEG'
-            o.src = neg8()
+            o.ops = neg8()
         if z == 5:
             # RETN, RETI (both are identical according to Undocumented Z80 Documented)
             if y == 1:
                 o.cmt = 'RETI'
             else:
                 o.cmt = 'RETN'
-            o.src = retin()
+            o.ops = retin()
         if z == 6:
             # IM m
             im_mode = [ 0, 0, 1, 2, 0, 0, 1, 2 ]
             o.cmt = 'IM {}'.format(im_mode[y])
-            o.src = '_S_IM({});'.format(im_mode[y])
+            o.ops = [Move('IM',str(im_mode[y]))]
         if z == 7:
             # misc ops on I,R and A
             op_tbl = [
-                [ 'LD I,A', '_T(1);_S_I(_G_A());' ],
-                [ 'LD R,A', '_T(1);_S_R(_G_A());' ],
-                [ 'LD A,I', '_T(1);d8=_G_I();_S_A(d8);_S_F(_SZIFF2_FLAGS(d8));' ],
-                [ 'LD A,R', '_T(1);d8=_G_R();_S_A(d8);_S_F(_SZIFF2_FLAGS(d8));' ],
+                [ 'LD I,A', [Tick(1), Move('I','_G_A()')] ],
+                [ 'LD R,A', [Tick(1), Move('R','_G_A()')] ],
+                [ 'LD A,I', [Tick(1), Move('d8','_G_I()'), Move('A','d8'), Flags('_SZIFF2_FLAGS(d8)', AllFlags, CF)] ],
+                [ 'LD A,R', [Tick(1), Move('d8','_G_R()'), Move('A','d8'), Flags('_SZIFF2_FLAGS(d8)', AllFlags, CF)] ],
                 [ 'RRD', rrd() ],
                 [ 'RLD', rld() ],
-                [ 'NOP (ED)', ' ' ],
-                [ 'NOP (ED)', ' ' ],
+                [ 'NOP (ED)', [Code(' ')] ],
+                [ 'NOP (ED)', [Code(' ')] ],
             ]
             o.cmt = op_tbl[y][0]
-            o.src = op_tbl[y][1]
+            o.ops = op_tbl[y][1]
     return o
 
 #-------------------------------------------------------------------------------
@@ -1278,34 +1461,98 @@ def enc_cb_op(op) :
     # handled dynamically in the fallthrough path!
     return o
 
+#-------------------------------------------------------------------------------
+# Fuse an instruction with the following instruction: if the end-of-
+# instruction checks wouldn't do anything, the next opcode is fetched
+# directly, and if it is the second instruction of the pair, that is
+# executed inline, otherwise the fetched opcode goes through the regular
+# decoder. The tick callbacks are exactly the same as without fusion.
+#
+def fuse(first, second) :
+    first.cmt += '; '+second.cmt
+    first.ops = first.ops + [If('_CHAIN()', [
+        Code('_TRAP();pre_pins=pins;_FETCH(op);'),
+        If('op=='+hex(second.byte), [Block(second.ops)], [Code('goto decode_op;')])
+    ])]
+
+#-------------------------------------------------------------------------------
+# Read an opcode pair profile (one pair per line: first and second opcode
+# as hex numbers, followed by the count, see z80_pairs.py), and return
+# the hottest pairs which can be fused, at most one pair per first opcode.
+#
+def read_pairs(path, max_pairs) :
+    counts = []
+    with open(path, 'r') as f :
+        for line in f :
+            items = line.split()
+            if len(items) >= 3 and not line.startswith('#') :
+                counts.append((int(items[2]), int(items[0], 16), int(items[1], 16)))
+    counts.sort(reverse=True)
+    pairs = []
+    for count, first, second in counts :
+        if len(pairs) == max_pairs :
+            break
+        if first in NoFuseFirst or second in NoFuseSecond :
+            continue
+        if first in [p[0] for p in pairs] :
+            continue
+        pairs.append((first, second))
+    return pairs
+
 #-------------------------------------------------------------------------------
 # write a single (writes a case inside the current switch)
 #
-def write_op(op) :
-    if op.src :
+def write_op(op, emitter) :
+    if op.ops :
         if not op.cmt:
             op.cmt='???'
-        l('case '+hex(op.byte)+':/*'+op.cmt+'*/'+op.src+'break;')
+        l('case '+hex(op.byte)+':/*'+op.cmt+'*/'+emitter.emit(op.ops)+'break;')
 
 #-------------------------------------------------------------------------------
 # main encoder function, this populates all the opcode tables and
 # generates the C++ source code into the file f
 #
+parser = argparse.ArgumentParser(description='generate the Z80 emulator')
+parser.add_argument('--pairs', metavar='PROFILE', help='opcode pair profile for fused instructions (see z80_pairs.py)')
+parser.add_argument('--max-pairs', type=int, default=len(DefaultPairs), help='max number of fused instruction pairs, 0 to disable')
+parser.add_argument('--regs', choices=['banks', 'locals'], default=Regs, help='register representation in z80_exec()')
+parser.add_argument('--alu-flags', choices=['arith', 'table'], default=AluFlags, help='flag computation of the 8-bit add/subtract instructions and DAA')
+parser.add_argument('-o', '--output', default=OutPath, help='output header (default: {})'.format(OutPath))
+args = parser.parse_args()
+Regs = args.regs
+AluFlags = args.alu_flags
+if args.pairs :
+    pairs = read_pairs(args.pairs, args.max_pairs)
+else :
+    pairs = DefaultPairs[:args.max_pairs]
+
+ops = [enc_op(i) for i in range(0, 256)]
+for first, second in pairs :
+    # NOTE: the second instruction is encoded again, so that it isn't
+    # affected by fusing it with its own successor
+    fuse(ops[first], enc_op(second))
+
+emitter = CEmitter()
 indent = 3
 for i in range(0, 256):
     # ED prefix instructions
     if i == 0xED:
-        write_ed_ops()
+        write_ed_ops(emitter)
     # CB prefix instructions
     elif i == 0xCB:
         write_cb_ops()
     # non-prefixed instruction
     else:
-        write_op(enc_op(i))
+        write_op(ops[i], emitter)
 indent = 0
 
+# the fused instructions jump to this label after fetching an opcode
+chain_label = '    decode_op:\n' if pairs else ''
+
 with open(InpPath, 'r') as inf:
     templ = Template(inf.read())
-    c_src = templ.safe_substitute(decode_block=out_lines)
-    with open(OutPath, 'w') as outf:
+    c_src = templ.safe_substitute(decode_block=''.join(out_lines), chain_label=chain_label,
+        regs_locals=1 if Regs == 'locals' else 0,
+        flag_tables=1 if AluFlags == 'table' else 0)
+    with open(args.output, 'w') as outf:
         outf.write(c_src)
\ No newline at end of file
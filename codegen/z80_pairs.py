@@ -0,0 +1,80 @@
+#-------------------------------------------------------------------------------
+#   z80_pairs.py
+#   Create an opcode pair profile for the fused instructions in z80_gen.py.
+#
+#   Usage:
+#
+#       python z80_pairs.py corpus.json [-n max_instructions] [-o pairs.txt]
+#       python z80_gen.py --pairs pairs.txt [--max-pairs 8]
+#
+#   The corpus has the same format as for pycpu_runner.py (6502 jobs are
+#   skipped). The Z80 programs are executed one instruction at a time, and
+#   each pair of subsequent unprefixed instructions is counted. The result
+#   is one pair per line, with the hottest pairs first:
+#
+#       7E 23 1234567
+#
+#   Single-stepping is about two orders of magnitude slower than running
+#   the corpus through pycpu_runner.py, so usually the number of
+#   instructions per job should be limited with -n.
+#-------------------------------------------------------------------------------
+import argparse
+import json
+import os
+import sys
+
+import pycpu_runner
+from pycpu_runner import TrapBDOS, num
+
+# opcode bytes which are prefixes, or start a prefixed instruction
+Prefixes = [ 0xCB, 0xDD, 0xED, 0xFD ]
+
+#-------------------------------------------------------------------------------
+def profile(job, base_dir, max_instrs, counts) :
+    '''run a job instruction by instruction and add the pair counts'''
+    cpu = pycpu_runner.setup(job, base_dir)
+    max_ticks = num(job.get('max_ticks', pycpu_runner.DefaultMaxTicks))
+    output = bytearray()
+    prev = None
+    for i in range(max_instrs) :
+        if cpu.ticks >= max_ticks :
+            break
+        op = cpu.mem[cpu.pc]
+        # NOTE: a DD or FD prefix is executed as separate step
+        if prev is not None and prev not in Prefixes and op not in Prefixes :
+            counts[(prev, op)] = counts.get((prev, op), 0) + 1
+        prev = op
+        cpu.run(1)
+        trap_id = cpu.trap_id
+        if trap_id == TrapBDOS :
+            pycpu_runner.bdos(cpu, output)
+            prev = None
+        elif trap_id != 0 :
+            break
+
+#-------------------------------------------------------------------------------
+def main() :
+    parser = argparse.ArgumentParser(description='create a Z80 opcode pair profile from a test program corpus')
+    parser.add_argument('corpus', help='JSON file with the list of jobs')
+    parser.add_argument('-n', '--max-instructions', type=int, default=10000000, help='max number of instructions per job')
+    parser.add_argument('-o', '--output', help='profile file (default: stdout)')
+    args = parser.parse_args()
+
+    with open(args.corpus, 'r') as f :
+        jobs = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(args.corpus))
+    counts = {}
+    for job in jobs :
+        if job['cpu'] == 'z80' :
+            sys.stderr.write('{}\n'.format(job['name']))
+            profile(job, base_dir, args.max_instructions, counts)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    out.write('# first second count\n')
+    for (first, second), count in sorted(counts.items(), key=lambda item: -item[1]) :
+        out.write('{:02X} {:02X} {}\n'.format(first, second, count))
+    if out is not sys.stdout :
+        out.close()
+
+if __name__ == '__main__' :
+    main()
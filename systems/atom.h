@@ -33,6 +33,23 @@
 
     FIXME!
 
+    ## Headless Mode
+
+    If atom_desc_t.headless is true (or after calling atom_set_headless(sys, true)),
+    the VDG doesn't decode video memory into the pixel buffer, and the
+    beeper doesn't generate audio samples (the audio callback isn't called).
+    The VDG's HSYNC and field sync signals work as usual, this is useful for
+    running automated tests as fast as possible. To look at the current
+    screen, switch headless mode off for one frame.
+
+    ## Snapshots
+
+    atom_save_snapshot() copies the emulator state into a caller-provided
+    atom_t with all host pointers cleared, atom_load_snapshot() copies it
+    back and keeps the host pointers and headless mode of the running
+    instance. A tape inserted with atom_insert_tape_nocopy() is only
+    referenced by the snapshot, not copied.
+
     ## TODO
 
     - handle shift key (some games use this as jump button)
@@ -66,6 +83,7 @@ extern "C" {
 #define ATOM_FREQUENCY (1000000)
 #define ATOM_MAX_AUDIO_SAMPLES (1024)       /* max number of audio samples in internal sample buffer */
 #define ATOM_DEFAULT_AUDIO_SAMPLES (128)    /* default number of samples in internal sample buffer */
+#define ATOM_SNAPSHOT_VERSION (1)           /* bumped when atom_t changes in an incompatible way */
 #define ATOM_MAX_TAPE_SIZE (1<<16)          /* max size of tape file in bytes */
 
 /* joystick emulation types */
@@ -92,6 +110,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 320*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for callbacks */
     void* user_data;
 
@@ -119,6 +140,7 @@ typedef struct {
     m6522_t via;
     beeper_t beeper;
     bool valid;
+    bool headless;
     int counter_2_4khz;
     int period_2_4khz;
     bool state_2_4khz;
@@ -141,6 +163,7 @@ typedef struct {
     /* tape loading */
     int tape_size;  /* tape_size is > 0 if a tape is inserted */
     int tape_pos;
+    const uint8_t* tape_ptr;    /* points to tape_buf[] or caller-owned memory */
     uint8_t tape_buf[ATOM_MAX_TAPE_SIZE];
 } atom_t;
 
@@ -172,8 +195,16 @@ void atom_set_joystick_type(atom_t* sys, atom_joystick_type_t type);
 atom_joystick_type_t atom_joystick_type(atom_t* sys);
 /* set joystick mask (combination of ATOM_JOYSTICK_*) */
 void atom_joystick(atom_t* sys, uint8_t mask);
+/* enable/disable headless mode (no video decoding and audio output) */
+void atom_set_headless(atom_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t atom_save_snapshot(atom_t* sys, atom_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool atom_load_snapshot(atom_t* sys, uint32_t version, const atom_t* src);
 /* insert a tape for loading (must be an Atom TAP file), data will be copied */
 bool atom_insert_tape(atom_t* sys, const uint8_t* ptr, int num_bytes);
+/* same, but without copying, data must remain valid until the tape is removed */
+bool atom_insert_tape_nocopy(atom_t* sys, const uint8_t* ptr, int num_bytes);
 /* remove tape */
 void atom_remove_tape(atom_t* sys);
 
@@ -233,6 +264,7 @@ void atom_init(atom_t* sys, const atom_desc_t* desc) {
     vdg_desc.fetch_cb = _atom_vdg_fetch;
     vdg_desc.user_data = sys;
     mc6847_init(&sys->vdg, &vdg_desc);
+    atom_set_headless(sys, desc->headless);
 
     i8255_init(&sys->ppi);
     m6522_init(&sys->via);
@@ -351,6 +383,47 @@ void atom_joystick(atom_t* sys, uint8_t mask) {
     sys->joy_joymask = mask;
 }
 
+void atom_set_headless(atom_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+    sys->vdg.headless = headless;
+}
+
+uint32_t atom_save_snapshot(atom_t* sys, atom_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    m6502_snapshot_onsave(&dst->cpu);
+    mc6847_snapshot_onsave(&dst->vdg);
+    mem_snapshot_onsave(&dst->mem, sys);
+    if (sys->tape_ptr == sys->tape_buf) {
+        dst->tape_ptr = 0;
+    }
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    return ATOM_SNAPSHOT_VERSION;
+}
+
+bool atom_load_snapshot(atom_t* sys, uint32_t version, const atom_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != ATOM_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static atom_t im;
+    im = *src;
+    m6502_snapshot_onload(&im.cpu, &sys->cpu);
+    mc6847_snapshot_onload(&im.vdg, &sys->vdg);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    if ((im.tape_size > 0) && (0 == im.tape_ptr)) {
+        im.tape_ptr = sys->tape_buf;
+    }
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    atom_set_headless(sys, headless);
+    return true;
+}
+
 /* CPU tick callback */
 uint64_t _atom_tick(atom_t* sys, uint64_t cpu_pins) {
 
@@ -365,7 +438,7 @@ uint64_t _atom_tick(atom_t* sys, uint64_t cpu_pins) {
     }
 
     /* update beeper */
-    if (beeper_tick(&sys->beeper)) {
+    if (!sys->headless && beeper_tick(&sys->beeper)) {
         /* new audio sample ready */
         sys->sample_buffer[sys->sample_pos++] = sys->beeper.sample;
         if (sys->sample_pos == sys->num_samples) {
@@ -613,24 +686,42 @@ typedef struct {
     uint16_t length;
 } _atom_tap_header;
 
-bool atom_insert_tape(atom_t* sys, const uint8_t* ptr, int num_bytes) {
+static bool _atom_insert_tape(atom_t* sys, const uint8_t* ptr, int num_bytes, bool copy) {
     CHIPS_ASSERT(sys && sys->valid);
     CHIPS_ASSERT(ptr);
     atom_remove_tape(sys);
     /* check for valid size */
-    if ((num_bytes < (int)sizeof(_atom_tap_header)) || (num_bytes > ATOM_MAX_TAPE_SIZE)) {
+    if (num_bytes < (int)sizeof(_atom_tap_header)) {
         return false;
     }
-    memcpy(sys->tape_buf, ptr, num_bytes);
+    if (copy) {
+        if (num_bytes > ATOM_MAX_TAPE_SIZE) {
+            return false;
+        }
+        memcpy(sys->tape_buf, ptr, num_bytes);
+        sys->tape_ptr = sys->tape_buf;
+    }
+    else {
+        sys->tape_ptr = ptr;
+    }
     sys->tape_pos = 0;
     sys->tape_size = num_bytes;
     return true;
 }
 
+bool atom_insert_tape(atom_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _atom_insert_tape(sys, ptr, num_bytes, true);
+}
+
+bool atom_insert_tape_nocopy(atom_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _atom_insert_tape(sys, ptr, num_bytes, false);
+}
+
 void atom_remove_tape(atom_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     sys->tape_pos = 0;
     sys->tape_size = 0;
+    sys->tape_ptr = 0;
 }
 
 /*
@@ -680,7 +771,7 @@ uint64_t _atom_osload(atom_t* sys, uint64_t pins) {
     if ((sys->tape_size > 0) && (sys->tape_pos < sys->tape_size)) {
         /* read next tape chunk */
         if ((int)(sys->tape_pos + sizeof(_atom_tap_header)) < sys->tape_size) {
-            const _atom_tap_header* hdr = (const _atom_tap_header*) &sys->tape_buf[sys->tape_pos];
+            const _atom_tap_header* hdr = (const _atom_tap_header*) &sys->tape_ptr[sys->tape_pos];
             sys->tape_pos += sizeof(_atom_tap_header);
             exec_addr = hdr->exec_addr;
             uint16_t addr = hdr->load_addr;
@@ -690,7 +781,7 @@ uint64_t _atom_osload(atom_t* sys, uint64_t pins) {
             }
             if ((sys->tape_pos + hdr->length) <= sys->tape_size) {
                 for (int i = 0; i < hdr->length; i++) {
-                    mem_wr(&sys->mem, addr++, sys->tape_buf[sys->tape_pos++]);
+                    mem_wr(&sys->mem, addr++, sys->tape_ptr[sys->tape_pos++]);
                 }
                 success = true;
             }
@@ -24,6 +24,7 @@
     - chips/ay38910.h
     - chips/clk.h
     - chips/mem.h
+    - chips/syncq.h
 
     ## The Bomb Jack Arcade Machine
 
@@ -31,7 +32,22 @@
     
         - https://floooh.github.io/2018/10/06/bombjack.html
         - https://github.com/floooh/emu-info/blob/master/misc/bombjack-schematics.pdf
+
+    ## Headless Mode
+
+    If bombjack_desc_t.headless is true (or after calling bombjack_set_headless(sys, true)),
+    the sound chips don't generate audio samples (the audio callback isn't
+    called), and bombjack_decode_video() does nothing. The emulation itself
+    runs exactly as with video and audio output, this is useful for running
+    automated tests as fast as possible.
         
+    ## Snapshots
+
+    bombjack_save_snapshot() copies the state of both boards, including the
+    queued sound commands, into a caller-provided bombjack_t,
+    bombjack_load_snapshot() restores it. The host pointers, debug
+    rendering flags and headless mode of the running instance are kept.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -59,6 +75,7 @@ extern "C" {
 
 #define BOMBJACK_MAX_AUDIO_SAMPLES (1024)
 #define BOMBJACK_DEFAULT_AUDIO_SAMPLES (128)
+#define BOMBJACK_SNAPSHOT_VERSION (5)
 
 /* joystick mask bits */
 #define BOMBJACK_JOYSTICK_RIGHT (1<<0)
@@ -130,6 +147,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 256*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for audio callback */
     void* user_data;
 
@@ -177,6 +197,7 @@ typedef struct {
 /* the whole Bomb Jack arcade machine state */
 typedef struct {
     bool valid;
+    bool headless;
     struct {
         z80_t cpu;
         clk_t clk;
@@ -196,10 +217,13 @@ typedef struct {
         z80_t cpu;
         clk_t clk;
         ay38910_t psg[3];
-        uint32_t tick_count;
+        uint32_t psg_ticks;     /* PSG ticks not yet rendered */
+        uint64_t tick_count;
         int vsync_count;
         mem_t mem;
     } soundboard;
+    uint64_t mainboard_tick_count;  /* running tick count of main board, used as sound command timestamp */
+    syncq_t sound_cmds;             /* timestamped sound commands written by main board */
     uint8_t sound_latch;            /* shared latch, written by main board, read by sound board */
     uint8_t main_ram[0x1C00];
     uint8_t sound_ram[0x0400];
@@ -237,6 +261,12 @@ void bombjack_reset(bombjack_t* sys);
 void bombjack_exec(bombjack_t* sys, uint32_t micro_seconds);
 /* decode video to pixel buffer, must be called once per frame */
 void bombjack_decode_video(bombjack_t* sys);
+/* enable/disable headless mode (no video decoding and audio output) */
+void bombjack_set_headless(bombjack_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t bombjack_save_snapshot(bombjack_t* sys, bombjack_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool bombjack_load_snapshot(bombjack_t* sys, uint32_t version, const bombjack_t* src);
 /* get the standard framebuffer width and height in pixels */
 int bombjack_std_display_width(void);
 int bombjack_std_display_height(void);
@@ -266,9 +296,11 @@ int bombjack_display_height(bombjack_t* sys);
 #define _BOMBJACK_DISPLAY_WIDTH (256)
 #define _BOMBJACK_DISPLAY_HEIGHT (256)
 #define _BOMBJACK_DISPLAY_SIZE (_BOMBJACK_DISPLAY_WIDTH*_BOMBJACK_DISPLAY_HEIGHT*4)
+#define _BOMBJACK_PSG_RENDER_TICKS (64)   /* max number of PSG ticks to accumulate before rendering */
 
 static uint64_t _bombjack_tick_mainboard(int num, uint64_t pins, void* user_data);
 static uint64_t _bombjack_tick_soundboard(int num, uint64_t pins, void* user_data);
+static void _bombjack_render_psgs(bombjack_t* sys);
 
 #define _bombjack_def(val, def) (val == 0 ? def : val)
 
@@ -357,6 +389,13 @@ void bombjack_init(bombjack_t* sys, const bombjack_desc_t* desc) {
         ay38910_init(&sys->soundboard.psg[i], &psg_desc);
     }
 
+    /* timestamped sound command queue between main and sound board */
+    syncq_desc_t syncq_desc;
+    memset(&syncq_desc, 0, sizeof(syncq_desc));
+    syncq_desc.src_freq_hz = _BOMBJACK_MAINBOARD_FREQUENCY;
+    syncq_desc.dst_freq_hz = _BOMBJACK_SOUNDBOARD_FREQUENCY;
+    syncq_init(&sys->sound_cmds, &syncq_desc);
+
     /* dip switches */
     sys->mainboard.dsw1 = BOMBJACK_DSW1_DEFAULT;
     sys->mainboard.dsw2 = BOMBJACK_DSW2_DEFAULT;
@@ -404,6 +443,7 @@ void bombjack_init(bombjack_t* sys, const bombjack_desc_t* desc) {
     sys->user_data = desc->user_data;
     CHIPS_ASSERT((0 == desc->pixel_buffer) || (desc->pixel_buffer && (desc->pixel_buffer_size >= _BOMBJACK_DISPLAY_SIZE)));
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
+    bombjack_set_headless(sys, desc->headless);
 }
 
 void bombjack_discard(bombjack_t* sys) {
@@ -435,8 +475,11 @@ int bombjack_display_height(bombjack_t* sys) {
 
 void bombjack_reset(bombjack_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
+    syncq_reset(&sys->sound_cmds);
+    sys->sound_latch = 0;
     z80_reset(&sys->mainboard.cpu);
     z80_reset(&sys->soundboard.cpu);
+    _bombjack_render_psgs(sys);
     for (int i = 0; i < 3; i++) {
         ay38910_reset(&sys->soundboard.psg[i]);
     }
@@ -444,34 +487,77 @@ void bombjack_reset(bombjack_t* sys) {
 
 void bombjack_exec(bombjack_t* sys, uint32_t micro_seconds) {
     CHIPS_ASSERT(sys && sys->valid);
-    /* Run the main board and sound board interleaved for half a frame.
-       This simplifies the communication via the sound latch (the main CPU
-       writes a command byte to the sound latch, the sound board reads
-       the command latch in its interrupt service routine.
-
-       The main board issues at most one command per 60Hz frame, but since the
-       host machine is also running at roughly 60 Hz it may happen that the
-       main board writes 2 sound commands per host frame. For this reason
-       run the 2 boards interleaved for half a frame, so it is guaranteed
-       that at most one sound command can be written by the main board
-       before the sound board is ticked (that way we don't need to implement
-       a complicated command queue.
+    /* Run the main board and sound board for the whole time slice each.
+
+       The only communication between the boards is the sound command latch
+       (the main CPU writes a command byte to the sound latch, the sound board
+       reads the command latch in its interrupt service routine). Instead of
+       running both boards interleaved in small slices, the main board runs
+       first and records each write to the sound latch with its timestamp
+       in a queue, and the sound board applies all queued commands with
+       a timestamp in its past when it reads the latch. This way the
+       sound board sees each command exactly at the time it was written
+       (and more than one sound command per host frame is no problem).
     */
-    const uint32_t slice_us = micro_seconds/2;
-    for (int i = 0; i < 2; i++) {
-        /* tick the main board */
-        {
-            uint32_t ticks_to_run = clk_ticks_to_run(&sys->mainboard.clk, slice_us);
-            uint32_t ticks_executed = z80_exec(&sys->mainboard.cpu, ticks_to_run);
-            clk_ticks_executed(&sys->mainboard.clk, ticks_executed);
-        }
-        /* tick the sound board */
-        {
-            uint32_t ticks_to_run = clk_ticks_to_run(&sys->soundboard.clk, slice_us);
-            uint32_t ticks_executed = z80_exec(&sys->soundboard.cpu, ticks_to_run);
-            clk_ticks_executed(&sys->soundboard.clk, ticks_executed);
-        }
+    {
+        uint32_t ticks_to_run = clk_ticks_to_run(&sys->mainboard.clk, micro_seconds);
+        uint32_t ticks_executed = z80_exec(&sys->mainboard.cpu, ticks_to_run);
+        clk_ticks_executed(&sys->mainboard.clk, ticks_executed);
+    }
+    {
+        uint32_t ticks_to_run = clk_ticks_to_run(&sys->soundboard.clk, micro_seconds);
+        uint32_t ticks_executed = z80_exec(&sys->soundboard.cpu, ticks_to_run);
+        clk_ticks_executed(&sys->soundboard.clk, ticks_executed);
+        _bombjack_render_psgs(sys);
+    }
+}
+
+void bombjack_set_headless(bombjack_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+    for (int i = 0; i < 3; i++) {
+        sys->soundboard.psg[i].headless = headless;
+    }
+}
+
+uint32_t bombjack_save_snapshot(bombjack_t* sys, bombjack_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->mainboard.cpu);
+    z80_snapshot_onsave(&dst->soundboard.cpu);
+    for (int i = 0; i < 3; i++) {
+        ay38910_snapshot_onsave(&dst->soundboard.psg[i], 0);
     }
+    mem_snapshot_onsave(&dst->mainboard.mem, sys);
+    mem_snapshot_onsave(&dst->soundboard.mem, sys);
+    dst->user_data = 0;
+    dst->audio.callback = 0;
+    dst->pixel_buffer = 0;
+    return BOMBJACK_SNAPSHOT_VERSION;
+}
+
+bool bombjack_load_snapshot(bombjack_t* sys, uint32_t version, const bombjack_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != BOMBJACK_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static bombjack_t im;
+    im = *src;
+    z80_snapshot_onload(&im.mainboard.cpu, &sys->mainboard.cpu);
+    z80_snapshot_onload(&im.soundboard.cpu, &sys->soundboard.cpu);
+    for (int i = 0; i < 3; i++) {
+        ay38910_snapshot_onload(&im.soundboard.psg[i], &sys->soundboard.psg[i]);
+    }
+    mem_snapshot_onload(&im.mainboard.mem, &sys->mainboard.mem, sys);
+    mem_snapshot_onload(&im.soundboard.mem, &sys->soundboard.mem, sys);
+    im.user_data = sys->user_data;
+    im.audio.callback = sys->audio.callback;
+    im.pixel_buffer = sys->pixel_buffer;
+    im.dbg = sys->dbg;
+    const bool headless = sys->headless;
+    *sys = im;
+    bombjack_set_headless(sys, headless);
+    return true;
 }
 
 /* Maintain a color palette cache with 32-bit colors, this is called for
@@ -499,6 +585,31 @@ static inline void _bombjack_update_palette_cache(bombjack_t* sys, uint16_t addr
     sys->mainboard.palette[pal_index] = c;
 }
 
+/* render the accumulated PSG ticks and mix the samples of the 3 sound chips */
+static void _bombjack_render_psgs(bombjack_t* sys) {
+    if (sys->soundboard.psg_ticks > 0) {
+        /* all 3 sound chips are ticked in lockstep, so they all
+           produce the same number of samples
+        */
+        float samples[3][_BOMBJACK_PSG_RENDER_TICKS];
+        int num_samples = 0;
+        for (int i = 0; i < 3; i++) {
+            num_samples = ay38910_render(&sys->soundboard.psg[i], sys->soundboard.psg_ticks, samples[i]);
+        }
+        sys->soundboard.psg_ticks = 0;
+        for (int i = 0; i < num_samples; i++) {
+            float s = samples[0][i] + samples[1][i] + samples[2][i];
+            sys->audio.sample_buffer[sys->audio.sample_pos++] = s * sys->audio.volume;
+            if (sys->audio.sample_pos == sys->audio.num_samples) {
+                if (sys->audio.callback) {
+                    sys->audio.callback(sys->audio.sample_buffer, sys->audio.num_samples, sys->user_data);
+                }
+                sys->audio.sample_pos = 0;
+            }
+        }
+    }
+}
+
 /* main board tick callback
 
     Bomb Jack uses memory mapped IO (the Z80's IORQ pin isn't connected).
@@ -564,6 +675,7 @@ static inline void _bombjack_update_palette_cache(bombjack_t* sys, uint16_t addr
 */
 static uint64_t _bombjack_tick_mainboard(int num_ticks, uint64_t pins, void* user_data) {
     bombjack_t* sys = (bombjack_t*) user_data;
+    sys->mainboard_tick_count += num_ticks;
 
     /* activate NMI pin during VBLANK */
     sys->mainboard.vsync_count -= num_ticks;
@@ -613,8 +725,11 @@ static uint64_t _bombjack_tick_mainboard(int num_ticks, uint64_t pins, void* use
             }
             /* FIXME: 0xB004: flip screen */
             else if (addr == 0xB800) {
-                /* shared sound latch */
-                sys->sound_latch = data;
+                /* shared sound latch, delivered to the sound board with timestamp
+                   (if the queue is full, the oldest command is dropped, this
+                   is counted in sound_cmds.num_overflows)
+                */
+                syncq_push(&sys->sound_cmds, sys->mainboard_tick_count, data);
             }
         }
         else if (pins & Z80_RD) {
@@ -683,23 +798,13 @@ static uint64_t _bombjack_tick_soundboard(int num_ticks, uint64_t pins, void* us
         pins |= Z80_NMI;
     }
 
-    /* tick the 3 sound chips at half frequency */
+    /* tick the 3 sound chips at half frequency (the ticks are accumulated
+       and rendered in one go)
+    */
     for (int i = 0; i < num_ticks; i++) {
         if (sys->soundboard.tick_count++ & 1) {
-            ay38910_tick(&sys->soundboard.psg[2]);
-            ay38910_tick(&sys->soundboard.psg[1]);
-            if (ay38910_tick(&sys->soundboard.psg[0])) {
-                /* new sample ready */
-                float s = sys->soundboard.psg[0].sample +
-                          sys->soundboard.psg[1].sample + 
-                          sys->soundboard.psg[2].sample;
-                sys->audio.sample_buffer[sys->audio.sample_pos++] = s * sys->audio.volume;
-                if (sys->audio.sample_pos == sys->audio.num_samples) {
-                    if (sys->audio.callback) {
-                        sys->audio.callback(sys->audio.sample_buffer, sys->audio.num_samples, sys->user_data);
-                    }
-                    sys->audio.sample_pos = 0;
-                }
+            if (++sys->soundboard.psg_ticks == _BOMBJACK_PSG_RENDER_TICKS) {
+                _bombjack_render_psgs(sys);
             }
         }
     }
@@ -710,6 +815,11 @@ static uint64_t _bombjack_tick_soundboard(int num_ticks, uint64_t pins, void* us
         if (pins & Z80_RD) {
             /* special case: read and clear sound latch and NMI flip-flop */
             if (addr == 0x6000) {
+                /* apply sound commands which have been written up to now */
+                uint32_t cmd;
+                while (syncq_pop(&sys->sound_cmds, sys->soundboard.tick_count, &cmd)) {
+                    sys->sound_latch = (uint8_t) cmd;
+                }
                 Z80_SET_DATA(pins, sys->sound_latch);
                 sys->sound_latch = 0;
                 pins &= ~Z80_NMI;
@@ -748,6 +858,7 @@ static uint64_t _bombjack_tick_soundboard(int num_ticks, uint64_t pins, void* us
             if (0 == (addr & 1)) {
                 psg_pins |= AY38910_BC1;
             }
+            _bombjack_render_psgs(sys);
             pins = ay38910_iorq(&sys->soundboard.psg[psg_index], psg_pins);
         }
     }
@@ -1026,7 +1137,7 @@ static void _bombjack_decode_sprites(bombjack_t* sys) {
 }
 
 void bombjack_decode_video(bombjack_t* sys) {
-    if (sys->pixel_buffer) {
+    if (sys->pixel_buffer && !sys->headless) {
         if (sys->dbg.draw_background_layer) {
             _bombjack_decode_background(sys);
         }
@@ -56,6 +56,15 @@
     bool c1530_tape_inserted(c1530_t* sys);
     ~~~
 
+    c1530_insert_tape() copies the tape data into the c1530_t, alternatively
+    use the following function to keep a pointer to the caller-owned data
+    instead (for instance a memory-mapped file), in this case the data must
+    remain valid until the tape is removed:
+
+    ~~~C
+    bool c1530_insert_tape_nocopy(c1530_t* sys, const uint8_t* ptr, int num_bytes);
+    ~~~
+
     Call the following functions to control the tape motor (press the Play
     or Stop buttons):
 
@@ -68,6 +77,28 @@
     The motor may also be switched on/off by the computer system through
     the cassette port's MOTOR pin.
 
+    ## Fast Loading
+
+    To load tapes without waiting for the pulses to be played back in real
+    time, the computer system emulators may trap the tape routines in the
+    operating system ROM, and call the following function instead to decode
+    the next block written in the standard CBM ROM loader format directly
+    from the .TAP pulse data:
+
+    ~~~C
+    int c1530_read_block(c1530_t* sys, uint8_t* dst, int max_bytes);
+    ~~~
+
+    The function skips the leader until the next block, decodes the block
+    into dst (at most max_bytes are written, dst may be a null pointer),
+    and also consumes the repeated copy of the block (which is used
+    instead if the checksum of the first copy doesn't match). The tape
+    position is moved behind the block, so that the real-time pulse
+    playback continues from there (for instance for custom turbo loaders).
+    The return value is the size of the block in bytes, or -1 if no valid
+    block was found until the end of the tape (or if both copies of the
+    block have a checksum error).
+
     ## zlib/libpng license
 
     Copyright (c) 2019 Andre Weissflog
@@ -115,6 +146,7 @@ typedef struct {
     uint32_t size;      /* tape_size > 0: a tape is inserted */
     uint32_t pos;
     uint32_t pulse_count;
+    const uint8_t* ptr; /* points to buf[] or caller-owned memory */
     uint8_t buf[C1530_MAX_TAPE_SIZE];
 } c1530_t;
 
@@ -128,16 +160,24 @@ void c1530_reset(c1530_t* sys);
 void c1530_tick(c1530_t* sys);
 /* insert a tape file */
 bool c1530_insert_tape(c1530_t* sys, const uint8_t* ptr, int num_bytes);
+/* insert a tape file without copying, data must remain valid until the tape is removed */
+bool c1530_insert_tape_nocopy(c1530_t* sys, const uint8_t* ptr, int num_bytes);
 /* remove tape file */
 void c1530_remove_tape(c1530_t* sys);
 /* return true if a tape is currently inserted */
 bool c1530_tape_inserted(c1530_t* sys);
+/* decode the next CBM ROM loader block into dst, return block size or -1 */
+int c1530_read_block(c1530_t* sys, uint8_t* dst, int max_bytes);
 /* start the tape (press the Play button) */
 void c1530_play(c1530_t* sys);
 /* stop the tape (unpress the Play button */
 void c1530_stop(c1530_t* sys);
 /* return true if tape motor is on */
 bool c1530_is_motor_on(c1530_t* sys);
+/* clear host pointers in a snapshot before saving */
+void c1530_snapshot_onsave(c1530_t* snapshot, c1530_t* sys);
+/* restore host pointers in a snapshot before loading */
+void c1530_snapshot_onload(c1530_t* snapshot, c1530_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -180,7 +220,7 @@ typedef struct {
     uint32_t size;          /* size of the following data */
 } _c1530_tap_header;
 
-bool c1530_insert_tape(c1530_t* sys, const uint8_t* ptr, int num_bytes) {
+static bool _c1530_insert_tape(c1530_t* sys, const uint8_t* ptr, int num_bytes, bool copy) {
     CHIPS_ASSERT(sys && sys->valid && ptr);
     c1530_remove_tape(sys);
     if (num_bytes <= (int) sizeof(_c1530_tap_header)) {
@@ -200,16 +240,30 @@ bool c1530_insert_tape(c1530_t* sys, const uint8_t* ptr, int num_bytes) {
     if (num_bytes < (int)(hdr->size + sizeof(_c1530_tap_header))) {
         return false;
     }
-    if (num_bytes > (int)sizeof(sys->buf)) {
-        return false;
+    if (copy) {
+        if (num_bytes > (int)sizeof(sys->buf)) {
+            return false;
+        }
+        memcpy(sys->buf, ptr, hdr->size);
+        sys->ptr = sys->buf;
+    }
+    else {
+        sys->ptr = ptr;
     }
-    memcpy(sys->buf, ptr, hdr->size);
     sys->size = hdr->size;
     sys->pos = 0;
     sys->pulse_count = 0;
     return true;
 }
 
+bool c1530_insert_tape(c1530_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _c1530_insert_tape(sys, ptr, num_bytes, true);
+}
+
+bool c1530_insert_tape_nocopy(c1530_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _c1530_insert_tape(sys, ptr, num_bytes, false);
+}
+
 void c1530_play(c1530_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     /* motor on, play button down */
@@ -233,6 +287,7 @@ void c1530_remove_tape(c1530_t* sys) {
     sys->size = 0;
     sys->pos = 0;
     sys->pulse_count = 0;
+    sys->ptr = 0;
 }
 
 bool c1530_tape_inserted(c1530_t* sys) {
@@ -245,11 +300,11 @@ void c1530_tick(c1530_t* sys) {
     *sys->cas_port &= ~C1530_CASPORT_READ;
     if (c1530_is_motor_on(sys) && (sys->size > 0) && (sys->pos <= sys->size)) {
         if (sys->pulse_count == 0) {
-            uint8_t val = sys->buf[sys->pos++];
+            uint8_t val = sys->ptr[sys->pos++];
             if (val == 0) {
                 uint8_t s[3];
                 for (int i = 0; i < 3; i++) {
-                    s[i] = sys->buf[sys->pos++];
+                    s[i] = sys->ptr[sys->pos++];
                 }
                 sys->pulse_count = (s[2]<<16) | (s[1]<<8) | s[0];
             }
@@ -264,4 +319,206 @@ void c1530_tick(c1530_t* sys) {
     }
 }
 
+/*
+    CBM ROM loader block decoding (for fast loading)
+
+    Each byte is encoded as a (long,medium) pulse pair byte marker, followed
+    by 8 data bits (LSB first) and an odd parity bit, where each bit is a
+    pulse pair: (short,medium) is a 0-bit, and (medium,short) is a 1-bit.
+    A (long,short) pair marks the end of the block. A block starts with the
+    countdown sequence $89..$81 (or $09..$01 for the repeated copy), followed
+    by the data bytes and an XOR checksum byte.
+*/
+#define _C1530_PULSE_SHORT  (0)
+#define _C1530_PULSE_MEDIUM (1)
+#define _C1530_PULSE_LONG   (2)
+#define _C1530_PULSE_OTHER  (3)
+#define _C1530_PULSE_END    (4)
+
+/* read the next pulse and classify by its length in CPU cycles */
+static int _c1530_read_pulse(const c1530_t* sys, uint32_t* pos) {
+    if (*pos >= sys->size) {
+        return _C1530_PULSE_END;
+    }
+    uint32_t cycles = sys->ptr[(*pos)++];
+    if (cycles == 0) {
+        if ((*pos + 3) > sys->size) {
+            *pos = sys->size;
+            return _C1530_PULSE_END;
+        }
+        const uint8_t* s = &sys->ptr[*pos];
+        cycles = (s[2]<<16) | (s[1]<<8) | s[0];
+        *pos += 3;
+    }
+    else {
+        cycles *= 8;
+    }
+    if (cycles < 0x24*8) {
+        return _C1530_PULSE_OTHER;
+    }
+    else if (cycles < 0x3A*8) {
+        return _C1530_PULSE_SHORT;
+    }
+    else if (cycles < 0x4C*8) {
+        return _C1530_PULSE_MEDIUM;
+    }
+    else if (cycles < 0x64*8) {
+        return _C1530_PULSE_LONG;
+    }
+    else {
+        return _C1530_PULSE_OTHER;
+    }
+}
+
+/* decode the data bits of a byte after its byte marker, return -1 on error */
+static int _c1530_read_byte_bits(const c1530_t* sys, uint32_t* pos) {
+    int val = 0;
+    int parity = 0;
+    for (int i = 0; i < 9; i++) {
+        const int p0 = _c1530_read_pulse(sys, pos);
+        const int p1 = _c1530_read_pulse(sys, pos);
+        int bit;
+        if ((p0 == _C1530_PULSE_SHORT) && (p1 == _C1530_PULSE_MEDIUM)) {
+            bit = 0;
+        }
+        else if ((p0 == _C1530_PULSE_MEDIUM) && (p1 == _C1530_PULSE_SHORT)) {
+            bit = 1;
+        }
+        else {
+            return -1;
+        }
+        if (i < 8) {
+            val |= bit<<i;
+        }
+        parity ^= bit;
+    }
+    /* odd parity over data bits and parity bit */
+    return (parity == 1) ? val : -1;
+}
+
+/*
+    decode one copy of a block, starting the search at *pos, returns
+    the block size and the first countdown byte, or -1 if the end
+    of the tape was reached without finding a valid block
+*/
+static int _c1530_decode_block(const c1530_t* sys, uint32_t* pos, uint8_t* dst, int max_bytes, uint8_t* out_sync, bool* out_checksum_ok) {
+    while (*pos < sys->size) {
+        /* find the first byte marker */
+        int p = _c1530_read_pulse(sys, pos);
+        if (p != _C1530_PULSE_LONG) {
+            continue;
+        }
+        uint32_t restart_pos = *pos;
+        if (_c1530_read_pulse(sys, pos) != _C1530_PULSE_MEDIUM) {
+            *pos = restart_pos;
+            continue;
+        }
+        /* check the countdown sequence */
+        int sync = _c1530_read_byte_bits(sys, pos);
+        if ((sync != 0x89) && (sync != 0x09)) {
+            *pos = restart_pos;
+            continue;
+        }
+        bool valid = true;
+        for (int i = 1; i < 9; i++) {
+            if ((_c1530_read_pulse(sys, pos) != _C1530_PULSE_LONG) ||
+                (_c1530_read_pulse(sys, pos) != _C1530_PULSE_MEDIUM) ||
+                (_c1530_read_byte_bits(sys, pos) != (sync - i)))
+            {
+                valid = false;
+                break;
+            }
+        }
+        if (!valid) {
+            *pos = restart_pos;
+            continue;
+        }
+        /* decode data bytes until the end-of-block marker, the last
+           byte is the checksum, so each byte is stored one byte late
+        */
+        int num_bytes = -1;
+        int pending = -1;
+        uint8_t checksum = 0;
+        while (true) {
+            const uint32_t byte_pos = *pos;
+            const int p0 = _c1530_read_pulse(sys, pos);
+            const int p1 = _c1530_read_pulse(sys, pos);
+            int val = -1;
+            if ((p0 == _C1530_PULSE_LONG) && (p1 == _C1530_PULSE_MEDIUM)) {
+                val = _c1530_read_byte_bits(sys, pos);
+            }
+            if (val < 0) {
+                /* end-of-block marker, or end of block data via dropout */
+                if (!((p0 == _C1530_PULSE_LONG) && (p1 == _C1530_PULSE_SHORT))) {
+                    *pos = byte_pos;
+                }
+                break;
+            }
+            if (pending >= 0) {
+                if (dst && (num_bytes < max_bytes)) {
+                    dst[num_bytes] = (uint8_t) pending;
+                }
+            }
+            num_bytes++;
+            pending = val;
+            checksum ^= (uint8_t) val;
+        }
+        if (num_bytes < 0) {
+            /* not even a checksum byte */
+            *pos = restart_pos;
+            continue;
+        }
+        *out_sync = (uint8_t) sync;
+        *out_checksum_ok = (checksum == 0);
+        return num_bytes;
+    }
+    return -1;
+}
+
+int c1530_read_block(c1530_t* sys, uint8_t* dst, int max_bytes) {
+    CHIPS_ASSERT(sys && sys->valid);
+    CHIPS_ASSERT(max_bytes >= 0);
+    if (0 == sys->size) {
+        return -1;
+    }
+    uint32_t pos = sys->pos;
+    uint8_t sync = 0;
+    bool checksum_ok = false;
+    int num_bytes = _c1530_decode_block(sys, &pos, dst, max_bytes, &sync, &checksum_ok);
+    if ((num_bytes >= 0) && (sync == 0x89)) {
+        /* consume the repeated copy, and use it if the first copy was broken */
+        uint32_t repeat_pos = pos;
+        uint8_t repeat_sync = 0;
+        bool repeat_checksum_ok = false;
+        int repeat_num_bytes = _c1530_decode_block(sys, &repeat_pos, 0, 0, &repeat_sync, &repeat_checksum_ok);
+        if ((repeat_num_bytes >= 0) && (repeat_sync == 0x09)) {
+            if (!checksum_ok && repeat_checksum_ok) {
+                num_bytes = _c1530_decode_block(sys, &pos, dst, max_bytes, &repeat_sync, &repeat_checksum_ok);
+                checksum_ok = true;
+            }
+            pos = repeat_pos;
+        }
+    }
+    sys->pos = pos;
+    sys->pulse_count = 0;
+    return checksum_ok ? num_bytes : -1;
+}
+
+void c1530_snapshot_onsave(c1530_t* snapshot, c1530_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->cas_port = 0;
+    if (sys->ptr == sys->buf) {
+        /* the tape data is part of the snapshot */
+        snapshot->ptr = 0;
+    }
+}
+
+void c1530_snapshot_onload(c1530_t* snapshot, c1530_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->cas_port = sys->cas_port;
+    if ((snapshot->size > 0) && (0 == snapshot->ptr)) {
+        snapshot->ptr = sys->buf;
+    }
+}
+
 #endif /* CHIPS_IMPL */
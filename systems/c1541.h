@@ -24,6 +24,22 @@
     - chips/m6522.h
     - chips/mem.h
 
+    ## Idle Mode
+
+    Most of the time the drive CPU spins in a short wait loop. The emulator
+    detects such loops by taking a snapshot of the CPU state at an
+    instruction fetch and comparing it against the CPU state at following
+    instruction fetches. If the exact same CPU state is reached again
+    without any memory writes in between, the drive is in a deterministic
+    loop with a known period (in ticks) and will be suspended, each
+    call to c1541_tick() only counts ticks until the IEC bus lines
+    change or the drive is reset. The drive is then resynchronized
+    cycle-exactly by running the remaining (elapsed ticks modulo loop period)
+    ticks.
+
+    If drive memory is modified from the outside (for instance in a debugger
+    memory editor), call c1541_wakeup() before the modification.
+
     ## zlib/libpng license
 
     Copyright (c) 2019 Andre Weissflog
@@ -57,6 +73,7 @@ extern "C" {
 #define C1541_IECPORT_ATN   (1<<4)
 
 #define C1541_FREQUENCY (1000000)
+#define C1541_IDLE_MAX_PERIOD (256)    /* max length of a detected idle loop in ticks */
 
 /* config params for c1541_init() */
 typedef struct {
@@ -69,6 +86,17 @@ typedef struct {
     int rom_e000_ffff_size;
 } c1541_desc_t;
 
+/* idle-loop detection state */
+typedef struct {
+    m6502_t cpu;            /* CPU state snapshot at loop start */
+    uint64_t pins;          /* CPU pin state at loop start */
+    uint32_t ticks;         /* ticks since snapshot was taken */
+    uint32_t period;        /* loop period in ticks while sleeping, 0 if awake */
+    uint32_t sleep_ticks;   /* number of ticks skipped while sleeping */
+    uint8_t iec;            /* IEC port state when going to sleep */
+    bool valid;             /* true if snapshot is valid */
+} c1541_idle_t;
+
 /* 1541 emulator state */
 typedef struct {
     uint64_t pins;
@@ -76,6 +104,7 @@ typedef struct {
     m6502_t cpu;
     m6522_t via_1;
     m6522_t via_2;
+    c1541_idle_t idle;
     bool valid;
     mem_t mem;
     uint8_t ram[0x0800];
@@ -90,10 +119,16 @@ void c1541_discard(c1541_t* sys);
 void c1541_reset(c1541_t* sys);
 /* tick a c1541_t instance forward */
 void c1541_tick(c1541_t* sys);
+/* resynchronize a sleeping drive (call before modifying drive memory) */
+void c1541_wakeup(c1541_t* sys);
 /* insert a disc image file (.d64) */
 void c1541_insert_disc(c1541_t* sys, const uint8_t* ptr, int num_bytes);
 /* remove current disc */
 void c1541_remove_disc(c1541_t* sys);
+/* clear host pointers in a snapshot before saving */
+void c1541_snapshot_onsave(c1541_t* snapshot, c1541_t* sys);
+/* restore host pointers in a snapshot before loading */
+void c1541_snapshot_onload(c1541_t* snapshot, c1541_t* sys);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -112,6 +147,7 @@ void c1541_init(c1541_t* sys, const c1541_desc_t* desc) {
 
     memset(sys, 0, sizeof(c1541_t));
     sys->valid = true;
+    sys->iec = desc->iec_port;
 
     /* copy ROM images */
     CHIPS_ASSERT(desc->rom_c000_dfff && (0x2000 == desc->rom_c000_dfff_size));
@@ -139,14 +175,17 @@ void c1541_discard(c1541_t* sys) {
 
 void c1541_reset(c1541_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
+    c1541_wakeup(sys);
     sys->pins |= M6502_RES;
     m6522_reset(&sys->via_1);
     m6522_reset(&sys->via_2);
 }
 
-void c1541_tick(c1541_t* sys) {
-    uint64_t pins = sys->pins;
+static inline uint8_t _c1541_iec(c1541_t* sys) {
+    return sys->iec ? *sys->iec : 0xFF;
+}
 
+static uint64_t _c1541_tick(c1541_t* sys, uint64_t pins) {
     pins = m6502_tick(&sys->cpu, pins);
     const uint16_t addr = M6502_GET_ADDR(pins);
 
@@ -156,8 +195,67 @@ void c1541_tick(c1541_t* sys) {
     else {
         mem_wr(&sys->mem, addr, M6502_GET_DATA(pins));
     }
+    return pins;
+}
+
+/*
+    Idle loop detection: if the CPU reaches the exact same state at an
+    instruction fetch without any memory writes in between, all following
+    ticks will repeat the same sequence (the CPU only reads from RAM and ROM
+    which haven't changed), so the drive can be put to sleep.
+*/
+static void _c1541_detect_idle(c1541_t* sys, uint64_t pins) {
+    c1541_idle_t* idle = &sys->idle;
+    if (0 == (pins & M6502_RW)) {
+        idle->valid = false;
+        return;
+    }
+    idle->ticks++;
+    if (pins & M6502_SYNC) {
+        if (idle->valid && (pins == idle->pins) && (0 == memcmp(&sys->cpu, &idle->cpu, sizeof(m6502_t)))) {
+            idle->period = idle->ticks;
+            idle->sleep_ticks = 0;
+            idle->iec = _c1541_iec(sys);
+        }
+        else if (!idle->valid || (idle->ticks > C1541_IDLE_MAX_PERIOD)) {
+            memcpy(&idle->cpu, &sys->cpu, sizeof(m6502_t));
+            idle->pins = pins;
+            idle->ticks = 0;
+            idle->valid = true;
+        }
+    }
+}
 
-    sys->pins = pins;
+void c1541_wakeup(c1541_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid);
+    c1541_idle_t* idle = &sys->idle;
+    if (idle->period > 0) {
+        /* the drive is still at the start of the loop, only the
+           remaining ticks of the last loop iteration need to be replayed
+        */
+        const uint32_t num_ticks = idle->sleep_ticks % idle->period;
+        uint64_t pins = sys->pins;
+        for (uint32_t i = 0; i < num_ticks; i++) {
+            pins = _c1541_tick(sys, pins);
+        }
+        sys->pins = pins;
+        idle->period = 0;
+        idle->sleep_ticks = 0;
+    }
+    idle->valid = false;
+}
+
+void c1541_tick(c1541_t* sys) {
+    if (sys->idle.period > 0) {
+        if (_c1541_iec(sys) == sys->idle.iec) {
+            sys->idle.sleep_ticks++;
+            return;
+        }
+        /* IEC bus lines have changed, resynchronize */
+        c1541_wakeup(sys);
+    }
+    sys->pins = _c1541_tick(sys, sys->pins);
+    _c1541_detect_idle(sys, sys->pins);
 }
 
 void c1541_insert_disc(c1541_t* sys, const uint8_t* ptr, int num_bytes) {
@@ -172,4 +270,18 @@ void c1541_remove_disc(c1541_t* sys) {
     (void)sys;
 }
 
+void c1541_snapshot_onsave(c1541_t* snapshot, c1541_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->iec = 0;
+    m6502_snapshot_onsave(&snapshot->cpu);
+    mem_snapshot_onsave(&snapshot->mem, sys);
+}
+
+void c1541_snapshot_onload(c1541_t* snapshot, c1541_t* sys) {
+    CHIPS_ASSERT(snapshot && sys);
+    snapshot->iec = sys->iec;
+    m6502_snapshot_onload(&snapshot->cpu, &sys->cpu);
+    mem_snapshot_onload(&snapshot->mem, &sys->mem, sys);
+}
+
 #endif /* CHIPS_IMPL */
@@ -35,6 +35,68 @@
 
     TODO!
 
+    ## Headless Mode
+
+    If c64_desc_t.headless is true (or after calling c64_set_headless(sys, true)),
+    the VIC-II doesn't write pixels into the pixel buffer, and the SID
+    doesn't generate audio samples (the audio callback isn't called). All
+    timing-relevant side effects (raster interrupts, badline and sprite DMA
+    stalls, sprite collisions, SID oscillator and envelope state) happen
+    exactly like with video and audio output, this is useful for running
+    automated tests as fast as possible. To look at the current screen,
+    switch headless mode off for one frame.
+
+    ## Deferred Audio
+
+    If c64_desc_t.audio_deferred is true, the SID sound synthesis is moved
+    out of c64_exec(), so that it can run on another thread. c64_exec()
+    only records the SID register writes (see 'Deferred Synthesis' in
+    m6581.h), and the host application hands the recorded writes over to
+    the synthesis once per frame by calling (on the emulation thread,
+    after c64_exec()):
+
+    ~~~C
+    void c64_audio_swap(c64_t* sys)
+    ~~~
+
+    The handed-over writes are then synthesized by calling the following
+    function on any thread, this writes the audio samples into the sample
+    buffer and calls the audio callback (on that same thread):
+
+    ~~~C
+    void c64_audio_synth(c64_t* sys)
+    ~~~
+
+    c64_audio_synth() only accesses the SID synthesis state (c64_t.sid_synth),
+    the sample buffer and the log passed by c64_audio_swap(), so the two
+    threads don't need any locking. c64_audio_synth() must have returned before
+    the next call to c64_audio_swap(), and before c64_save_snapshot() or
+    c64_load_snapshot() is called
+    (c64.h doesn't contain any threading code, the host application takes
+    care of this, for instance with a semaphore).
+
+    ## Tape Fast Loading
+
+    If c64_desc_t.c1530_fast_load is true, the KERNAL routines which read
+    a tape header into the cassette buffer and a program into memory
+    are trapped, and the blocks are decoded directly from the .TAP pulse
+    data (see c1530_read_block()) instead of being played back in real
+    time. The trapped routines return with the same memory locations and
+    CPU flags as the original routines. Programs which use their own
+    tape loader after the first block are still loaded in real time from
+    the tape position behind the trapped blocks. The traps are only
+    active while the original KERNAL code is mapped in. Switch between fast
+    and real-time loading at any time by setting c64_t.c1530_fast_load.
+
+    ## Snapshots
+
+    Call c64_save_snapshot() to copy the emulator state (including the
+    datassette and floppy drive) into a caller-provided c64_t, and
+    c64_load_snapshot() to copy it back. Before the state is copied, pending
+    VIC-II pixel output is decoded, so that the snapshot doesn't reference
+    the pixel buffer. A loaded snapshot keeps the host callbacks, the headless
+    mode and the c1530_fast_load setting of the running instance.
+
     ## TODO:
 
     - floppy disc support
@@ -251,6 +313,7 @@ extern "C" {
 #define C64_FREQUENCY (985248)              /* clock frequency in Hz */
 #define C64_MAX_AUDIO_SAMPLES (1024)        /* max number of audio samples in internal sample buffer */
 #define C64_DEFAULT_AUDIO_SAMPLES (128)     /* default number of samples in internal sample buffer */ 
+#define C64_SNAPSHOT_VERSION (3)            /* bumped when c64_t changes in an incompatible way */
 
 /* C64 joystick types */
 typedef enum {
@@ -293,6 +356,7 @@ typedef void (*c64_audio_callback_t)(const float* samples, int num_samples, void
 /* config parameters for c64_init() */
 typedef struct {
     bool c1530_enabled;     /* true to enable the C1530 datassette emulation */
+    bool c1530_fast_load;   /* true to trap the KERNAL tape loader for instant loading */
     bool c1541_enabled;     /* true to enable the C1541 floppy drive emulation */
     c64_joystick_type_t joystick_type;  /* default is C64_JOYSTICK_NONE */
 
@@ -300,6 +364,10 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, 
                                    at least 512*312*4 bytes, or ask via c64_max_display_size() */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
+    bool video_line_batched;    /* if true, use the line-batched VIC-II pixel decoder */
+
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
 
     /* optional user-data for callback functions */
     void* user_data;
@@ -309,6 +377,7 @@ typedef struct {
     int audio_num_samples;          /* default is C64_AUDIO_NUM_SAMPLES */
     int audio_sample_rate;          /* playback sample rate in Hz, default is 44100 */
     float audio_sid_volume;         /* audio volume of the SID chip (0.0 .. 1.0), default is 1.0 */
+    bool audio_deferred;            /* if true, SID synthesis moves to c64_audio_synth() */
 
     /* ROM images */
     const void* rom_char;           /* 4 KByte character ROM dump */
@@ -333,9 +402,12 @@ typedef struct {
     m6526_t cia_2;
     m6569_t vic;
     m6581_t sid;
+    m6581_t sid_synth;          /* SID synthesis state for c64_audio_synth() */
     
     bool valid;
     c64_joystick_type_t joystick_type;
+    bool headless;              /* true if video decoding and audio output are skipped */
+    bool c1530_fast_load;       /* true if the KERNAL tape loader is trapped */
     bool io_mapped;             /* true when D000..DFFF has IO area mapped in */
     uint8_t cas_port;           /* cassette port, shared with c1530_t if datasette is connected */
     uint8_t iec_port;           /* IEC serial port, shared with c1541_t if connected */
@@ -395,10 +467,22 @@ void c64_set_joystick_type(c64_t* sys, c64_joystick_type_t type);
 c64_joystick_type_t c64_joystick_type(c64_t* sys);
 /* set joystick mask (combination of C64_JOYSTICK_*) */
 void c64_joystick(c64_t* sys, uint8_t joy1_mask, uint8_t joy2_mask);
+/* enable/disable headless mode (no video decoding and audio output) */
+void c64_set_headless(c64_t* sys, bool headless);
+/* hand the SID register writes since the last call over to c64_audio_synth() (deferred audio only) */
+void c64_audio_swap(c64_t* sys);
+/* synthesize the handed-over SID register writes and call the audio callback (deferred audio only) */
+void c64_audio_synth(c64_t* sys);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t c64_save_snapshot(c64_t* sys, c64_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool c64_load_snapshot(c64_t* sys, uint32_t version, const c64_t* src);
 /* quickload a .bin/.prg file */
 bool c64_quickload(c64_t* sys, const uint8_t* ptr, int num_bytes);
 /* insert tape as .TAP file (c1530 must be enabled) */
 bool c64_insert_tape(c64_t* sys, const uint8_t* ptr, int num_bytes);
+/* insert tape without copying, data must remain valid until the tape is removed */
+bool c64_insert_tape_nocopy(c64_t* sys, const uint8_t* ptr, int num_bytes);
 /* remove tape file */
 void c64_remove_tape(c64_t* sys);
 /* return true if a tape is currently inserted */
@@ -429,8 +513,11 @@ bool c64_is_tape_motor_on(c64_t* sys);
 #define _C64_DISPLAY_SIZE (_C64_DBG_DISPLAY_WIDTH*_C64_DBG_DISPLAY_HEIGHT*4)
 #define _C64_DISPLAY_X (64)
 #define _C64_DISPLAY_Y (24)
+#define _C64_TRAP_TAPE_HEADER (0xF72F)
+#define _C64_TRAP_TAPE_DATA (0xF8A1)
 
 static uint64_t _c64_tick(c64_t* sys, uint64_t pins);
+static uint64_t _c64_tape_trap(c64_t* sys, uint64_t pins, uint16_t addr);
 static uint8_t _c64_cpu_port_in(void* user_data);
 static void _c64_cpu_port_out(uint8_t data, void* user_data);
 static uint16_t _c64_vic_fetch(uint16_t addr, void* user_data);
@@ -486,6 +573,7 @@ void c64_init(c64_t* sys, const c64_desc_t* desc) {
     vic_desc.vis_w = _C64_STD_DISPLAY_WIDTH;
     vic_desc.vis_h = _C64_STD_DISPLAY_HEIGHT;
     vic_desc.user_data = sys;
+    vic_desc.line_batched = desc->video_line_batched;
     m6569_init(&sys->vic, &vic_desc);
 
     const int sound_hz = _C64_DEFAULT(desc->audio_sample_rate, 44100);
@@ -495,7 +583,13 @@ void c64_init(c64_t* sys, const c64_desc_t* desc) {
     sid_desc.tick_hz = C64_FREQUENCY;
     sid_desc.sound_hz = sound_hz;
     sid_desc.magnitude = sid_volume;
+    sid_desc.deferred = desc->audio_deferred;
     m6581_init(&sys->sid, &sid_desc);
+    if (desc->audio_deferred) {
+        sid_desc.deferred = false;
+        m6581_init(&sys->sid_synth, &sid_desc);
+    }
+    c64_set_headless(sys, desc->headless);
 
     _c64_init_key_map(sys);
     _c64_init_memory_map(sys);
@@ -505,6 +599,7 @@ void c64_init(c64_t* sys, const c64_desc_t* desc) {
         _C64_CLEAR(c1530_desc);
         c1530_desc.cas_port = &sys->cas_port;
         c1530_init(&sys->c1530, &c1530_desc);
+        sys->c1530_fast_load = desc->c1530_fast_load;
     }
     if (desc->c1541_enabled) {
         c1541_desc_t c1541_desc;
@@ -527,6 +622,7 @@ void c64_discard(c64_t* sys) {
     if (sys->c1541.valid) {
         c1541_discard(&sys->c1541);
     }
+    m6581_discard(&sys->sid);
 }
 
 int c64_std_display_width(void) {
@@ -578,6 +674,7 @@ void c64_exec(c64_t* sys, uint32_t micro_seconds) {
         pins = _c64_tick(sys, pins);
     }
     sys->pins = pins;
+    m6569_flush(&sys->vic);
     kbd_update(&sys->kbd, micro_seconds);
 }
 
@@ -663,6 +760,75 @@ void c64_joystick(c64_t* sys, uint8_t joy1_mask, uint8_t joy2_mask) {
     sys->joy_joy2_mask = joy2_mask;
 }
 
+void c64_set_headless(c64_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+    sys->vic.headless = headless;
+    sys->sid.headless = headless;
+    sys->sid_synth.headless = headless;
+}
+
+uint32_t c64_save_snapshot(c64_t* sys, c64_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    m6502_snapshot_onsave(&dst->cpu);
+    m6569_snapshot_onsave(&dst->vic);
+    mem_snapshot_onsave(&dst->mem_cpu, sys);
+    mem_snapshot_onsave(&dst->mem_vic, sys);
+    c1530_snapshot_onsave(&dst->c1530, &sys->c1530);
+    c1541_snapshot_onsave(&dst->c1541, &sys->c1541);
+    m6581_snapshot_onsave(&dst->sid, &dst->sid_synth);
+    dst->user_data = 0;
+    dst->pixel_buffer = 0;
+    dst->audio_cb = 0;
+    return C64_SNAPSHOT_VERSION;
+}
+
+bool c64_load_snapshot(c64_t* sys, uint32_t version, const c64_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != C64_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static c64_t im;
+    im = *src;
+    m6502_snapshot_onload(&im.cpu, &sys->cpu);
+    m6569_snapshot_onload(&im.vic, &sys->vic);
+    mem_snapshot_onload(&im.mem_cpu, &sys->mem_cpu, sys);
+    mem_snapshot_onload(&im.mem_vic, &sys->mem_vic, sys);
+    c1530_snapshot_onload(&im.c1530, &sys->c1530);
+    c1541_snapshot_onload(&im.c1541, &sys->c1541);
+    m6581_snapshot_onload(&im.sid, &sys->sid);
+    im.user_data = sys->user_data;
+    im.pixel_buffer = sys->pixel_buffer;
+    im.audio_cb = sys->audio_cb;
+    im.c1530_fast_load = sys->c1530_fast_load;
+    const bool headless = sys->headless;
+    *sys = im;
+    c64_set_headless(sys, headless);
+    return true;
+}
+
+void c64_audio_swap(c64_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid && sys->sid.deferred);
+    m6581_log_swap(&sys->sid, &sys->sid_synth);
+}
+
+void c64_audio_synth(c64_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid && sys->sid.deferred);
+    /* the log which has been handed over by the last c64_audio_swap() */
+    m6581_log_t* log = &sys->sid.log[sys->sid.log_index ^ 1];
+    while (m6581_synth_pending(log)) {
+        float* dst = &sys->sample_buffer[sys->sample_pos];
+        sys->sample_pos += m6581_synth(&sys->sid_synth, log, dst, sys->num_samples - sys->sample_pos);
+        if (sys->sample_pos == sys->num_samples) {
+            if (sys->audio_cb) {
+                sys->audio_cb(sys->sample_buffer, sys->num_samples, sys->user_data);
+            }
+            sys->sample_pos = 0;
+        }
+    }
+}
+
 static uint64_t _c64_tick(c64_t* sys, uint64_t pins) {
 
     /* FIXME: move datasette and floppy tick to end */
@@ -670,6 +836,7 @@ static uint64_t _c64_tick(c64_t* sys, uint64_t pins) {
         c1530_tick(&sys->c1530);
     }
     if (sys->c1541.valid) {
+        /* NOTE: this is cheap while the drive sits in an idle loop */
         c1541_tick(&sys->c1541);
     }
 
@@ -849,6 +1016,13 @@ static uint64_t _c64_tick(c64_t* sys, uint64_t pins) {
             mem_wr(&sys->mem_cpu, addr, M6502_GET_DATA(pins));
         }
     }
+
+    /* check if one of the trapped KERNAL tape routines is about to be executed */
+    if (sys->c1530_fast_load && (pins & M6502_SYNC) && !(pins & M6502_RDY)) {
+        if (((addr == _C64_TRAP_TAPE_HEADER) || (addr == _C64_TRAP_TAPE_DATA)) && sys->c1530.valid && (sys->c1530.size > 0)) {
+            pins = _c64_tape_trap(sys, pins, addr);
+        }
+    }
     return pins;
 }
 
@@ -1066,11 +1240,78 @@ bool c64_quickload(c64_t* sys, const uint8_t* ptr, int num_bytes) {
     return true;
 }
 
+/*
+    KERNAL tape fast loading traps (same trap locations as VICE):
+
+    F72F: JSR $F841 (read tape block into the cassette buffer at ($B2)),
+          continue at F732, carry flag clear on success
+    F8A1: JSR $FCBD (start of reading tape block into memory from ($C1)
+          to ($AE)), continue at FC93 which restores the IRQ vector from
+          $029F/$02A0, switches the screen back on and returns to the
+          caller with the result in the status byte at $90
+*/
+static bool _c64_trap_code_matches(c64_t* sys, uint16_t addr, uint8_t b0, uint8_t b1, uint8_t b2) {
+    return (mem_rd(&sys->mem_cpu, addr) == b0) &&
+           (mem_rd(&sys->mem_cpu, addr+1) == b1) &&
+           (mem_rd(&sys->mem_cpu, addr+2) == b2);
+}
+
+static uint64_t _c64_tape_trap(c64_t* sys, uint64_t pins, uint16_t addr) {
+    uint16_t next_pc;
+    uint8_t p = m6502_p(&sys->cpu);
+    if (addr == _C64_TRAP_TAPE_HEADER) {
+        if (!_c64_trap_code_matches(sys, addr, 0x20, 0x41, 0xF8)) {
+            return pins;
+        }
+        /* read the next header block into the cassette buffer */
+        const uint16_t buf_addr = sys->ram[0xB2] | (sys->ram[0xB3]<<8);
+        const int max_bytes = 0x10000 - buf_addr;
+        const int res = c1530_read_block(&sys->c1530, &sys->ram[buf_addr], (max_bytes < 192) ? max_bytes : 192);
+        sys->ram[0x90] = 0;
+        if (res < 0) {
+            p |= M6502_CF;
+        }
+        else {
+            p &= ~M6502_CF;
+        }
+        next_pc = 0xF732;
+    }
+    else {
+        if (!_c64_trap_code_matches(sys, addr, 0x20, 0xBD, 0xFC) || (m6502_x(&sys->cpu) != 0x0E)) {
+            /* only the 'read into memory' command is trapped */
+            return pins;
+        }
+        const uint16_t start_addr = sys->ram[0xC1] | (sys->ram[0xC2]<<8);
+        const uint16_t end_addr = sys->ram[0xAE] | (sys->ram[0xAF]<<8);
+        const int len = (end_addr > start_addr) ? (end_addr - start_addr) : 0;
+        const int res = c1530_read_block(&sys->c1530, &sys->ram[start_addr], len);
+        /* status: EOF on success, otherwise 'unrecoverable read error' */
+        sys->ram[0x90] |= (res >= len) ? 0x40 : 0x10;
+        sys->ram[0xAC] = (uint8_t) end_addr;
+        sys->ram[0xAD] = (uint8_t) (end_addr>>8);
+        /* the routine at FC93 restores the IRQ vector from here */
+        sys->ram[0x029F] = 0x31;
+        sys->ram[0x02A0] = 0xEA;
+        p &= ~(M6502_CF|M6502_IF);
+        next_pc = 0xFC93;
+    }
+    m6502_set_p(&sys->cpu, p);
+    M6502_SET_ADDR(pins, next_pc);
+    M6502_SET_DATA(pins, mem_rd(&sys->mem_cpu, next_pc));
+    m6502_set_pc(&sys->cpu, next_pc);
+    return pins;
+}
+
 bool c64_insert_tape(c64_t* sys, const uint8_t* ptr, int num_bytes) {
     CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
     return c1530_insert_tape(&sys->c1530, ptr, num_bytes);
 }
 
+bool c64_insert_tape_nocopy(c64_t* sys, const uint8_t* ptr, int num_bytes) {
+    CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
+    return c1530_insert_tape_nocopy(&sys->c1530, ptr, num_bytes);
+}
+
 void c64_remove_tape(c64_t* sys) {
     CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
     c1530_remove_tape(&sys->c1530);
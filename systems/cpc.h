@@ -44,6 +44,64 @@
 
     FIXME!
 
+    ## Headless Mode
+
+    If cpc_desc_t.headless is true (or after calling cpc_set_headless(sys, true)),
+    the gate array doesn't decode video memory into the pixel buffer, and
+    the PSG doesn't generate audio samples (the audio callback isn't called).
+    The CRTC, gate array interrupts and wait states, and the PSG state
+    are updated exactly as with video and audio output, this is useful for
+    running automated tests as fast as possible. To look at the current
+    screen, switch headless mode off for one frame.
+
+    ## Deferred Audio
+
+    If cpc_desc_t.audio_deferred is true, the PSG sound synthesis is moved
+    out of cpc_exec(), so that it can run on another thread. cpc_exec()
+    only records the PSG register writes (see 'DEFERRED SYNTHESIS' in
+    ay38910.h), and the host application hands the recorded writes over to
+    the synthesis once per frame by calling cpc_audio_swap() on the
+    emulation thread after cpc_exec(). The handed-over writes are then
+    synthesized by calling cpc_audio_synth() on any thread, this writes
+    the audio samples into the sample buffer and calls the audio callback
+    (on that same thread).
+
+    cpc_audio_synth() only accesses the PSG synthesis state (cpc_t.psg_synth),
+    the sample buffer and the log passed by cpc_audio_swap(), so the two
+    threads don't need any locking. cpc_audio_synth() must have returned before
+    the next call to cpc_audio_swap(), and before cpc_save_snapshot() or
+    cpc_load_snapshot() is called
+    (cpc.h doesn't contain any threading code, the host application takes
+    care of this, for instance with a semaphore).
+
+    ## Fast Disc Transfer
+
+    If cpc_desc_t.fdc_fast_read is true, the firmware's floppy controller
+    read loop (polling the status register and reading sector data bytes
+    one by one into (HL) while interrupts are disabled) is detected by its
+    code pattern, and the remaining sector data is transferred in one step
+    with upd765_read_bytes(). Afterwards the CPU registers which depend
+    on the loop counter or the last data byte (HL, R, A or the carry flag)
+    are fixed up, and the rest of the system (gate array, CRTC, PSG) is
+    ticked for the exact number of clock cycles the loop would have taken.
+    The number of cycles per loop iteration is measured on the first
+    iterations, the loop is only accelerated once two iterations had
+    the same cycle count. The CPU then executes the loop exit path
+    itself, so the state observed from outside is the same as without
+    the fast transfer. The fast transfer can be switched on and off at
+    any time with cpc_set_fdc_fast_read().
+
+    ## Snapshots
+
+    cpc_save_snapshot() and cpc_load_snapshot() save and load the complete
+    emulator state through a caller-provided cpc_t. Host pointers are
+    cleared in a saved snapshot, and a loaded snapshot keeps the host
+    pointers, the headless mode and the fdc_fast_read setting of the
+    running instance. Tapes and discs which have been copied into the
+    cpc_t are part of the snapshot, but a tape or disc inserted with one
+    of the _nocopy() functions is only referenced, such a snapshot can
+    only be loaded while the caller-owned image data is still valid.
+
     ## TODO
 
     - improve CRTC emulation, some graphics demos don't work yet
@@ -76,6 +134,7 @@ extern "C" {
 
 #define CPC_MAX_AUDIO_SAMPLES (1024)        /* max number of audio samples in internal sample buffer */
 #define CPC_DEFAULT_AUDIO_SAMPLES (128)     /* default number of samples in internal sample buffer */
+#define CPC_SNAPSHOT_VERSION (4)            /* bumped when cpc_t changes in an incompatible way */
 #define CPC_MAX_TAPE_SIZE (128*1024)        /* max size of tape file in bytes */
 
 /* CPC model types */
@@ -112,6 +171,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 1024*312*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for audio- and video-debugging callbacks */
     void* user_data;
 
@@ -120,6 +182,10 @@ typedef struct {
     int audio_num_samples;          /* default is ZX_AUDIO_NUM_SAMPLES */
     int audio_sample_rate;          /* playback sample rate, default is 44100 */
     float audio_volume;             /* audio volume: 0.0..1.0, default is 0.25 */
+    bool audio_deferred;            /* if true, PSG synthesis moves to cpc_audio_synth() */
+
+    /* if true, accelerate the firmware's floppy disc read loop */
+    bool fdc_fast_read;
 
     /* ROM images */
     const void* rom_464_os;
@@ -142,6 +208,8 @@ typedef struct {
 typedef struct {
     z80_t cpu;
     ay38910_t psg;
+    uint32_t psg_ticks;     /* PSG ticks not yet rendered */
+    ay38910_t psg_synth;    /* PSG synthesis state for cpc_audio_synth() */
     mc6845_t crtc;
     am40010_t ga;
     i8255_t ppi;
@@ -150,10 +218,21 @@ typedef struct {
     bool valid;
     cpc_type_t type;
     cpc_joystick_type_t joystick_type;
+    bool headless;
     uint8_t kbd_joymask;
     uint8_t joy_joymask;
     uint16_t casread_trap;
     uint16_t casread_ret;
+    /* floppy disc fast transfer */
+    bool fdc_fast_read;
+    uint16_t fdc_loop_pc;       /* address of detected FDC read loop */
+    uint16_t fdc_loop_len;      /* length of the read loop code in bytes, 0 if none detected */
+    uint8_t fdc_loop_m1;        /* number of opcode fetches per loop iteration */
+    bool fdc_loop_ini;          /* true if the loop body uses INI instead of IN A,(C) */
+    uint32_t fdc_loop_ticks;    /* measured ticks per loop iteration, 0 if not measured */
+    uint32_t fdc_loop_mark;     /* tick count in cpc_exec() at last loop iteration start */
+    uint32_t fdc_loop_delta;    /* previous measured iteration tick count */
+    bool fdc_loop_marked;
 
     clk_t clk;
     kbd_t kbd;
@@ -170,6 +249,7 @@ typedef struct {
     /* tape loading */
     int tape_size;      /* tape_size is > 0 if a tape is inserted */
     int tape_pos;
+    const uint8_t* tape_ptr;    /* points to tape_buf[] or caller-owned memory */
     uint8_t tape_buf[CPC_MAX_TAPE_SIZE];
     /* floppy disc drive */
     fdd_t fdd;
@@ -201,14 +281,30 @@ void cpc_set_joystick_type(cpc_t* sys, cpc_joystick_type_t type);
 cpc_joystick_type_t cpc_joystick_type(cpc_t* sys);
 /* set joystick mask (combination of CPC_JOYSTICK_*) */
 void cpc_joystick(cpc_t* sys, uint8_t mask);
+/* enable/disable headless mode (no video decoding and audio output) */
+void cpc_set_headless(cpc_t* sys, bool headless);
+/* hand the PSG register writes since the last call over to cpc_audio_synth() (deferred audio only) */
+void cpc_audio_swap(cpc_t* sys);
+/* synthesize the handed-over PSG register writes and call the audio callback (deferred audio only) */
+void cpc_audio_synth(cpc_t* sys);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t cpc_save_snapshot(cpc_t* sys, cpc_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool cpc_load_snapshot(cpc_t* sys, uint32_t version, const cpc_t* src);
+/* enable/disable the fast floppy disc read loop transfer */
+void cpc_set_fdc_fast_read(cpc_t* sys, bool enabled);
 /* load a snapshot file (.sna or .bin) into the emulator */
 bool cpc_quickload(cpc_t* cpc, const uint8_t* ptr, int num_bytes);
 /* insert a tape file (.tap) */
 bool cpc_insert_tape(cpc_t* cpc, const uint8_t* ptr, int num_bytes);
+/* insert a tape file (.tap) without copying, data must remain valid until the tape is removed */
+bool cpc_insert_tape_nocopy(cpc_t* cpc, const uint8_t* ptr, int num_bytes);
 /* remove currently inserted tape */
 void cpc_remove_tape(cpc_t* cpc);
 /* insert a disk image file (.dsk) */
 bool cpc_insert_disc(cpc_t* cpc, const uint8_t* ptr, int num_bytes);
+/* insert a disk image file (.dsk) without copying, data must remain valid until the disc is removed */
+bool cpc_insert_disc_nocopy(cpc_t* cpc, const uint8_t* ptr, int num_bytes);
 /* remove current disc */
 void cpc_remove_disc(cpc_t* cpc);
 /* if enabled, start calling the video-debugging-callback */
@@ -229,11 +325,18 @@ bool cpc_video_debugging_enabled(cpc_t* cpc);
 #endif
 
 #define _CPC_FREQUENCY (4000000)
+/* max number of PSG ticks to accumulate before rendering */
+#define _CPC_PSG_RENDER_TICKS (64)
+/* CPU trap ids */
+#define _CPC_TRAPID_CASREAD (1)
+#define _CPC_TRAPID_FDC_READ (2)
 
 static uint64_t _cpc_tick(int num, uint64_t pins, void* user_data);
 static uint64_t _cpc_cclk(void* user_data);
 static void _cpc_psg_out(int port_id, uint8_t data, void* user_data);
 static uint8_t _cpc_psg_in(int port_id, void* user_data);
+static uint64_t _cpc_psg_iorq(cpc_t* sys, uint64_t ay_pins);
+static void _cpc_render_psg(cpc_t* sys);
 static void _cpc_init_keymap(cpc_t* sys);
 static void _cpc_bankswitch(uint8_t ram_config, uint8_t rom_enable, uint8_t rom_select, void* user_data);
 static void _cpc_cas_read(cpc_t* sys);
@@ -242,6 +345,9 @@ static int _cpc_fdc_seeksector(int drive, upd765_sectorinfo_t* inout_info, void*
 static int _cpc_fdc_read(int drive, uint8_t h, void* user_data, uint8_t* out_data);
 static int _cpc_fdc_trackinfo(int drive, int side, void* user_data, upd765_sectorinfo_t* out_info);
 static void _cpc_fdc_driveinfo(int drive, void* user_data, upd765_driveinfo_t* out_info);
+static uint16_t _cpc_fdc_match_read_loop(cpc_t* sys, uint16_t pc, uint8_t* out_m1, bool* out_ini);
+static uint32_t _cpc_fdc_fast_read(cpc_t* sys, uint32_t ticks_executed, uint32_t ticks_to_run);
+static void _cpc_update_trap_cb(cpc_t* sys);
 
 #define _CPC_DEFAULT(val,def) (((val) != 0) ? (val) : (def));
 #define _CPC_CLEAR(val) memset(&val, 0, sizeof(val))
@@ -300,7 +406,15 @@ void cpc_init(cpc_t* sys, const cpc_desc_t* desc) {
     psg_desc.sound_hz = _CPC_DEFAULT(desc->audio_sample_rate, 44100);
     psg_desc.magnitude = _CPC_DEFAULT(desc->audio_volume, 0.5f);
     psg_desc.user_data = sys;
+    psg_desc.deferred = desc->audio_deferred;
     ay38910_init(&sys->psg, &psg_desc);
+    if (desc->audio_deferred) {
+        psg_desc.in_cb = 0;
+        psg_desc.out_cb = 0;
+        psg_desc.user_data = 0;
+        psg_desc.deferred = false;
+        ay38910_init(&sys->psg_synth, &psg_desc);
+    }
 
     mc6845_init(&sys->crtc, MC6845_TYPE_UM6845R);
 
@@ -315,6 +429,7 @@ void cpc_init(cpc_t* sys, const cpc_desc_t* desc) {
     ga_desc.rgba8_buffer_size = desc->pixel_buffer_size;
     ga_desc.user_data = sys;
     am40010_init(&sys->ga, &ga_desc);
+    cpc_set_headless(sys, desc->headless);
 
     upd765_desc_t fdc_desc;
     _CPC_CLEAR(fdc_desc);
@@ -326,6 +441,7 @@ void cpc_init(cpc_t* sys, const cpc_desc_t* desc) {
     fdc_desc.user_data = sys;
     upd765_init(&sys->fdc, &fdc_desc);
     fdd_init(&sys->fdd);
+    cpc_set_fdc_fast_read(sys, desc->fdc_fast_read);
 
     _cpc_init_keymap(sys);
 
@@ -347,6 +463,7 @@ void cpc_init(cpc_t* sys, const cpc_desc_t* desc) {
 void cpc_discard(cpc_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     sys->valid = false;
+    ay38910_discard(&sys->psg);
 }
 
 int cpc_std_display_width(void) {
@@ -376,6 +493,7 @@ void cpc_reset(cpc_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     mem_unmap_all(&sys->mem);
     mc6845_reset(&sys->crtc);
+    _cpc_render_psg(sys);
     ay38910_reset(&sys->psg);
     i8255_reset(&sys->ppi);
     am40010_reset(&sys->ga);
@@ -390,11 +508,16 @@ void cpc_exec(cpc_t* sys, uint32_t micro_seconds) {
     uint32_t ticks_to_run = clk_ticks_to_run(&sys->clk, micro_seconds);
     uint32_t ticks_executed = 0;
     int trap_id = 0;
+    sys->fdc_loop_marked = false;
     while ((ticks_executed < ticks_to_run) && (0 == trap_id)) {
-        ticks_executed += z80_exec(&sys->cpu, ticks_to_run);
+        ticks_executed += z80_exec(&sys->cpu, ticks_to_run - ticks_executed);
         /* check if casread trap has been hit, and the right ROM is mapped in */
         trap_id = sys->cpu.trap_id;
-        if (trap_id == 1) {
+        if (trap_id == _CPC_TRAPID_FDC_READ) {
+            ticks_executed += _cpc_fdc_fast_read(sys, ticks_executed, ticks_to_run);
+            trap_id = 0;
+        }
+        else if (trap_id == _CPC_TRAPID_CASREAD) {
             if (sys->type == CPC_TYPE_6128) {
                 if (0 == (sys->ga.regs.config & (1<<2))) {
                     _cpc_cas_read(sys);
@@ -408,6 +531,7 @@ void cpc_exec(cpc_t* sys, uint32_t micro_seconds) {
         }
     }
     clk_ticks_executed(&sys->clk, ticks_executed);
+    _cpc_render_psg(sys);
     kbd_update(&sys->kbd, micro_seconds);
 }
 
@@ -460,6 +584,80 @@ void cpc_joystick(cpc_t* sys, uint8_t mask) {
     sys->joy_joymask = mask;
 }
 
+void cpc_set_headless(cpc_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+    sys->ga.headless = headless;
+    sys->psg.headless = headless;
+    sys->psg_synth.headless = headless;
+}
+
+void cpc_audio_swap(cpc_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid && sys->psg.deferred);
+    _cpc_render_psg(sys);
+    ay38910_log_swap(&sys->psg);
+}
+
+void cpc_audio_synth(cpc_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid && sys->psg.deferred);
+    /* the log which has been handed over by the last cpc_audio_swap() */
+    ay38910_log_t* log = &sys->psg.log[sys->psg.log_index ^ 1];
+    while (ay38910_synth_pending(log)) {
+        float* dst = &sys->sample_buffer[sys->sample_pos];
+        sys->sample_pos += ay38910_synth(&sys->psg_synth, log, dst, sys->num_samples - sys->sample_pos);
+        if (sys->sample_pos == sys->num_samples) {
+            if (sys->audio_cb) {
+                sys->audio_cb(sys->sample_buffer, sys->num_samples, sys->user_data);
+            }
+            sys->sample_pos = 0;
+        }
+    }
+}
+
+uint32_t cpc_save_snapshot(cpc_t* sys, cpc_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    ay38910_snapshot_onsave(&dst->psg, &dst->psg_synth);
+    am40010_snapshot_onsave(&dst->ga);
+    upd765_snapshot_onsave(&dst->fdc);
+    mem_snapshot_onsave(&dst->mem, sys);
+    fdd_snapshot_onsave(&dst->fdd, &sys->fdd);
+    if (sys->tape_ptr == sys->tape_buf) {
+        dst->tape_ptr = 0;
+    }
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    return CPC_SNAPSHOT_VERSION;
+}
+
+bool cpc_load_snapshot(cpc_t* sys, uint32_t version, const cpc_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != CPC_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static cpc_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    ay38910_snapshot_onload(&im.psg, &sys->psg);
+    am40010_snapshot_onload(&im.ga, &sys->ga);
+    upd765_snapshot_onload(&im.fdc, &sys->fdc);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    fdd_snapshot_onload(&im.fdd, &sys->fdd);
+    if ((im.tape_size > 0) && (0 == im.tape_ptr)) {
+        im.tape_ptr = sys->tape_buf;
+    }
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    im.fdc_fast_read = sys->fdc_fast_read;
+    const bool headless = sys->headless;
+    *sys = im;
+    cpc_set_headless(sys, headless);
+    /* the CPU trap depends on the inserted tape and fdc_fast_read */
+    _cpc_update_trap_cb(sys);
+    return true;
+}
+
 void cpc_enable_video_debugging(cpc_t* sys, bool enabled) {
     CHIPS_ASSERT(sys && sys->valid);
     sys->ga.dbg_vis = enabled;
@@ -536,7 +734,7 @@ static uint64_t _cpc_tick(int num_ticks, uint64_t cpu_pins, void* user_data) {
                 if (sys->ppi.pins & I8255_PC6) { ay_pins |= AY38910_BC1; }
                 const uint8_t ay_data = I8255_GET_PA(sys->ppi.pins);
                 AY38910_SET_DATA(ay_pins, ay_data);
-                ay_pins = ay38910_iorq(&sys->psg, ay_pins);
+                ay_pins = _cpc_psg_iorq(sys, ay_pins);
                 I8255_SET_PA(ppi_pins, AY38910_DATA(ay_pins));
             }
             ppi_pins |= I8255_PB1|I8255_PB2|I8255_PB3;  /* Amstrad */
@@ -556,7 +754,7 @@ static uint64_t _cpc_tick(int num_ticks, uint64_t cpu_pins, void* user_data) {
                 if (ppi_pins & I8255_PC6) { ay_pins |= AY38910_BC1; }
                 const uint8_t ay_data = I8255_GET_PA(ppi_pins);
                 AY38910_SET_DATA(ay_pins, ay_data);
-                ay38910_iorq(&sys->psg, ay_pins);
+                _cpc_psg_iorq(sys, ay_pins);
             }
             /* PC0..PC3: select keyboard matrix line*/
             uint16_t col_mask = 1<<(I8255_GET_PC(ppi_pins) & 0x0F);
@@ -619,8 +817,8 @@ static uint64_t _cpc_tick(int num_ticks, uint64_t cpu_pins, void* user_data) {
 }
 
 /* called when a new sample is ready from the sound chip */
-static inline void _cpc_sample_ready(cpc_t* sys) {
-    sys->sample_buffer[sys->sample_pos++] = sys->psg.sample;
+static inline void _cpc_sample_ready(cpc_t* sys, float sample) {
+    sys->sample_buffer[sys->sample_pos++] = sample;
     if (sys->sample_pos == sys->num_samples) {
         if (sys->audio_cb) {
             /* new sample packet is ready */
@@ -630,15 +828,32 @@ static inline void _cpc_sample_ready(cpc_t* sys) {
     }
 }
 
+/* render the accumulated PSG ticks */
+static void _cpc_render_psg(cpc_t* sys) {
+    if (sys->psg_ticks > 0) {
+        float samples[_CPC_PSG_RENDER_TICKS];
+        const int num_samples = ay38910_render(&sys->psg, sys->psg_ticks, samples);
+        for (int i = 0; i < num_samples; i++) {
+            _cpc_sample_ready(sys, samples[i]);
+        }
+        sys->psg_ticks = 0;
+    }
+}
+
+/* PSG register access, catches up sound generation first */
+static uint64_t _cpc_psg_iorq(cpc_t* sys, uint64_t ay_pins) {
+    _cpc_render_psg(sys);
+    return ay38910_iorq(&sys->psg, ay_pins);
+}
+
 /* handle a 1 MHz CCLK tick generated by the gate array, this ticks the
    MC6845 CRTC and AY-3-8912 PSG, and must return the CRTC pins.
 */
 static uint64_t _cpc_cclk(void* user_data) {
     cpc_t* sys = (cpc_t*) user_data;
-    /* tick the sound chip... */
-    if (ay38910_tick(&sys->psg)) {
-        /* new sound sample ready */
-        _cpc_sample_ready(sys);
+    /* tick the sound chip (ticks are accumulated and rendered in one go)... */
+    if (++sys->psg_ticks == _CPC_PSG_RENDER_TICKS) {
+        _cpc_render_psg(sys);
     }
     /* tick the CRTC and return its pin mask */
     uint64_t crtc_pins = mc6845_tick(&sys->crtc);
@@ -910,10 +1125,10 @@ static bool _cpc_load_sna(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
     sys->ppi.control = hdr->ppi_control;
 
     for (int i = 0; i < 16; i++) {
-        ay38910_iorq(&sys->psg, AY38910_BDIR|AY38910_BC1|(i<<16));
-        ay38910_iorq(&sys->psg, AY38910_BDIR|(hdr->psg_regs[i]<<16));
+        _cpc_psg_iorq(sys, AY38910_BDIR|AY38910_BC1|(i<<16));
+        _cpc_psg_iorq(sys, AY38910_BDIR|(hdr->psg_regs[i]<<16));
     }
-    ay38910_iorq(&sys->psg, AY38910_BDIR|AY38910_BC1|(hdr->psg_selected<<16));
+    _cpc_psg_iorq(sys, AY38910_BDIR|AY38910_BC1|(hdr->psg_selected<<16));
     return true;
 }
 
@@ -974,33 +1189,78 @@ bool cpc_quickload(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
 }
 
 /*=== CASSETTE TAPE FILE LOADING =============================================*/
-/* CPU trap handler to check for casread */
+/* CPU trap handler to check for casread and the FDC read loop */
 static int _cpc_trap_cb(uint16_t pc, uint32_t ticks, uint64_t pins, void* user_data) {
     (void)ticks;
     (void)pins;
     cpc_t* sys = (cpc_t*) user_data;
-    return (pc == sys->casread_trap) ? 1 : 0;
+    if ((sys->tape_size > 0) && (pc == sys->casread_trap)) {
+        return _CPC_TRAPID_CASREAD;
+    }
+    if (sys->fdc_fast_read && (UPD765_PHASE_EXEC == sys->fdc.phase) && (UPD765_CMD_READ_DATA == sys->fdc.cmd)) {
+        if ((sys->fdc_loop_len > 0) && (pc == sys->fdc_loop_pc)) {
+            return _CPC_TRAPID_FDC_READ;
+        }
+        uint8_t m1 = 0;
+        bool ini = false;
+        const uint16_t len = _cpc_fdc_match_read_loop(sys, pc, &m1, &ini);
+        if (len > 0) {
+            sys->fdc_loop_pc = pc;
+            sys->fdc_loop_len = len;
+            sys->fdc_loop_m1 = m1;
+            sys->fdc_loop_ini = ini;
+            sys->fdc_loop_ticks = 0;
+            sys->fdc_loop_marked = false;
+            return _CPC_TRAPID_FDC_READ;
+        }
+    }
+    return 0;
 }
 
-bool cpc_insert_tape(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
+/* install the trap callback if any trap is needed */
+static void _cpc_update_trap_cb(cpc_t* sys) {
+    if ((sys->tape_size > 0) || sys->fdc_fast_read) {
+        z80_trap_cb(&sys->cpu, _cpc_trap_cb, sys);
+    }
+    else {
+        z80_trap_cb(&sys->cpu, 0, 0);
+    }
+}
+
+static bool _cpc_insert_tape(cpc_t* sys, const uint8_t* ptr, int num_bytes, bool copy) {
     CHIPS_ASSERT(sys && sys->valid);
     CHIPS_ASSERT(ptr);
     cpc_remove_tape(sys);
-    if (num_bytes > CPC_MAX_TAPE_SIZE) {
-        return false;
+    if (copy) {
+        if (num_bytes > CPC_MAX_TAPE_SIZE) {
+            return false;
+        }
+        memcpy(sys->tape_buf, ptr, num_bytes);
+        sys->tape_ptr = sys->tape_buf;
+    }
+    else {
+        sys->tape_ptr = ptr;
     }
-    memcpy(sys->tape_buf, ptr, num_bytes);
     sys->tape_pos = 0;
     sys->tape_size = num_bytes;
-    z80_trap_cb(&sys->cpu, _cpc_trap_cb, sys);
+    _cpc_update_trap_cb(sys);
     return true;
 }
 
+bool cpc_insert_tape(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _cpc_insert_tape(sys, ptr, num_bytes, true);
+}
+
+bool cpc_insert_tape_nocopy(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
+    return _cpc_insert_tape(sys, ptr, num_bytes, false);
+}
+
 void cpc_remove_tape(cpc_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     sys->tape_pos = 0;
     sys->tape_size = 0;
-    z80_trap_cb(&sys->cpu, 0, 0);
+    sys->tape_ptr = 0;
+    _cpc_update_trap_cb(sys);
 }
 
 /* the trapped OS casread function, reads one tape block into memory */
@@ -1008,16 +1268,16 @@ static void _cpc_cas_read(cpc_t* sys) {
     bool success = false;
     /* if no tape is currently inserted, both tape_pos and tape_size is 0 */
     if ((sys->tape_pos + 3) < sys->tape_size) {
-        uint8_t len_l = sys->tape_buf[sys->tape_pos++];
-        uint8_t len_h = sys->tape_buf[sys->tape_pos++];
+        uint8_t len_l = sys->tape_ptr[sys->tape_pos++];
+        uint8_t len_h = sys->tape_ptr[sys->tape_pos++];
         uint16_t len = len_h<<8 | len_l;
         if ((sys->tape_pos + len) <= sys->tape_size) {
-            uint8_t sync = sys->tape_buf[sys->tape_pos++];
+            uint8_t sync = sys->tape_ptr[sys->tape_pos++];
             if (sync == z80_a(&sys->cpu)) {
                 success = true;
                 for (uint16_t i = 0; i < (len-1); i++) {
                     uint16_t hl = z80_hl(&sys->cpu);
-                    uint8_t val = sys->tape_buf[sys->tape_pos++];
+                    uint8_t val = sys->tape_ptr[sys->tape_pos++];
                     mem_wr(&sys->mem, hl++, val);
                     z80_set_hl(&sys->cpu, hl);
                 }
@@ -1117,10 +1377,196 @@ static void _cpc_fdc_driveinfo(int drive, void* user_data, upd765_driveinfo_t* o
     }
 }
 
+/*
+    Match the firmware's FDC read loop (BC = FB7E on entry):
+
+        loop:   IN A,(C)        ED 78
+                JP P,loop       F2 xx xx
+                AND 20h         E6 20
+                JP Z,exit       CA xx xx    (or JR Z,exit   28 xx)
+                INC C           0C
+                (body)
+                JP loop         C3 xx xx    (or JR loop     18 xx)
+
+    with one of the following bodies to read a data byte into (HL):
+
+                IN A,(C); LD (HL),A; INC HL; DEC C
+                IN A,(C); LD (HL),A; DEC C; INC HL
+                INI; INC B; DEC C
+                INI; DEC C; INC B
+*/
+static uint16_t _cpc_fdc_match_read_loop(cpc_t* sys, uint16_t pc, uint8_t* out_m1, bool* out_ini) {
+    static const uint8_t bodies[4][6] = {
+        { 5, 0xED, 0x78, 0x77, 0x23, 0x0D },
+        { 5, 0xED, 0x78, 0x77, 0x0D, 0x23 },
+        { 4, 0xED, 0xA2, 0x04, 0x0D, 0x00 },
+        { 4, 0xED, 0xA2, 0x0D, 0x04, 0x00 },
+    };
+    uint16_t addr = pc;
+    #define _CPC_RD(offset) mem_rd(&sys->mem, (uint16_t)(addr+(offset)))
+    #define _CPC_RD16(offset) (_CPC_RD(offset) | (_CPC_RD(offset+1)<<8))
+    if ((_CPC_RD(0) != 0xED) || (_CPC_RD(1) != 0x78)) {
+        return 0;
+    }
+    if ((_CPC_RD(2) != 0xF2) || (_CPC_RD16(3) != pc)) {
+        return 0;
+    }
+    if ((_CPC_RD(5) != 0xE6) || (_CPC_RD(6) != 0x20)) {
+        return 0;
+    }
+    if (_CPC_RD(7) == 0xCA) {
+        addr += 10;
+    }
+    else if (_CPC_RD(7) == 0x28) {
+        addr += 9;
+    }
+    else {
+        return 0;
+    }
+    if (_CPC_RD(0) != 0x0C) {
+        return 0;
+    }
+    addr += 1;
+    int body_len = 0;
+    bool ini = false;
+    for (int i = 0; i < 4; i++) {
+        const int len = bodies[i][0];
+        bool match = true;
+        for (int j = 0; j < len; j++) {
+            if (_CPC_RD(j) != bodies[i][j+1]) {
+                match = false;
+                break;
+            }
+        }
+        if (match) {
+            body_len = len;
+            ini = (0xA2 == bodies[i][2]);
+            break;
+        }
+    }
+    if (0 == body_len) {
+        return 0;
+    }
+    addr += body_len;
+    if ((_CPC_RD(0) == 0xC3) && (_CPC_RD16(1) == pc)) {
+        addr += 3;
+    }
+    else if ((_CPC_RD(0) == 0x18) && ((uint16_t)(addr + 2 + (int8_t)_CPC_RD(1)) == pc)) {
+        addr += 2;
+    }
+    else {
+        return 0;
+    }
+    #undef _CPC_RD
+    #undef _CPC_RD16
+    /* opcode fetches: IN, JP P, AND, JP Z, INC C, body (the ED prefix is an extra fetch), JP */
+    *out_m1 = (uint8_t)(2 + 1 + 1 + 1 + 1 + body_len + 1);
+    *out_ini = ini;
+    return (uint16_t)(addr - pc);
+}
+
+/* called when the CPU is at the start of the FDC read loop, returns number of ticks executed */
+static uint32_t _cpc_fdc_fast_read(cpc_t* sys, uint32_t ticks_executed, uint32_t ticks_to_run) {
+    /* interrupts must be disabled, and the loop must be entered at an instruction boundary */
+    if (z80_iff1(&sys->cpu) || !z80_opdone(&sys->cpu) || (z80_pc(&sys->cpu) != sys->fdc_loop_pc)) {
+        sys->fdc_loop_marked = false;
+        return 0;
+    }
+    /* the code at the loop address may have changed (e.g. by bank switching) */
+    uint8_t m1 = 0;
+    bool ini = false;
+    if (_cpc_fdc_match_read_loop(sys, sys->fdc_loop_pc, &m1, &ini) != sys->fdc_loop_len) {
+        sys->fdc_loop_len = 0;
+        sys->fdc_loop_marked = false;
+        return 0;
+    }
+    /* measure the number of ticks per loop iteration until it's stable, and
+       only accelerate right after a complete iteration has been executed,
+       the CPU state is then identical to the state after each skipped iteration
+       (except for the registers fixed up below)
+    */
+    const bool marked = sys->fdc_loop_marked;
+    const uint32_t delta = ticks_executed - sys->fdc_loop_mark;
+    sys->fdc_loop_mark = ticks_executed;
+    sys->fdc_loop_marked = true;
+    if (!marked) {
+        return 0;
+    }
+    if (0 == sys->fdc_loop_ticks) {
+        if (delta == sys->fdc_loop_delta) {
+            sys->fdc_loop_ticks = delta;
+        }
+        sys->fdc_loop_delta = delta;
+        return 0;
+    }
+    if (delta != sys->fdc_loop_ticks) {
+        return 0;
+    }
+    /* number of loop iterations that fit into the current time slice */
+    if (ticks_executed >= ticks_to_run) {
+        return 0;
+    }
+    int max_bytes = (int) ((ticks_to_run - ticks_executed) / sys->fdc_loop_ticks);
+    if (max_bytes > FDD_MAX_SECTOR_SIZE) {
+        max_bytes = FDD_MAX_SECTOR_SIZE;
+    }
+    /* don't accelerate if the loop would overwrite its own code */
+    const uint16_t hl = z80_hl(&sys->cpu);
+    const uint16_t rel = (uint16_t)(sys->fdc_loop_pc - hl);
+    if (rel < max_bytes) {
+        max_bytes = rel;
+    }
+    else if ((uint16_t)(hl - sys->fdc_loop_pc) < sys->fdc_loop_len) {
+        max_bytes = 0;
+    }
+    if (max_bytes <= 0) {
+        return 0;
+    }
+    uint8_t buf[FDD_MAX_SECTOR_SIZE];
+    const int num_bytes = upd765_read_bytes(&sys->fdc, buf, max_bytes);
+    for (int i = 0; i < num_bytes; i++) {
+        mem_wr(&sys->mem, (uint16_t)(hl + i), buf[i]);
+    }
+    if (0 == num_bytes) {
+        return 0;
+    }
+    /* fix up the CPU registers, all other registers are identical at the loop start */
+    z80_set_hl(&sys->cpu, (uint16_t)(hl + num_bytes));
+    const uint8_t r = z80_r(&sys->cpu);
+    z80_set_r(&sys->cpu, (r & 0x80) | ((r + num_bytes * sys->fdc_loop_m1) & 0x7F));
+    const uint8_t last = buf[num_bytes - 1];
+    if (sys->fdc_loop_ini) {
+        /* the carry flag is the only flag set by INI that survives the loop body */
+        const uint8_t f = z80_f(&sys->cpu) & ~Z80_CF;
+        const uint32_t t = ((z80_c(&sys->cpu) + 2) & 0xFF) + last;
+        z80_set_f(&sys->cpu, (t & 0x100) ? (f | Z80_CF) : f);
+    }
+    else {
+        z80_set_a(&sys->cpu, last);
+    }
+    /* tick the rest of the system for the time the loop would have taken */
+    const uint32_t num_ticks = (uint32_t)num_bytes * sys->fdc_loop_ticks;
+    am40010_tick(&sys->ga, (int)num_ticks, 0);
+    sys->fdc_loop_mark = ticks_executed + num_ticks;
+    return num_ticks;
+}
+
+void cpc_set_fdc_fast_read(cpc_t* sys, bool enabled) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->fdc_fast_read = enabled;
+    sys->fdc_loop_len = 0;
+    sys->fdc_loop_marked = false;
+    _cpc_update_trap_cb(sys);
+}
+
 bool cpc_insert_disc(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
     return fdd_cpc_insert_dsk(&sys->fdd, ptr, num_bytes);
 }
 
+bool cpc_insert_disc_nocopy(cpc_t* sys, const uint8_t* ptr, int num_bytes) {
+    return fdd_cpc_insert_dsk_nocopy(&sys->fdd, ptr, num_bytes);
+}
+
 void cpc_remove_disc(cpc_t* sys) {
     fdd_eject_disc(&sys->fdd);
 }
@@ -225,6 +225,24 @@
         - bits 2..6:    unused
         - bit 7:        enable the 4 KByte CAOS ROM bank at C000
 
+    ## Headless Mode
+
+    If kc85_desc_t.headless is true (or after calling kc85_set_headless(sys, true)),
+    video memory isn't decoded into the pixel buffer, and the beepers
+    don't generate audio samples (the audio callback isn't called). The
+    video timing (and thus the VSYNC trigger on CTC channel 2) and the CTC
+    work exactly as with video and audio output, this is useful for
+    running automated tests as fast as possible. To look at the current
+    screen, switch headless mode off for one frame.
+
+    ## Snapshots
+
+    kc85_save_snapshot() and kc85_load_snapshot() save and restore the
+    emulator state, including the expansion modules and their memory,
+    through a caller-provided kc85_t. The patch callback and other host
+    pointers aren't stored in a snapshot, they're taken over from the
+    running instance when a snapshot is loaded.
+
     ## TODO:
 
     - optionally proper keyboard emulation (the current implementation
@@ -259,6 +277,7 @@ extern "C" {
 
 #define KC85_MAX_AUDIO_SAMPLES (1024)       /* max number of audio samples in internal sample buffer */
 #define KC85_DEFAULT_AUDIO_SAMPLES (128)    /* default number of samples in internal sample buffer */ 
+#define KC85_SNAPSHOT_VERSION (2)           /* bumped when kc85_t changes in an incompatible way */
 #define KC85_MAX_TAPE_SIZE (64 * 1024)      /* max size of a snapshot file in bytes */
 #define KC85_NUM_SLOTS (2)                  /* 2 expansion slots in main unit, each needs one mem_t layer! */
 #define KC85_EXP_BUFSIZE (KC85_NUM_SLOTS*64*1024) /* expansion system buffer size (64 KB per slot) */
@@ -308,6 +327,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 320*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for callback functions */
     void* user_data;
 
@@ -382,6 +404,7 @@ typedef struct {
 
     bool valid;
     kc85_type_t type;
+    bool headless;          /* true if video decoding and audio output are skipped */
     uint8_t pio_a;          /* current PIO-A value, used for bankswitching */
     uint8_t pio_b;          /* current PIO-B value, used for bankswitching */
     uint8_t io84;           /* byte latch at port 0x84, only on KC85/4 */
@@ -390,6 +413,7 @@ typedef struct {
 
     uint32_t h_tick;        /* video timing generator counter */
     uint32_t v_count;
+    uint32_t audio_ticks;   /* beeper ticks not yet rendered */
 
     clk_t clk;
     kbd_t kbd;
@@ -431,6 +455,12 @@ void kc85_exec(kc85_t* sys, uint32_t micro_seconds);
 void kc85_key_down(kc85_t* sys, int key_code);
 /* send a key-up event */
 void kc85_key_up(kc85_t* sys, int key_code);
+/* enable/disable headless mode (no video decoding and audio output) */
+void kc85_set_headless(kc85_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t kc85_save_snapshot(kc85_t* sys, kc85_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool kc85_load_snapshot(kc85_t* sys, uint32_t version, const kc85_t* src);
 /* insert a RAM module (slot must be 0x08 or 0x0C) */
 bool kc85_insert_ram_module(kc85_t* sys, uint8_t slot, kc85_module_type_t type);
 /* insert a ROM module (slot must be 0x08 or 0x0C) */
@@ -476,6 +506,7 @@ bool kc85_quickload(kc85_t* sys, const uint8_t* ptr, int num_bytes);
 #define _KC85_IRM0_PAGE (4)
 
 static uint64_t _kc85_tick(int num, uint64_t pins, void* user_data);
+static void _kc85_render_audio(kc85_t* sys);
 static uint64_t _kc85_tick_video(kc85_t* sys, int num_cpu_ticks, uint64_t pins);
 static uint8_t _kc85_pio_in(int port_id, void* user_data);
 static void _kc85_pio_out(int port_id, uint8_t data, void* user_data);
@@ -547,6 +578,7 @@ void kc85_init(kc85_t* sys, const kc85_desc_t* desc) {
     /* video- and audio-output */
     CHIPS_ASSERT((0 == desc->pixel_buffer) || (desc->pixel_buffer && (desc->pixel_buffer_size >= _KC85_DISPLAY_SIZE)));
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
+    sys->headless = desc->headless;
     sys->audio_cb = desc->audio_cb;
     sys->patch_cb = desc->patch_cb;
     sys->user_data = desc->user_data;
@@ -627,6 +659,7 @@ void kc85_reset(kc85_t* sys) {
     z80_reset(&sys->cpu);
     z80ctc_reset(&sys->ctc);
     z80pio_reset(&sys->pio);
+    _kc85_render_audio(sys);
     beeper_reset(&sys->beeper_1);
     beeper_reset(&sys->beeper_2);
     sys->pio_a = 0;
@@ -646,6 +679,7 @@ void kc85_exec(kc85_t* sys, uint32_t micro_seconds) {
     uint32_t ticks_to_run = clk_ticks_to_run(&sys->clk, micro_seconds);
     uint32_t ticks_executed = z80_exec(&sys->cpu, ticks_to_run);
     clk_ticks_executed(&sys->clk, ticks_executed);
+    _kc85_render_audio(sys);
     kbd_update(&sys->kbd, micro_seconds);
     _kc85_handle_keyboard(sys);
 }
@@ -660,6 +694,44 @@ void kc85_key_up(kc85_t* sys, int key_code) {
     kbd_key_up(&sys->kbd, key_code);
 }
 
+void kc85_set_headless(kc85_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+}
+
+uint32_t kc85_save_snapshot(kc85_t* sys, kc85_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    z80pio_snapshot_onsave(&dst->pio);
+    mem_snapshot_onsave(&dst->mem, sys);
+    dst->pixel_buffer = 0;
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    dst->patch_cb = 0;
+    return KC85_SNAPSHOT_VERSION;
+}
+
+bool kc85_load_snapshot(kc85_t* sys, uint32_t version, const kc85_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != KC85_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static kc85_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    z80pio_snapshot_onload(&im.pio, &sys->pio);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    im.pixel_buffer = sys->pixel_buffer;
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    im.patch_cb = sys->patch_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    kc85_set_headless(sys, headless);
+    return true;
+}
+
 /* hardwired foreground colors */
 static uint32_t _kc85_fg_pal[16] = {
     0xFF000000,     /* black */
@@ -853,8 +925,26 @@ static uint64_t _kc85_video_kc85_4_std(kc85_t* sys, int num_cpu_ticks, uint64_t
     return cpu_pins;
 }
 
+/* headless mode: only advance the video timing counters */
+static uint64_t _kc85_video_headless(kc85_t* sys, int num_cpu_ticks, uint64_t cpu_pins) {
+    const uint32_t h_total = (sys->type == KC85_TYPE_4) ? 113 : 112;
+    sys->h_tick += num_cpu_ticks;
+    while (sys->h_tick >= h_total) {
+        sys->h_tick -= h_total;
+        sys->v_count++;
+        if (sys->v_count == 312) {
+            sys->v_count = 0;
+            cpu_pins |= Z80CTC_CLKTRG2;
+        }
+    }
+    return cpu_pins;
+}
+
 static uint64_t _kc85_tick_video(kc85_t* sys, int num_cpu_ticks, uint64_t cpu_pins) {
-    if (sys->type == KC85_TYPE_4) {
+    if (sys->headless) {
+        return _kc85_video_headless(sys, num_cpu_ticks, cpu_pins);
+    }
+    else if (sys->type == KC85_TYPE_4) {
         if (sys->io84 & KC85_IO84_HICOLOR) {
             return _kc85_video_kc85_4_std(sys, num_cpu_ticks, cpu_pins);
         }
@@ -974,32 +1064,25 @@ static uint64_t _kc85_tick(int num_ticks, uint64_t pins, void* user_data) {
     /* tick the video system, this may return Z80CTC_CLKTRG2 on VSYNC */
     pins = _kc85_tick_video(sys, num_ticks, pins);
 
-    /* tick the CTC and beepers */
+    /* tick the CTC, the beepers are only rendered when their level changes */
     for (int i = 0; i < num_ticks; i++) {
         pins = z80ctc_tick(&sys->ctc, pins);
         /* CTC channels 0 and 1 triggers control audio frequencies */
-        if (pins & Z80CTC_ZCTO0) {
-            beeper_toggle(&sys->beeper_1);
-        }
-        if (pins & Z80CTC_ZCTO1) {
-            beeper_toggle(&sys->beeper_2);
+        if (pins & (Z80CTC_ZCTO0|Z80CTC_ZCTO1)) {
+            _kc85_render_audio(sys);
+            if (pins & Z80CTC_ZCTO0) {
+                beeper_toggle(&sys->beeper_1);
+            }
+            if (pins & Z80CTC_ZCTO1) {
+                beeper_toggle(&sys->beeper_2);
+            }
         }
         /* CTC channel 2 trigger controls video blink frequency */
         if (pins & Z80CTC_ZCTO2) {
             sys->blink_flag = !sys->blink_flag;
         }
         pins &= Z80_PIN_MASK;
-        beeper_tick(&sys->beeper_1);
-        if (beeper_tick(&sys->beeper_2)) {
-            /* new audio sample ready */
-            sys->sample_buffer[sys->sample_pos++] = sys->beeper_1.sample + sys->beeper_2.sample;
-            if (sys->sample_pos == sys->num_samples) {
-                if (sys->audio_cb) {
-                    sys->audio_cb(sys->sample_buffer, sys->num_samples, sys->user_data);
-                }
-                sys->sample_pos = 0;
-            }
-        }
+        sys->audio_ticks++;
     }    
     
     /* interrupt daisy chain, CTC is higher priority then PIO */
@@ -1013,6 +1096,31 @@ static uint64_t _kc85_tick(int num_ticks, uint64_t pins, void* user_data) {
     return (pins & Z80_PIN_MASK);    
 }
 
+/* catch up the beepers with the accumulated ticks */
+static void _kc85_render_audio(kc85_t* sys) {
+    uint32_t num_ticks = sys->audio_ticks;
+    sys->audio_ticks = 0;
+    while (num_ticks > 0) {
+        /* render up to the next sample point, both beepers run in lockstep */
+        uint32_t span = beeper_sample_ticks(&sys->beeper_1);
+        if (span > num_ticks) {
+            span = num_ticks;
+        }
+        num_ticks -= span;
+        beeper_render(&sys->beeper_1, span, 0);
+        if ((beeper_render(&sys->beeper_2, span, 0) > 0) && !sys->headless) {
+            /* new audio sample ready */
+            sys->sample_buffer[sys->sample_pos++] = sys->beeper_1.sample + sys->beeper_2.sample;
+            if (sys->sample_pos == sys->num_samples) {
+                if (sys->audio_cb) {
+                    sys->audio_cb(sys->sample_buffer, sys->num_samples, sys->user_data);
+                }
+                sys->sample_pos = 0;
+            }
+        }
+    }
+}
+
 static uint8_t _kc85_pio_in(int port_id, void* user_data) {
     (void)port_id;
     (void)user_data;
@@ -48,7 +48,20 @@
     - 3x VQE23 2-digits LED display block (equiv ???)
 
     TODO: more details about the hardware and emulator
+
+    ## Headless Mode
+
+    If lc80_desc_t.headless is true (or after calling lc80_set_headless(sys, true)),
+    the beeper doesn't generate audio samples (the audio callback isn't
+    called), this is useful for running automated tests as fast as possible.
+    The LED display state is always updated.
         
+    ## Snapshots
+
+    Use lc80_save_snapshot() and lc80_load_snapshot() to save and restore
+    the emulator state through a caller-provided lc80_t, the audio callback
+    and user data of the running instance are kept when loading a snapshot.
+
     ## zlib/libpng license
 
     Copyright (c) 2019 Andre Weissflog
@@ -183,12 +196,16 @@ extern "C" {
 typedef void (*lc80_audio_callback_t)(const float* samples, int num_samples, void* user_data);
 #define LC80_MAX_AUDIO_SAMPLES (1024)
 #define LC80_DEFAULT_AUDIO_SAMPLES (128)
+#define LC80_SNAPSHOT_VERSION (2)
 
 /* config parameters for lc80_init() */
 typedef struct {
     /* optional userdata pointer for callbacks */
     void* user_data;
 
+    /* if true, skip audio sample generation */
+    bool headless;
+
     /* audio output config (if you don't want audio, set audio_cb to zero) */
     lc80_audio_callback_t audio_cb;     /* called when audio_num_samples are ready */
     int audio_num_samples;              /* default is LC80_DEFAULT_AUDIO_SAMPLES */
@@ -203,6 +220,7 @@ typedef struct {
 /* LC80 emulator state */
 typedef struct {
     bool valid;
+    bool headless;
 
     z80_t cpu;
     z80ctc_t ctc;
@@ -236,6 +254,11 @@ void lc80_exec(lc80_t* sys, uint32_t micro_seconds);
 void lc80_key_down(lc80_t* sys, int key_code);
 void lc80_key_up(lc80_t* sys, int key_code);
 void lc80_key(lc80_t* sys, int key_code);       /* down + up */
+void lc80_set_headless(lc80_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t lc80_save_snapshot(lc80_t* sys, lc80_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool lc80_load_snapshot(lc80_t* sys, uint32_t version, const lc80_t* src);
 
 #ifdef __cplusplus
 } /* extern "C" */
@@ -262,6 +285,7 @@ void lc80_init(lc80_t* sys, const lc80_desc_t* desc) {
     
     memset(sys, 0, sizeof(lc80_t));
     sys->valid = true;
+    sys->headless = desc->headless;
     sys->user_data = desc->user_data;
     
     CHIPS_ASSERT(desc->rom_ptr && (desc->rom_size == sizeof(sys->rom)));
@@ -392,6 +416,40 @@ void lc80_key(lc80_t* sys, int key_code) {
     lc80_key_up(sys, key_code);
 }
 
+void lc80_set_headless(lc80_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+}
+
+uint32_t lc80_save_snapshot(lc80_t* sys, lc80_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    z80pio_snapshot_onsave(&dst->pio_sys);
+    z80pio_snapshot_onsave(&dst->pio_usr);
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    return LC80_SNAPSHOT_VERSION;
+}
+
+bool lc80_load_snapshot(lc80_t* sys, uint32_t version, const lc80_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != LC80_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static lc80_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    z80pio_snapshot_onload(&im.pio_sys, &sys->pio_sys);
+    z80pio_snapshot_onload(&im.pio_usr, &sys->pio_usr);
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    lc80_set_headless(sys, headless);
+    return true;
+}
+
 #define _LC80_HI(pins,mask) (0!=(pins&mask))
 #define _LC80_LO(pins,mask) (0==(pins&mask))
 
@@ -512,7 +570,7 @@ uint64_t _lc80_tick(int num_ticks, uint64_t pins, void* user_data) {
     /* tick CTC and handle beeper */
     for (int i = 0; i < num_ticks; i++) {
         pins = z80ctc_tick(&sys->ctc, pins);
-        if (beeper_tick(&sys->beeper)) {
+        if (!sys->headless && beeper_tick(&sys->beeper)) {
             /* new audio sample ready */
             sys->sample_buffer[sys->sample_pos++] = sys->beeper.sample;
             if (sys->sample_pos == sys->num_samples) {
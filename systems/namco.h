@@ -39,6 +39,21 @@
     https://github.com/floooh/chips-test/blob/master/examples/sokol/pacman.c
     https://github.com/floooh/chips-test/blob/master/examples/sokol/pengo.c
 
+    ## Headless Mode
+
+    If namco_desc_t.headless is true (or after calling namco_set_headless(sys, true)),
+    the sound hardware doesn't generate audio samples (the audio callback
+    isn't called), and namco_decode_video() does nothing. The CPU and the
+    VSYNC interrupt run exactly as with video and audio output, this is
+    useful for running automated tests as fast as possible.
+
+    ## Snapshots
+
+    namco_save_snapshot() copies the machine state into a caller-provided
+    namco_t, namco_load_snapshot() copies it back into a running instance,
+    which keeps its pixel buffer, audio callback, user data and headless
+    mode.
+
     ## zlib/libpng license
 
     Copyright (c) 2019 Andre Weissflog
@@ -66,6 +81,7 @@ extern "C" {
 
 #define NAMCO_MAX_AUDIO_SAMPLES (1024)
 #define NAMCO_DEFAULT_AUDIO_SAMPLES (128)
+#define NAMCO_SNAPSHOT_VERSION (2)
 
 /* input bits (use with namco_input_set() and namco_input_clear()) */
 #define NAMCO_INPUT_P1_UP       (1<<0)
@@ -92,6 +108,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 224*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for audio callback */
     void* user_data;
 
@@ -162,6 +181,7 @@ typedef struct {
 /* the Namco arcade machine state */
 typedef struct {
     bool valid;
+    bool headless;
     z80_t cpu;
     clk_t clk;
     uint8_t in0;    /* inverted bits (active-low) */
@@ -200,6 +220,12 @@ void namco_reset(namco_t* sys);
 void namco_exec(namco_t* sys, uint32_t micro_seconds);
 /* decode video to pixel buffer, must be called once per frame */
 void namco_decode_video(namco_t* sys);
+/* enable/disable headless mode (no video decoding and audio output) */
+void namco_set_headless(namco_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t namco_save_snapshot(namco_t* sys, namco_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool namco_load_snapshot(namco_t* sys, uint32_t version, const namco_t* src);
 /* set input bits */
 void namco_input_set(namco_t* sys, uint32_t mask);
 /* clear input bits */
@@ -414,6 +440,7 @@ void namco_init(namco_t* sys, const namco_desc_t* desc) {
     _namco_sound_init(sys, desc);
     CHIPS_ASSERT((0 == desc->pixel_buffer) || (desc->pixel_buffer && (desc->pixel_buffer_size >= NAMCO_DISPLAY_SIZE)));
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
+    sys->headless = desc->headless;
     
     /* copy over ROM images */
     CHIPS_ASSERT(desc->rom_cpu_0000_0FFF && (desc->rom_cpu_0000_0FFF_size == 0x1000));
@@ -594,7 +621,9 @@ static uint64_t _namco_tick(int num_ticks, uint64_t pins, void* user_data) {
     }
 
     /* tick the sound chip */
-    _namco_sound_tick(sys, num_ticks);
+    if (!sys->headless) {
+        _namco_sound_tick(sys, num_ticks);
+    }
 
     /* memory requests */
     uint16_t addr = Z80_GET_ADDR(pins) & NAMCO_ADDR_MASK;
@@ -793,12 +822,46 @@ static void _namco_decode_sprites(namco_t* sys) {
 
 void namco_decode_video(namco_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
-    if (sys->pixel_buffer) {
+    if (sys->pixel_buffer && !sys->headless) {
         _namco_decode_chars(sys);
         _namco_decode_sprites(sys);
     }
 }
 
+void namco_set_headless(namco_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+}
+
+uint32_t namco_save_snapshot(namco_t* sys, namco_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    mem_snapshot_onsave(&dst->mem, sys);
+    dst->pixel_buffer = 0;
+    dst->user_data = 0;
+    dst->sound.callback = 0;
+    return NAMCO_SNAPSHOT_VERSION;
+}
+
+bool namco_load_snapshot(namco_t* sys, uint32_t version, const namco_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != NAMCO_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static namco_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    im.pixel_buffer = sys->pixel_buffer;
+    im.user_data = sys->user_data;
+    im.sound.callback = sys->sound.callback;
+    const bool headless = sys->headless;
+    *sys = im;
+    namco_set_headless(sys, headless);
+    return true;
+}
+
 void namco_input_set(namco_t* sys, uint32_t mask) {
     CHIPS_ASSERT(sys && sys->valid);
     if (mask & NAMCO_INPUT_P1_UP) {
@@ -33,6 +33,24 @@
 
     TODO!
 
+    ## Headless Mode
+
+    If vic20_desc_t.headless is true (or after calling vic20_set_headless(sys, true)),
+    the VIC doesn't write pixels into the pixel buffer and doesn't generate
+    audio samples (the audio callback isn't called). The raster counter and
+    video memory fetches work exactly as with video and audio output, this
+    is useful for running automated tests as fast as possible. To look at
+    the current screen, switch headless mode off for one frame.
+
+    ## Snapshots
+
+    vic20_save_snapshot() copies the emulator state into a caller-provided
+    vic20_t without any host pointers, and vic20_load_snapshot() copies such
+    a snapshot back while keeping the callbacks, pixel buffer and headless
+    mode of the running instance. An inserted ROM cartridge and tape are
+    part of the snapshot (unless the tape was inserted with
+    vic20_insert_tape_nocopy()).
+
     ## Links
 
     http://blog.tynemouthsoftware.co.uk/2019/09/how-the-vic20-works.html
@@ -65,6 +83,7 @@ extern "C" {
 #define VIC20_FREQUENCY (1108404)
 #define VIC20_MAX_AUDIO_SAMPLES (1024)        /* max number of audio samples in internal sample buffer */
 #define VIC20_DEFAULT_AUDIO_SAMPLES (128)     /* default number of samples in internal sample buffer */ 
+#define VIC20_SNAPSHOT_VERSION (1)            /* bumped when vic20_t changes in an incompatible way */
 
 /* VIC-20 joystick types (only one joystick supported) */
 typedef enum {
@@ -116,6 +135,9 @@ typedef struct {
                                    query required size via vic20_max_display_size() */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for callback functions */
     void* user_data;
 
@@ -143,6 +165,7 @@ typedef struct {
     m6561_t vic;
     
     bool valid;
+    bool headless;              /* true if video decoding and audio output are skipped */
     vic20_joystick_type_t joystick_type;
     vic20_memory_config_t mem_config;
     uint8_t cas_port;           /* cassette port, shared with c1530_t if datasette is connected */
@@ -205,6 +228,12 @@ void vic20_set_joystick_type(vic20_t* sys, vic20_joystick_type_t type);
 vic20_joystick_type_t vic20_joystick_type(vic20_t* sys);
 /* set joystick mask (combination of VIC20_JOYSTICK_*) */
 void vic20_joystick(vic20_t* sys, uint8_t joy_mask);
+/* enable/disable headless mode (no video decoding and audio output) */
+void vic20_set_headless(vic20_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t vic20_save_snapshot(vic20_t* sys, vic20_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool vic20_load_snapshot(vic20_t* sys, uint32_t version, const vic20_t* src);
 /* quickload a .prg/.bin file */
 bool vic20_quickload(vic20_t* sys, const uint8_t* ptr, int num_bytes);
 /* load a .prg/.bin file as ROM cartridge */
@@ -213,6 +242,8 @@ bool vic20_insert_rom_cartridge(vic20_t* sys, const uint8_t* ptr, int num_bytes)
 void vic20_remove_rom_cartridge(vic20_t* sys);
 /* insert tape as .TAP file (c1530 must be enabled) */
 bool vic20_insert_tape(vic20_t* sys, const uint8_t* ptr, int num_bytes);
+/* insert tape without copying, data must remain valid until the tape is removed */
+bool vic20_insert_tape_nocopy(vic20_t* sys, const uint8_t* ptr, int num_bytes);
 /* remove tape file */
 void vic20_remove_tape(vic20_t* sys);
 /* return true if a tape is currently inserted */
@@ -296,6 +327,7 @@ void vic20_init(vic20_t* sys, const vic20_desc_t* desc) {
     vic_desc.sound_hz = _VIC20_DEFAULT(desc->audio_sample_rate, 44100);
     vic_desc.sound_magnitude = _VIC20_DEFAULT(desc->audio_volume, 1.0f);
     m6561_init(&sys->vic, &vic_desc);
+    vic20_set_headless(sys, desc->headless);
 
     _vic20_init_key_map(sys);
     
@@ -806,11 +838,59 @@ void vic20_joystick(vic20_t* sys, uint8_t joy_mask) {
     _vic20_update_joymasks(sys);
 }
 
+void vic20_set_headless(vic20_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+    sys->vic.headless = headless;
+}
+
+uint32_t vic20_save_snapshot(vic20_t* sys, vic20_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    m6502_snapshot_onsave(&dst->cpu);
+    m6561_snapshot_onsave(&dst->vic);
+    mem_snapshot_onsave(&dst->mem_cpu, sys);
+    mem_snapshot_onsave(&dst->mem_vic, sys);
+    mem_snapshot_onsave(&dst->mem_cart, sys);
+    c1530_snapshot_onsave(&dst->c1530, &sys->c1530);
+    dst->user_data = 0;
+    dst->pixel_buffer = 0;
+    dst->audio_cb = 0;
+    return VIC20_SNAPSHOT_VERSION;
+}
+
+bool vic20_load_snapshot(vic20_t* sys, uint32_t version, const vic20_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != VIC20_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static vic20_t im;
+    im = *src;
+    m6502_snapshot_onload(&im.cpu, &sys->cpu);
+    m6561_snapshot_onload(&im.vic, &sys->vic);
+    mem_snapshot_onload(&im.mem_cpu, &sys->mem_cpu, sys);
+    mem_snapshot_onload(&im.mem_vic, &sys->mem_vic, sys);
+    mem_snapshot_onload(&im.mem_cart, &sys->mem_cart, sys);
+    c1530_snapshot_onload(&im.c1530, &sys->c1530);
+    im.user_data = sys->user_data;
+    im.pixel_buffer = sys->pixel_buffer;
+    im.audio_cb = sys->audio_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    vic20_set_headless(sys, headless);
+    return true;
+}
+
 bool vic20_insert_tape(vic20_t* sys, const uint8_t* ptr, int num_bytes) {
     CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
     return c1530_insert_tape(&sys->c1530, ptr, num_bytes);
 }
 
+bool vic20_insert_tape_nocopy(vic20_t* sys, const uint8_t* ptr, int num_bytes) {
+    CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
+    return c1530_insert_tape_nocopy(&sys->c1530, ptr, num_bytes);
+}
+
 void vic20_remove_tape(vic20_t* sys) {
     CHIPS_ASSERT(sys && sys->valid && sys->c1530.valid);
     c1530_remove_tape(&sys->c1530);
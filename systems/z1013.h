@@ -39,6 +39,21 @@
 
     No cassette-tape / beeper sound emulated!
 
+    ## Headless Mode
+
+    If z1013_desc_t.headless is true (or after calling z1013_set_headless(sys, true)),
+    the video memory isn't decoded into the pixel buffer at the end of
+    z1013_exec(), this is useful for running automated tests as fast
+    as possible. To look at the current screen, switch headless mode off
+    before the next call to z1013_exec().
+
+    ## Snapshots
+
+    z1013_save_snapshot() copies the emulator state into a caller-provided
+    z1013_t (without the pixel buffer pointer), z1013_load_snapshot() copies
+    it back into a running instance, which keeps its pixel buffer and
+    headless mode.
+
     ## TODO: add hardware/software reference links
 
     ## TODO: Describe Usage
@@ -69,6 +84,8 @@
 extern "C" {
 #endif
 
+#define Z1013_SNAPSHOT_VERSION (2)
+
 /* Z1013 model types */
 typedef enum {
     Z1013_TYPE_64,      /* Z1013.64 (default, latest model with 2 MHz and 64 KB RAM, new ROM) */
@@ -84,6 +101,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 256*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding */
+    bool headless;
+
     /* ROM images */
     const void* rom_mon202;
     const void* rom_mon_a2;
@@ -98,6 +118,7 @@ typedef struct {
     z80_t cpu;
     z80pio_t pio;
     bool valid;
+    bool headless;
     z1013_type_t type;
     uint8_t kbd_request_column;
     bool kbd_request_line_hilo;
@@ -130,6 +151,12 @@ void z1013_exec(z1013_t* sys, uint32_t micro_seconds);
 void z1013_key_down(z1013_t* sys, int key_code);
 /* send a key-up event */
 void z1013_key_up(z1013_t* sys, int key_code);
+/* enable/disable headless mode (no video decoding) */
+void z1013_set_headless(z1013_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t z1013_save_snapshot(z1013_t* sys, z1013_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool z1013_load_snapshot(z1013_t* sys, uint32_t version, const z1013_t* src);
 /* load a "KC .z80" file into the emulator */
 bool z1013_quickload(z1013_t* sys, const uint8_t* ptr, int num_bytes);
 
@@ -171,6 +198,7 @@ void z1013_init(z1013_t* sys, const z1013_desc_t* desc) {
     sys->valid = true;
     sys->type = desc->type;
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
+    sys->headless = desc->headless;
     memcpy(sys->rom_font, desc->rom_font, sizeof(sys->rom_font));
     if (desc->type == Z1013_TYPE_01) {
         memcpy(sys->rom_os, desc->rom_mon202, sizeof(sys->rom_os));
@@ -331,7 +359,9 @@ void z1013_exec(z1013_t* sys, uint32_t micro_seconds) {
     uint32_t ticks_executed = z80_exec(&sys->cpu, ticks_to_run);
     clk_ticks_executed(&sys->clk, ticks_executed);
     kbd_update(&sys->kbd, micro_seconds);
-    _z1013_decode_vidmem(sys);
+    if (!sys->headless) {
+        _z1013_decode_vidmem(sys);
+    }
 }
 
 void z1013_key_down(z1013_t* sys, int key_code) {
@@ -344,6 +374,38 @@ void z1013_key_up(z1013_t* sys, int key_code) {
     kbd_key_up(&sys->kbd, key_code);
 }
 
+void z1013_set_headless(z1013_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+}
+
+uint32_t z1013_save_snapshot(z1013_t* sys, z1013_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    z80pio_snapshot_onsave(&dst->pio);
+    mem_snapshot_onsave(&dst->mem, sys);
+    dst->pixel_buffer = 0;
+    return Z1013_SNAPSHOT_VERSION;
+}
+
+bool z1013_load_snapshot(z1013_t* sys, uint32_t version, const z1013_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != Z1013_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static z1013_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    z80pio_snapshot_onload(&im.pio, &sys->pio);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    im.pixel_buffer = sys->pixel_buffer;
+    const bool headless = sys->headless;
+    *sys = im;
+    z1013_set_headless(sys, headless);
+    return true;
+}
+
 static uint64_t _z1013_tick(int num_ticks, uint64_t pins, void* user_data) {
     (void)num_ticks;
     z1013_t* sys = (z1013_t*) user_data;
@@ -49,6 +49,23 @@
     plus a blinking flag. This video extension was already available on the
     Z9001 though.
 
+    ## Headless Mode
+
+    If z9001_desc_t.headless is true (or after calling z9001_set_headless(sys, true)),
+    the video memory isn't decoded into the pixel buffer at the end of
+    z9001_exec(), and the beeper doesn't generate audio samples (the
+    audio callback isn't called). The CTC and the blink flip flop work
+    exactly as with video and audio output, this is useful for running
+    automated tests as fast as possible. To look at the current screen,
+    switch headless mode off before the next call to z9001_exec().
+
+    ## Snapshots
+
+    z9001_save_snapshot() and z9001_load_snapshot() save and restore the
+    emulator state through a caller-provided z9001_t. Host pointers aren't
+    part of a snapshot, when loading, the pixel buffer, audio callback,
+    user data and headless mode of the running instance are kept.
+
     ## TODO:
     - enable/disable audio on PIO1-A bit 7
     - border color
@@ -86,6 +103,7 @@ extern "C" {
 
 #define Z9001_MAX_AUDIO_SAMPLES (1024)      /* max number of audio samples in internal sample buffer */
 #define Z9001_DEFAULT_AUDIO_SAMPLES (128)   /* default number of samples in internal sample buffer */ 
+#define Z9001_SNAPSHOT_VERSION (2)          /* bumped when z9001_t changes in an incompatible way */
 
 /* Z9001/KC87 model types */
 typedef enum {
@@ -104,6 +122,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 320*192*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user data for call back functions */
     void* user_data;
 
@@ -142,6 +163,7 @@ typedef struct {
     z80ctc_t ctc;
     beeper_t beeper;
     bool valid;
+    bool headless;
     bool z9001_has_basic_rom;
     z9001_type_t type;
     uint64_t ctc_zcto2;     /* pin mask to store state of CTC ZCTO2 */
@@ -182,6 +204,12 @@ void z9001_exec(z9001_t* sys, uint32_t micro_seconds);
 void z9001_key_down(z9001_t* sys, int key_code);
 /* send a key-up event */
 void z9001_key_up(z9001_t* sys, int key_code);
+/* enable/disable headless mode (no video decoding and audio output) */
+void z9001_set_headless(z9001_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t z9001_save_snapshot(z9001_t* sys, z9001_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool z9001_load_snapshot(z9001_t* sys, uint32_t version, const z9001_t* src);
 /* load a KC TAP or KCC file into the emulator */
 bool z9001_quickload(z9001_t* sys, const uint8_t* ptr, int num_bytes);
 
@@ -249,6 +277,7 @@ void z9001_init(z9001_t* sys, const z9001_desc_t* desc) {
     }
     CHIPS_ASSERT(desc->pixel_buffer && (desc->pixel_buffer_size >= _Z9001_DISPLAY_SIZE));
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
+    sys->headless = desc->headless;
     sys->audio_cb = desc->audio_cb;
     sys->user_data = desc->user_data;
     sys->num_samples = _Z9001_DEFAULT(desc->audio_num_samples, Z9001_DEFAULT_AUDIO_SAMPLES);
@@ -422,7 +451,9 @@ void z9001_exec(z9001_t* sys, uint32_t micro_seconds) {
     uint32_t ticks_executed = z80_exec(&sys->cpu, ticks_to_run);
     clk_ticks_executed(&sys->clk, ticks_executed);
     kbd_update(&sys->kbd, micro_seconds);
-    _z9001_decode_vidmem(sys);
+    if (!sys->headless) {
+        _z9001_decode_vidmem(sys);
+    }
 }
 
 void z9001_key_down(z9001_t* sys, int key_code) {
@@ -439,6 +470,44 @@ void z9001_key_up(z9001_t* sys, int key_code) {
     z80pio_write_port(&sys->pio2, Z80PIO_PORT_B, ~kbd_scan_lines(&sys->kbd));
 }
 
+void z9001_set_headless(z9001_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    sys->headless = headless;
+}
+
+uint32_t z9001_save_snapshot(z9001_t* sys, z9001_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    z80pio_snapshot_onsave(&dst->pio1);
+    z80pio_snapshot_onsave(&dst->pio2);
+    mem_snapshot_onsave(&dst->mem, sys);
+    dst->pixel_buffer = 0;
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    return Z9001_SNAPSHOT_VERSION;
+}
+
+bool z9001_load_snapshot(z9001_t* sys, uint32_t version, const z9001_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != Z9001_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static z9001_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    z80pio_snapshot_onload(&im.pio1, &sys->pio1);
+    z80pio_snapshot_onload(&im.pio2, &sys->pio2);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    im.pixel_buffer = sys->pixel_buffer;
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    z9001_set_headless(sys, headless);
+    return true;
+}
+
 /* the CPU tick callback performs memory and I/O reads/writes */
 static uint64_t _z9001_tick(int num_ticks, uint64_t pins, void* user_data) {
     z9001_t* sys = (z9001_t*) user_data;
@@ -457,7 +526,7 @@ static uint64_t _z9001_tick(int num_ticks, uint64_t pins, void* user_data) {
             /* CTC channel 0 controls the beeper frequency */
             beeper_toggle(&sys->beeper);
         }
-        if (beeper_tick(&sys->beeper)) {
+        if (!sys->headless && beeper_tick(&sys->beeper)) {
             /* new audio sample ready */
             sys->sample_buffer[sys->sample_pos++] = sys->beeper.sample;
             if (sys->sample_pos == sys->num_samples) {
@@ -35,6 +35,41 @@
 
     TODO! 
 
+    ## Headless Mode
+
+    If zx_desc_t.headless is true (or after calling zx_set_headless(sys, true)),
+    the emulator doesn't decode video memory into the pixel buffer and
+    doesn't generate audio samples (the audio callback isn't called). The
+    scanline counter and vblank interrupt, the blink counter and the
+    AY-3-8912 sound generator state are updated as usual, so the
+    emulation runs exactly like with video and audio output, just faster.
+    This is useful for automated tests. To look at the current screen,
+    switch headless mode off for one frame.
+
+    ## Display Cache
+
+    The 256x192 display area is only re-decoded for scanlines which have
+    changed since they were last decoded. CPU writes into the 0x4000..0x5AFF
+    display region (of the RAM bank which is currently scanned out) flag
+    the affected scanline (or all 8 scanlines of a character row for
+    attribute writes) as dirty, and when the flash phase flips, all
+    scanlines which contain flashing characters are flagged as dirty.
+    The border area is decoded for every scanline.
+
+    If you write video memory without going through the emulated CPU
+    (for instance from a debugger memory editor), call
+    zx_invalidate_display() to force a full redraw.
+
+    ## Snapshots
+
+    zx_save_snapshot() copies the emulator state into a caller-provided
+    zx_t, with the host pointers (callbacks, user data and pixel buffer)
+    cleared and the memory mapping stored as offsets into the zx_t, so that
+    the snapshot can be written to a file, or kept in a rewind buffer
+    (see chips/rewind.h). zx_load_snapshot() copies a snapshot back into a
+    running instance, the host pointers and the headless mode of the
+    running instance are kept, and the whole display is decoded again.
+
     ## TODO:
     - wait states when CPU accesses 'contended memory' and IO ports
     - reads from port 0xFF must return 'current VRAM bytes
@@ -67,6 +102,7 @@ extern "C" {
 
 #define ZX_MAX_AUDIO_SAMPLES (1024)      /* max number of audio samples in internal sample buffer */
 #define ZX_DEFAULT_AUDIO_SAMPLES (128)   /* default number of samples in internal sample buffer */ 
+#define ZX_SNAPSHOT_VERSION (4)          /* bumped when zx_t changes in an incompatible way */
 
 /* ZX Spectrum models */
 typedef enum {
@@ -101,6 +137,9 @@ typedef struct {
     void* pixel_buffer;         /* pointer to a linear RGBA8 pixel buffer, at least 320*256*4 bytes */
     int pixel_buffer_size;      /* size of the pixel buffer in bytes */
 
+    /* if true, skip video decoding and audio sample generation */
+    bool headless;
+
     /* optional user-data for callback functions */
     void* user_data;
 
@@ -131,9 +170,11 @@ typedef struct {
     zx_type_t type;
     zx_joystick_type_t joystick_type;
     bool memory_paging_disabled;
+    bool headless;
     uint8_t kbd_joymask;        /* joystick mask from keyboard joystick emulation */
     uint8_t joy_joymask;        /* joystick mask from zx_joystick() */
     uint32_t tick_count;
+    uint32_t audio_tick_count;      /* tick count up to which audio has been rendered */
     uint8_t last_mem_config;        /* last out to 0x7FFD */
     uint8_t last_fe_out;            /* last out value to 0xFE port */
     uint8_t blink_counter;          /* incremented on each vblank */
@@ -144,6 +185,8 @@ typedef struct {
     int scanline_y;
     uint32_t display_ram_bank;
     uint32_t border_color;
+    uint8_t display_dirty[24];      /* one byte per attribute row, one bit per scanline */
+    uint8_t display_flash[24];      /* same layout, scanlines with flashing characters */
     clk_t clk;
     kbd_t kbd;
     mem_t mem;
@@ -184,6 +227,14 @@ void zx_set_joystick_type(zx_t* sys, zx_joystick_type_t type);
 zx_joystick_type_t zx_joystick_type(zx_t* sys);
 /* set joystick mask (combination of ZX_JOYSTICK_*) */
 void zx_joystick(zx_t* sys, uint8_t mask);
+/* enable/disable headless mode (no video decoding and audio output) */
+void zx_set_headless(zx_t* sys, bool headless);
+/* save a snapshot into dst, returns the snapshot version */
+uint32_t zx_save_snapshot(zx_t* sys, zx_t* dst);
+/* load a snapshot, returns false if the snapshot version doesn't match */
+bool zx_load_snapshot(zx_t* sys, uint32_t version, const zx_t* src);
+/* force a full redraw of the display area (after writing video memory directly) */
+void zx_invalidate_display(zx_t* sys);
 /* load a ZX Z80 file into the emulator */
 bool zx_quickload(zx_t* sys, const uint8_t* ptr, int num_bytes); 
 
@@ -206,9 +257,11 @@ bool zx_quickload(zx_t* sys, const uint8_t* ptr, int num_bytes);
 #define _ZX_128_FREQUENCY (3546894)
 
 static uint64_t _zx_tick(int num, uint64_t pins, void* user_data);
+static uint8_t* _zx_bulk(uint16_t addr, uint16_t* num_bytes, bool write, void* user_data);
 static void _zx_init_memory_map(zx_t* sys);
 static void _zx_init_keyboard_matrix(zx_t* sys);
 static bool _zx_decode_scanline(zx_t* sys);
+static void _zx_render_audio(zx_t* sys);
 
 #define _ZX_DEFAULT(val,def) (((val) != 0) ? (val) : (def));
 #define _ZX_CLEAR(val) memset(&val, 0, sizeof(val))
@@ -221,6 +274,7 @@ void zx_init(zx_t* sys, const zx_desc_t* desc) {
     sys->valid = true;
     sys->type = desc->type;
     sys->joystick_type = desc->joystick_type;
+    sys->headless = desc->headless;
     sys->pixel_buffer = (uint32_t*) desc->pixel_buffer;
     sys->user_data = desc->user_data;
     sys->audio_cb = desc->audio_cb;
@@ -257,6 +311,7 @@ void zx_init(zx_t* sys, const zx_desc_t* desc) {
     cpu_desc.tick_cb = _zx_tick;
     cpu_desc.user_data = sys;
     z80_init(&sys->cpu, &cpu_desc);
+    z80_bulk_cb(&sys->cpu, _zx_bulk, sys);
 
     const int audio_hz = _ZX_DEFAULT(desc->audio_sample_rate, 44100);
     const float beeper_vol = _ZX_DEFAULT(desc->audio_beeper_volume, 0.25f);
@@ -269,9 +324,11 @@ void zx_init(zx_t* sys, const zx_desc_t* desc) {
         ay_desc.sound_hz = audio_hz;
         ay_desc.magnitude = _ZX_DEFAULT(desc->audio_ay_volume, 0.5f);
         ay38910_init(&sys->ay, &ay_desc);
+        sys->ay.headless = sys->headless;
     }
     _zx_init_memory_map(sys);
     _zx_init_keyboard_matrix(sys);
+    zx_invalidate_display(sys);
     
     z80_set_pc(&sys->cpu, 0x0000);
 }
@@ -306,6 +363,7 @@ int zx_display_height(zx_t* sys) {
 void zx_reset(zx_t* sys) {
     CHIPS_ASSERT(sys && sys->valid);
     z80_reset(&sys->cpu);
+    _zx_render_audio(sys);
     beeper_reset(&sys->beeper);
     if (sys->type == ZX_TYPE_128) {
         ay38910_reset(&sys->ay);
@@ -324,6 +382,7 @@ void zx_reset(zx_t* sys) {
         sys->display_ram_bank = 5;
     }
     _zx_init_memory_map(sys);
+    zx_invalidate_display(sys);
     z80_set_pc(&sys->cpu, 0x0000);
 }
 
@@ -332,6 +391,7 @@ void zx_exec(zx_t* sys, uint32_t micro_seconds) {
     uint32_t ticks_to_run = clk_ticks_to_run(&sys->clk, micro_seconds);
     uint32_t ticks_executed = z80_exec(&sys->cpu, ticks_to_run);
     clk_ticks_executed(&sys->clk, ticks_executed);
+    _zx_render_audio(sys);
     kbd_update(&sys->kbd, micro_seconds);
 }
 
@@ -460,6 +520,54 @@ void zx_joystick(zx_t* sys, uint8_t mask) {
     }
 }
 
+void zx_set_headless(zx_t* sys, bool headless) {
+    CHIPS_ASSERT(sys && sys->valid);
+    if (sys->headless && !headless) {
+        /* the display cache wasn't updated in headless mode */
+        zx_invalidate_display(sys);
+    }
+    sys->headless = headless;
+    sys->ay.headless = headless;
+}
+
+uint32_t zx_save_snapshot(zx_t* sys, zx_t* dst) {
+    CHIPS_ASSERT(sys && sys->valid && dst);
+    *dst = *sys;
+    z80_snapshot_onsave(&dst->cpu);
+    ay38910_snapshot_onsave(&dst->ay, 0);
+    mem_snapshot_onsave(&dst->mem, sys);
+    dst->pixel_buffer = 0;
+    dst->user_data = 0;
+    dst->audio_cb = 0;
+    return ZX_SNAPSHOT_VERSION;
+}
+
+bool zx_load_snapshot(zx_t* sys, uint32_t version, const zx_t* src) {
+    CHIPS_ASSERT(sys && sys->valid && src);
+    if (version != ZX_SNAPSHOT_VERSION) {
+        return false;
+    }
+    static zx_t im;
+    im = *src;
+    z80_snapshot_onload(&im.cpu, &sys->cpu);
+    ay38910_snapshot_onload(&im.ay, &sys->ay);
+    mem_snapshot_onload(&im.mem, &sys->mem, sys);
+    im.pixel_buffer = sys->pixel_buffer;
+    im.user_data = sys->user_data;
+    im.audio_cb = sys->audio_cb;
+    const bool headless = sys->headless;
+    *sys = im;
+    zx_set_headless(sys, headless);
+    /* the display cache flags refer to the pixel buffer content before loading */
+    zx_invalidate_display(sys);
+    return true;
+}
+
+void zx_invalidate_display(zx_t* sys) {
+    CHIPS_ASSERT(sys && sys->valid);
+    memset(sys->display_dirty, 0xFF, sizeof(sys->display_dirty));
+}
+
 static uint32_t _zx_palette[8] = {
     0xFF000000,     // black
     0xFFFF0000,     // blue
@@ -471,30 +579,27 @@ static uint32_t _zx_palette[8] = {
     0xFFFFFFFF,     // white
 };
 
-static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
-    zx_t* sys = (zx_t*) user_data;
-    /* video decoding and vblank interrupt */
-    sys->scanline_counter -= num_ticks;
-    if (sys->scanline_counter <= 0) {
-        sys->scanline_counter += sys->scanline_period;
-        /* decode next video scanline */
-        if (_zx_decode_scanline(sys)) {
-            /* request vblank interrupt */
-            pins |= Z80_INT;
+/* catch up the beeper and AY-3-8912 with the ticks executed since the last call,
+   this must happen before the beeper level changes or the AY-3-8912 is accessed
+*/
+static void _zx_render_audio(zx_t* sys) {
+    uint32_t num_ticks = sys->tick_count - sys->audio_tick_count;
+    while (num_ticks > 0) {
+        /* render up to the next sample point */
+        uint32_t span = beeper_sample_ticks(&sys->beeper);
+        if (span > num_ticks) {
+            span = num_ticks;
         }
-    }
-
-    /* tick audio systems */
-    for (int i = 0; i < num_ticks; i++) {
-        sys->tick_count++;
-        bool sample_ready = beeper_tick(&sys->beeper);
-        /* the AY-3-8912 chip runs at half CPU frequency */
         if (sys->type == ZX_TYPE_128) {
-            if (sys->tick_count & 1) {
-                ay38910_tick(&sys->ay);
+            /* the AY-3-8912 runs at half CPU frequency (ticks on odd tick counts) */
+            const uint32_t ay_ticks = (span + (~sys->audio_tick_count & 1)) >> 1;
+            if (ay_ticks > 0) {
+                ay38910_render(&sys->ay, ay_ticks, 0);
             }
         }
-        if (sample_ready) {
+        sys->audio_tick_count += span;
+        num_ticks -= span;
+        if ((beeper_render(&sys->beeper, span, 0) > 0) && !sys->headless) {
             float sample = sys->beeper.sample;
             if (sys->type == ZX_TYPE_128) {
                 sample += sys->ay.sample;
@@ -508,6 +613,82 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
             }
         }
     }
+}
+
+/* flag display scanlines as dirty when the CPU writes into the scanned-out display region */
+static inline void _zx_track_display_write(zx_t* sys, uint16_t addr) {
+    const uint16_t offset = addr & 0x3FFF;
+    if (offset >= 0x1B00) {
+        return;
+    }
+    bool display_bank;
+    if (addr < 0x4000) {
+        /* ROM */
+        display_bank = false;
+    }
+    else if (addr < 0x8000) {
+        /* RAM bank 0 on 48K, bank 5 on 128 */
+        display_bank = (sys->type == ZX_TYPE_48K) || (sys->display_ram_bank == 5);
+    }
+    else if (addr >= 0xC000) {
+        /* switchable RAM bank on 128 */
+        display_bank = (sys->type == ZX_TYPE_128) && ((sys->last_mem_config & 7) == sys->display_ram_bank);
+    }
+    else {
+        display_bank = false;
+    }
+    if (display_bank) {
+        if (offset < 0x1800) {
+            /* pixel data: | 0| 1| 0|Y7|Y6|Y2|Y1|Y0|Y5|Y4|Y3|X4|X3|X2|X1|X0| */
+            const uint16_t yy = ((offset>>5) & 0xC0) | ((offset>>2) & 0x38) | ((offset>>8) & 0x07);
+            sys->display_dirty[yy>>3] |= 1<<(yy & 7);
+        }
+        else {
+            /* attribute data, affects all 8 scanlines of a character row */
+            sys->display_dirty[(offset - 0x1800)>>5] = 0xFF;
+        }
+    }
+}
+
+/* direct memory access for the Z80 block instruction fast path, the
+   number of bytes is limited so that no video scanline is decoded in
+   the middle of a chunk
+*/
+static uint8_t* _zx_bulk(uint16_t addr, uint16_t* num_bytes, bool write, void* user_data) {
+    zx_t* sys = (zx_t*) user_data;
+    const int max_bytes = (sys->scanline_counter - 1) / Z80_BULK_TICKS;
+    if (max_bytes <= 0) {
+        return 0;
+    }
+    uint8_t* ptr = mem_bulk_ptr(&sys->mem, addr, *num_bytes, write);
+    if (ptr) {
+        if (write) {
+            for (uint32_t i = 0; i < *num_bytes; i++) {
+                _zx_track_display_write(sys, (uint16_t)(addr + i));
+            }
+        }
+        if (*num_bytes > max_bytes) {
+            *num_bytes = (uint16_t) max_bytes;
+        }
+    }
+    return ptr;
+}
+
+static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
+    zx_t* sys = (zx_t*) user_data;
+    /* video decoding and vblank interrupt */
+    sys->scanline_counter -= num_ticks;
+    if (sys->scanline_counter <= 0) {
+        sys->scanline_counter += sys->scanline_period;
+        /* decode next video scanline */
+        if (_zx_decode_scanline(sys)) {
+            /* request vblank interrupt */
+            pins |= Z80_INT;
+        }
+    }
+
+    /* audio is rendered in one go when needed, see _zx_render_audio() */
+    sys->tick_count += num_ticks;
 
     /* memory and IO requests */
     if (pins & Z80_MREQ) {
@@ -520,6 +701,7 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
         }
         else if (pins & Z80_WR) {
             mem_wr(&sys->mem, addr, Z80_GET_DATA(pins));
+            _zx_track_display_write(sys, addr);
         }
     }
     else if (pins & Z80_IORQ) {
@@ -552,6 +734,7 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
             else if (sys->type == ZX_TYPE_128){
                 /* read from AY-3-8912 (11............0.) */
                 if ((pins & (Z80_A15|Z80_A14|Z80_A1)) == (Z80_A15|Z80_A14)) {
+                    _zx_render_audio(sys);
                     pins = ay38910_iorq(&sys->ay, AY38910_BC1|pins) & Z80_PIN_MASK;
                 }
             }
@@ -568,6 +751,7 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
                 */
                 sys->border_color = _zx_palette[data & 7] & 0xFFD7D7D7;
                 sys->last_fe_out = data;
+                _zx_render_audio(sys);
                 beeper_set(&sys->beeper, 0 != (data & (1<<4)));
             }
             else if (sys->type == ZX_TYPE_128) {
@@ -578,7 +762,11 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
                     if (!sys->memory_paging_disabled) {
                         sys->last_mem_config = data;
                         /* bit 3 defines the video scanout memory bank (5 or 7) */
-                        sys->display_ram_bank = (data & (1<<3)) ? 7 : 5;
+                        const uint32_t display_ram_bank = (data & (1<<3)) ? 7 : 5;
+                        if (display_ram_bank != sys->display_ram_bank) {
+                            sys->display_ram_bank = display_ram_bank;
+                            zx_invalidate_display(sys);
+                        }
                         /* only last memory bank is mappable */
                         mem_map_ram(&sys->mem, 0, 0xC000, 0x4000, sys->ram[data & 0x7]);
 
@@ -606,6 +794,7 @@ static uint64_t _zx_tick(int num_ticks, uint64_t pins, void* user_data) {
                 }
                 else if ((pins & (Z80_A15|Z80_A14|Z80_A1)) == Z80_A15) {
                     /* write to AY-3-8912 (10............0.) */
+                    _zx_render_audio(sys);
                     ay38910_iorq(&sys->ay, AY38910_BDIR|pins);
                 }
             }
@@ -635,7 +824,7 @@ static bool _zx_decode_scanline(zx_t* sys) {
     */
     const int top_decode_line = sys->top_border_scanlines - 32;
     const int btm_decode_line = sys->top_border_scanlines + 192 + 32;
-    if ((sys->scanline_y >= top_decode_line) && (sys->scanline_y < btm_decode_line)) {
+    if (!sys->headless && (sys->scanline_y >= top_decode_line) && (sys->scanline_y < btm_decode_line)) {
         const uint16_t y = sys->scanline_y - top_decode_line;
         uint32_t* dst = &sys->pixel_buffer[y * _ZX_DISPLAY_WIDTH];
         const uint8_t* vidmem_bank = sys->ram[sys->display_ram_bank];
@@ -655,37 +844,54 @@ static bool _zx_decode_scanline(zx_t* sys) {
             */
             const uint16_t yy = y-32;
             const uint16_t y_offset = ((yy & 0xC0)<<5) | ((yy & 0x07)<<8) | ((yy & 0x38)<<2);
+            const int row = yy>>3;
+            const uint8_t line_mask = 1<<(yy & 7);
 
             /* left border */
             for (int x = 0; x < (4*8); x++) {
                 *dst++ = sys->border_color;
             }
 
-            /* valid 256x192 vidmem area */
-            for (uint16_t x = 0; x < 32; x++) {
-                const uint16_t pix_offset = y_offset | x;
-                const uint16_t clr_offset = 0x1800 + (((yy & ~0x7)<<2) | x);
-
-                /* pixel mask and color attribute bytes */
-                const uint8_t pix = vidmem_bank[pix_offset];
-                const uint8_t clr = vidmem_bank[clr_offset];
-
-                /* foreground and background color */
-                if ((clr & (1<<7)) && blink) {
-                    fg = _zx_palette[(clr>>3) & 7];
-                    bg = _zx_palette[clr & 7];
-                }
-                else {
-                    fg = _zx_palette[clr & 7];
-                    bg = _zx_palette[(clr>>3) & 7];
+            /* valid 256x192 vidmem area, skip if the scanline hasn't changed */
+            if (0 == (sys->display_dirty[row] & line_mask)) {
+                dst += 256;
+            }
+            else {
+                sys->display_dirty[row] &= ~line_mask;
+                uint8_t flash = 0;
+                for (uint16_t x = 0; x < 32; x++) {
+                    const uint16_t pix_offset = y_offset | x;
+                    const uint16_t clr_offset = 0x1800 + (((yy & ~0x7)<<2) | x);
+
+                    /* pixel mask and color attribute bytes */
+                    const uint8_t pix = vidmem_bank[pix_offset];
+                    const uint8_t clr = vidmem_bank[clr_offset];
+                    flash |= clr;
+
+                    /* foreground and background color */
+                    if ((clr & (1<<7)) && blink) {
+                        fg = _zx_palette[(clr>>3) & 7];
+                        bg = _zx_palette[clr & 7];
+                    }
+                    else {
+                        fg = _zx_palette[clr & 7];
+                        bg = _zx_palette[(clr>>3) & 7];
+                    }
+                    if (0 == (clr & (1<<6))) {
+                        // standard brightness
+                        fg &= 0xFFD7D7D7;
+                        bg &= 0xFFD7D7D7;
+                    }
+                    for (int px = 7; px >=0; px--) {
+                        *dst++ = pix & (1<<px) ? fg : bg;
+                    }
                 }
-                if (0 == (clr & (1<<6))) {
-                    // standard brightness
-                    fg &= 0xFFD7D7D7;
-                    bg &= 0xFFD7D7D7;
+                /* remember scanlines with flashing characters */
+                if (flash & (1<<7)) {
+                    sys->display_flash[row] |= line_mask;
                 }
-                for (int px = 7; px >=0; px--) {
-                    *dst++ = pix & (1<<px) ? fg : bg;
+                else {
+                    sys->display_flash[row] &= ~line_mask;
                 }
             }
 
@@ -700,6 +906,12 @@ static bool _zx_decode_scanline(zx_t* sys) {
         /* start new frame, request vblank interrupt */
         sys->scanline_y = 0;
         sys->blink_counter++;
+        if (0 == (sys->blink_counter & 0x0F)) {
+            /* flash phase has flipped, redraw scanlines with flashing characters */
+            for (int row = 0; row < 24; row++) {
+                sys->display_dirty[row] |= sys->display_flash[row];
+            }
+        }
         return true;
     }
     else {
@@ -981,6 +1193,7 @@ bool zx_quickload(zx_t* sys, const uint8_t* ptr, int num_bytes) {
     if (ext_hdr) {
         z80_set_pc(&sys->cpu, ext_hdr->PC_h<<8|ext_hdr->PC_l);
         if (sys->type == ZX_TYPE_128) {
+            _zx_render_audio(sys);
             for (int i = 0; i < 16; i++) {
                 /* latch AY-3-8912 register address */
                 ay38910_iorq(&sys->ay, AY38910_BDIR|AY38910_BC1|(i<<16));
@@ -1001,6 +1214,7 @@ bool zx_quickload(zx_t* sys, const uint8_t* ptr, int num_bytes) {
         z80_set_pc(&sys->cpu, hdr->PC_h<<8|hdr->PC_l);
     }
     sys->border_color = _zx_palette[(hdr->flags0>>1) & 7] & 0xFFD7D7D7;
+    zx_invalidate_display(sys);
     return true;
 }
 #endif /* CHIPS_IMPL */
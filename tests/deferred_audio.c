@@ -0,0 +1,269 @@
+/*
+    deferred_audio.c
+
+    Checks that deferred sound synthesis (m6581_desc_t.deferred and
+    ay38910_desc_t.deferred) generates bit-identical samples with the
+    inline synthesis, also when far more register writes happen between
+    two log swaps than the initial log capacity (M6581_LOG_WRITES and
+    AY38910_LOG_WRITES).
+
+    Each chip runs as an inline instance, a deferred instance and a
+    synthesis instance, which are fed with the same random register
+    writes, register reads and resets. The logs are swapped every 10
+    frames, and the handed-over log is synthesized half a frame period
+    later (like a synthesis thread which is running late). A snapshot is
+    saved while a handed-over log is still pending, and after the first
+    run the snapshot is loaded back, and the rest of the run is repeated
+    from there. Build and run from the repository root:
+
+        cc -o deferred_audio tests/deferred_audio.c && ./deferred_audio
+*/
+#define CHIPS_IMPL
+#include "../chips/m6581.h"
+#include "../chips/ay38910.h"
+#include <stdio.h>
+#include <string.h>
+
+#define NUM_FRAMES (60)
+#define SAVE_FRAME (25)
+#define FRAME_TICKS (20000)
+#define MAX_SAMPLES (NUM_FRAMES * 1024)
+
+static float inline_samples[MAX_SAMPLES];
+static float deferred_samples[MAX_SAMPLES];
+static int num_inline;
+static int num_deferred;
+static uint32_t rnd;
+static uint32_t snapshot_rnd;
+
+/* inline, deferred and synthesis instances, and their snapshots */
+static m6581_t sid[3];
+static m6581_t sid_snapshot[3];
+static ay38910_t psg[3];
+static ay38910_t psg_snapshot[3];
+
+static uint32_t rand_u32(void) {
+    rnd = rnd * 1103515245 + 12345;
+    return rnd >> 8;
+}
+
+/* compare the samples of the inline and deferred synthesis */
+static int compare(const char* name, const char* phase) {
+    if (num_inline != num_deferred) {
+        printf("FAILED: %s %s: %d inline samples, but %d deferred samples\n", name, phase, num_inline, num_deferred);
+        return 1;
+    }
+    if (0 != memcmp(inline_samples, deferred_samples, num_inline * sizeof(float))) {
+        printf("FAILED: %s %s: deferred samples differ from inline samples\n", name, phase);
+        return 1;
+    }
+    printf("%s %s: %d samples OK\n", name, phase, num_inline);
+    return 0;
+}
+
+static void sid_synth(m6581_log_t* log) {
+    while (m6581_synth_pending(log)) {
+        num_deferred += m6581_synth(&sid[2], log, &deferred_samples[num_deferred], MAX_SAMPLES - num_deferred);
+    }
+}
+
+/* run the SID instances from 'first_frame' to the end, return number of mismatching reads */
+static int sid_run(int first_frame) {
+    int num_errors = 0;
+    m6581_log_t* log = 0;
+    num_inline = num_deferred = 0;
+    for (int frame = first_frame; frame < NUM_FRAMES; frame++) {
+        if (frame == SAVE_FRAME) {
+            for (int i = 0; i < 3; i++) {
+                sid_snapshot[i] = sid[i];
+            }
+            m6581_snapshot_onsave(&sid_snapshot[1], &sid_snapshot[2]);
+            snapshot_rnd = rnd;
+        }
+        for (int tick = 0; tick < FRAME_TICKS; tick++) {
+            uint64_t pins = 0;
+            const uint32_t r = rand_u32() & 0xFF;
+            if (r < 4) {
+                pins = M6581_CS | (rand_u32() % 25);
+                M6581_SET_DATA(pins, rand_u32() & 0xFF);
+            }
+            else if (r < 5) {
+                /* OSC3 or ENV3 */
+                pins = M6581_CS | M6581_RW | (27 + (rand_u32() & 1));
+            }
+            const uint64_t inline_pins = m6581_tick(&sid[0], pins);
+            const uint64_t deferred_pins = m6581_tick(&sid[1], pins);
+            if (inline_pins & M6581_SAMPLE) {
+                inline_samples[num_inline++] = sid[0].sample;
+            }
+            if ((pins & M6581_RW) && (M6581_GET_DATA(inline_pins) != M6581_GET_DATA(deferred_pins))) {
+                num_errors++;
+            }
+        }
+        if ((frame % 25) == 12) {
+            m6581_reset(&sid[0]);
+            m6581_reset(&sid[1]);
+        }
+        if (log && ((frame % 10) == 5)) {
+            sid_synth(log);
+        }
+        if ((frame % 10) == 9) {
+            log = m6581_log_swap(&sid[1], &sid[2]);
+        }
+    }
+    if (log) {
+        sid_synth(log);
+    }
+    sid_synth(m6581_log_swap(&sid[1], &sid[2]));
+    return num_errors;
+}
+
+static int test_sid(void) {
+    m6581_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.tick_hz = 985248;
+    desc.sound_hz = 44100;
+    desc.magnitude = 1.0f;
+    m6581_init(&sid[0], &desc);
+    m6581_init(&sid[2], &desc);
+    desc.deferred = true;
+    m6581_init(&sid[1], &desc);
+    rnd = 1;
+
+    if (sid_run(0) > 0) {
+        printf("FAILED: SID register reads differ\n");
+        return 1;
+    }
+    if ((sid[1].log[0].max_writes <= M6581_LOG_WRITES) || (sid[1].log[1].max_writes <= M6581_LOG_WRITES)) {
+        printf("FAILED: SID logs didn't grow\n");
+        return 1;
+    }
+    if (compare("SID", "run")) {
+        return 1;
+    }
+
+    /* load the snapshot back into the running instances */
+    m6581_snapshot_onload(&sid_snapshot[1], &sid[1]);
+    for (int i = 0; i < 3; i++) {
+        sid[i] = sid_snapshot[i];
+    }
+    rnd = snapshot_rnd;
+    if (sid_run(SAVE_FRAME) > 0) {
+        printf("FAILED: SID register reads differ after loading snapshot\n");
+        return 1;
+    }
+    if (compare("SID", "snapshot")) {
+        return 1;
+    }
+    m6581_discard(&sid[1]);
+    return 0;
+}
+
+static void psg_synth(ay38910_log_t* log) {
+    while (ay38910_synth_pending(log)) {
+        num_deferred += ay38910_synth(&psg[2], log, &deferred_samples[num_deferred], MAX_SAMPLES - num_deferred);
+    }
+}
+
+/* perform the same IO request on the inline and deferred instance, return true if the data bus differs */
+static bool psg_iorq(uint64_t pins) {
+    const uint64_t inline_pins = ay38910_iorq(&psg[0], pins);
+    const uint64_t deferred_pins = ay38910_iorq(&psg[1], pins);
+    return AY38910_DATA(inline_pins) != AY38910_DATA(deferred_pins);
+}
+
+/* run the AY instances from 'first_frame' to the end, return number of mismatching reads */
+static int psg_run(int first_frame) {
+    int num_errors = 0;
+    ay38910_log_t* log = 0;
+    num_inline = num_deferred = 0;
+    for (int frame = first_frame; frame < NUM_FRAMES; frame++) {
+        if (frame == SAVE_FRAME) {
+            for (int i = 0; i < 3; i++) {
+                psg_snapshot[i] = psg[i];
+            }
+            ay38910_snapshot_onsave(&psg_snapshot[1], &psg_snapshot[2]);
+            snapshot_rnd = rnd;
+        }
+        for (int tick = 0; tick < FRAME_TICKS; tick++) {
+            const uint32_t r = rand_u32() & 0xFF;
+            if (r < 5) {
+                /* latch address, and write or read (IO port registers included) */
+                psg_iorq(AY38910_BDIR|AY38910_BC1|((uint64_t)(rand_u32() & 0x0F)<<16));
+                if (r < 4) {
+                    psg_iorq(AY38910_BDIR|((uint64_t)(rand_u32() & 0xFF)<<16));
+                }
+                else if (psg_iorq(AY38910_BC1)) {
+                    num_errors++;
+                }
+            }
+            if (ay38910_tick(&psg[0])) {
+                inline_samples[num_inline++] = psg[0].sample;
+            }
+            ay38910_tick(&psg[1]);
+        }
+        if ((frame % 25) == 12) {
+            ay38910_reset(&psg[0]);
+            ay38910_reset(&psg[1]);
+        }
+        if (log && ((frame % 10) == 5)) {
+            psg_synth(log);
+        }
+        if ((frame % 10) == 9) {
+            log = ay38910_log_swap(&psg[1]);
+        }
+    }
+    if (log) {
+        psg_synth(log);
+    }
+    psg_synth(ay38910_log_swap(&psg[1]));
+    return num_errors;
+}
+
+static int test_psg(void) {
+    ay38910_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.tick_hz = 1000000;
+    desc.sound_hz = 44100;
+    desc.magnitude = 1.0f;
+    ay38910_init(&psg[0], &desc);
+    ay38910_init(&psg[2], &desc);
+    desc.deferred = true;
+    ay38910_init(&psg[1], &desc);
+    rnd = 1;
+
+    if (psg_run(0) > 0) {
+        printf("FAILED: AY register reads differ\n");
+        return 1;
+    }
+    if ((psg[1].log[0].max_writes <= AY38910_LOG_WRITES) || (psg[1].log[1].max_writes <= AY38910_LOG_WRITES)) {
+        printf("FAILED: AY logs didn't grow\n");
+        return 1;
+    }
+    if (compare("AY", "run")) {
+        return 1;
+    }
+
+    ay38910_snapshot_onload(&psg_snapshot[1], &psg[1]);
+    for (int i = 0; i < 3; i++) {
+        psg[i] = psg_snapshot[i];
+    }
+    rnd = snapshot_rnd;
+    if (psg_run(SAVE_FRAME) > 0) {
+        printf("FAILED: AY register reads differ after loading snapshot\n");
+        return 1;
+    }
+    if (compare("AY", "snapshot")) {
+        return 1;
+    }
+    ay38910_discard(&psg[1]);
+    return 0;
+}
+
+int main() {
+    if (test_sid() || test_psg()) {
+        return 10;
+    }
+    printf("deferred_audio: OK\n");
+    return 0;
+}
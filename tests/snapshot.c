@@ -0,0 +1,130 @@
+/*
+    snapshot.c
+
+    Saves a snapshot from one ZX Spectrum 128 instance, loads it into a
+    second instance, and checks that all memory mappings of the second
+    instance point into its own zx_t (or are unmapped), and that both
+    instances then run in lockstep.
+
+    A small replacement ROM switches the RAM bank at 0xC000 and writes
+    into the switched bank and the display RAM in a loop. Build and run
+    from the repository root:
+
+        cc -o snapshot tests/snapshot.c && ./snapshot
+*/
+#define CHIPS_IMPL
+#include "../chips/z80.h"
+#include "../chips/beeper.h"
+#include "../chips/ay38910.h"
+#include "../chips/kbd.h"
+#include "../chips/mem.h"
+#include "../chips/clk.h"
+#include "../systems/zx.h"
+#include <stdio.h>
+#include <string.h>
+
+#define FRAME_US (20000)
+
+static uint8_t rom[2][0x4000];
+static uint32_t pixels[2][320*256];
+static zx_t sys[2];
+static zx_t snapshot;
+
+static const uint8_t prg[] = {
+    0xF3,               /* 0000: DI */
+    0x31, 0x00, 0x80,   /* 0001: LD SP,8000 */
+    0x01, 0xFD, 0x7F,   /* 0004: LD BC,7FFD */
+    0x3A, 0x00, 0x80,   /* 0007: LD A,(8000) */
+    0x3C,               /* 000A: INC A */
+    0x32, 0x00, 0x80,   /* 000B: LD (8000),A */
+    0xE6, 0x07,         /* 000E: AND 07 */
+    0xED, 0x79,         /* 0010: OUT (C),A */
+    0x32, 0x00, 0xC0,   /* 0012: LD (C000),A */
+    0x3A, 0x00, 0x80,   /* 0015: LD A,(8000) */
+    0x32, 0x00, 0x40,   /* 0018: LD (4000),A */
+    0x18, 0xEA,         /* 001B: JR 0007 */
+};
+
+static void init(int i) {
+    zx_desc_t desc;
+    memset(&desc, 0, sizeof(desc));
+    desc.type = ZX_TYPE_128;
+    desc.pixel_buffer = pixels[i];
+    desc.pixel_buffer_size = sizeof(pixels[i]);
+    desc.rom_zx128_0 = rom[0];
+    desc.rom_zx128_0_size = sizeof(rom[0]);
+    desc.rom_zx128_1 = rom[1];
+    desc.rom_zx128_1_size = sizeof(rom[1]);
+    zx_init(&sys[i], &desc);
+}
+
+static bool in_sys(const zx_t* s, const void* ptr) {
+    const uint8_t* p = (const uint8_t*) ptr;
+    return (p >= (const uint8_t*)s) && (p < (const uint8_t*)(s + 1));
+}
+
+/* all mapped pointers must point into the instance, unmapped layer pages must be null */
+static int check_mem(const zx_t* s) {
+    int num_errors = 0;
+    for (int layer = 0; layer < MEM_NUM_LAYERS; layer++) {
+        for (int i = 0; i < MEM_NUM_PAGES; i++) {
+            const mem_page_t* page = &s->mem.layers[layer][i];
+            if (page->read_ptr || page->write_ptr) {
+                if (!in_sys(s, page->read_ptr) || !in_sys(s, page->write_ptr)) {
+                    num_errors++;
+                }
+            }
+        }
+    }
+    for (int i = 0; i < MEM_NUM_PAGES; i++) {
+        const mem_page_t* page = &s->mem.page_table[i];
+        if (!in_sys(s, page->read_ptr) || !in_sys(s, page->write_ptr)) {
+            num_errors++;
+        }
+    }
+    return num_errors;
+}
+
+int main() {
+    memcpy(rom[0], prg, sizeof(prg));
+    memcpy(rom[1], prg, sizeof(prg));
+    init(0);
+    init(1);
+    /* the second instance has a different history than the first */
+    for (int frame = 0; frame < 10; frame++) {
+        zx_exec(&sys[0], FRAME_US);
+    }
+    zx_exec(&sys[1], FRAME_US);
+
+    const uint32_t version = zx_save_snapshot(&sys[0], &snapshot);
+    if (!zx_load_snapshot(&sys[1], version, &snapshot)) {
+        printf("FAILED: snapshot version %d rejected\n", (int)version);
+        return 10;
+    }
+    int num_errors = check_mem(&sys[1]);
+    if (num_errors > 0) {
+        printf("FAILED: %d page pointers outside of the loaded instance\n", num_errors);
+        return 10;
+    }
+
+    /* bank switching after loading remaps pages from the layers */
+    for (int frame = 0; frame < 10; frame++) {
+        zx_exec(&sys[0], FRAME_US);
+        zx_exec(&sys[1], FRAME_US);
+        num_errors += check_mem(&sys[1]);
+        if (0 != memcmp(sys[0].ram, sys[1].ram, sizeof(sys[0].ram))) {
+            printf("FAILED: RAM differs after frame %d\n", frame);
+            return 10;
+        }
+        if ((sys[0].last_mem_config != sys[1].last_mem_config) || (z80_pc(&sys[0].cpu) != z80_pc(&sys[1].cpu))) {
+            printf("FAILED: CPU or memory configuration differs after frame %d\n", frame);
+            return 10;
+        }
+    }
+    if (num_errors > 0) {
+        printf("FAILED: %d page pointers outside of the loaded instance\n", num_errors);
+        return 10;
+    }
+    printf("snapshot: OK\n");
+    return 0;
+}
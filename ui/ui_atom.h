@@ -346,6 +346,7 @@ void ui_atom_init(ui_atom_t* ui, const ui_atom_desc_t* ui_desc) {
         desc.y = y;
         desc.m6502 = &ui->atom->cpu;
         desc.read_cb = _ui_atom_mem_read;
+        desc.mem = &ui->atom->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
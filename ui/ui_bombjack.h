@@ -260,6 +260,7 @@ void ui_bombjack_init(ui_bombjack_t* ui, const ui_bombjack_desc_t* ui_desc) {
         desc.z80 = &ui->bj->mainboard.cpu;
         desc.read_cb = _ui_bombjack_mem_read;
         desc.read_layer = _UI_BOMBJACK_MEMLAYER_MAIN;
+        desc.mem = &ui->bj->mainboard.mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
@@ -271,6 +272,7 @@ void ui_bombjack_init(ui_bombjack_t* ui, const ui_bombjack_desc_t* ui_desc) {
         desc.title = "CPU Debugger (Sound)";
         desc.z80 = &ui->bj->soundboard.cpu;
         desc.read_layer = _UI_BOMBJACK_MEMLAYER_SOUND;
+        desc.mem = &ui->bj->soundboard.mem;
         ui_dbg_init(&ui->sound.dbg, &desc);
     }
     x += dx; y += dy;
@@ -299,6 +299,7 @@ static void _ui_c64_mem_write(int layer, uint16_t addr, uint8_t data, void* user
             break;
         case _UI_C64_MEMLAYER_1541:
             if (ui->c64->c1541.valid) {
+                c1541_wakeup(&ui->c64->c1541);
                 mem_wr(&ui->c64->c1541.mem, addr, data);
             }
             break;
@@ -550,6 +551,7 @@ void ui_c64_init(ui_c64_t* ui, const ui_c64_desc_t* ui_desc) {
         desc.y = y;
         desc.m6502 = &ui->c64->cpu;
         desc.read_cb = _ui_c64_mem_read;
+        desc.mem = &ui->c64->mem_cpu;
         desc.break_cb = _ui_c64_eval_bp;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
@@ -570,6 +572,7 @@ void ui_c64_init(ui_c64_t* ui, const ui_c64_desc_t* ui_desc) {
             desc.x = x;
             desc.y = y;
             desc.read_cb = _ui_c64_c1541_mem_read;
+            desc.mem = &ui->c64->c1541.mem;
             desc.break_cb = 0;
             desc.user_breaktypes[0].label = 0;
             desc.user_breaktypes[1].label = 0;
@@ -598,6 +598,7 @@ void ui_cpc_init(ui_cpc_t* ui, const ui_cpc_desc_t* ui_desc) {
         desc.y = y;
         desc.z80 = &ui->cpc->cpu;
         desc.read_cb = _ui_cpc_mem_read;
+        desc.mem = &ui->cpc->mem;
         desc.break_cb = _ui_cpc_eval_bp;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
@@ -29,6 +29,7 @@
 
         - imgui.h
         - ui_util.h
+        - mem.h
         - z80.h         (only if UI_DBG_USE_Z80 is defined)
         - z80dasm.h     (only if UI_DBG_USE_Z80 is defined)
         - m6502.h       (only if UI_DBG_USE_M6502 is defined)
@@ -37,6 +38,20 @@
     All strings provided to ui_dbg_init() must remain alive until
     ui_dbg_discard() is called!
 
+    Byte- and word-breakpoints are checked after each instruction by
+    reading the breakpoint values. If the optional ui_dbg_desc_t.mem
+    pointer is provided, byte/word breakpoints can additionally be
+    switched into write-watch mode (the 'W' checkbox, or the 'watch' flag
+    in ui_dbg_breakpoint_t): the debugger flags the memory pages of those
+    breakpoints as watched in the mem_t instance (see mem.h), and only
+    checks their conditions after the CPU has written to the breakpoint
+    address (and once after the breakpoint has been changed). This is
+    faster with many breakpoints, but a watched breakpoint misses changes
+    which don't come from a CPU write through the mem_t instance, like
+    IO registers, DMA, or memory changed by the host. The mem_t instance
+    must be the CPU-visible memory which is also read by read_cb. The
+    debugger owns the write-watch callback of the mem_t instance.
+
     ## zlib/libpng license
 
     Copyright (c) 2018 Andre Weissflog
@@ -112,6 +127,7 @@ typedef struct ui_dbg_breakpoint_t {
     int type;           /* UI_DBG_BREAKTYPE_* */
     int cond;           /* UI_DBG_BREAKCOND_* */
     bool enabled;
+    bool watch;         /* byte/word only: check after CPU writes instead of each instruction (needs ui_dbg_desc_t.mem) */
     uint16_t addr;
     int val;
 } ui_dbg_breakpoint_t;
@@ -166,6 +182,7 @@ typedef struct ui_dbg_desc_t {
     #endif
     ui_dbg_read_t read_cb;          /* callback to read memory */
     int read_layer;                 /* layer argument for read_cb */
+    mem_t* mem;                     /* optional CPU-visible memory for write-watchpoints */
     ui_dbg_user_break_t break_cb;   /* optional user-breakpoint evaluation callback */
     ui_dbg_create_texture_t create_texture_cb;      /* callback to create UI texture */
     ui_dbg_update_texture_t update_texture_cb;      /* callback to update UI texture */
@@ -187,6 +204,43 @@ typedef struct ui_dbg_dasm_t {
     uint8_t bin_buf[UI_DBG_MAX_BINLEN];
 } ui_dbg_dasm_t;
 
+/* breakpoint condition evaluator (compares current and breakpoint value) */
+typedef bool (*ui_dbg_bp_cond_t)(int val, int bp_val);
+
+/* a compiled breakpoint */
+typedef struct ui_dbg_bp_item_t {
+    int index;                  /* index into breakpoint list */
+    uint16_t addr;
+    int val;
+    uint64_t pin_mask;          /* only for IRQ/NMI breakpoints */
+    ui_dbg_bp_cond_t cond;      /* only for byte/word breakpoints */
+} ui_dbg_bp_item_t;
+
+/* compiled breakpoints, rebuilt whenever the breakpoint list changes */
+typedef struct ui_dbg_bp_compiled_t {
+    /* the breakpoint list at compile time, used to detect changes */
+    int num_breakpoints;
+    ui_dbg_breakpoint_t breakpoints[UI_DBG_MAX_BREAKPOINTS];
+    bool any_enabled;           /* true if any builtin breakpoint is enabled */
+    uint64_t rising_pin_mask;   /* rising CPU pins with enabled IRQ/NMI breakpoints */
+    int num_exec;
+    int num_byte;
+    int num_word;
+    int num_watch_byte;
+    int num_watch_word;
+    int num_pin;
+    int num_io;
+    ui_dbg_bp_item_t exec[UI_DBG_MAX_BREAKPOINTS];
+    ui_dbg_bp_item_t byte[UI_DBG_MAX_BREAKPOINTS];        /* checked after each instruction */
+    ui_dbg_bp_item_t word[UI_DBG_MAX_BREAKPOINTS];
+    ui_dbg_bp_item_t watch_byte[UI_DBG_MAX_BREAKPOINTS];  /* checked after CPU writes */
+    ui_dbg_bp_item_t watch_word[UI_DBG_MAX_BREAKPOINTS];
+    ui_dbg_bp_item_t pin[UI_DBG_MAX_BREAKPOINTS];
+    ui_dbg_bp_item_t io[UI_DBG_MAX_BREAKPOINTS];      /* addr is port, val is port mask */
+    uint8_t exec_map[(1<<16)/8];    /* one bit per address with enabled exec breakpoint */
+    uint8_t watch_map[(1<<16)/8];   /* one bit per address with enabled write-watched breakpoint */
+} ui_dbg_bp_compiled_t;
+
 /* debugger state */
 typedef struct ui_dbg_state_t {
     #if defined(UI_DBG_USE_Z80)
@@ -211,6 +265,8 @@ typedef struct ui_dbg_state_t {
     int delete_breakpoint_index;
     int num_breakpoints;
     ui_dbg_breakpoint_t breakpoints[UI_DBG_MAX_BREAKPOINTS];
+    ui_dbg_bp_compiled_t compiled;
+    bool watch_hit;             /* set when the CPU wrote to a write-watched breakpoint address */
 } ui_dbg_state_t;
 
 /* a displayed line */
@@ -274,6 +330,7 @@ typedef struct ui_dbg_t {
     uint32_t op_ticks;
     ui_dbg_read_t read_cb;
     int read_layer;
+    mem_t* mem;
     ui_dbg_user_break_t break_cb;
     ui_dbg_create_texture_t create_texture_cb;
     ui_dbg_update_texture_t update_texture_cb;
@@ -630,6 +687,168 @@ static void _ui_dbg_dbgstate_init(ui_dbg_t* win, ui_dbg_desc_t* desc) {
     dbg->delete_breakpoint_index = -1;
 }
 
+/* specialized breakpoint condition evaluators */
+static bool _ui_dbg_bp_cond_equal(int val, int bp_val)          { return val == bp_val; }
+static bool _ui_dbg_bp_cond_nonequal(int val, int bp_val)       { return val != bp_val; }
+static bool _ui_dbg_bp_cond_greater(int val, int bp_val)        { return val > bp_val; }
+static bool _ui_dbg_bp_cond_less(int val, int bp_val)           { return val < bp_val; }
+static bool _ui_dbg_bp_cond_greater_equal(int val, int bp_val)  { return val >= bp_val; }
+static bool _ui_dbg_bp_cond_less_equal(int val, int bp_val)     { return val <= bp_val; }
+static bool _ui_dbg_bp_cond_never(int val, int bp_val)          { (void)val; (void)bp_val; return false; }
+
+static ui_dbg_bp_cond_t _ui_dbg_bp_cond_func(int cond) {
+    switch (cond) {
+        case UI_DBG_BREAKCOND_EQUAL:            return _ui_dbg_bp_cond_equal;
+        case UI_DBG_BREAKCOND_NONEQUAL:         return _ui_dbg_bp_cond_nonequal;
+        case UI_DBG_BREAKCOND_GREATER:          return _ui_dbg_bp_cond_greater;
+        case UI_DBG_BREAKCOND_LESS:             return _ui_dbg_bp_cond_less;
+        case UI_DBG_BREAKCOND_GREATER_EQUAL:    return _ui_dbg_bp_cond_greater_equal;
+        case UI_DBG_BREAKCOND_LESS_EQUAL:       return _ui_dbg_bp_cond_less_equal;
+        default:                                return _ui_dbg_bp_cond_never;
+    }
+}
+
+/* add a compiled breakpoint item to one of the per-type lists */
+static ui_dbg_bp_item_t* _ui_dbg_bp_compile_item(ui_dbg_bp_item_t* items, int* num_items, int index, uint16_t addr, int val, ui_dbg_bp_cond_t cond) {
+    ui_dbg_bp_item_t* item = &items[(*num_items)++];
+    item->index = index;
+    item->addr = addr;
+    item->val = val;
+    item->pin_mask = 0;
+    item->cond = cond;
+    return item;
+}
+
+static void _ui_dbg_bp_watch_addr(ui_dbg_bp_compiled_t* c, uint16_t addr) {
+    c->watch_map[addr>>3] |= 1<<(addr & 7);
+}
+
+/* write-watch callback, installed in the optional mem_t instance */
+static void _ui_dbg_mem_watch(uint16_t addr, uint8_t data, void* user_data) {
+    (void)data;
+    ui_dbg_t* win = (ui_dbg_t*) user_data;
+    if (win->dbg.compiled.watch_map[addr>>3] & (1<<(addr & 7))) {
+        win->dbg.watch_hit = true;
+    }
+}
+
+/* flag the memory pages of write-watched byte/word breakpoints as watched
+
+    This must also be called after the system has been reset or rebooted,
+    since this re-initializes the mem_t instance.
+*/
+static void _ui_dbg_bp_install_watches(ui_dbg_t* win) {
+    if (!win->mem) {
+        return;
+    }
+    const ui_dbg_bp_compiled_t* c = &win->dbg.compiled;
+    mem_unwatch_all(win->mem);
+    mem_watch_cb(win->mem, _ui_dbg_mem_watch, win);
+    for (int i = 0; i < c->num_watch_byte; i++) {
+        mem_watch(win->mem, c->watch_byte[i].addr, 1);
+    }
+    for (int i = 0; i < c->num_watch_word; i++) {
+        mem_watch(win->mem, c->watch_word[i].addr, 2);
+    }
+    /* check the watched conditions once, they might already be true */
+    win->dbg.watch_hit = (c->num_watch_byte + c->num_watch_word) > 0;
+}
+
+/* rebuild the compiled breakpoints from the breakpoint list
+
+    Breakpoints are sorted into per-type lists (in breakpoint index order,
+    so that the first matching breakpoint wins like in the breakpoint list),
+    and execution breakpoint addresses are additionally stored in a
+    bitmap, so that checking for an execution breakpoint is a single
+    bit test, no matter how many breakpoints exist.
+*/
+static void _ui_dbg_bp_compile(ui_dbg_t* win) {
+    ui_dbg_bp_compiled_t* c = &win->dbg.compiled;
+    c->num_breakpoints = win->dbg.num_breakpoints;
+    c->any_enabled = false;
+    c->rising_pin_mask = 0;
+    c->num_exec = c->num_byte = c->num_word = c->num_pin = c->num_io = 0;
+    c->num_watch_byte = c->num_watch_word = 0;
+    memset(c->exec_map, 0, sizeof(c->exec_map));
+    memset(c->watch_map, 0, sizeof(c->watch_map));
+    for (int i = 0; i < win->dbg.num_breakpoints; i++) {
+        const ui_dbg_breakpoint_t* bp = &win->dbg.breakpoints[i];
+        c->breakpoints[i] = *bp;
+        if (!bp->enabled) {
+            continue;
+        }
+        switch (bp->type) {
+            case UI_DBG_BREAKTYPE_EXEC:
+                _ui_dbg_bp_compile_item(c->exec, &c->num_exec, i, bp->addr, 0, 0);
+                c->exec_map[bp->addr>>3] |= 1<<(bp->addr & 7);
+                break;
+            case UI_DBG_BREAKTYPE_BYTE:
+                if (bp->watch && win->mem) {
+                    _ui_dbg_bp_compile_item(c->watch_byte, &c->num_watch_byte, i, bp->addr, bp->val, _ui_dbg_bp_cond_func(bp->cond));
+                    _ui_dbg_bp_watch_addr(c, bp->addr);
+                }
+                else {
+                    _ui_dbg_bp_compile_item(c->byte, &c->num_byte, i, bp->addr, bp->val, _ui_dbg_bp_cond_func(bp->cond));
+                }
+                break;
+            case UI_DBG_BREAKTYPE_WORD:
+                if (bp->watch && win->mem) {
+                    _ui_dbg_bp_compile_item(c->watch_word, &c->num_watch_word, i, bp->addr, bp->val, _ui_dbg_bp_cond_func(bp->cond));
+                    _ui_dbg_bp_watch_addr(c, bp->addr);
+                    _ui_dbg_bp_watch_addr(c, bp->addr+1);
+                }
+                else {
+                    _ui_dbg_bp_compile_item(c->word, &c->num_word, i, bp->addr, bp->val, _ui_dbg_bp_cond_func(bp->cond));
+                }
+                break;
+            case UI_DBG_BREAKTYPE_IRQ:
+            case UI_DBG_BREAKTYPE_NMI:
+                {
+                    #if defined(UI_DBG_USE_Z80)
+                        const uint64_t mask = (bp->type == UI_DBG_BREAKTYPE_IRQ) ? Z80_INT : Z80_NMI;
+                    #elif defined(UI_DBG_USE_M6502)
+                        const uint64_t mask = (bp->type == UI_DBG_BREAKTYPE_IRQ) ? M6502_IRQ : M6502_NMI;
+                    #else
+                    #error "CPU TYPE"
+                    #endif
+                    _ui_dbg_bp_compile_item(c->pin, &c->num_pin, i, 0, 0, 0)->pin_mask = mask;
+                    c->rising_pin_mask |= mask;
+                }
+                break;
+            #if defined(UI_DBG_USE_Z80)
+            case UI_DBG_BREAKTYPE_OUT:
+            case UI_DBG_BREAKTYPE_IN:
+                _ui_dbg_bp_compile_item(c->io, &c->num_io, i, bp->addr, bp->val, 0);
+                break;
+            #endif
+            default:
+                /* user breakpoint types are evaluated in the user callback */
+                continue;
+        }
+        c->any_enabled = true;
+    }
+    _ui_dbg_bp_install_watches(win);
+}
+
+/* recompile breakpoints if the breakpoint list has changed since the last compile */
+static void _ui_dbg_bp_update(ui_dbg_t* win) {
+    const ui_dbg_bp_compiled_t* c = &win->dbg.compiled;
+    bool changed = c->num_breakpoints != win->dbg.num_breakpoints;
+    for (int i = 0; (i < win->dbg.num_breakpoints) && !changed; i++) {
+        const ui_dbg_breakpoint_t* bp0 = &c->breakpoints[i];
+        const ui_dbg_breakpoint_t* bp1 = &win->dbg.breakpoints[i];
+        changed = (bp0->type != bp1->type) || (bp0->cond != bp1->cond) || (bp0->enabled != bp1->enabled) ||
+                  (bp0->watch != bp1->watch) || (bp0->addr != bp1->addr) || (bp0->val != bp1->val);
+    }
+    if (changed) {
+        _ui_dbg_bp_compile(win);
+    }
+    else if (win->mem && ((win->mem->watch_cb != _ui_dbg_mem_watch) || (win->mem->watch_user_data != win))) {
+        /* the memory watches were cleared by a system reset outside the debugger */
+        _ui_dbg_bp_install_watches(win);
+    }
+}
+
 static void _ui_dbg_dbgstate_reset(ui_dbg_t* win) {
     ui_dbg_state_t* dbg = &win->dbg;
     #if defined(UI_DBG_USE_Z80)
@@ -646,12 +865,84 @@ static void _ui_dbg_dbgstate_reset(ui_dbg_t* win) {
     dbg->next_pc = 0;
     dbg->last_ticks = 0;
     dbg->last_trap_id = 0;
+    /* the system reset has cleared the memory watches */
+    _ui_dbg_bp_install_watches(win);
 }
 
 static void _ui_dbg_dbgstate_reboot(ui_dbg_t* win) {
     _ui_dbg_dbgstate_reset(win);
 }
 
+/* evaluate compiled byte/word breakpoint lists, return the new first hit index */
+static int _ui_dbg_bp_eval_mem(ui_dbg_t* win, const ui_dbg_bp_item_t* bytes, int num_bytes, const ui_dbg_bp_item_t* words, int num_words, int hit) {
+    for (int i = 0; (i < num_bytes) && (bytes[i].index < hit); i++) {
+        const ui_dbg_bp_item_t* item = &bytes[i];
+        if (item->cond((int)_ui_dbg_read_byte(win, item->addr), item->val)) {
+            hit = item->index;
+            break;
+        }
+    }
+    for (int i = 0; (i < num_words) && (words[i].index < hit); i++) {
+        const ui_dbg_bp_item_t* item = &words[i];
+        if (item->cond((int)_ui_dbg_read_word(win, item->addr), item->val)) {
+            hit = item->index;
+            break;
+        }
+    }
+    return hit;
+}
+
+/* evaluate the compiled breakpoints, return index of first triggered breakpoint, or -1 */
+static int _ui_dbg_bp_eval_compiled(ui_dbg_t* win, uint16_t pc, uint64_t pins) {
+    const ui_dbg_bp_compiled_t* c = &win->dbg.compiled;
+    /* since each list is sorted by breakpoint index, only the first hit
+       in each list matters, and lists can stop early once they reach
+       the index of an earlier hit
+    */
+    int hit = UI_DBG_MAX_BREAKPOINTS;
+    if (c->exec_map[pc>>3] & (1<<(pc & 7))) {
+        for (int i = 0; i < c->num_exec; i++) {
+            if (c->exec[i].addr == pc) {
+                hit = c->exec[i].index;
+                break;
+            }
+        }
+    }
+    hit = _ui_dbg_bp_eval_mem(win, c->byte, c->num_byte, c->word, c->num_word, hit);
+    /* write-watched byte/word breakpoints only need to be checked after
+       the CPU has written to one of their addresses
+    */
+    if (win->dbg.watch_hit) {
+        win->dbg.watch_hit = false;
+        hit = _ui_dbg_bp_eval_mem(win, c->watch_byte, c->num_watch_byte, c->watch_word, c->num_watch_word, hit);
+    }
+    const uint64_t rising_pins = pins & (pins ^ win->dbg.cpu_pins) & c->rising_pin_mask;
+    if (rising_pins) {
+        for (int i = 0; (i < c->num_pin) && (c->pin[i].index < hit); i++) {
+            if (rising_pins & c->pin[i].pin_mask) {
+                hit = c->pin[i].index;
+                break;
+            }
+        }
+    }
+    #if defined(UI_DBG_USE_Z80)
+    if ((c->num_io > 0) && (pins & Z80_IORQ)) {
+        const int type = ((pins & Z80_CTRL_MASK) == (Z80_IORQ|Z80_WR)) ? UI_DBG_BREAKTYPE_OUT :
+                         (((pins & Z80_CTRL_MASK) == (Z80_IORQ|Z80_RD)) ? UI_DBG_BREAKTYPE_IN : -1);
+        const uint16_t port = Z80_GET_ADDR(pins);
+        for (int i = 0; (i < c->num_io) && (c->io[i].index < hit); i++) {
+            const ui_dbg_bp_item_t* item = &c->io[i];
+            const uint16_t mask = (uint16_t)item->val;
+            if ((c->breakpoints[item->index].type == type) && ((port & mask) == (item->addr & mask))) {
+                hit = item->index;
+                break;
+            }
+        }
+    }
+    #endif
+    return (hit < UI_DBG_MAX_BREAKPOINTS) ? hit : -1;
+}
+
 /* breakpoint evaluation callback, this is installed as CPU trap callback when needed */
 static int _ui_dbg_bp_eval(uint16_t pc, uint32_t ticks, uint64_t pins, void* user_data) {
     ui_dbg_t* win = (ui_dbg_t*) user_data;
@@ -690,103 +981,10 @@ static int _ui_dbg_bp_eval(uint16_t pc, uint32_t ticks, uint64_t pins, void* use
                 break;
         }
     }
-    else {
-        uint64_t rising_pins = pins & (pins ^ win->dbg.cpu_pins);
-        for (int i = 0; (i < win->dbg.num_breakpoints) && (trap_id == 0); i++) {
-            const ui_dbg_breakpoint_t* bp = &win->dbg.breakpoints[i];
-            if (bp->enabled) {
-                switch (bp->type) {
-                    case UI_DBG_BREAKTYPE_EXEC:
-                        if (pc == bp->addr) {
-                            trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                        }
-                        break;
-
-                    case UI_DBG_BREAKTYPE_BYTE:
-                        {
-                            int val = (int) _ui_dbg_read_byte(win, bp->addr);
-                            bool b = false;
-                            switch (bp->cond) {
-                                case UI_DBG_BREAKCOND_EQUAL:            b = val == bp->val; break;
-                                case UI_DBG_BREAKCOND_NONEQUAL:         b = val != bp->val; break;
-                                case UI_DBG_BREAKCOND_GREATER:          b = val > bp->val; break;
-                                case UI_DBG_BREAKCOND_LESS:             b = val < bp->val; break;
-                                case UI_DBG_BREAKCOND_GREATER_EQUAL:    b = val >= bp->val; break;
-                                case UI_DBG_BREAKCOND_LESS_EQUAL:       b = val <= bp->val; break;
-                            }
-                            if (b) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        }
-                        break;
-
-                    case UI_DBG_BREAKTYPE_WORD:
-                        {
-                            uint16_t val = (int) _ui_dbg_read_word(win, bp->addr);
-                            bool b = false;
-                            switch (bp->cond) {
-                                case UI_DBG_BREAKCOND_EQUAL:            b = val == bp->val; break;
-                                case UI_DBG_BREAKCOND_NONEQUAL:         b = val != bp->val; break;
-                                case UI_DBG_BREAKCOND_GREATER:          b = val > bp->val; break;
-                                case UI_DBG_BREAKCOND_LESS:             b = val < bp->val; break;
-                                case UI_DBG_BREAKCOND_GREATER_EQUAL:    b = val >= bp->val; break;
-                                case UI_DBG_BREAKCOND_LESS_EQUAL:       b = val <= bp->val; break;
-                            }
-                            if (b) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        }
-                        break;
-
-                    case UI_DBG_BREAKTYPE_IRQ:
-                        #if defined(UI_DBG_USE_Z80)
-                            if (Z80_INT & rising_pins) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        #elif defined(UI_DBG_USE_M6502)
-                            if (M6502_IRQ & rising_pins) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        #else
-                        #error "CPU TYPE"
-                        #endif
-                        break;
-
-                    case UI_DBG_BREAKTYPE_NMI:
-                        #if defined(UI_DBG_USE_Z80)
-                            if (Z80_NMI & rising_pins) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        #elif defined(UI_DBG_USE_M6502)
-                            if (M6502_NMI & rising_pins) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        #else
-                        #error "CPU TYPE"
-                        #endif
-                        break;
-
-                    #if defined(UI_DBG_USE_Z80)
-                    case UI_DBG_BREAKTYPE_OUT:
-                        if ((pins & Z80_CTRL_MASK) == (Z80_IORQ|Z80_WR)) {
-                            const uint16_t mask = bp->val;
-                            if ((Z80_GET_ADDR(pins) & mask) == (bp->addr & mask)) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        }
-                        break;
-
-                    case UI_DBG_BREAKTYPE_IN:
-                        if ((pins & Z80_CTRL_MASK) == (Z80_IORQ|Z80_RD)) {
-                            const uint16_t mask = bp->val;
-                            if ((Z80_GET_ADDR(pins) & mask) == (bp->addr & mask)) {
-                                trap_id = UI_DBG_BP_BASE_TRAPID + i;
-                            }
-                        }
-                        break;
-                    #endif
-                }
-            }
+    else if (win->dbg.compiled.any_enabled) {
+        const int bp_index = _ui_dbg_bp_eval_compiled(win, pc, pins);
+        if (bp_index >= 0) {
+            trap_id = UI_DBG_BP_BASE_TRAPID + bp_index;
         }
     }
     /* call optional user-breakpoint evaluation callback */
@@ -862,6 +1060,7 @@ static bool _ui_dbg_bp_add_exec(ui_dbg_t* win, bool enabled, uint16_t addr) {
         bp->addr = addr;
         bp->val = 0;
         bp->enabled = enabled;
+        bp->watch = false;
         return true;
     }
     else {
@@ -879,6 +1078,7 @@ static bool _ui_dbg_bp_add_byte(ui_dbg_t* win, bool enabled, uint16_t addr) {
         bp->addr = addr;
         bp->val = _ui_dbg_read_byte(win, addr);
         bp->enabled = enabled;
+        bp->watch = false;
         return true;
     }
     else {
@@ -896,6 +1096,7 @@ static bool _ui_dbg_bp_add_word(ui_dbg_t* win, bool enabled, uint16_t addr) {
         bp->addr = addr;
         bp->val = _ui_dbg_read_word(win, addr);
         bp->enabled = enabled;
+        bp->watch = false;
         return true;
     }
     else {
@@ -1088,6 +1289,13 @@ static void _ui_dbg_bp_draw(ui_dbg_t* win) {
                     bp->val = (int) ui_util_input_u16("##word", (uint16_t)bp->val);
                 }
             }
+            if (win->mem && ((bp->type == UI_DBG_BREAKTYPE_BYTE) || (bp->type == UI_DBG_BREAKTYPE_WORD))) {
+                ImGui::SameLine();
+                ImGui::Checkbox("W##watch", &bp->watch);
+                if (ImGui::IsItemHovered()) {
+                    ImGui::SetTooltip("Only check after CPU writes (faster, but misses IO, DMA and host changes)");
+                }
+            }
             ImGui::SameLine();
             if (ImGui::Button("Del")) {
                 del_bp_index = i;
@@ -1905,6 +2113,7 @@ void ui_dbg_init(ui_dbg_t* win, ui_dbg_desc_t* desc) {
     win->valid = true;
     win->read_cb = desc->read_cb;
     win->read_layer = desc->read_layer;
+    win->mem = desc->mem;
     win->break_cb = desc->break_cb;
     win->create_texture_cb = desc->create_texture_cb;
     win->update_texture_cb = desc->update_texture_cb;
@@ -1917,6 +2126,10 @@ void ui_dbg_init(ui_dbg_t* win, ui_dbg_desc_t* desc) {
 
 void ui_dbg_discard(ui_dbg_t* win) {
     CHIPS_ASSERT(win && win->valid);
+    if (win->mem) {
+        mem_unwatch_all(win->mem);
+        mem_watch_cb(win->mem, 0, 0);
+    }
     _ui_dbg_heatmap_discard(win);
     win->valid = false;
 }
@@ -2017,12 +2230,15 @@ void ui_dbg_tick(ui_dbg_t* win, uint64_t pins) {
 
 void ui_dbg_draw(ui_dbg_t* win) {
     CHIPS_ASSERT(win && win->valid && win->ui.title);
-    if (!(win->ui.open || win->ui.show_heatmap || win->ui.show_breakpoints || win->ui.show_history)) {
-        return;
+    if (win->ui.open || win->ui.show_heatmap || win->ui.show_breakpoints || win->ui.show_history) {
+        _ui_dbg_dbgwin_draw(win);
+        _ui_dbg_heatmap_draw(win);
+        _ui_dbg_history_draw(win);
+        _ui_dbg_bp_draw(win);
     }
-    _ui_dbg_dbgwin_draw(win);
-    _ui_dbg_heatmap_draw(win);
-    _ui_dbg_history_draw(win);
-    _ui_dbg_bp_draw(win);
+    /* breakpoints are only edited through the UI, so this is the right
+       place to rebuild the compiled breakpoints
+    */
+    _ui_dbg_bp_update(win);
 }
 #endif /* CHIPS_IMPL */
@@ -165,7 +165,7 @@ void ui_fdd_draw(ui_fdd_t* win) {
                                             int j = 0;
                                             ImGui::Text("%04X:", i); ImGui::SameLine();
                                             for (; (j < bytes_per_line) && (i < sec->data_size); j++, i++) {
-                                                uint8_t val = win->fdd->data[i+sec->data_offset];
+                                                uint8_t val = win->fdd->data_ptr[i+sec->data_offset];
                                                 if (isalnum((int)val)) {
                                                     buf[j] = val;
                                                 }
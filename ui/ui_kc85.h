@@ -362,6 +362,7 @@ void ui_kc85_init(ui_kc85_t* ui, const ui_kc85_desc_t* ui_desc) {
         desc.y = y;
         desc.z80 = &ui->kc85->cpu;
         desc.read_cb = _ui_kc85_mem_read;
+        desc.mem = &ui->kc85->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
@@ -124,7 +124,7 @@ static void _ui_m6502_regs(ui_m6502_t* win) {
     ImGui::Text("X:  %02X", cpu->X);
     ImGui::Text("Y:  %02X", cpu->Y);
     ImGui::Text("S:  %02X", cpu->S);
-    const uint8_t f = cpu->P;
+    const uint8_t f = m6502_p(cpu);
     char f_str[9] = {
         (f & M6502_NF) ? 'N':'-',
         (f & M6502_VF) ? 'V':'-',
@@ -241,6 +241,8 @@ void ui_m6522_draw(ui_m6522_t* win) {
     if (!win->open) {
         return;
     }
+    /* apply deferred timer ticks before displaying the timer state */
+    m6522_sync(win->via);
     ImGui::SetNextWindowPos(ImVec2(win->init_x, win->init_y), ImGuiCond_Once);
     ImGui::SetNextWindowSize(ImVec2(win->init_w, win->init_h), ImGuiCond_Once);
     if (ImGui::Begin(win->title, &win->open)) {
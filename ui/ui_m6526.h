@@ -215,6 +215,8 @@ void ui_m6526_draw(ui_m6526_t* win) {
     if (!win->open) {
         return;
     }
+    /* apply deferred timer ticks before displaying the timer state */
+    m6526_sync(win->cia);
     ImGui::SetNextWindowPos(ImVec2(win->init_x, win->init_y), ImGuiCond_Once);
     ImGui::SetNextWindowSize(ImVec2(win->init_w, win->init_h), ImGuiCond_Once);
     if (ImGui::Begin(win->title, &win->open)) {
@@ -209,6 +209,7 @@ void ui_namco_init(ui_namco_t* ui, const ui_namco_desc_t* ui_desc) {
         desc.z80 = &ui->sys->cpu;
         desc.read_cb = _ui_namco_mem_read;
         desc.read_layer = _UI_NAMCO_MEMLAYER_MAIN;
+        desc.mem = &ui->sys->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
@@ -398,6 +398,7 @@ void ui_vic20_init(ui_vic20_t* ui, const ui_vic20_desc_t* ui_desc) {
         desc.y = y;
         desc.m6502 = &ui->vic20->cpu;
         desc.read_cb = _ui_vic20_mem_read;
+        desc.mem = &ui->vic20->mem_cpu;
         desc.break_cb = _ui_vic20_eval_bp;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
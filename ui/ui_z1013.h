@@ -281,6 +281,7 @@ void ui_z1013_init(ui_z1013_t* ui, const ui_z1013_desc_t* ui_desc) {
         desc.y = y;
         desc.z80 = &ui->z1013->cpu;
         desc.read_cb = _ui_z1013_mem_read;
+        desc.mem = &ui->z1013->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
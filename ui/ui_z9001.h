@@ -318,6 +318,7 @@ void ui_z9001_init(ui_z9001_t* ui, const ui_z9001_desc_t* ui_desc) {
         desc.y = y;
         desc.z80 = &ui->z9001->cpu;
         desc.read_cb = _ui_z9001_mem_read;
+        desc.mem = &ui->z9001->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;
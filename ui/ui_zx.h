@@ -279,6 +279,8 @@ static void _ui_zx_mem_write(int layer, uint16_t addr, uint8_t data, void* user_
             *ptr = data;
         }
     }
+    /* writes from the memory editor bypass the display cache */
+    zx_invalidate_display(zx);
 }
 
 static const ui_chip_pin_t _ui_zx_cpu_pins[] = {
@@ -353,6 +355,7 @@ void ui_zx_init(ui_zx_t* ui, const ui_zx_desc_t* ui_desc) {
         desc.y = y;
         desc.z80 = &ui->zx->cpu;
         desc.read_cb = _ui_zx_mem_read;
+        desc.mem = &ui->zx->mem;
         desc.create_texture_cb = ui_desc->create_texture_cb;
         desc.update_texture_cb = ui_desc->update_texture_cb;
         desc.destroy_texture_cb = ui_desc->destroy_texture_cb;